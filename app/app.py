@@ -1,8 +1,7 @@
 """File defining the Metadata. And the basic functions creating the database tables and calling the router"""
 
 import logging
-import uuid
-from collections.abc import AsyncGenerator, Awaitable, Callable
+from collections.abc import AsyncGenerator, Callable
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import TYPE_CHECKING
@@ -10,9 +9,8 @@ from typing import TYPE_CHECKING
 import alembic.command as alembic_command
 import alembic.config as alembic_config
 import alembic.migration as alembic_migration
-import redis
 from calypsso import get_calypsso_app
-from fastapi import FastAPI, HTTPException, Request, Response, status
+from fastapi import BackgroundTasks, FastAPI, Request, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
@@ -38,7 +36,9 @@ from app.dependencies import (
     disconnect_state,
     get_db,
     get_notification_manager,
+    get_rate_limiter,
     get_redis_client,
+    get_scheduler,
     init_state,
 )
 from app.module import all_modules, module_list
@@ -50,13 +50,12 @@ from app.types.exceptions import (
 from app.types.sqlalchemy import Base
 from app.utils import initialization
 from app.utils.communication.notifications import NotificationManager
-from app.utils.redis import limiter
+from app.utils.middleware import LoggingMiddleware
 from app.utils.state import LifespanState
 
 if TYPE_CHECKING:
-    import redis
-
     from app.types.factory import Factory
+    from app.types.scheduler import Scheduler
 
 
 # NOTE: We can not get loggers at the top of this file like we do in other files
@@ -362,6 +361,8 @@ async def initialize_notification_topics(
     db: AsyncSession,
     hyperion_error_logger: logging.Logger,
     notification_manager: NotificationManager,
+    scheduler: "Scheduler",
+    background_tasks: BackgroundTasks,
 ) -> None:
     existing_topics = await get_notification_topic(db=db)
     existing_topics_id = [topic.id for topic in existing_topics]
@@ -381,6 +382,8 @@ async def initialize_notification_topics(
                         restrict_to_group_id=registred_topic.restrict_to_group_id,
                         restrict_to_members=registred_topic.restrict_to_members,
                         db=db,
+                        scheduler=scheduler,
+                        background_tasks=background_tasks,
                     )
 
 
@@ -573,11 +576,14 @@ async def init_lifespan(
             settings=settings,
         )
 
+    # Users are subscribed to new topics by the scheduler, once the topics are committed
+    topics_background_tasks = BackgroundTasks()
     async for db in get_db_dependency():
         notification_manager = app.dependency_overrides.get(
             get_notification_manager,
             get_notification_manager,
         )()
+        scheduler = app.dependency_overrides.get(get_scheduler, get_scheduler)()
         await initialization.use_lock_for_workers(
             initialize_notification_topics,
             "initialize_notification_topics",
@@ -587,7 +593,10 @@ async def init_lifespan(
             db=db,
             hyperion_error_logger=hyperion_error_logger,
             notification_manager=notification_manager,
+            scheduler=scheduler,
+            background_tasks=topics_background_tasks,
         )
+    await topics_background_tasks()
 
     return LifespanState()
 
@@ -598,8 +607,6 @@ def get_application(settings: Settings, drop_db: bool = False) -> FastAPI:
     # Initialize loggers
     LogConfig().initialize_loggers(settings=settings)
 
-    hyperion_access_logger = logging.getLogger("hyperion.access")
-    hyperion_security_logger = logging.getLogger("hyperion.security")
     hyperion_error_logger = logging.getLogger("hyperion.error")
 
     # Creating a lifespan which will be called when the application starts then shuts down
@@ -638,71 +645,22 @@ def get_application(settings: Settings, drop_db: bool = False) -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # Allow browsers to read pagination headers
+        expose_headers=["X-Next-Cursor"],
     )
 
     calypsso = get_calypsso_app()
     app.mount("/calypsso", calypsso, "Calypsso")
 
-    get_redis_client_dependency = app.dependency_overrides.get(
-        get_redis_client,
-        get_redis_client,
+    app.add_middleware(
+        LoggingMiddleware,
+        settings=settings,
+        get_rate_limiter=app.dependency_overrides.get(
+            get_rate_limiter,
+            get_rate_limiter,
+        ),
     )
 
-    @app.middleware("http")
-    async def logging_middleware(
-        request: Request,
-        call_next: Callable[[Request], Awaitable[Response]],
-    ) -> Response:
-        """
-        This middleware is called around each request.
-        It logs the request and inject a unique identifier in the request that should be used to associate logs saved during the request.
-        """
-        # We use a middleware to log every request
-        # See https://fastapi.tiangolo.com/tutorial/middleware/
-
-        # We generate a unique identifier for the request and save it as a state.
-        # This identifier will allow combining logs associated with the same request
-        # https://www.starlette.io/requests/#other-state
-        request_id = str(uuid.uuid4())
-
-        request.state.request_id = request_id
-
-        # This should never happen, but we log it just in case
-        if request.client is None:
-            hyperion_security_logger.warning(
-                f"Client information not available for {request.url.path}",
-            )
-            raise HTTPException(status_code=400, detail="No client information")
-
-        ip_address = request.client.host
-        port = request.client.port
-        client_address = f"{ip_address}:{port}"
-
-        redis_client: redis.Redis | None = get_redis_client_dependency()
-
-        # We test the ip address with the redis limiter
-        process = True
-        if redis_client and settings.ENABLE_RATE_LIMITER:  # If redis is configured
-            process, log = limiter(
-                redis_client,
-                ip_address,
-                settings.REDIS_LIMIT,
-                settings.REDIS_WINDOW,
-            )
-            if log:
-                hyperion_security_logger.warning(
-                    f"Rate limit reached for {ip_address} (limit: {settings.REDIS_LIMIT}, window: {settings.REDIS_WINDOW})",
-                )
-        if process:
-            response = await call_next(request)
-
-            hyperion_access_logger.info(
-                f'{client_address} - "{request.method} {request.url.path}" {response.status_code} ({request_id})',
-            )
-        else:
-            response = Response(status_code=429, content="Too Many Requests")
-        return response
-
     @app.exception_handler(RequestValidationError)
     async def validation_exception_handler(
         request: Request,
@@ -17,7 +17,7 @@ from app.dependencies import (
     is_user,
     is_user_in,
 )
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.module import CoreModule
 from app.utils.tools import get_file_from_data, save_file_as_data
 
@@ -193,6 +193,7 @@ async def create_association_logo(
 )
 async def read_association_logo(
     association_id: uuid.UUID,
+    size: ImageSize | None = None,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user()),
 ):
@@ -213,4 +214,5 @@ async def read_association_logo(
         directory="associations/logos",
         filename=association_id,
         raise_http_exception=True,
+        size=size,
     )
@@ -35,11 +35,14 @@ async def get_queued_emails(
     """
     Get a list of emails in the queue, ordered by creation date.
     This is used to send emails in the background.
+
+    Selected emails are locked until the end of the transaction, so that concurrent tasks don't send them twice.
     """
     result = await db.execute(
         select(models_core.EmailQueue)
         .order_by(models_core.EmailQueue.created_on)
-        .limit(limit),
+        .limit(limit)
+        .with_for_update(skip_locked=True),
     )
     return result.scalars().all()
 
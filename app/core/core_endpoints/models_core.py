@@ -27,7 +27,7 @@ class CoreData(Base):
 class EmailQueue(Base):
     """
     A table to store emails to be sent. This allows to send low priority emails, without risking to be ratelimited by the email provider.
-    Emails are sent by a queued task every hour.
+    Emails are sent by a queued task every minute, within the rate budget of the email provider.
     """
 
     __tablename__ = "email_queue"
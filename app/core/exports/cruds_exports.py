@@ -0,0 +1,101 @@
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.exports import models_exports
+from app.core.exports.types_exports import ExportJobStatus
+
+
+def create_export_job(
+    export_job: models_exports.ExportJob,
+    db: AsyncSession,
+) -> None:
+    db.add(export_job)
+
+
+async def get_export_job_by_id(
+    export_job_id: UUID,
+    db: AsyncSession,
+) -> models_exports.ExportJob | None:
+    result = await db.execute(
+        select(models_exports.ExportJob).where(
+            models_exports.ExportJob.id == export_job_id,
+        ),
+    )
+    return result.scalars().first()
+
+
+async def get_export_job_by_lock(
+    lock: str,
+    db: AsyncSession,
+) -> models_exports.ExportJob | None:
+    result = await db.execute(
+        select(models_exports.ExportJob).where(
+            models_exports.ExportJob.lock == lock,
+        ),
+    )
+    return result.scalars().first()
+
+
+async def update_export_job_progress(
+    export_job_id: UUID,
+    progress: int,
+    db: AsyncSession,
+) -> None:
+    await db.execute(
+        update(models_exports.ExportJob)
+        .where(models_exports.ExportJob.id == export_job_id)
+        .values(status=ExportJobStatus.running, progress=progress),
+    )
+
+
+async def end_export_job(
+    export_job_id: UUID,
+    status: ExportJobStatus,
+    expiration: datetime | None,
+    error: str | None,
+    db: AsyncSession,
+) -> None:
+    """
+    Mark the job as succeeded or failed and release its lock
+    """
+    values: dict[str, Any] = {
+        "status": status,
+        "expiration": expiration,
+        "error": error,
+        "lock": None,
+    }
+    if status == ExportJobStatus.succeeded:
+        values["progress"] = 100
+    await db.execute(
+        update(models_exports.ExportJob)
+        .where(models_exports.ExportJob.id == export_job_id)
+        .values(**values),
+    )
+
+
+async def get_expired_export_job_ids(
+    now: datetime,
+    db: AsyncSession,
+) -> Sequence[UUID]:
+    result = await db.execute(
+        select(models_exports.ExportJob.id).where(
+            models_exports.ExportJob.expiration < now,
+        ),
+    )
+    return result.scalars().all()
+
+
+async def delete_export_jobs(
+    export_job_ids: Sequence[UUID],
+    db: AsyncSession,
+) -> None:
+    await db.execute(
+        delete(models_exports.ExportJob).where(
+            models_exports.ExportJob.id.in_(export_job_ids),
+        ),
+    )
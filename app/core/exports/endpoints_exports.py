@@ -0,0 +1,99 @@
+from datetime import UTC, datetime
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.exports import cruds_exports, models_exports, schemas_exports
+from app.core.exports.types_exports import ExportJobStatus
+from app.core.exports.utils_exports import get_export_file_path
+from app.core.users import models_users
+from app.dependencies import get_db, is_user
+from app.types.module import CoreModule
+
+router = APIRouter(tags=["Exports"])
+
+core_module = CoreModule(
+    root="exports",
+    tag="Exports",
+    router=router,
+    factory=None,
+)
+
+
+async def get_user_export_job(
+    export_job_id: UUID,
+    user: models_users.CoreUser,
+    db: AsyncSession,
+) -> models_exports.ExportJob:
+    export_job = await cruds_exports.get_export_job_by_id(
+        export_job_id=export_job_id,
+        db=db,
+    )
+    # Exports may contain personal data, only the user who started the export can access it
+    if export_job is None or export_job.creator_id != user.id:
+        raise HTTPException(
+            status_code=404,
+            detail="Export not found",
+        )
+    return export_job
+
+
+@router.get(
+    "/exports/{export_job_id}",
+    response_model=schemas_exports.ExportJob,
+    status_code=200,
+)
+async def get_export_job(
+    export_job_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    user: models_users.CoreUser = Depends(is_user()),
+):
+    """
+    Get the status and the progress of an export.
+    Once the export succeeded, the file can be downloaded using `/exports/{export_job_id}/download` until the expiration date.
+
+    **Only the user who started the export can access it**
+    """
+    return await get_user_export_job(export_job_id=export_job_id, user=user, db=db)
+
+
+@router.get(
+    "/exports/{export_job_id}/download",
+    response_class=FileResponse,
+    status_code=200,
+)
+async def download_export(
+    export_job_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    user: models_users.CoreUser = Depends(is_user()),
+):
+    """
+    Download the file generated by an export.
+
+    **Only the user who started the export can access it**
+    """
+    export_job = await get_user_export_job(
+        export_job_id=export_job_id,
+        user=user,
+        db=db,
+    )
+    if export_job.status != ExportJobStatus.succeeded:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Export is {export_job.status.value}",
+        )
+    if export_job.expiration is not None and export_job.expiration < datetime.now(
+        UTC,
+    ):
+        raise HTTPException(
+            status_code=404,
+            detail="Export expired",
+        )
+
+    return FileResponse(
+        get_export_file_path(export_job.id),
+        filename=export_job.file_name,
+        media_type=export_job.media_type,
+    )
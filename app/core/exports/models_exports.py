@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.exports.types_exports import ExportJobStatus, ExportType
+from app.types.sqlalchemy import Base, PrimaryKey
+
+
+class ExportJob(Base):
+    __tablename__ = "core_export_job"
+
+    id: Mapped[PrimaryKey]
+    export_type: Mapped[ExportType]
+    creator_id: Mapped[str] = mapped_column(ForeignKey("core_user.id"))
+    status: Mapped[ExportJobStatus]
+    # Percentage of the export already generated
+    progress: Mapped[int]
+    # Name and media type of the generated file, used when it is downloaded
+    file_name: Mapped[str]
+    media_type: Mapped[str]
+    creation: Mapped[datetime]
+
+    # Identifies what is being exported, ex: a seller. It is only set while the job is pending or running,
+    # the unique constraint prevents two jobs from generating the same export at the same time
+    lock: Mapped[str | None] = mapped_column(unique=True)
+
+    # After this date, the generated file is deleted
+    expiration: Mapped[datetime | None] = mapped_column(default=None)
+    error: Mapped[str | None] = mapped_column(default=None)
@@ -0,0 +1,19 @@
+from datetime import datetime
+from uuid import UUID
+
+from pydantic import BaseModel, ConfigDict
+
+from app.core.exports.types_exports import ExportJobStatus, ExportType
+
+
+class ExportJob(BaseModel):
+    id: UUID
+    export_type: ExportType
+    status: ExportJobStatus
+    progress: int
+    file_name: str
+    creation: datetime
+    expiration: datetime | None
+    error: str | None
+
+    model_config = ConfigDict(from_attributes=True)
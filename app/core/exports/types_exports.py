@@ -0,0 +1,14 @@
+from enum import Enum
+
+
+class ExportType(str, Enum):
+    cdr_seller_results = "cdr_seller_results"
+    raid_teams_pdf = "raid_teams_pdf"
+    raid_teams_csv = "raid_teams_csv"
+
+
+class ExportJobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
@@ -0,0 +1,194 @@
+import logging
+from collections.abc import Callable, Coroutine
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from uuid import UUID, uuid4
+
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import dependencies
+from app.core.exports import cruds_exports, models_exports
+from app.core.exports.types_exports import ExportJobStatus, ExportType
+from app.core.utils.config import Settings
+from app.types.sqlalchemy import SessionLocalType
+
+if TYPE_CHECKING:
+    from app.types.scheduler import Scheduler
+
+hyperion_error_logger = logging.getLogger("hyperion.error")
+
+EXPORTS_DIRECTORY = Path("data/exports")
+# Generated files can be downloaded during this delay, then they are deleted
+EXPORT_EXPIRATION = timedelta(days=1)
+# A job still pending or running after this delay is considered lost, for example if its worker was stopped
+EXPORT_JOB_TIMEOUT = timedelta(hours=1)
+
+# An export function is called with `progress: ExportProgress`, `file_path: Path`, `db: AsyncSession`,
+# `settings: Settings` and the parameters passed to `start_export_job`. It should write the export at `file_path`.
+ExportFunction = Callable[..., Coroutine[Any, Any, None]]
+
+
+class ExportProgress:
+    def __init__(self, export_job_id: UUID, session_local: SessionLocalType):
+        """
+        Allow an export function to report its progress.
+
+        The progress is committed in its own transaction, so that it can be polled while the export is running.
+        """
+        self.export_job_id = export_job_id
+        self.session_local = session_local
+        self.progress: int | None = None
+
+    async def update(self, done: int, total: int) -> None:
+        progress = min(done * 100 // total, 99) if total > 0 else 0
+        # We only write to the database when the percentage changes
+        if progress == self.progress:
+            return
+        self.progress = progress
+        async with self.session_local() as db:
+            await cruds_exports.update_export_job_progress(
+                export_job_id=self.export_job_id,
+                progress=progress,
+                db=db,
+            )
+            await db.commit()
+
+
+def get_export_file_path(export_job_id: UUID) -> Path:
+    return EXPORTS_DIRECTORY / str(export_job_id)
+
+
+async def start_export_job(
+    export_type: ExportType,
+    lock: str,
+    file_name: str,
+    media_type: str,
+    export_function: ExportFunction,
+    creator_id: str,
+    db: AsyncSession,
+    scheduler: "Scheduler",
+    background_tasks: BackgroundTasks,
+    **params: Any,
+) -> models_exports.ExportJob:
+    """
+    Create an export job, which will be executed by the scheduler.
+
+    Only one job can be pending or running for a given `lock`, for example the id of the exported seller.
+    If such a job already exists, it is returned instead of starting a new one.
+
+    The job is queued after the response is sent, once the request session was committed.
+    """
+    running_job = await cruds_exports.get_export_job_by_lock(lock=lock, db=db)
+    if running_job is not None:
+        if running_job.creation > datetime.now(UTC) - EXPORT_JOB_TIMEOUT:
+            return running_job
+        # The job was lost, we release its lock
+        await cruds_exports.end_export_job(
+            export_job_id=running_job.id,
+            status=ExportJobStatus.failed,
+            expiration=datetime.now(UTC) + EXPORT_EXPIRATION,
+            error="The export timed out",
+            db=db,
+        )
+
+    export_job = models_exports.ExportJob(
+        id=uuid4(),
+        export_type=export_type,
+        creator_id=creator_id,
+        status=ExportJobStatus.pending,
+        progress=0,
+        file_name=file_name,
+        media_type=media_type,
+        creation=datetime.now(UTC),
+        lock=lock,
+    )
+    try:
+        async with db.begin_nested():
+            cruds_exports.create_export_job(export_job=export_job, db=db)
+    except IntegrityError:
+        # Another request started the same export in the meantime
+        running_job = await cruds_exports.get_export_job_by_lock(lock=lock, db=db)
+        if running_job is None:
+            raise
+        return running_job
+
+    background_tasks.add_task(
+        scheduler.queue_job,
+        run_export_job,
+        job_id=f"export_{export_job.id}",
+        # Exports may take longer than the default timeout of five minutes
+        job_timeout=EXPORT_JOB_TIMEOUT,
+        export_job_id=export_job.id,
+        export_function=export_function,
+        **params,
+    )
+    return export_job
+
+
+async def run_export_job(
+    export_job_id: UUID,
+    export_function: ExportFunction,
+    settings: Settings,
+    **params: Any,
+) -> None:
+    """
+    Execute an export function, then mark the job as succeeded or failed.
+    This function is called by the scheduler.
+    """
+    session_local = dependencies.get_session_local()
+    file_path = get_export_file_path(export_job_id)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    progress = ExportProgress(export_job_id=export_job_id, session_local=session_local)
+    status = ExportJobStatus.succeeded
+    error: str | None = None
+    try:
+        await progress.update(0, 1)
+        # The export may modify the database, its changes are committed only if it succeeds
+        async with session_local() as db:
+            await export_function(
+                progress=progress,
+                file_path=file_path,
+                db=db,
+                settings=settings,
+                **params,
+            )
+            await db.commit()
+    except HTTPException as exception:
+        # Export functions may share their checks with endpoints
+        status = ExportJobStatus.failed
+        error = str(exception.detail)
+    except Exception:
+        hyperion_error_logger.exception(f"Export job {export_job_id} failed")
+        status = ExportJobStatus.failed
+        error = "An unexpected error occurred"
+
+    if status == ExportJobStatus.failed:
+        file_path.unlink(missing_ok=True)
+
+    async with session_local() as db:
+        await cruds_exports.end_export_job(
+            export_job_id=export_job_id,
+            status=status,
+            # Failed jobs are kept for the same delay, to let the user know about the error
+            expiration=datetime.now(UTC) + EXPORT_EXPIRATION,
+            error=error,
+            db=db,
+        )
+        await db.commit()
+
+
+async def delete_expired_exports(db: AsyncSession) -> None:
+    """
+    Delete expired export jobs and their files. This function should be called by a cron scheduled task.
+    """
+    expired_job_ids = await cruds_exports.get_expired_export_job_ids(
+        now=datetime.now(UTC),
+        db=db,
+    )
+    for export_job_id in expired_job_ids:
+        get_export_file_path(export_job_id).unlink(missing_ok=True)
+    await cruds_exports.delete_export_jobs(export_job_ids=expired_job_ids, db=db)
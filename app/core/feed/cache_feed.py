@@ -0,0 +1,9 @@
+"""Cache of the first pages of published news, requested on every application launch"""
+
+from app.core.feed import schemas_feed
+from app.utils.cache import TTLCache
+
+# First pages of the feed, indexed by their size
+published_news_cache: TTLCache[int | None, list[schemas_feed.News]] = TTLCache(
+    max_size=16,
+)
@@ -1,10 +1,12 @@
 from collections.abc import Sequence
+from datetime import UTC, datetime
 from uuid import UUID
 
-from sqlalchemy import select, update
+from sqlalchemy import and_, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.feed import models_feed
+from app.core.feed.cache_feed import published_news_cache
 from app.core.feed.types_feed import NewsStatus
 
 
@@ -17,16 +19,39 @@ async def create_news(
     """
 
     db.add(news)
+    published_news_cache.clear_after_commit(db)
 
 
 async def get_news(
     status: list[NewsStatus],
     db: AsyncSession,
+    limit: int | None = None,
+    before: tuple[datetime, UUID] | None = None,
+    since: datetime | None = None,
 ) -> Sequence[models_feed.News]:
+    """
+    Return the news with one of the given status, the most recent first.
+
+    News are ordered by (start, id). To paginate, `before` should be the (start, id) of the last news of the previous page.
+    If `since` is provided, only news created or whose status changed after this date are returned.
+    """
     result = await db.execute(
-        select(models_feed.News).where(
+        select(models_feed.News)
+        .where(
             models_feed.News.status.in_(status),
-        ),
+            or_(
+                models_feed.News.start < before[0],
+                and_(
+                    models_feed.News.start == before[0],
+                    models_feed.News.id < before[1],
+                ),
+            )
+            if before
+            else and_(True),
+            models_feed.News.last_modified > since if since else and_(True),
+        )
+        .order_by(models_feed.News.start.desc(), models_feed.News.id.desc())
+        .limit(limit),
     )
     return result.scalars().all()
 
@@ -58,5 +83,6 @@ async def change_news_status(
     await db.execute(
         update(models_feed.News)
         .where(models_feed.News.id == news_id)
-        .values(status=status),
+        .values(status=status, last_modified=datetime.now(UTC)),
     )
+    published_news_cache.clear_after_commit(db)
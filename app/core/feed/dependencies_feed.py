@@ -0,0 +1,22 @@
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import HTTPException
+
+from app.core.feed.utils_feed import decode_news_cursor
+
+
+def get_news_cursor(cursor: str | None = None) -> tuple[datetime, UUID] | None:
+    """
+    Decode the `cursor` query parameter used to paginate the feed.
+    Return the (start, id) key after which the news should start.
+    """
+    if cursor is None:
+        return None
+    try:
+        return decode_news_cursor(cursor)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor",
+        ) from error
@@ -1,12 +1,17 @@
 import logging
+from datetime import datetime
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from fastapi.responses import FileResponse
+from pydantic import AwareDatetime
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.feed import cruds_feed, schemas_feed
+from app.core.feed.cache_feed import published_news_cache
+from app.core.feed.dependencies_feed import get_news_cursor
 from app.core.feed.types_feed import NewsStatus
+from app.core.feed.utils_feed import encode_news_cursor
 from app.core.groups.groups_type import GroupType
 from app.core.users import models_users
 from app.dependencies import (
@@ -14,6 +19,7 @@ from app.dependencies import (
     is_user_a_school_member,
     is_user_in,
 )
+from app.types.content_type import ImageSize
 from app.types.module import CoreModule
 from app.utils.tools import get_file_from_data
 
@@ -35,14 +41,46 @@ hyperion_error_logger = logging.getLogger("hyperion.error")
     status_code=200,
 )
 async def get_published_news(
+    response: Response,
+    limit: int | None = Query(default=None, ge=1),
+    before: tuple[datetime, UUID] | None = Depends(get_news_cursor),
+    since: AwareDatetime | None = None,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_school_member),
 ):
     """
-    Return published news from the feed
-    """
+    Return published news from the feed, the most recent first.
+
+    If `limit` is set, at most `limit` news are returned. When more news may be available,
+    the `X-Next-Cursor` response header contains a cursor which should be passed as `cursor` to get the next page.
 
-    return await cruds_feed.get_news(status=[NewsStatus.PUBLISHED], db=db)
+    If `since` is set, only news published or rejected after this date are returned, to refresh a previously fetched feed.
+    Rejected news should be removed from the feed.
+    """
+    # The first page of the feed, requested on every application launch, is cached
+    is_first_page = before is None and since is None
+    news = published_news_cache.get(limit) if is_first_page else None
+    if news is None:
+        generation = published_news_cache.generation
+        news = [
+            schemas_feed.News.model_validate(news_item, from_attributes=True)
+            for news_item in await cruds_feed.get_news(
+                status=[NewsStatus.PUBLISHED, NewsStatus.REJECTED]
+                if since
+                else [NewsStatus.PUBLISHED],
+                db=db,
+                limit=limit,
+                before=before,
+                since=since,
+            )
+        ]
+        if is_first_page:
+            published_news_cache.set(key=limit, value=news, generation=generation)
+
+    if limit is not None and len(news) == limit:
+        response.headers["X-Next-Cursor"] = encode_news_cursor(news[-1])
+
+    return news
 
 
 @router.get(
@@ -52,6 +90,7 @@ async def get_published_news(
 )
 async def get_news_image(
     news_id: UUID,
+    size: ImageSize | None = None,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_school_member),
 ):
@@ -70,6 +109,7 @@ async def get_news_image(
         directory=news.image_directory,
         filename=news.image_id,
         raise_http_exception=True,
+        size=size,
     )
 
 
@@ -1,7 +1,7 @@
 from datetime import datetime
 from uuid import UUID
 
-from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import Mapped, mapped_column
 
 from app.core.feed.types_feed import NewsStatus
 from app.types.sqlalchemy import Base, PrimaryKey
@@ -13,7 +13,7 @@ class News(Base):
     id: Mapped[PrimaryKey]
     title: Mapped[str]
 
-    start: Mapped[datetime]
+    start: Mapped[datetime] = mapped_column(index=True)
     end: Mapped[datetime | None]
 
     # Name of the entity that created the news
@@ -34,3 +34,6 @@ class News(Base):
     image_id: Mapped[UUID]
 
     status: Mapped[NewsStatus]
+
+    # Date of the creation of the news or of the last change of its status, used to refresh the feed incrementally
+    last_modified: Mapped[datetime] = mapped_column(index=True)
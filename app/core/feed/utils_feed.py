@@ -1,15 +1,39 @@
+import base64
 import uuid
-from datetime import datetime
+from datetime import UTC, datetime
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.feed import cruds_feed, models_feed
+from app.core.feed import cruds_feed, models_feed, schemas_feed
 from app.core.feed.types_feed import NewsStatus
 from app.core.groups.groups_type import GroupType
 from app.core.notification.schemas_notification import Message
 from app.utils.communication.notifications import NotificationTool
 
 
+def encode_news_cursor(news: schemas_feed.News) -> str:
+    """
+    Return an opaque cursor pointing after `news`, to request the next page of the feed
+    """
+    return base64.urlsafe_b64encode(
+        f"{news.start.isoformat()}|{news.id}".encode(),
+    ).decode()
+
+
+def decode_news_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """
+    Return the (start, id) key encoded in a cursor.
+
+    Raise a `ValueError` if the cursor is invalid.
+    """
+    # Decoding errors are subclasses of `ValueError`
+    start, news_id = base64.urlsafe_b64decode(cursor).decode().split("|")
+    start_datetime = datetime.fromisoformat(start)
+    if start_datetime.tzinfo is None:
+        raise ValueError(cursor)
+    return start_datetime, uuid.UUID(news_id)
+
+
 async def create_feed_news(
     title: str,
     start: datetime,
@@ -54,6 +78,7 @@ async def create_feed_news(
         status=NewsStatus.WAITING_APPROVAL
         if require_feed_admin_approval
         else NewsStatus.PUBLISHED,
+        last_modified=datetime.now(UTC),
     )
     await cruds_feed.create_news(news=news, db=db)
 
@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.core.groups import models_groups, schemas_groups
+from app.core.users.cache_users import authenticated_users_cache
 
 
 async def get_groups(db: AsyncSession) -> Sequence[models_groups.CoreGroup]:
@@ -64,6 +65,7 @@ async def delete_group(db: AsyncSession, group_id: str):
         delete(models_groups.CoreGroup).where(models_groups.CoreGroup.id == group_id),
     )
     await db.flush()
+    authenticated_users_cache.clear_after_commit(db)
 
 
 async def create_membership(
@@ -74,6 +76,7 @@ async def create_membership(
 
     db.add(membership)
     await db.flush()
+    authenticated_users_cache.invalidate_after_commit(db, membership.user_id)
     return await get_group_by_id(db, membership.group_id)
 
 
@@ -87,6 +90,7 @@ async def delete_membership_by_group_id(
         ),
     )
     await db.flush()
+    authenticated_users_cache.clear_after_commit(db)
 
 
 async def delete_membership_by_group_and_user_id(
@@ -101,6 +105,7 @@ async def delete_membership_by_group_and_user_id(
         ),
     )
     await db.flush()
+    authenticated_users_cache.invalidate_after_commit(db, user_id)
 
 
 async def update_group(
@@ -114,3 +119,5 @@ async def update_group(
         .values(**group_update.model_dump(exclude_none=True)),
     )
     await db.flush()
+    # Cached users contain the name of their groups
+    authenticated_users_cache.clear_after_commit(db)
@@ -16,14 +16,16 @@ from app.core.groups.factory_groups import CoreGroupsFactory
 from app.core.groups.groups_type import GroupType
 from app.core.notification.utils_notification import get_topics_restricted_to_group_id
 from app.core.users import cruds_users, models_users
+from app.core.users.search_users import UserSearchIndex
 from app.dependencies import (
     get_db,
     get_notification_manager,
     get_request_id,
+    get_user_search_index,
     is_user,
     is_user_in,
 )
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.module import CoreModule
 from app.utils.communication.notifications import NotificationManager
 from app.utils.tools import (
@@ -163,6 +165,7 @@ async def create_membership(
     db: AsyncSession = Depends(get_db),
     user=Depends(is_user_in(GroupType.admin)),
     request_id: str = Depends(get_request_id),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
 ):
     """
     Create a new membership in database and return the group. This allows to "add a user to a group".
@@ -188,7 +191,9 @@ async def create_membership(
         group_id=membership.group_id,
         description=membership.description,
     )
-    return await cruds_groups.create_membership(db=db, membership=membership_db)
+    group = await cruds_groups.create_membership(db=db, membership=membership_db)
+    await user_search_index.refresh_user_after_commit(db=db, user_id=membership.user_id)
+    return group
 
 
 @router.post(
@@ -200,6 +205,7 @@ async def create_batch_membership(
     db: AsyncSession = Depends(get_db),
     user=Depends(is_user_in(GroupType.admin)),
     request_id: str = Depends(get_request_id),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
 ):
     """
     Add a list of user to a group, using a list of email.
@@ -236,6 +242,8 @@ async def create_batch_membership(
 
         # If the user does not exist, we will pass silently
 
+    user_search_index.invalidate_after_commit(db)
+
 
 @router.delete(
     "/groups/membership",
@@ -247,6 +255,7 @@ async def delete_membership(
     user=Depends(is_user_in(GroupType.admin)),
     request_id: str = Depends(get_request_id),
     notification_manager: NotificationManager = Depends(get_notification_manager),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
 ):
     """
     Delete a membership using the user and group ids.
@@ -276,6 +285,7 @@ async def delete_membership(
         user_id=membership.user_id,
         db=db,
     )
+    await user_search_index.refresh_user_after_commit(db=db, user_id=membership.user_id)
 
 
 @router.delete(
@@ -288,6 +298,7 @@ async def delete_batch_membership(
     user=Depends(is_user_in(GroupType.admin)),
     request_id: str = Depends(get_request_id),
     notification_manager: NotificationManager = Depends(get_notification_manager),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
 ):
     """
     This endpoint removes all users from a given group.
@@ -324,6 +335,7 @@ async def delete_batch_membership(
         group_id=batch_membership.group_id,
         db=db,
     )
+    user_search_index.invalidate_after_commit(db)
 
 
 @router.delete(
@@ -394,6 +406,7 @@ async def create_group_logo(
 )
 async def read_user_profile_picture(
     group_id: str,
+    size: ImageSize | None = None,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user()),
 ):
@@ -412,4 +425,5 @@ async def read_user_profile_picture(
         filename=group_id,
         default_asset="assets/images/default_profile_picture.png",
         raise_http_exception=True,
+        size=size,
     )
@@ -1,24 +1,42 @@
-from collections.abc import Sequence
-from datetime import datetime
+from collections.abc import AsyncIterator, Sequence
+from datetime import UTC, datetime
 from uuid import UUID
 
-from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    and_,
+    case,
+    cast,
+    delete,
+    exists,
+    func,
+    literal,
+    null,
+    or_,
+    select,
+    union_all,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import noload, selectinload
+from sqlalchemy.orm import InstrumentedAttribute, aliased, noload, selectinload
 
+from app.core.memberships import models_memberships
 from app.core.mypayment import models_mypayment, schemas_mypayment
 from app.core.mypayment.exceptions_mypayment import WalletNotFoundOnUpdateError
 from app.core.mypayment.types_mypayment import (
+    HistoryType,
     TransactionStatus,
     WalletDeviceStatus,
     WalletType,
 )
 from app.core.mypayment.utils_mypayment import (
+    history_row_to_schema,
     invoice_model_to_schema,
     refund_model_to_schema,
     structure_model_to_schema,
 )
-from app.core.users import schemas_users
+from app.core.users import models_users, schemas_users
 
 
 async def create_structure(
@@ -355,17 +373,79 @@ async def create_wallet(
 async def get_wallets(
     db: AsyncSession,
 ) -> Sequence[schemas_mypayment.WalletBase]:
-    result = await db.execute(select(models_mypayment.Wallet))
+    # We only select the needed columns, to prevent the wallets' store and user from being joined
+    result = await db.execute(
+        select(
+            models_mypayment.Wallet.id,
+            models_mypayment.Wallet.type,
+            models_mypayment.Wallet.balance,
+        ),
+    )
     return [
         schemas_mypayment.WalletBase(
-            id=wallet.id,
-            type=wallet.type,
-            balance=wallet.balance,
+            id=wallet_id,
+            type=wallet_type,
+            balance=balance,
         )
-        for wallet in result.scalars().all()
+        for wallet_id, wallet_type, balance in result.tuples()
     ]
 
 
+async def stream_wallets(
+    db: AsyncSession,
+    batch_size: int = 1000,
+) -> AsyncIterator[schemas_mypayment.WalletBase]:
+    """
+    Iterate over all wallets, fetching them from the database `batch_size` rows at a time
+    """
+    result = await db.stream(
+        select(
+            models_mypayment.Wallet.id,
+            models_mypayment.Wallet.type,
+            models_mypayment.Wallet.balance,
+        ).execution_options(yield_per=batch_size),
+    )
+    async for wallet_id, wallet_type, balance in result:
+        yield schemas_mypayment.WalletBase(
+            id=wallet_id,
+            type=wallet_type,
+            balance=balance,
+        )
+
+
+async def get_wallets_balance_changes(
+    db: AsyncSession,
+    start_date: datetime,
+) -> dict[UUID, int]:
+    """
+    Return, for each wallet involved in a non canceled transaction created since `start_date`,
+    the sum of the totals it was credited minus the sum of the totals it was debited.
+
+    The aggregation is made by the database in a single query.
+    """
+    credited = select(
+        models_mypayment.Transaction.credited_wallet_id.label("wallet_id"),
+        models_mypayment.Transaction.total.label("change"),
+    ).where(
+        models_mypayment.Transaction.creation >= start_date,
+        models_mypayment.Transaction.status != TransactionStatus.CANCELED,
+    )
+    debited = select(
+        models_mypayment.Transaction.debited_wallet_id.label("wallet_id"),
+        (-models_mypayment.Transaction.total).label("change"),
+    ).where(
+        models_mypayment.Transaction.creation >= start_date,
+        models_mypayment.Transaction.status != TransactionStatus.CANCELED,
+    )
+    changes = union_all(credited, debited).subquery()
+    result = await db.execute(
+        select(changes.c.wallet_id, func.sum(changes.c.change)).group_by(
+            changes.c.wallet_id,
+        ),
+    )
+    return {wallet_id: int(change) for wallet_id, change in result.tuples()}
+
+
 async def get_wallet(
     wallet_id: UUID,
     db: AsyncSession,
@@ -465,6 +545,57 @@ async def increment_wallet_balance(
     wallet.balance += amount
 
 
+async def lock_wallets_balances(
+    wallet_ids: list[UUID],
+    db: AsyncSession,
+) -> dict[UUID, int]:
+    """
+    Lock the wallets `for update` and return their balances.
+
+    All rows are locked by a single statement, in a deterministic order,
+    to prevent deadlocks between transactions locking the same wallets.
+    """
+    result = await db.execute(
+        select(models_mypayment.Wallet.id, models_mypayment.Wallet.balance)
+        .where(models_mypayment.Wallet.id.in_(wallet_ids))
+        .order_by(models_mypayment.Wallet.id)
+        .with_for_update(),
+    )
+    return dict(result.tuples().all())
+
+
+async def transfer_between_wallets(
+    debited_wallet_id: UUID,
+    credited_wallet_id: UUID,
+    amount: int,
+    db: AsyncSession,
+) -> dict[UUID, int]:
+    """
+    Move `amount` from the debited wallet to the credited one using a single UPDATE, and return their new balances.
+
+    Wallets should have been locked using `lock_wallets_balances`.
+    """
+    result = await db.execute(
+        update(models_mypayment.Wallet)
+        .where(
+            models_mypayment.Wallet.id.in_([debited_wallet_id, credited_wallet_id]),
+        )
+        .values(
+            balance=models_mypayment.Wallet.balance
+            + case(
+                (models_mypayment.Wallet.id == debited_wallet_id, -amount),
+                else_=amount,
+            ),
+        )
+        .returning(models_mypayment.Wallet.id, models_mypayment.Wallet.balance),
+    )
+    balances = dict(result.tuples().all())
+    for wallet_id in (debited_wallet_id, credited_wallet_id):
+        if wallet_id not in balances:
+            raise WalletNotFoundOnUpdateError(wallet_id=wallet_id)
+    return balances
+
+
 async def create_user_payment(
     user_id: str,
     wallet_id: UUID,
@@ -578,6 +709,37 @@ async def get_transaction(
     )
 
 
+def _select_transactions(
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    exclude_canceled: bool = False,
+) -> Select[tuple[models_mypayment.Transaction]]:
+    return select(models_mypayment.Transaction).where(
+        models_mypayment.Transaction.creation >= start_date
+        if start_date
+        else and_(True),
+        models_mypayment.Transaction.creation <= end_date if end_date else and_(True),
+        models_mypayment.Transaction.status != TransactionStatus.CANCELED
+        if exclude_canceled
+        else and_(True),
+    )
+
+
+def _transaction_model_to_schema(
+    transaction: models_mypayment.Transaction,
+) -> schemas_mypayment.TransactionBase:
+    return schemas_mypayment.TransactionBase(
+        id=transaction.id,
+        debited_wallet_id=transaction.debited_wallet_id,
+        credited_wallet_id=transaction.credited_wallet_id,
+        transaction_type=transaction.transaction_type,
+        seller_user_id=transaction.seller_user_id,
+        total=transaction.total,
+        creation=transaction.creation,
+        status=transaction.status,
+    )
+
+
 async def get_transactions(
     db: AsyncSession,
     start_date: datetime | None = None,
@@ -585,33 +747,37 @@ async def get_transactions(
     exclude_canceled: bool = False,
 ) -> Sequence[schemas_mypayment.TransactionBase]:
     result = await db.execute(
-        select(models_mypayment.Transaction).where(
-            models_mypayment.Transaction.creation >= start_date
-            if start_date
-            else and_(True),
-            models_mypayment.Transaction.creation <= end_date
-            if end_date
-            else and_(True),
-            models_mypayment.Transaction.status != TransactionStatus.CANCELED
-            if exclude_canceled
-            else and_(True),
+        _select_transactions(
+            start_date=start_date,
+            end_date=end_date,
+            exclude_canceled=exclude_canceled,
         ),
     )
     return [
-        schemas_mypayment.TransactionBase(
-            id=transaction.id,
-            debited_wallet_id=transaction.debited_wallet_id,
-            credited_wallet_id=transaction.credited_wallet_id,
-            transaction_type=transaction.transaction_type,
-            seller_user_id=transaction.seller_user_id,
-            total=transaction.total,
-            creation=transaction.creation,
-            status=transaction.status,
-        )
+        _transaction_model_to_schema(transaction)
         for transaction in result.scalars().all()
     ]
 
 
+async def stream_transactions(
+    db: AsyncSession,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[schemas_mypayment.TransactionBase]:
+    """
+    Iterate over transactions, fetching them from the database `batch_size` rows at a time
+    """
+    result = await db.stream_scalars(
+        _select_transactions(start_date=start_date, end_date=end_date)
+        # The refund relationship is not needed and would be joined
+        .options(noload(models_mypayment.Transaction.refund))
+        .execution_options(yield_per=batch_size),
+    )
+    async for transaction in result:
+        yield _transaction_model_to_schema(transaction)
+
+
 async def get_transactions_by_wallet_id(
     wallet_id: UUID,
     db: AsyncSession,
@@ -640,30 +806,54 @@ async def get_transactions_by_wallet_id(
     return result.scalars().all()
 
 
+def _select_transfers(
+    last_checked: datetime | None = None,
+) -> Select[tuple[models_mypayment.Transfer]]:
+    return select(models_mypayment.Transfer).where(
+        models_mypayment.Transfer.creation >= last_checked
+        if last_checked
+        else and_(True),
+    )
+
+
+def _transfer_model_to_schema(
+    transfer: models_mypayment.Transfer,
+) -> schemas_mypayment.Transfer:
+    return schemas_mypayment.Transfer(
+        id=transfer.id,
+        type=transfer.type,
+        transfer_identifier=transfer.transfer_identifier,
+        approver_user_id=transfer.approver_user_id,
+        wallet_id=transfer.wallet_id,
+        total=transfer.total,
+        creation=transfer.creation,
+        confirmed=transfer.confirmed,
+    )
+
+
 async def get_transfers(
     db: AsyncSession,
     last_checked: datetime | None = None,
 ) -> Sequence[schemas_mypayment.Transfer]:
-    result = await db.execute(
-        select(models_mypayment.Transfer).where(
-            models_mypayment.Transfer.creation >= last_checked
-            if last_checked
-            else and_(True),
+    result = await db.execute(_select_transfers(last_checked=last_checked))
+    return [_transfer_model_to_schema(transfer) for transfer in result.scalars().all()]
+
+
+async def stream_transfers(
+    db: AsyncSession,
+    last_checked: datetime | None = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[schemas_mypayment.Transfer]:
+    """
+    Iterate over transfers, fetching them from the database `batch_size` rows at a time
+    """
+    result = await db.stream_scalars(
+        _select_transfers(last_checked=last_checked).execution_options(
+            yield_per=batch_size,
         ),
     )
-    return [
-        schemas_mypayment.Transfer(
-            id=transfer.id,
-            type=transfer.type,
-            transfer_identifier=transfer.transfer_identifier,
-            approver_user_id=transfer.approver_user_id,
-            wallet_id=transfer.wallet_id,
-            total=transfer.total,
-            creation=transfer.creation,
-            confirmed=transfer.confirmed,
-        )
-        for transfer in result.scalars().all()
-    ]
+    async for transfer in result:
+        yield _transfer_model_to_schema(transfer)
 
 
 async def create_transfer(
@@ -729,29 +919,54 @@ async def get_transfer_by_transfer_identifier(
     return result.scalars().first()
 
 
+def _select_refunds(
+    last_checked: datetime | None = None,
+) -> Select[tuple[models_mypayment.Refund]]:
+    return select(models_mypayment.Refund).where(
+        models_mypayment.Refund.creation >= last_checked
+        if last_checked
+        else and_(True),
+    )
+
+
+def _refund_model_to_schema(
+    refund: models_mypayment.Refund,
+) -> schemas_mypayment.RefundBase:
+    return schemas_mypayment.RefundBase(
+        id=refund.id,
+        transaction_id=refund.transaction_id,
+        credited_wallet_id=refund.credited_wallet_id,
+        debited_wallet_id=refund.debited_wallet_id,
+        total=refund.total,
+        creation=refund.creation,
+        seller_user_id=refund.seller_user_id,
+    )
+
+
 async def get_refunds(
     db: AsyncSession,
     last_checked: datetime | None = None,
 ) -> Sequence[schemas_mypayment.RefundBase]:
-    result = await db.execute(
-        select(models_mypayment.Refund).where(
-            models_mypayment.Refund.creation >= last_checked
-            if last_checked
-            else and_(True),
-        ),
+    result = await db.execute(_select_refunds(last_checked=last_checked))
+    return [_refund_model_to_schema(refund) for refund in result.scalars().all()]
+
+
+async def stream_refunds(
+    db: AsyncSession,
+    last_checked: datetime | None = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[schemas_mypayment.RefundBase]:
+    """
+    Iterate over refunds, fetching them from the database `batch_size` rows at a time
+    """
+    result = await db.stream_scalars(
+        _select_refunds(last_checked=last_checked)
+        # The transaction relationship is not needed and would be joined
+        .options(noload(models_mypayment.Refund.transaction))
+        .execution_options(yield_per=batch_size),
     )
-    return [
-        schemas_mypayment.RefundBase(
-            id=refund.id,
-            transaction_id=refund.transaction_id,
-            credited_wallet_id=refund.credited_wallet_id,
-            debited_wallet_id=refund.debited_wallet_id,
-            total=refund.total,
-            creation=refund.creation,
-            seller_user_id=refund.seller_user_id,
-        )
-        for refund in result.scalars().all()
-    ]
+    async for refund in result:
+        yield _refund_model_to_schema(refund)
 
 
 async def create_refund(
@@ -822,6 +1037,152 @@ async def get_refunds_by_wallet_id(
     return [refund_model_to_schema(refund) for refund in result]
 
 
+async def get_wallet_history(
+    wallet_id: UUID,
+    db: AsyncSession,
+    start_datetime: datetime | None = None,
+    end_datetime: datetime | None = None,
+    include_transfers: bool = True,
+    limit: int | None = None,
+    before: tuple[datetime, UUID] | None = None,
+    only_name_users: bool = False,
+) -> list[schemas_mypayment.History]:
+    """
+    Return the transactions, transfers and refunds of a wallet, the most recent first.
+
+    They are merged by the database in a single UNION query, which only selects the columns needed to build the history.
+    The display name of the other wallet is joined from its store or its user, see `history_row_to_schema` for `only_name_users`.
+
+    Items are ordered by (creation, id). To paginate, `before` should be the (creation, id) of the last item of the previous page.
+    """
+    transaction = models_mypayment.Transaction
+    transfer = models_mypayment.Transfer
+    refund = models_mypayment.Refund
+
+    def filter_creation(
+        creation: InstrumentedAttribute[datetime],
+        item_id: InstrumentedAttribute[UUID],
+    ) -> ColumnElement[bool]:
+        return and_(
+            creation >= start_datetime if start_datetime else and_(True),
+            creation <= end_datetime if end_datetime else and_(True),
+            or_(
+                creation < before[0],
+                and_(creation == before[0], item_id < before[1]),
+            )
+            if before
+            else and_(True),
+        )
+
+    # Columns which do not exist for a kind of item are set to NULL. The NULL values are explicitly cast,
+    # as PostgreSQL can not infer their type when they are in multiple selects of the union
+    transactions = (
+        select(
+            transaction.id,
+            transaction.creation,
+            transaction.total,
+            case(
+                (
+                    transaction.credited_wallet_id == wallet_id,
+                    HistoryType.RECEIVED.value,
+                ),
+                else_=HistoryType.GIVEN.value,
+            ).label("type"),
+            transaction.status,
+            case(
+                (
+                    transaction.credited_wallet_id == wallet_id,
+                    transaction.debited_wallet_id,
+                ),
+                else_=transaction.credited_wallet_id,
+            ).label("other_wallet_id"),
+            cast(null(), transfer.confirmed.type).label("confirmed"),
+            refund.total.label("refund_total"),
+            refund.creation.label("refund_creation"),
+        )
+        .outerjoin(refund, refund.transaction_id == transaction.id)
+        .where(
+            or_(
+                transaction.debited_wallet_id == wallet_id,
+                transaction.credited_wallet_id == wallet_id,
+            ),
+            filter_creation(transaction.creation, transaction.id),
+        )
+    )
+    refunds = select(
+        refund.id,
+        refund.creation,
+        refund.total,
+        case(
+            (refund.debited_wallet_id == wallet_id, HistoryType.REFUND_DEBITED.value),
+            else_=HistoryType.REFUND_CREDITED.value,
+        ),
+        cast(null(), transaction.status.type),
+        case(
+            (refund.debited_wallet_id == wallet_id, refund.credited_wallet_id),
+            else_=refund.debited_wallet_id,
+        ),
+        cast(null(), transfer.confirmed.type),
+        cast(null(), refund.total.type),
+        cast(null(), refund.creation.type),
+    ).where(
+        or_(
+            refund.debited_wallet_id == wallet_id,
+            refund.credited_wallet_id == wallet_id,
+        ),
+        filter_creation(refund.creation, refund.id),
+    )
+    selects = [transactions, refunds]
+    if include_transfers:
+        selects.append(
+            select(
+                transfer.id,
+                transfer.creation,
+                transfer.total,
+                literal(HistoryType.TRANSFER.value),
+                cast(null(), transaction.status.type),
+                cast(null(), transfer.wallet_id.type),
+                transfer.confirmed,
+                cast(null(), refund.total.type),
+                cast(null(), refund.creation.type),
+            ).where(
+                transfer.wallet_id == wallet_id,
+                filter_creation(transfer.creation, transfer.id),
+            ),
+        )
+    history = union_all(*selects).subquery()
+
+    request = (
+        select(
+            history,
+            models_mypayment.Store.name.label("store_name"),
+            models_users.CoreUser.firstname,
+            models_users.CoreUser.name.label("user_name"),
+            models_users.CoreUser.nickname,
+        )
+        .outerjoin(
+            models_mypayment.Store,
+            models_mypayment.Store.wallet_id == history.c.other_wallet_id,
+        )
+        .outerjoin(
+            models_mypayment.UserPayment,
+            models_mypayment.UserPayment.wallet_id == history.c.other_wallet_id,
+        )
+        .outerjoin(
+            models_users.CoreUser,
+            models_users.CoreUser.id == models_mypayment.UserPayment.user_id,
+        )
+        .order_by(history.c.creation.desc(), history.c.id.desc())
+    )
+    if limit is not None:
+        request = request.limit(limit)
+
+    result = await db.execute(request)
+    return [
+        history_row_to_schema(row, only_name_users=only_name_users) for row in result
+    ]
+
+
 async def get_store(
     store_id: UUID,
     db: AsyncSession,
@@ -834,6 +1195,87 @@ async def get_store(
     return result.scalars().first()
 
 
+async def get_store_scan_context(
+    store_id: UUID,
+    seller_user_id: str,
+    wallet_device_id: UUID,
+    db: AsyncSession,
+) -> schemas_mypayment.StoreScanContext | None:
+    """
+    Load, in a single query, the store, the seller permissions, the wallet device, the debited wallet and its user
+    needed to bank a QR code.
+
+    Return None if the store does not exist.
+    """
+    debited_wallet_store = aliased(models_mypayment.Store)
+    today = datetime.now(UTC).date()
+    debited_user_is_member = (
+        exists()
+        .where(
+            models_memberships.CoreAssociationUserMembership.user_id
+            == models_mypayment.UserPayment.user_id,
+            models_memberships.CoreAssociationUserMembership.association_membership_id
+            == models_mypayment.Structure.association_membership_id,
+            models_memberships.CoreAssociationUserMembership.start_date <= today,
+            models_memberships.CoreAssociationUserMembership.end_date >= today,
+        )
+        .label("debited_user_is_member")
+    )
+    result = await db.execute(
+        select(
+            models_mypayment.Store.id.label("store_id"),
+            models_mypayment.Store.name.label("store_name"),
+            models_mypayment.Store.wallet_id.label("store_wallet_id"),
+            models_mypayment.Structure.association_membership_id,
+            models_mypayment.Seller.can_bank.label("seller_can_bank"),
+            models_mypayment.WalletDevice.status.label("wallet_device_status"),
+            models_mypayment.WalletDevice.ed25519_public_key.label(
+                "wallet_device_public_key",
+            ),
+            models_mypayment.Wallet.id.label("debited_wallet_id"),
+            debited_wallet_store.id.is_not(None).label("debited_wallet_is_store"),
+            models_mypayment.UserPayment.user_id.label("debited_user_id"),
+            models_mypayment.UserPayment.accepted_tos_version.label(
+                "debited_user_accepted_tos_version",
+            ),
+            debited_user_is_member,
+        )
+        .select_from(models_mypayment.Store)
+        .join(
+            models_mypayment.Structure,
+            models_mypayment.Structure.id == models_mypayment.Store.structure_id,
+        )
+        .outerjoin(
+            models_mypayment.Seller,
+            and_(
+                models_mypayment.Seller.store_id == models_mypayment.Store.id,
+                models_mypayment.Seller.user_id == seller_user_id,
+            ),
+        )
+        .outerjoin(
+            models_mypayment.WalletDevice,
+            models_mypayment.WalletDevice.id == wallet_device_id,
+        )
+        .outerjoin(
+            models_mypayment.Wallet,
+            models_mypayment.Wallet.id == models_mypayment.WalletDevice.wallet_id,
+        )
+        .outerjoin(
+            debited_wallet_store,
+            debited_wallet_store.wallet_id == models_mypayment.Wallet.id,
+        )
+        .outerjoin(
+            models_mypayment.UserPayment,
+            models_mypayment.UserPayment.wallet_id == models_mypayment.Wallet.id,
+        )
+        .where(models_mypayment.Store.id == store_id),
+    )
+    row = result.first()
+    if row is None:
+        return None
+    return schemas_mypayment.StoreScanContext.model_validate(row._asdict())
+
+
 async def create_used_qrcode(
     qr_code: schemas_mypayment.ScanInfo,
     db: AsyncSession,
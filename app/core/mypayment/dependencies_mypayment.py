@@ -1,8 +1,12 @@
+from datetime import datetime
+from uuid import UUID
+
 from fastapi import Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.mypayment.coredata_mypayment import MyPaymentBankAccountHolder
 from app.core.mypayment.cruds_mypayment import get_structure_by_id
+from app.core.mypayment.utils_mypayment import decode_history_cursor
 from app.core.users.models_users import CoreUser
 from app.dependencies import get_db, is_user
 from app.utils.tools import get_core_data
@@ -32,3 +36,19 @@ async def is_user_bank_account_holder(
             detail="User is not the bank account holder",
         )
     return user
+
+
+def get_history_cursor(cursor: str | None = None) -> tuple[datetime, UUID] | None:
+    """
+    Decode the `cursor` query parameter used to paginate wallets history.
+    Return the (creation, id) key after which the history should start.
+    """
+    if cursor is None:
+        return None
+    try:
+        return decode_history_cursor(cursor)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor",
+        ) from error
@@ -14,8 +14,10 @@ from fastapi import (
     Header,
     HTTPException,
     Query,
+    Response,
+    WebSocket,
 )
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -32,7 +34,10 @@ from app.core.mypayment import cruds_mypayment, schemas_mypayment
 from app.core.mypayment.coredata_mypayment import (
     MyPaymentBankAccountHolder,
 )
-from app.core.mypayment.dependencies_mypayment import is_user_bank_account_holder
+from app.core.mypayment.dependencies_mypayment import (
+    get_history_cursor,
+    is_user_bank_account_holder,
+)
 from app.core.mypayment.exceptions_mypayment import (
     InvoiceNotFoundAfterCreationError,
     ReferencedStructureNotFoundError,
@@ -46,7 +51,6 @@ from app.core.mypayment.integrity_mypayment import (
 )
 from app.core.mypayment.models_mypayment import Store, WalletDevice
 from app.core.mypayment.types_mypayment import (
-    HistoryType,
     TransactionStatus,
     TransactionType,
     TransferType,
@@ -55,9 +59,14 @@ from app.core.mypayment.types_mypayment import (
     WalletType,
 )
 from app.core.mypayment.utils_mypayment import (
+    INTEGRITY_CHECK_DELAY,
     LATEST_TOS,
     QRCODE_EXPIRATION,
+    can_user_subscribe_to_store,
+    encode_history_cursor,
     is_user_latest_tos_signed,
+    send_transaction_to_store_room,
+    stream_integrity_check_data,
     structure_model_to_schema,
     validate_transfer_callback,
     verify_signature,
@@ -73,8 +82,11 @@ from app.dependencies import (
     get_notification_tool,
     get_payment_tool,
     get_request_id,
+    get_session_local,
     get_settings,
     get_token_data,
+    get_unsafe_db,
+    get_websocket_connection_manager,
     is_user,
     is_user_a_school_member,
     is_user_in,
@@ -82,6 +94,8 @@ from app.dependencies import (
 from app.types import standard_responses
 from app.types.module import CoreModule
 from app.types.scopes_type import ScopeType
+from app.types.sqlalchemy import SessionLocalType
+from app.types.websocket import WebsocketConnectionManager, WebsocketRoomType
 from app.utils.auth.auth_utils import get_user_from_token_with_scopes
 from app.utils.communication.notifications import NotificationTool
 from app.utils.mail.mailworker import send_email
@@ -584,13 +598,19 @@ async def create_store(
 )
 async def get_store_history(
     store_id: UUID,
+    response: Response,
     start_date: datetime | None = None,
     end_date: datetime | None = None,
+    limit: int | None = Query(default=None, ge=1),
+    before: tuple[datetime, UUID] | None = Depends(get_history_cursor),
     db: AsyncSession = Depends(get_db),
     user: CoreUser = Depends(is_user()),
 ):
     """
-    Get all transactions for the store.
+    Get all transactions for the store, the most recent first.
+
+    If `limit` is set, at most `limit` items are returned. When more items may be available,
+    the `X-Next-Cursor` response header contains a cursor which should be passed as `cursor` to get the next page.
 
     **The user must be authorized to see the store history**
     """
@@ -615,88 +635,20 @@ async def get_store_history(
             detail="User is not authorized to see the store history",
         )
 
-    history = []
-
-    transactions = await cruds_mypayment.get_transactions_by_wallet_id(
-        wallet_id=store.wallet_id,
-        db=db,
-        start_datetime=start_date,
-        end_datetime=end_date,
-    )
-    for transaction in transactions:
-        history_refund: schemas_mypayment.HistoryRefund | None = None
-        if transaction.refund is not None:
-            history_refund = schemas_mypayment.HistoryRefund(
-                total=transaction.refund.total,
-                creation=transaction.refund.creation,
-            )
-
-        if transaction.debited_wallet_id == store.wallet_id:
-            history.append(
-                schemas_mypayment.History(
-                    id=transaction.id,
-                    type=HistoryType.GIVEN,
-                    total=transaction.total,
-                    status=transaction.status,
-                    creation=transaction.creation,
-                    other_wallet_name=transaction.credited_wallet.user.full_name
-                    if transaction.credited_wallet.user is not None
-                    else "",
-                    refund=history_refund,
-                ),
-            )
-        else:
-            history.append(
-                schemas_mypayment.History(
-                    id=transaction.id,
-                    type=HistoryType.RECEIVED,
-                    total=transaction.total,
-                    status=transaction.status,
-                    creation=transaction.creation,
-                    other_wallet_name=transaction.debited_wallet.user.full_name
-                    if transaction.debited_wallet.user is not None
-                    else "",
-                    refund=history_refund,
-                ),
-            )
-
-    # TODO: do we accept transfers to empty a store wallet?
-    transfers = await cruds_mypayment.get_transfers_by_wallet_id(
-        wallet_id=store.wallet_id,
-        db=db,
-        start_datetime=start_date,
-        end_datetime=end_date,
-    )
-    if len(transfers) > 0:
-        hyperion_error_logger.error(
-            f"Store {store.id} should never have transfers",
-        )
-
-    # We add refunds
-    refunds = await cruds_mypayment.get_refunds_by_wallet_id(
+    # Stores should never have transfers
+    history = await cruds_mypayment.get_wallet_history(
         wallet_id=store.wallet_id,
         db=db,
         start_datetime=start_date,
         end_datetime=end_date,
+        include_transfers=False,
+        limit=limit,
+        before=before,
+        # Clients which don't paginate the history expect an empty name for transactions with other stores
+        only_name_users=limit is None and before is None,
     )
-    for refund in refunds:
-        if refund.debited_wallet_id == store.wallet_id:
-            transaction_type = HistoryType.REFUND_DEBITED
-            other_wallet_info = refund.credited_wallet
-        else:
-            transaction_type = HistoryType.REFUND_CREDITED
-            other_wallet_info = refund.debited_wallet
-
-        history.append(
-            schemas_mypayment.History(
-                id=refund.id,
-                type=transaction_type,
-                other_wallet_name=other_wallet_info.owner_name or "Unknown",
-                total=refund.total,
-                creation=refund.creation,
-                status=TransactionStatus.CONFIRMED,
-            ),
-        )
+    if limit is not None and len(history) == limit:
+        response.headers["X-Next-Cursor"] = encode_history_cursor(history[-1])
 
     return history
 
@@ -1605,13 +1557,19 @@ async def revoke_user_devices(
     response_model=list[schemas_mypayment.History],
 )
 async def get_user_wallet_history(
+    response: Response,
     db: AsyncSession = Depends(get_db),
     user: CoreUser = Depends(is_user()),
     start_date: datetime | None = None,
     end_date: datetime | None = None,
+    limit: int | None = Query(default=None, ge=1),
+    before: tuple[datetime, UUID] | None = Depends(get_history_cursor),
 ):
     """
-    Get all transactions for the current user's wallet.
+    Get all transactions for the current user's wallet, the most recent first.
+
+    If `limit` is set, at most `limit` items are returned. When more items may be available,
+    the `X-Next-Cursor` response header contains a cursor which should be passed as `cursor` to get the next page.
 
     **The user must be authenticated to use this endpoint**
     """
@@ -1626,104 +1584,16 @@ async def get_user_wallet_history(
             detail="User is not registered for MyPayment",
         )
 
-    history: list[schemas_mypayment.History] = []
-
-    # First we get all received and send transactions
-    transactions = await cruds_mypayment.get_transactions_by_wallet_id(
-        wallet_id=user_payment.wallet_id,
-        db=db,
-        start_datetime=start_date,
-        end_datetime=end_date,
-    )
-
-    for transaction in transactions:
-        if transaction.credited_wallet_id == user_payment.wallet_id:
-            # The user received the transaction
-            transaction_type = HistoryType.RECEIVED
-            other_wallet = transaction.debited_wallet
-        else:
-            # The user sent the transaction
-            transaction_type = HistoryType.GIVEN
-            other_wallet = transaction.credited_wallet
-
-        # We need to find if the other wallet correspond to a store or a user to get its display name
-        if other_wallet.store is not None:
-            other_wallet_name = other_wallet.store.name
-        elif other_wallet.user is not None:
-            other_wallet_name = other_wallet.user.full_name
-        else:
-            raise UnexpectedError("Transaction has no credited or debited wallet")  # noqa: TRY003
-
-        history_refund: schemas_mypayment.HistoryRefund | None = None
-        if transaction.refund is not None:
-            history_refund = schemas_mypayment.HistoryRefund(
-                total=transaction.refund.total,
-                creation=transaction.refund.creation,
-            )
-        history.append(
-            schemas_mypayment.History(
-                id=transaction.id,
-                type=transaction_type,
-                other_wallet_name=other_wallet_name,
-                total=transaction.total,
-                creation=transaction.creation,
-                status=transaction.status,
-                refund=history_refund,
-            ),
-        )
-
-    # We also want to include transfers
-    transfers = await cruds_mypayment.get_transfers_by_wallet_id(
-        wallet_id=user_payment.wallet_id,
-        db=db,
-        start_datetime=start_date,
-        end_datetime=end_date,
-    )
-
-    for transfer in transfers:
-        if transfer.confirmed:
-            status = TransactionStatus.CONFIRMED
-        elif datetime.now(UTC) < transfer.creation + timedelta(minutes=15):
-            status = TransactionStatus.PENDING
-        else:
-            status = TransactionStatus.CANCELED
-
-        history.append(
-            schemas_mypayment.History(
-                id=transfer.id,
-                type=HistoryType.TRANSFER,
-                other_wallet_name="Transfer",
-                total=transfer.total,
-                creation=transfer.creation,
-                status=status,
-            ),
-        )
-
-    # We add refunds
-    refunds = await cruds_mypayment.get_refunds_by_wallet_id(
+    history = await cruds_mypayment.get_wallet_history(
         wallet_id=user_payment.wallet_id,
         db=db,
         start_datetime=start_date,
         end_datetime=end_date,
+        limit=limit,
+        before=before,
     )
-    for refund in refunds:
-        if refund.debited_wallet_id == user_payment.wallet_id:
-            transaction_type = HistoryType.REFUND_DEBITED
-            other_wallet_info = refund.credited_wallet
-        else:
-            transaction_type = HistoryType.REFUND_CREDITED
-            other_wallet_info = refund.debited_wallet
-
-        history.append(
-            schemas_mypayment.History(
-                id=refund.id,
-                type=transaction_type,
-                other_wallet_name=other_wallet_info.owner_name or "Unknown",
-                total=refund.total,
-                creation=refund.creation,
-                status=TransactionStatus.CONFIRMED,
-            ),
-        )
+    if limit is not None and len(history) == limit:
+        response.headers["X-Next-Cursor"] = encode_history_cursor(history[-1])
 
     return history
 
@@ -1977,11 +1847,13 @@ async def validate_can_scan_qrcode(
 async def store_scan_qrcode(
     store_id: UUID,
     scan_info: schemas_mypayment.ScanInfo,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     user: CoreUser = Depends(is_user_a_school_member),
     request_id: str = Depends(get_request_id),
     notification_tool: NotificationTool = Depends(get_notification_tool),
     settings: Settings = Depends(get_settings),
+    ws_manager: WebsocketConnectionManager = Depends(get_websocket_connection_manager),
 ):
     """
     Scan and bank a QR code for this store.
@@ -2032,48 +1904,44 @@ async def store_scan_qrcode(
     # We start a SAVEPOINT to ensure that even if the following code fails due to a database exception,
     # after roleback the `used_qrcode` will still be created and committed in db.
     async with db.begin_nested():
-        store = await cruds_mypayment.get_store(
+        # Stores queues are latency bound on this endpoint:
+        # the store, the seller, the wallet device and the debited wallet are loaded in a single query
+        context = await cruds_mypayment.get_store_scan_context(
             store_id=store_id,
+            seller_user_id=user.id,
+            wallet_device_id=scan_info.key,
             db=db,
         )
-        if store is None:
+        if context is None:
             raise HTTPException(
                 status_code=404,
                 detail="Store does not exist",
             )
 
-        seller = await cruds_mypayment.get_seller(
-            store_id=store_id,
-            user_id=user.id,
-            db=db,
-        )
-
-        if seller is None or not seller.can_bank:
+        if not context.seller_can_bank:
             raise HTTPException(
                 status_code=400,
                 detail="User does not have `can_bank` permission for this store",
             )
 
         # We verify the signature
-        debited_wallet_device = await cruds_mypayment.get_wallet_device(
-            wallet_device_id=scan_info.key,
-            db=db,
-        )
-
-        if debited_wallet_device is None:
+        if (
+            context.wallet_device_status is None
+            or context.wallet_device_public_key is None
+        ):
             raise HTTPException(
                 status_code=400,
                 detail="Wallet device does not exist",
             )
 
-        if debited_wallet_device.status != WalletDeviceStatus.ACTIVE:
+        if context.wallet_device_status != WalletDeviceStatus.ACTIVE:
             raise HTTPException(
                 status_code=400,
                 detail="Wallet device is not active",
             )
 
         if not verify_signature(
-            public_key_bytes=debited_wallet_device.ed25519_public_key,
+            public_key_bytes=context.wallet_device_public_key,
             signature=scan_info.signature,
             data=scan_info,
             wallet_device_id=scan_info.key,
@@ -2105,38 +1973,37 @@ async def store_scan_qrcode(
                 detail="QR Code is expired",
             )
 
-        # We verify that the debited walled contains enough money
-        debited_wallet = await cruds_mypayment.get_wallet(
-            wallet_id=debited_wallet_device.wallet_id,
-            db=db,
-        )
-        if debited_wallet is None:
+        debited_wallet_id = context.debited_wallet_id
+        if debited_wallet_id is None:
             hyperion_error_logger.error(
-                f"MyPayment: Could not find wallet associated with the debited wallet device {debited_wallet_device.id}, this should never happen",
+                f"MyPayment: Could not find wallet associated with the debited wallet device {scan_info.key}, this should never happen",
             )
             raise HTTPException(
                 status_code=400,
                 detail="Could not find wallet associated with the debited wallet device",
             )
-        if debited_wallet.user is None or debited_wallet.store is not None:
+        debited_user_id = context.debited_user_id
+        if debited_user_id is None or context.debited_wallet_is_store:
             raise HTTPException(
                 status_code=400,
                 detail="Stores are not allowed to make transaction by QR code",
             )
 
-        debited_user_payment = await cruds_mypayment.get_user_payment(
-            debited_wallet.user.id,
-            db=db,
-        )
-        if debited_user_payment is None or not is_user_latest_tos_signed(
-            debited_user_payment,
-        ):
+        if context.debited_user_accepted_tos_version != LATEST_TOS:
             raise HTTPException(
                 status_code=400,
                 detail="Debited user has not signed the latest TOS",
             )
 
-        if debited_wallet.balance < scan_info.tot:
+        # We lock both wallets, in a single statement and a deterministic order to prevent deadlocks.
+        # The debited wallet balance can not be modified by an other request until the end of the transaction
+        balances = await cruds_mypayment.lock_wallets_balances(
+            wallet_ids=[debited_wallet_id, context.store_wallet_id],
+            db=db,
+        )
+
+        # We verify that the debited walled contains enough money
+        if balances.get(debited_wallet_id, 0) < scan_info.tot:
             raise HTTPException(
                 status_code=400,
                 detail="Insufficient balance in the debited wallet",
@@ -2144,38 +2011,29 @@ async def store_scan_qrcode(
 
         # If `bypass_membership` is not set, we check if the user is a member of the association
         # and raise an error if not
-        if not scan_info.bypass_membership:
-            if store.structure.association_membership_id is not None:
-                current_membership = await get_user_active_membership_to_association_membership(
-                    user_id=debited_wallet.user.id,
-                    association_membership_id=store.structure.association_membership_id,
-                    db=db,
-                )
-                if current_membership is None:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="User is not a member of the association",
-                    )
-
-        # We increment the receiving wallet balance
-        await cruds_mypayment.increment_wallet_balance(
-            wallet_id=store.wallet_id,
-            amount=scan_info.tot,
-            db=db,
-        )
+        if (
+            not scan_info.bypass_membership
+            and context.association_membership_id is not None
+            and not context.debited_user_is_member
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail="User is not a member of the association",
+            )
 
-        # We decrement the debited wallet balance
-        await cruds_mypayment.increment_wallet_balance(
-            wallet_id=debited_wallet.id,
-            amount=-scan_info.tot,
+        # We decrement the debited wallet balance and increment the store wallet balance
+        await cruds_mypayment.transfer_between_wallets(
+            debited_wallet_id=debited_wallet_id,
+            credited_wallet_id=context.store_wallet_id,
+            amount=scan_info.tot,
             db=db,
         )
         transaction_id = uuid.uuid4()
         creation_date = datetime.now(UTC)
         transaction = schemas_mypayment.TransactionBase(
             id=transaction_id,
-            debited_wallet_id=debited_wallet_device.wallet_id,
-            credited_wallet_id=store.wallet_id,
+            debited_wallet_id=debited_wallet_id,
+            credited_wallet_id=context.store_wallet_id,
             transaction_type=TransactionType.DIRECT,
             seller_user_id=user.id,
             total=scan_info.tot,
@@ -2186,7 +2044,7 @@ async def store_scan_qrcode(
         # We create a transaction
         await cruds_mypayment.create_transaction(
             transaction=transaction,
-            debited_wallet_device_id=debited_wallet_device.id,
+            debited_wallet_device_id=scan_info.key,
             store_note=None,
             db=db,
         )
@@ -2199,14 +2057,21 @@ async def store_scan_qrcode(
             },
         )
         message = Message(
-            title=f"💳 Paiement - {store.name}",
+            title=f"💳 Paiement - {context.store_name}",
             content=f"Une transaction de {scan_info.tot / 100} € a été effectuée",
             action_module=settings.school.payment_name,
         )
         await notification_tool.send_notification_to_user(
-            user_id=debited_wallet.user.id,
+            user_id=debited_user_id,
             message=message,
         )
+        # Sellers following the store live are notified once the transaction is committed
+        background_tasks.add_task(
+            send_transaction_to_store_room,
+            transaction=transaction,
+            store_id=store_id,
+            ws_manager=ws_manager,
+        )
         return transaction
 
 
@@ -2355,16 +2220,16 @@ async def refund_transaction(
         db=db,
     )
 
-    # We add the amount to the wallet that was previously debited
-    await cruds_mypayment.increment_wallet_balance(
-        wallet_id=wallet_previously_debited.id,
-        amount=refund_amount,
+    # We lock both wallets in the same order as store scans, to prevent deadlocks,
+    # then add the amount to the wallet that was previously debited
+    await cruds_mypayment.lock_wallets_balances(
+        wallet_ids=[wallet_previously_debited.id, wallet_previously_credited.id],
         db=db,
     )
-
-    await cruds_mypayment.increment_wallet_balance(
-        wallet_id=wallet_previously_credited.id,
-        amount=-refund_amount,
+    await cruds_mypayment.transfer_between_wallets(
+        debited_wallet_id=wallet_previously_credited.id,
+        credited_wallet_id=wallet_previously_debited.id,
+        amount=refund_amount,
         db=db,
     )
 
@@ -2507,15 +2372,15 @@ async def cancel_transaction(
         db=db,
     )
 
-    await cruds_mypayment.increment_wallet_balance(
-        wallet_id=transaction.debited_wallet_id,
-        amount=transaction.total,
+    # We lock both wallets in the same order as store scans, to prevent deadlocks
+    await cruds_mypayment.lock_wallets_balances(
+        wallet_ids=[transaction.debited_wallet_id, transaction.credited_wallet_id],
         db=db,
     )
-
-    await cruds_mypayment.increment_wallet_balance(
-        wallet_id=transaction.credited_wallet_id,
-        amount=-transaction.total,
+    await cruds_mypayment.transfer_between_wallets(
+        debited_wallet_id=transaction.credited_wallet_id,
+        credited_wallet_id=transaction.debited_wallet_id,
+        amount=transaction.total,
         db=db,
     )
 
@@ -2899,6 +2764,7 @@ async def aknowledge_invoice_as_received(
         invoice_id=invoice.id,
         db=db,
     )
+    stores: list[Store] = []
     for detail in invoice.details:
         store = await cruds_mypayment.get_store(
             store_id=detail.store_id,
@@ -2912,6 +2778,14 @@ async def aknowledge_invoice_as_received(
                 status_code=500,
                 detail="Could not find store associated with the invoice",
             )
+        stores.append(store)
+
+    # All store wallets are locked at once, in the same order as store scans, to prevent deadlocks
+    await cruds_mypayment.lock_wallets_balances(
+        wallet_ids=[store.wallet_id for store in stores],
+        db=db,
+    )
+    for detail, store in zip(invoice.details, stores, strict=True):
         await cruds_mypayment.increment_wallet_balance(
             wallet_id=store.wallet_id,
             amount=-detail.total,
@@ -2983,6 +2857,7 @@ async def get_data_for_integrity_check(
     headers: schemas_mypayment.IntegrityCheckHeaders = Header(),
     query_params: schemas_mypayment.IntegrityCheckQuery = Query(),
     db: AsyncSession = Depends(get_db),
+    session_local: SessionLocalType = Depends(get_session_local),
     settings: Settings = Depends(get_settings),
 ):
     """
@@ -2993,6 +2868,9 @@ async def get_data_for_integrity_check(
     - Transfers
     - Refunds
 
+    If `stream` is true, the same data is streamed as it is read from the database,
+    which allows to retrieve large datasets without the server holding them in memory.
+
     **The header must contain the MYPAYMENT_DATA_VERIFIER_ACCESS_TOKEN defined in the settings in the `x-data-verifier-token` field**
     """
     if settings.MYPAYMENT_DATA_VERIFIER_ACCESS_TOKEN is None:
@@ -3010,33 +2888,31 @@ async def get_data_for_integrity_check(
             detail="Access denied",
         )
 
+    if query_params.stream:
+        return StreamingResponse(
+            stream_integrity_check_data(
+                session_local=session_local,
+                last_checked=query_params.lastChecked,
+                is_initialisation=query_params.isInitialisation,
+            ),
+            media_type="application/json",
+        )
+
     now = await cruds_core.start_isolation_mode(db)
     # We use a 30 seconds delay to avoid unstable transactions
     # as they can be canceled during the 30 seconds after their creation
-    security_now = now - timedelta(seconds=30)
+    security_now = now - INTEGRITY_CHECK_DELAY
 
     wallets = await cruds_mypayment.get_wallets(
         db=db,
     )
-    to_substract_transactions = await cruds_mypayment.get_transactions(
+    balance_changes = await cruds_mypayment.get_wallets_balance_changes(
         db=db,
         start_date=security_now,
-        exclude_canceled=True,
     )
     # We substract the transactions that are not older than 30 seconds
-    for transaction in to_substract_transactions:
-        debited_wallet = next(
-            (w for w in wallets if w.id == transaction.debited_wallet_id),
-            None,
-        )
-        credited_wallet = next(
-            (w for w in wallets if w.id == transaction.credited_wallet_id),
-            None,
-        )
-        if debited_wallet is not None:
-            debited_wallet.balance += transaction.total
-        if credited_wallet is not None:
-            credited_wallet.balance -= transaction.total
+    for wallet in wallets:
+        wallet.balance -= balance_changes.get(wallet.id, 0)
 
     if query_params.isInitialisation:
         return schemas_mypayment.IntegrityCheckData(
@@ -3067,3 +2943,25 @@ async def get_data_for_integrity_check(
         transfers=transfers,
         refunds=refunds,
     )
+
+
+@router.websocket("/mypayment/ws")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    ws_manager: WebsocketConnectionManager = Depends(get_websocket_connection_manager),
+    db: AsyncSession = Depends(get_unsafe_db),
+    settings: Settings = Depends(get_settings),
+):
+    """
+    Websocket sending live updates of MyPayment.
+
+    Sellers who can see the history of a store can subscribe to its new transactions, with the room type `mypayment_store`.
+    """
+    await ws_manager.manage_websocket(
+        websocket=websocket,
+        settings=settings,
+        room_authorizers={
+            WebsocketRoomType.mypayment_store: can_user_subscribe_to_store,
+        },
+        db=db,
+    )
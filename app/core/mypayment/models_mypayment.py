@@ -1,7 +1,7 @@
 from datetime import datetime
 from uuid import UUID
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.core.memberships import models_memberships
@@ -46,6 +46,19 @@ class WalletDevice(Base):
 
 class Transaction(Base):
     __tablename__ = "mypayment_transaction"
+    # Used to retrieve wallets history, ordered by creation
+    __table_args__ = (
+        Index(
+            "ix_mypayment_transaction_debited_wallet_id_creation",
+            "debited_wallet_id",
+            "creation",
+        ),
+        Index(
+            "ix_mypayment_transaction_credited_wallet_id_creation",
+            "credited_wallet_id",
+            "creation",
+        ),
+    )
 
     id: Mapped[PrimaryKey]
     debited_wallet_id: Mapped[UUID] = mapped_column(ForeignKey("mypayment_wallet.id"))
@@ -89,6 +102,19 @@ class Transaction(Base):
 
 class Refund(Base):
     __tablename__ = "mypayment_refund"
+    # Used to retrieve wallets history, ordered by creation
+    __table_args__ = (
+        Index(
+            "ix_mypayment_refund_debited_wallet_id_creation",
+            "debited_wallet_id",
+            "creation",
+        ),
+        Index(
+            "ix_mypayment_refund_credited_wallet_id_creation",
+            "credited_wallet_id",
+            "creation",
+        ),
+    )
 
     id: Mapped[PrimaryKey]
     transaction_id: Mapped[UUID] = mapped_column(
@@ -193,6 +219,14 @@ class Request(Base):
 
 class Transfer(Base):
     __tablename__ = "mypayment_transfer"
+    # Used to retrieve wallets history, ordered by creation
+    __table_args__ = (
+        Index(
+            "ix_mypayment_transfer_wallet_id_creation",
+            "wallet_id",
+            "creation",
+        ),
+    )
 
     id: Mapped[PrimaryKey]
     type: Mapped[TransferType]
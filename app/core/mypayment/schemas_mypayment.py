@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Literal
 from uuid import UUID
 
 from pydantic import (
@@ -17,6 +18,7 @@ from app.core.mypayment.types_mypayment import (
     WalletType,
 )
 from app.core.users import schemas_users
+from app.types.websocket import WSMessageModel
 
 
 class StructureBase(BaseModel):
@@ -187,6 +189,28 @@ class ScanInfo(QRCodeContentData):
     bypass_membership: bool = False
 
 
+class StoreScanContext(BaseModel):
+    """
+    Data needed to bank a QR code for a store, loaded in a single query.
+
+    Fields related to the seller, the wallet device or the debited wallet are None if they do not exist.
+    """
+
+    store_id: UUID
+    store_name: str
+    store_wallet_id: UUID
+    association_membership_id: UUID | None
+    seller_can_bank: bool | None
+    wallet_device_status: WalletDeviceStatus | None
+    wallet_device_public_key: bytes | None
+    debited_wallet_id: UUID | None
+    debited_wallet_is_store: bool
+    debited_user_id: str | None
+    debited_user_accepted_tos_version: int | None
+    # If the debited user has an active membership to the store's association membership
+    debited_user_is_member: bool
+
+
 class WalletBase(BaseModel):
     id: UUID
     type: WalletType
@@ -240,6 +264,11 @@ class Transaction(TransactionBase):
     refund: "RefundBase | None" = None
 
 
+class NewTransactionWSMessageModel(WSMessageModel):
+    command: Literal["NEW_TRANSACTION"] = "NEW_TRANSACTION"
+    data: TransactionBase
+
+
 class Transfer(BaseModel):
     id: UUID
     type: TransferType
@@ -277,6 +306,8 @@ class IntegrityCheckHeaders(BaseModel):
 class IntegrityCheckQuery(BaseModel):
     lastChecked: datetime | None = None
     isInitialisation: bool = False
+    # Stream the response instead of building it in memory
+    stream: bool = False
 
 
 class IntegrityCheckData(BaseModel):
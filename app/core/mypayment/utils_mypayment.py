@@ -1,12 +1,18 @@
 import base64
 import logging
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+from typing import Any
 from uuid import UUID
 
 from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.primitives.asymmetric import ed25519
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.checkout import schemas_checkout
+from app.core.core_endpoints import cruds_core
 from app.core.memberships import schemas_memberships
 from app.core.mypayment import cruds_mypayment, models_mypayment, schemas_mypayment
 from app.core.mypayment.integrity_mypayment import format_transfer_log
@@ -15,11 +21,19 @@ from app.core.mypayment.schemas_mypayment import (
     QRCodeContentData,
 )
 from app.core.mypayment.types_mypayment import (
+    HistoryType,
+    TransactionStatus,
     TransferAlreadyConfirmedInCallbackError,
     TransferNotFoundByCallbackError,
     TransferTotalDontMatchInCallbackError,
 )
-from app.core.users import schemas_users
+from app.core.users import models_users, schemas_users
+from app.types.sqlalchemy import SessionLocalType
+from app.types.websocket import (
+    WebsocketConnectionManager,
+    WebsocketRoomType,
+    get_room_id,
+)
 
 hyperion_security_logger = logging.getLogger("hyperion.security")
 hyperion_mypayment_logger = logging.getLogger("hyperion.mypayment")
@@ -29,6 +43,11 @@ LATEST_TOS = 2
 QRCODE_EXPIRATION = 5  # minutes
 MYPAYMENT_LOGS_S3_SUBFOLDER = "logs"
 RETENTION_DURATION = 10 * 365  # 10 years in days
+# Transactions can be canceled during the 30 seconds after their creation,
+# they are not sent for integrity check before this delay
+INTEGRITY_CHECK_DELAY = timedelta(seconds=30)
+# Users have 15 minutes to complete the HelloAsso checkout of a transfer
+TRANSFER_EXPIRATION = timedelta(minutes=15)
 
 
 def verify_signature(
@@ -62,6 +81,46 @@ def verify_signature(
     return True
 
 
+async def can_user_subscribe_to_store(
+    user: models_users.CoreUser,
+    entity_id: str,
+    db: AsyncSession,
+) -> bool:
+    """
+    Only sellers who can see the history of a store can subscribe to its transactions
+    """
+    try:
+        store_id = UUID(entity_id)
+    except ValueError:
+        return False
+    seller = await cruds_mypayment.get_seller(
+        user_id=user.id,
+        store_id=store_id,
+        db=db,
+    )
+    return seller is not None and seller.can_see_history
+
+
+async def send_transaction_to_store_room(
+    transaction: schemas_mypayment.TransactionBase,
+    store_id: UUID,
+    ws_manager: WebsocketConnectionManager,
+) -> None:
+    """
+    Send a new transaction to the sellers who subscribed to the store. This function should be called once the transaction was committed.
+    """
+    room_id = get_room_id(WebsocketRoomType.mypayment_store, store_id)
+    try:
+        await ws_manager.send_message_to_room(
+            message=schemas_mypayment.NewTransactionWSMessageModel(data=transaction),
+            room_id=room_id,
+        )
+    except Exception:
+        hyperion_error_logger.exception(
+            f"Error while sending a message to the room {room_id}",
+        )
+
+
 def is_user_latest_tos_signed(
     user_payment: UserPayment,
 ) -> bool:
@@ -203,6 +262,89 @@ def refund_model_to_schema(
     )
 
 
+def history_row_to_schema(
+    row: Row[Any],
+    only_name_users: bool = False,
+) -> schemas_mypayment.History:
+    """
+    Convert a row returned by `cruds_mypayment.get_wallet_history` to a schema.
+
+    If `only_name_users` is True, transactions with a wallet which does not belong to a user get an empty name,
+    as in the store history returned before it could be paginated.
+    """
+    history_type = HistoryType(row.type)
+
+    # The other wallet may belong to a store or a user
+    if (
+        only_name_users
+        and row.firstname is None
+        and history_type in (HistoryType.GIVEN, HistoryType.RECEIVED)
+    ):
+        other_wallet_name = ""
+    elif row.store_name is not None:
+        other_wallet_name = row.store_name
+    elif row.firstname is not None:
+        other_wallet_name = (
+            f"{row.firstname} {row.user_name} ({row.nickname})"
+            if row.nickname
+            else f"{row.firstname} {row.user_name}"
+        )
+    elif history_type == HistoryType.TRANSFER:
+        other_wallet_name = "Transfer"
+    else:
+        other_wallet_name = "Unknown"
+
+    if history_type == HistoryType.TRANSFER:
+        if row.confirmed:
+            status = TransactionStatus.CONFIRMED
+        elif datetime.now(UTC) < row.creation + TRANSFER_EXPIRATION:
+            status = TransactionStatus.PENDING
+        else:
+            status = TransactionStatus.CANCELED
+    elif history_type in (HistoryType.REFUND_CREDITED, HistoryType.REFUND_DEBITED):
+        status = TransactionStatus.CONFIRMED
+    else:
+        status = row.status
+
+    return schemas_mypayment.History(
+        id=row.id,
+        type=history_type,
+        other_wallet_name=other_wallet_name,
+        total=row.total,
+        creation=row.creation,
+        status=status,
+        refund=schemas_mypayment.HistoryRefund(
+            total=row.refund_total,
+            creation=row.refund_creation,
+        )
+        if row.refund_total is not None
+        else None,
+    )
+
+
+def encode_history_cursor(history: schemas_mypayment.History) -> str:
+    """
+    Return an opaque cursor pointing after `history`, to request the next page of a wallet history
+    """
+    return base64.urlsafe_b64encode(
+        f"{history.creation.isoformat()}|{history.id}".encode(),
+    ).decode()
+
+
+def decode_history_cursor(cursor: str) -> tuple[datetime, UUID]:
+    """
+    Return the (creation, id) key encoded in a cursor.
+
+    Raise a `ValueError` if the cursor is invalid.
+    """
+    # Decoding errors are subclasses of `ValueError`
+    creation, history_id = base64.urlsafe_b64decode(cursor).decode().split("|")
+    creation_datetime = datetime.fromisoformat(creation)
+    if creation_datetime.tzinfo is None:
+        raise ValueError(cursor)
+    return creation_datetime, UUID(history_id)
+
+
 def invoice_model_to_schema(
     invoice: models_mypayment.Invoice,
 ) -> schemas_mypayment.Invoice:
@@ -236,3 +378,72 @@ def invoice_model_to_schema(
             for detail in invoice.details
         ],
     )
+
+
+async def stream_integrity_check_data(
+    session_local: SessionLocalType,
+    last_checked: datetime | None,
+    is_initialisation: bool,
+    flush_size: int = 65536,
+) -> AsyncIterator[bytes]:
+    """
+    Stream the JSON serialization of `IntegrityCheckData`.
+
+    Rows are fetched from the database in batches and sent as soon as they are serialized,
+    thus the dataset is never held in memory as a whole.
+    The response is sent after the request dependencies exited: the database session has to be opened here.
+    """
+    async with session_local() as db:
+        now = await cruds_core.start_isolation_mode(db)
+        security_now = now - INTEGRITY_CHECK_DELAY
+        balance_changes = await cruds_mypayment.get_wallets_balance_changes(
+            db=db,
+            start_date=security_now,
+        )
+
+        async def adjusted_wallets() -> AsyncIterator[schemas_mypayment.WalletBase]:
+            async for wallet in cruds_mypayment.stream_wallets(db=db):
+                # We substract the transactions that are not older than the integrity check delay
+                wallet.balance -= balance_changes.get(wallet.id, 0)
+                yield wallet
+
+        sections: list[tuple[str, AsyncIterator[BaseModel]]] = [
+            ("wallets", adjusted_wallets()),
+        ]
+        if not is_initialisation:
+            sections += [
+                (
+                    "transactions",
+                    cruds_mypayment.stream_transactions(
+                        db=db,
+                        start_date=last_checked,
+                        end_date=security_now,
+                    ),
+                ),
+                (
+                    "transfers",
+                    cruds_mypayment.stream_transfers(db=db, last_checked=last_checked),
+                ),
+                (
+                    "refunds",
+                    cruds_mypayment.stream_refunds(db=db, last_checked=last_checked),
+                ),
+            ]
+
+        chunk = bytearray(b'{"date":')
+        chunk += TypeAdapter(datetime).dump_json(security_now)
+        for name, items in sections:
+            chunk += f',"{name}":['.encode()
+            separator = b""
+            async for item in items:
+                chunk += separator
+                chunk += item.model_dump_json().encode()
+                separator = b","
+                if len(chunk) >= flush_size:
+                    yield bytes(chunk)
+                    chunk.clear()
+            chunk += b"]"
+        if is_initialisation:
+            chunk += b',"transactions":[],"transfers":[],"refunds":[]'
+        chunk += b"}"
+        yield bytes(chunk)
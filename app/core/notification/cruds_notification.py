@@ -1,11 +1,13 @@
 from collections.abc import Sequence
-from datetime import date
+from datetime import date, datetime
 from uuid import UUID
 
-from sqlalchemy import delete, select, update
+from sqlalchemy import delete, exists, insert, literal, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.groups import models_groups
 from app.core.notification import models_notification
+from app.core.users import models_users
 
 
 async def get_notification_topic(
@@ -252,3 +254,120 @@ async def get_firebase_tokens_by_user_ids(
         ),
     )
     return list(result.scalars().all())
+
+
+async def get_firebase_devices_by_user_ids(
+    user_ids: list[str],
+    db: AsyncSession,
+) -> Sequence[models_notification.FirebaseDevice]:
+    result = await db.execute(
+        select(models_notification.FirebaseDevice).where(
+            models_notification.FirebaseDevice.user_id.in_(user_ids),
+        ),
+    )
+    return result.scalars().all()
+
+
+async def create_notification_outbox_messages(
+    outbox_messages: list[models_notification.NotificationOutboxMessage],
+    db: AsyncSession,
+) -> None:
+    db.add_all(outbox_messages)
+    await db.flush()
+
+
+async def get_notification_outbox_messages_to_send(
+    now: datetime,
+    limit: int,
+    db: AsyncSession,
+) -> Sequence[models_notification.NotificationOutboxMessage]:
+    """
+    Return the oldest messages that should be sent.
+
+    Selected messages are locked until the end of the transaction. Messages already locked by another dispatcher are skipped.
+    """
+    result = await db.execute(
+        select(models_notification.NotificationOutboxMessage)
+        .where(models_notification.NotificationOutboxMessage.next_attempt <= now)
+        .order_by(models_notification.NotificationOutboxMessage.next_attempt)
+        .limit(limit)
+        .with_for_update(skip_locked=True),
+    )
+    return result.scalars().all()
+
+
+async def delete_notification_outbox_messages(
+    outbox_message_ids: list[UUID],
+    db: AsyncSession,
+) -> None:
+    await db.execute(
+        delete(models_notification.NotificationOutboxMessage).where(
+            models_notification.NotificationOutboxMessage.id.in_(outbox_message_ids),
+        ),
+    )
+
+
+async def postpone_notification_outbox_messages(
+    outbox_message_ids: list[UUID],
+    next_attempt: datetime,
+    db: AsyncSession,
+) -> None:
+    await db.execute(
+        update(models_notification.NotificationOutboxMessage)
+        .where(
+            models_notification.NotificationOutboxMessage.id.in_(outbox_message_ids),
+        )
+        .values(
+            attempts=models_notification.NotificationOutboxMessage.attempts + 1,
+            next_attempt=next_attempt,
+        ),
+    )
+
+
+async def create_topic_memberships_for_all_users(
+    topic_id: UUID,
+    group_id: str | None,
+    db: AsyncSession,
+) -> None:
+    """
+    Subscribe all users, or all members of `group_id`, to the topic using a single INSERT ... SELECT query.
+    Existing memberships are skipped.
+    """
+    users_query = select(
+        models_users.CoreUser.id,
+        literal(topic_id, models_notification.TopicMembership.topic_id.type),
+    ).where(
+        ~exists().where(
+            models_notification.TopicMembership.topic_id == topic_id,
+            models_notification.TopicMembership.user_id == models_users.CoreUser.id,
+        ),
+    )
+    if group_id is not None:
+        users_query = users_query.where(
+            exists().where(
+                models_groups.CoreMembership.group_id == group_id,
+                models_groups.CoreMembership.user_id == models_users.CoreUser.id,
+            ),
+        )
+    await db.execute(
+        insert(models_notification.TopicMembership).from_select(
+            ["user_id", "topic_id"],
+            users_query,
+        ),
+    )
+
+
+async def get_firebase_tokens_by_topic_id(
+    topic_id: UUID,
+    db: AsyncSession,
+) -> list[str]:
+    result = await db.execute(
+        select(models_notification.FirebaseDevice.firebase_device_token)
+        .join(
+            models_notification.TopicMembership,
+            models_notification.TopicMembership.user_id
+            == models_notification.FirebaseDevice.user_id,
+        )
+        .where(models_notification.TopicMembership.topic_id == topic_id),
+    )
+    return list(result.scalars().all())
@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime
 from uuid import UUID
 
 from sqlalchemy import ForeignKey
@@ -49,3 +49,25 @@ class TopicMembership(Base):
         ForeignKey("notification_topic.id"),
         primary_key=True,
     )
+
+
+class NotificationOutboxMessage(Base):
+    """
+    A notification waiting to be sent to a user.
+
+    Messages are added in the same transaction as the change they notify about, and sent by the scheduler.
+    A notification is thus never sent for a rolled back change, and is not lost if the server restarts.
+    """
+
+    __tablename__ = "notification_outbox"
+
+    id: Mapped[PrimaryKey]
+    user_id: Mapped[str] = mapped_column(ForeignKey("core_user.id"))
+    title: Mapped[str | None]
+    content: Mapped[str | None]
+    action_module: Mapped[str]
+    creation: Mapped[datetime]
+
+    # Failed messages are retried with an exponential backoff
+    attempts: Mapped[int]
+    next_attempt: Mapped[datetime] = mapped_column(index=True)
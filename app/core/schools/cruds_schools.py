@@ -7,6 +7,7 @@ from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.schools import models_schools, schemas_schools
+from app.core.users.cache_users import authenticated_users_cache
 
 
 async def get_schools(db: AsyncSession) -> Sequence[models_schools.CoreSchool]:
@@ -86,3 +87,5 @@ async def update_school(
         .values(**school_update.model_dump(exclude_none=True)),
     )
     await db.flush()
+    # Cached users contain their school
+    authenticated_users_cache.clear_after_commit(db)
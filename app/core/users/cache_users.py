@@ -0,0 +1,88 @@
+"""
+Per-worker cache of the users making authenticated requests.
+
+Authenticating a request used to load the user, its groups and its school before the endpoint could even check the user permissions.
+The cache keeps, for a few seconds, the columns of the recently authenticated users with their groups and school.
+A cached user is attached to the request session using `Session.merge(load=False)`, which does not emit any SQL query:
+endpoints receive a persistent `CoreUser`, as if it had been loaded from the database.
+
+Writes changing users, memberships, groups or schools invalidate the cache of the current worker, see `TTLCache`.
+"""
+
+from typing import Any, NamedTuple, TypeVar
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.groups.models_groups import CoreGroup
+from app.core.schools.models_schools import CoreSchool
+from app.core.users.models_users import CoreUser
+from app.types.sqlalchemy import Base
+from app.utils.cache import TTLCache
+
+ModelType = TypeVar("ModelType", bound=Base)
+
+
+class CachedUser(NamedTuple):
+    user: dict[str, Any]
+    groups: list[dict[str, Any]]
+    school: dict[str, Any]
+
+
+def get_column_values(instance: Base) -> dict[str, Any]:
+    return {
+        attribute.key: getattr(instance, attribute.key)
+        for attribute in inspect(instance).mapper.column_attrs
+    }
+
+
+def make_detached_instance(model: type[ModelType], values: dict[str, Any]) -> ModelType:
+    """
+    Create a detached instance of `model` from its column values, without calling its constructor
+    """
+    instance: ModelType = model.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(instance, key, value)
+    make_transient_to_detached(instance)
+    return instance
+
+
+class AuthenticatedUsersCache(TTLCache[str, CachedUser]):
+    def set_user(self, user: CoreUser, generation: int) -> None:
+        """
+        Cache `user`, which should have been loaded with its groups and school.
+
+        `generation` is the value of `self.generation` before the user was loaded.
+        """
+        self.set(
+            key=user.id,
+            value=CachedUser(
+                user=get_column_values(user),
+                groups=[get_column_values(group) for group in user.groups],
+                school=get_column_values(user.school),
+            ),
+            generation=generation,
+        )
+
+    async def attach(self, db: AsyncSession, cached_user: CachedUser) -> CoreUser:
+        """
+        Return a persistent user, attached to `db`, built from a cache entry. No query is made to the database.
+        """
+        user = make_detached_instance(CoreUser, cached_user.user)
+        set_committed_value(
+            user,
+            "groups",
+            [make_detached_instance(CoreGroup, group) for group in cached_user.groups],
+        )
+        set_committed_value(
+            user,
+            "school",
+            make_detached_instance(CoreSchool, cached_user.school),
+        )
+        return await db.merge(user, load=False)
+
+
+# The cache should be accessible from the cruds, which invalidate it, thus it can not live in the global state
+authenticated_users_cache = AuthenticatedUsersCache()
@@ -12,6 +12,7 @@ from app.core.groups import models_groups
 from app.core.groups.groups_type import AccountType
 from app.core.schools.schools_type import SchoolType
 from app.core.users import models_users, schemas_users
+from app.core.users.cache_users import authenticated_users_cache
 
 
 async def count_users(db: AsyncSession) -> int:
@@ -33,11 +34,13 @@ async def get_users(
     included_groups: list[str] | None = None,
     excluded_groups: list[str] | None = None,
     schools_ids: list[UUID] | None = None,
+    users_ids: list[str] | None = None,
 ) -> Sequence[models_users.CoreUser]:
     """
     Return all users from database.
 
     Parameters `excluded_account_types` and `excluded_groups` can be used to filter results.
+    Parameter `users_ids` can be used to restrict the results to a given set of users.
     """
     included_account_types = included_account_types or None
     excluded_account_types = excluded_account_types or []
@@ -91,6 +94,9 @@ async def get_users(
         if schools_ids
         else and_(True)
     )
+    users_ids_condition = (
+        models_users.CoreUser.id.in_(users_ids) if users_ids is not None else and_(True)
+    )
 
     result = await db.execute(
         select(models_users.CoreUser).where(
@@ -101,12 +107,58 @@ async def get_users(
                 *excluded_account_type_condition,
                 *excluded_group_condition,
                 school_condition,
+                users_ids_condition,
             ),
         ),
     )
     return result.scalars().all()
 
 
+async def get_users_search_entries(
+    db: AsyncSession,
+    users_ids: list[str] | None = None,
+) -> Sequence[tuple[str, str, str, str | None, AccountType]]:
+    """
+    Return the columns needed to index users for the search: id, firstname, name, nickname and account type.
+
+    Only these columns are selected, without loading groups and school relationships.
+    """
+    result = await db.execute(
+        select(
+            models_users.CoreUser.id,
+            models_users.CoreUser.firstname,
+            models_users.CoreUser.name,
+            models_users.CoreUser.nickname,
+            models_users.CoreUser.account_type,
+        ).where(
+            models_users.CoreUser.id.in_(users_ids)
+            if users_ids is not None
+            else and_(True),
+        ),
+    )
+    return result.tuples().all()
+
+
+async def get_users_memberships(
+    db: AsyncSession,
+    users_ids: list[str] | None = None,
+) -> Sequence[tuple[str, str]]:
+    """
+    Return all `(user_id, group_id)` memberships, optionally restricted to the given users
+    """
+    result = await db.execute(
+        select(
+            models_groups.CoreMembership.user_id,
+            models_groups.CoreMembership.group_id,
+        ).where(
+            models_groups.CoreMembership.user_id.in_(users_ids)
+            if users_ids is not None
+            else and_(True),
+        ),
+    )
+    return result.tuples().all()
+
+
 async def get_user_by_id(
     db: AsyncSession,
     user_id: str,
@@ -152,6 +204,7 @@ async def update_user(
         .where(models_users.CoreUser.id == user_id)
         .values(**user_update.model_dump(exclude_none=True)),
     )
+    authenticated_users_cache.invalidate_after_commit(db, user_id)
 
 
 async def update_user_as_super_admin(
@@ -165,6 +218,7 @@ async def update_user_as_super_admin(
         .where(models_users.CoreUser.id == user_id)
         .values(is_super_admin=True),
     )
+    authenticated_users_cache.invalidate_after_commit(db, user_id)
 
 
 async def create_unconfirmed_user(
@@ -219,6 +273,7 @@ async def delete_user(db: AsyncSession, user_id: str):
         delete(models_users.CoreUser).where(models_users.CoreUser.id == user_id),
     )
     await db.flush()
+    authenticated_users_cache.invalidate_after_commit(db, user_id)
 
 
 async def create_user_recover_request(
@@ -336,6 +391,7 @@ async def update_user_password_by_id(
         .values(password_hash=new_password_hash),
     )
     await db.flush()
+    authenticated_users_cache.invalidate_after_commit(db, user_id)
 
 
 async def remove_users_from_school(
@@ -352,6 +408,7 @@ async def remove_users_from_school(
             account_type=AccountType.external,
         ),
     )
+    authenticated_users_cache.clear_after_commit(db)
 
 
 async def fusion_users(
@@ -473,3 +530,5 @@ async def fusion_users(
 
     # Delete the user_deleted
     await delete_user(db, user_deleted_id)
+    # The kept user may have been added to the groups of the deleted user
+    authenticated_users_cache.invalidate_after_commit(db, user_kept_id)
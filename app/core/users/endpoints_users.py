@@ -27,6 +27,7 @@ from app.core.notification.utils_notification import get_user_notification_topic
 from app.core.schools.schools_type import SchoolType
 from app.core.users import cruds_users, models_users, schemas_users
 from app.core.users.factory_users import CoreUsersFactory
+from app.core.users.search_users import UserSearchIndex
 from app.core.users.tools_users import get_account_type_and_school_id_from_email
 from app.core.utils import security
 from app.core.utils.config import Settings
@@ -34,15 +35,18 @@ from app.dependencies import (
     get_db,
     get_mail_templates,
     get_notification_manager,
+    get_password_hasher,
     get_request_id,
     get_settings,
+    get_user_search_index,
     is_user,
     is_user_a_school_member,
     is_user_in,
     is_user_super_admin,
+    rate_limit,
 )
 from app.types import standard_responses
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.exceptions import UserWithEmailAlreadyExistError
 from app.types.module import CoreModule
 from app.types.s3_access import S3Access
@@ -52,7 +56,6 @@ from app.utils.tools import (
     create_and_send_email_migration,
     get_file_from_data,
     save_file_as_data,
-    sort_user,
 )
 
 router = APIRouter(tags=["Users"])
@@ -123,6 +126,7 @@ async def search_users(
     excludedGroups: list[str] = Query(default=[]),
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_school_member),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
 ):
     """
     Search for a user using Jaro_Winkler distance algorithm.
@@ -132,15 +136,28 @@ async def search_users(
     **The user must be authenticated to use this endpoint**
     """
 
+    users_ids = await user_search_index.search(
+        db=db,
+        query=string.capwords(query),
+        included_account_types=includedAccountTypes,
+        excluded_account_types=excludedAccountTypes,
+        included_groups=includedGroups,
+        excluded_groups=excludedGroups,
+    )
+
+    # The index of the worker may be out of date,
+    # we only return users that still exist and match the filters
     users = await cruds_users.get_users(
         db,
         included_account_types=includedAccountTypes,
         excluded_account_types=excludedAccountTypes,
         included_groups=includedGroups,
         excluded_groups=excludedGroups,
+        users_ids=users_ids,
     )
+    users_by_id = {user.id: user for user in users}
 
-    return sort_user(string.capwords(query), users)
+    return [users_by_id[user_id] for user_id in users_ids if user_id in users_by_id]
 
 
 @router.get(
@@ -180,6 +197,7 @@ async def read_current_user(
     "/users/create",
     response_model=standard_responses.Result,
     status_code=201,
+    dependencies=[Depends(rate_limit(limit=10, window=60))],
 )
 async def create_user_by_user(
     user_create: schemas_users.CoreUserCreateRequest,
@@ -455,6 +473,8 @@ async def activate_user(
     request_id: str = Depends(get_request_id),
     settings: Settings = Depends(get_settings),
     notification_manager: NotificationManager = Depends(get_notification_manager),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
+    password_hasher: security.PasswordHasher = Depends(get_password_hasher),
 ):
     """
     Activate the previously created account.
@@ -499,7 +519,7 @@ async def activate_user(
         settings=settings,
     )
     # A password should have been provided
-    password_hash = security.get_password_hash(user.password)
+    password_hash = await password_hasher.get_password_hash(user.password)
 
     nb_user = await cruds_users.count_users(db=db)
     is_super_admin = False
@@ -545,6 +565,8 @@ async def activate_user(
             ),
         )
 
+    await user_search_index.refresh_user_after_commit(db=db, user_id=confirmed_user.id)
+
     hyperion_security_logger.info(
         f"Activate_user: Activated user {confirmed_user.id} (email: {confirmed_user.email}) ({request_id})",
     )
@@ -616,6 +638,7 @@ async def init_s3_for_users(
     "/users/recover",
     response_model=standard_responses.Result,
     status_code=201,
+    dependencies=[Depends(rate_limit(limit=10, window=60))],
 )
 async def recover_user(
     # We use embed for email parameter: https://fastapi.tiangolo.com/tutorial/body-multiple-params/#embed-a-single-body-parameter
@@ -644,7 +667,7 @@ async def recover_user(
             mail = mail_templates.get_mail_reset_password_account_does_not_exist(
                 register_url=calypsso_register_url,
             )
-            send_email(
+            await send_email(
                 recipient=email,
                 subject=f"{settings.school.application_name} - reset your password",
                 content=mail,
@@ -682,7 +705,7 @@ async def recover_user(
             mail = mail_templates.get_mail_reset_password(
                 confirmation_url=calypsso_reset_url,
             )
-            send_email(
+            await send_email(
                 recipient=db_user.email,
                 subject=f"{settings.school.application_name} - reset your password",
                 content=mail,
@@ -705,6 +728,7 @@ async def reset_password(
     reset_password_request: schemas_users.ResetPasswordRequest,
     db: AsyncSession = Depends(get_db),
     settings: Settings = Depends(get_settings),
+    password_hasher: security.PasswordHasher = Depends(get_password_hasher),
 ):
     """
     Reset the user password, using a **reset_token** provided by `/users/recover` endpoint.
@@ -725,7 +749,9 @@ async def reset_password(
             ),
         )
 
-    new_password_hash = security.get_password_hash(reset_password_request.new_password)
+    new_password_hash = await password_hasher.get_password_hash(
+        reset_password_request.new_password,
+    )
     await cruds_users.update_user_password_by_id(
         db=db,
         user_id=recover_request.user_id,
@@ -774,7 +800,7 @@ async def migrate_mail(
         )
         if settings.SMTP_ACTIVE:
             mail = mail_templates.get_mail_mail_migration_already_exist()
-            send_email(
+            await send_email(
                 recipient=mail_migration.new_email,
                 subject=f"{settings.school.application_name} - Confirm your new email address",
                 content=mail,
@@ -813,6 +839,7 @@ async def migrate_mail_confirm(
     token: str,
     db: AsyncSession = Depends(get_db),
     settings: Settings = Depends(get_settings),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
 ):
     """
     This endpoint will updates the user new email address.
@@ -871,6 +898,11 @@ async def migrate_mail_confirm(
 
     await db.flush()
 
+    await user_search_index.refresh_user_after_commit(
+        db=db,
+        user_id=migration_object.user_id,
+    )
+
     await cruds_users.delete_email_migration_code_by_token(
         confirmation_token=token,
         db=db,
@@ -891,10 +923,12 @@ async def migrate_mail_confirm(
     "/users/change-password",
     response_model=standard_responses.Result,
     status_code=201,
+    dependencies=[Depends(rate_limit(limit=5, window=60, per_user=True))],
 )
 async def change_password(
     change_password_request: schemas_users.ChangePasswordRequest,
     db: AsyncSession = Depends(get_db),
+    password_hasher: security.PasswordHasher = Depends(get_password_hasher),
 ):
     """
     Change a user password.
@@ -906,11 +940,14 @@ async def change_password(
         db=db,
         email=change_password_request.email,
         password=change_password_request.old_password,
+        password_hasher=password_hasher,
     )
     if user is None:
         raise HTTPException(status_code=403, detail="The old password is invalid")
 
-    new_password_hash = security.get_password_hash(change_password_request.new_password)
+    new_password_hash = await password_hasher.get_password_hash(
+        change_password_request.new_password,
+    )
     await cruds_users.update_user_password_by_id(
         db=db,
         user_id=user.id,
@@ -991,6 +1028,7 @@ async def update_current_user(
     user_update: schemas_users.CoreUserUpdate,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user()),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
 ):
     """
     Update the current user, the request should contain a JSON with the fields to change (not necessarily all fields) and their new value
@@ -999,6 +1037,7 @@ async def update_current_user(
     """
 
     await cruds_users.update_user(db=db, user_id=user.id, user_update=user_update)
+    await user_search_index.refresh_user_after_commit(db=db, user_id=user.id)
 
 
 @router.post(
@@ -1012,6 +1051,7 @@ async def merge_users(
     user: models_users.CoreUser = Depends(is_user_in(GroupType.admin)),
     settings: Settings = Depends(get_settings),
     mail_templates: calypsso.MailTemplates = Depends(get_mail_templates),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
 ):
     """
     Fusion two users into one. The first user will be deleted and its data will be transferred to the second user.
@@ -1039,18 +1079,23 @@ async def merge_users(
         user_deleted_id=user_deleted.id,
     )
 
-    mail = mail_templates.get_mail_account_merged(
-        deleted_mail=user_deleted.email,
-        kept_mail=user_kept.email,
-    )
+    # The kept user may have inherited groups from the deleted one
+    user_search_index.remove_user_after_commit(db=db, user_id=user_deleted.id)
+    await user_search_index.refresh_user_after_commit(db=db, user_id=user_kept.id)
 
-    background_tasks.add_task(
-        send_email,
-        recipient=[user_kept.email, user_deleted.email],
-        subject=f"{settings.school.application_name} - Accounts merged",
-        content=mail,
-        settings=settings,
-    )
+    if settings.SMTP_ACTIVE:
+        mail = mail_templates.get_mail_account_merged(
+            deleted_mail=user_deleted.email,
+            kept_mail=user_kept.email,
+        )
+
+        background_tasks.add_task(
+            send_email,
+            recipient=[user_kept.email, user_deleted.email],
+            subject=f"{settings.school.application_name} - Accounts merged",
+            content=mail,
+            settings=settings,
+        )
     hyperion_security_logger.info(
         f"User {user_kept.email} - {user_kept.id} has been merged with {user_deleted.email} - {user_deleted.id}",
     )
@@ -1065,6 +1110,7 @@ async def update_user(
     user_update: schemas_users.CoreUserUpdateAdmin,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_in(GroupType.admin)),
+    user_search_index: UserSearchIndex = Depends(get_user_search_index),
 ):
     """
     Update an user, the request should contain a JSON with the fields to change (not necessarily all fields) and their new value
@@ -1076,6 +1122,7 @@ async def update_user(
         raise HTTPException(status_code=404, detail="User not found")
 
     await cruds_users.update_user(db=db, user_id=user_id, user_update=user_update)
+    await user_search_index.refresh_user_after_commit(db=db, user_id=user_id)
 
 
 @router.patch(
@@ -1135,6 +1182,7 @@ async def create_current_user_profile_picture(
     status_code=200,
 )
 async def read_own_profile_picture(
+    size: ImageSize | None = None,
     user: models_users.CoreUser = Depends(is_user()),
 ):
     """
@@ -1145,6 +1193,7 @@ async def read_own_profile_picture(
         directory="profile-pictures",
         filename=str(user.id),
         default_asset="assets/images/default_profile_picture.png",
+        size=size,
     )
 
 
@@ -1155,6 +1204,7 @@ async def read_own_profile_picture(
 )
 async def read_user_profile_picture(
     user_id: str,
+    size: ImageSize | None = None,
     db: AsyncSession = Depends(get_db),
 ):
     """
@@ -1171,4 +1221,5 @@ async def read_user_profile_picture(
         directory="profile-pictures",
         filename=str(user_id),
         default_asset="assets/images/default_profile_picture.png",
+        size=size,
     )
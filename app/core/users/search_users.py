@@ -0,0 +1,321 @@
+"""
+In-process search index used by the `/users/search` endpoint.
+
+Searching users used to load every user, with their groups and school, then compute five Jaro-Winkler similarities per user.
+The index keeps, for each worker, the unaccented names of all users and:
+ - a table mapping padded trigrams to users ids. Words are padded with two leading spaces so that prefixes are indexed too
+ - tables mapping account types and groups to users ids, allowing to apply filters as set intersections
+
+A query only needs to score the users sharing enough trigrams with it.
+"""
+
+import asyncio
+import heapq
+import logging
+import re
+import time
+from collections import Counter
+from collections.abc import Iterable, Sequence
+from typing import NamedTuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.groups.groups_type import AccountType
+from app.core.users import cruds_users
+from app.utils.cache import run_after_commit
+from app.utils.tools import get_user_match_score, unaccent
+
+hyperion_error_logger = logging.getLogger("hyperion.error")
+
+word_separator_regex = re.compile(r"[^a-z0-9]+")
+
+
+class IndexedUser(NamedTuple):
+    id: str
+    # Names are stored unaccented
+    firstname: str
+    name: str
+    nickname: str | None
+    account_type: AccountType
+    group_ids: frozenset[str]
+
+
+def get_words(value: str) -> list[str]:
+    """
+    Split an unaccented string in lowercase words
+    """
+    return [word for word in word_separator_regex.split(value.lower()) if word]
+
+
+def get_word_trigrams(word: str, is_prefix: bool = False) -> set[str]:
+    """
+    Return the trigrams of a word padded with two leading spaces and a trailing one.
+
+    If `is_prefix` is True, the trailing space is omitted so that the word
+    matches all words beginning with it.
+    """
+    padded = f"  {word}" if is_prefix else f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def get_query_trigrams(query: str) -> set[str]:
+    """
+    Return the trigrams of a query. We assume the last word of the query is the beginning of a name.
+    """
+    words = get_words(query)
+    trigrams: set[str] = set()
+    for i, word in enumerate(words):
+        trigrams |= get_word_trigrams(word, is_prefix=i == len(words) - 1)
+    return trigrams
+
+
+def get_user_trigrams(user: IndexedUser) -> set[str]:
+    trigrams: set[str] = set()
+    for value in (user.firstname, user.name, user.nickname or ""):
+        for word in get_words(value):
+            trigrams |= get_word_trigrams(word)
+    return trigrams
+
+
+class UserSearchTables:
+    """
+    Lookup tables of the search index. A new instance is built when the whole index is rebuilt.
+    """
+
+    def __init__(self, users: Iterable[IndexedUser] = ()):
+        self.users: dict[str, IndexedUser] = {}
+        self.trigrams: dict[str, set[str]] = {}
+        self.account_types: dict[AccountType, set[str]] = {}
+        self.groups: dict[str, set[str]] = {}
+        for user in users:
+            self.add_user(user)
+
+    def add_user(self, user: IndexedUser) -> None:
+        self.users[user.id] = user
+        for trigram in get_user_trigrams(user):
+            self.trigrams.setdefault(trigram, set()).add(user.id)
+        self.account_types.setdefault(user.account_type, set()).add(user.id)
+        for group_id in user.group_ids:
+            self.groups.setdefault(group_id, set()).add(user.id)
+
+    def remove_user(self, user_id: str) -> None:
+        user = self.users.pop(user_id, None)
+        if user is None:
+            return
+        for trigram in get_user_trigrams(user):
+            self.trigrams.get(trigram, set()).discard(user_id)
+        self.account_types.get(user.account_type, set()).discard(user_id)
+        for group_id in user.group_ids:
+            self.groups.get(group_id, set()).discard(user_id)
+
+
+def make_indexed_users(
+    entries: Sequence[tuple[str, str, str, str | None, AccountType]],
+    memberships: Sequence[tuple[str, str]],
+) -> list[IndexedUser]:
+    group_ids: dict[str, set[str]] = {}
+    for user_id, group_id in memberships:
+        group_ids.setdefault(user_id, set()).add(group_id)
+
+    return [
+        IndexedUser(
+            id=user_id,
+            firstname=unaccent(firstname),
+            name=unaccent(name),
+            nickname=unaccent(nickname) if nickname else None,
+            account_type=account_type,
+            group_ids=frozenset(group_ids.get(user_id, ())),
+        )
+        for user_id, firstname, name, nickname, account_type in entries
+    ]
+
+
+def build_tables(
+    entries: Sequence[tuple[str, str, str, str | None, AccountType]],
+    memberships: Sequence[tuple[str, str]],
+) -> UserSearchTables:
+    return UserSearchTables(make_indexed_users(entries, memberships))
+
+
+class UserSearchIndex:
+    def __init__(self, ttl: int, max_candidates: int = 500):
+        """
+        Initialize an empty index. The index will be built from the database on the first search.
+
+        Each worker has its own index. The index is updated once the transactions of the endpoints creating, updating
+        or merging users are committed, but it can not see changes made by other workers, it is thus rebuilt after `ttl` seconds.
+        Returned users should always be fetched back from the database, which make sure stale entries are never returned.
+
+        `max_candidates` is the maximum number of users that will be scored for a query.
+        """
+        self.ttl = ttl
+        self.max_candidates = max_candidates
+
+        self.tables = UserSearchTables()
+
+        # Monotonic time of the last build, None if the index needs to be built
+        self.built_at: float | None = None
+        self.build_lock = asyncio.Lock()
+        # Incremented on each change of the index. If the index changed during a build,
+        # the new tables may miss this change and should be rebuilt on the next search
+        self.generation = 0
+
+    def is_up_to_date(self) -> bool:
+        return self.built_at is not None and time.monotonic() - self.built_at < self.ttl
+
+    def invalidate(self) -> None:
+        """
+        Force the index to be rebuilt on the next search
+        """
+        self.built_at = None
+        self.generation += 1
+
+    def invalidate_after_commit(self, db: AsyncSession) -> None:
+        run_after_commit(db, self.invalidate)
+
+    async def ensure_built(self, db: AsyncSession) -> None:
+        if self.is_up_to_date():
+            return
+        async with self.build_lock:
+            # The index may have been built by a concurrent search while we were waiting for the lock
+            if self.is_up_to_date():
+                return
+            started_at = time.monotonic()
+            generation = self.generation
+            entries = await cruds_users.get_users_search_entries(db=db)
+            memberships = await cruds_users.get_users_memberships(db=db)
+            # Building the tables for tens of thousands of users takes some time,
+            # we don't want to block the event loop meanwhile
+            self.tables = await asyncio.to_thread(build_tables, entries, memberships)
+            if generation == self.generation:
+                self.built_at = started_at
+            hyperion_error_logger.debug(
+                f"User search index: indexed {len(self.tables.users)} users in {time.monotonic() - started_at:.3f}s",
+            )
+
+    def _replace_user(self, user_id: str, users: list[IndexedUser]) -> None:
+        self.generation += 1
+        self.tables.remove_user(user_id)
+        for user in users:
+            self.tables.add_user(user)
+
+    def remove_user_after_commit(self, db: AsyncSession, user_id: str) -> None:
+        run_after_commit(db, lambda: self._replace_user(user_id, []))
+
+    async def refresh_user_after_commit(self, db: AsyncSession, user_id: str) -> None:
+        """
+        Update the index entry of an user after it was created or updated, or after its groups changed.
+        The entry is loaded now and added to the index once the transaction of `db` is committed.
+
+        This method should be called after the changes were flushed to the database.
+        """
+        if self.built_at is None:
+            # The index will be built with up to date data on the next search.
+            # A build in progress may have loaded the user before the commit
+            self.invalidate_after_commit(db)
+            return
+        entries = await cruds_users.get_users_search_entries(
+            db=db,
+            users_ids=[user_id],
+        )
+        memberships = await cruds_users.get_users_memberships(
+            db=db,
+            users_ids=[user_id],
+        )
+        users = make_indexed_users(entries, memberships)
+        run_after_commit(db, lambda: self._replace_user(user_id, users))
+
+    def _get_allowed_users_ids(
+        self,
+        included_account_types: list[AccountType],
+        excluded_account_types: list[AccountType],
+        included_groups: list[str],
+        excluded_groups: list[str],
+    ) -> set[str] | None:
+        """
+        Apply the filters using set operations. Return None if all users are allowed.
+
+        Filters have the same meaning as in `cruds_users.get_users`:
+        an user should have one of the included account types and be a member of all included groups.
+        """
+        tables = self.tables
+        allowed: set[str] | None = None
+        if included_account_types:
+            allowed = set()
+            for account_type in included_account_types:
+                allowed |= tables.account_types.get(account_type, set())
+        for group_id in included_groups:
+            members = tables.groups.get(group_id, set())
+            allowed = set(members) if allowed is None else allowed & members
+
+        excluded: set[str] = set()
+        for account_type in excluded_account_types:
+            excluded |= tables.account_types.get(account_type, set())
+        for group_id in excluded_groups:
+            excluded |= tables.groups.get(group_id, set())
+        if excluded:
+            allowed = (set(tables.users) if allowed is None else allowed) - excluded
+
+        return allowed
+
+    async def search(
+        self,
+        db: AsyncSession,
+        query: str,
+        included_account_types: list[AccountType] | None = None,
+        excluded_account_types: list[AccountType] | None = None,
+        included_groups: list[str] | None = None,
+        excluded_groups: list[str] | None = None,
+        limit: int = 10,
+    ) -> list[str]:
+        """
+        Return the ids of the `limit` users best matching `query`, sorted by decreasing score.
+
+        Users are scored using `get_user_match_score`, only users sharing at least half
+        of the query trigrams are considered.
+        """
+        await self.ensure_built(db)
+        tables = self.tables
+
+        allowed = self._get_allowed_users_ids(
+            included_account_types=included_account_types or [],
+            excluded_account_types=excluded_account_types or [],
+            included_groups=included_groups or [],
+            excluded_groups=excluded_groups or [],
+        )
+
+        query = unaccent(query)
+        query_trigrams = get_query_trigrams(query)
+        if not query_trigrams:
+            # Without any query, all allowed users match equally
+            return heapq.nsmallest(
+                limit,
+                tables.users if allowed is None else allowed,
+            )
+
+        shared_trigrams: Counter[str] = Counter()
+        for trigram in query_trigrams:
+            users_ids = tables.trigrams.get(trigram)
+            if users_ids:
+                shared_trigrams.update(
+                    users_ids if allowed is None else users_ids & allowed,
+                )
+
+        minimum_shared_trigrams = max(1, len(query_trigrams) // 2)
+        candidates = [
+            tables.users[user_id]
+            for user_id, count in shared_trigrams.most_common(self.max_candidates)
+            if count >= minimum_shared_trigrams
+        ]
+
+        best_matches = heapq.nlargest(
+            limit,
+            candidates,
+            key=lambda user: get_user_match_score(
+                query=query,
+                firstname=user.firstname,
+                name=user.name,
+                nickname=user.nickname,
+            ),
+        )
+        return [user.id for user in best_matches]
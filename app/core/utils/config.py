@@ -216,6 +216,33 @@ class Settings(BaseSettings):
     # If self registration is disabled, users will need to be invited by an administrator to be able to register
     ALLOW_SELF_REGISTRATION: bool = True
 
+    # Each worker keeps an in-memory index of users names to answer `/users/search` requests.
+    # The index is updated when users are created or modified through the worker, but can not see changes made by other workers.
+    # It is thus fully rebuilt from the database after this delay, in seconds.
+    USER_SEARCH_INDEX_TTL: int = 300
+
+    # Users making authenticated requests are cached by each worker during this delay, in seconds, to avoid loading them
+    # with their groups and school on every request. Changes made through another worker, like a removal from a group,
+    # may thus take this long to be taken into account. Set to 0 to disable the cache.
+    AUTHENTICATED_USERS_CACHE_TTL: int = 5
+
+    # The first page of the feed is cached by each worker during this delay, in seconds. News published or rejected
+    # through another worker may thus take this long to appear. Set to 0 to disable the cache.
+    FEED_CACHE_TTL: int = 30
+
+    # The status of the vote and the voter groups of the campaign module are cached by each worker during this delay, in seconds.
+    # Only read-only endpoints use this cached state, votes always check the database. Set to 0 to disable the cache.
+    CAMPAIGN_CACHE_TTL: int = 2
+
+    # Passwords are hashed and verified using bcrypt in a pool of threads, to avoid blocking the event loop.
+    # Each hash takes around 0.5 seconds of CPU time. When more than PASSWORD_HASHING_MAX_PENDING operations
+    # are running or waiting in a worker, new authentication requests are refused with a 503 error.
+    PASSWORD_HASHING_THREADS: int = 2
+    PASSWORD_HASHING_MAX_PENDING: int = 32
+
+    # Uploaded images are decoded and resized in a pool of threads, to avoid blocking the event loop
+    IMAGE_PROCESSING_THREADS: int = 2
+
     ############################
     # PostgreSQL configuration #
     ############################
@@ -242,6 +269,12 @@ class Settings(BaseSettings):
     SMTP_USERNAME: str
     SMTP_PASSWORD: str
     SMTP_EMAIL: str
+    # Emails are sent over persistent connections, kept open between emails. These limits apply to each Hyperion worker
+    SMTP_MAX_CONNECTIONS: int = 2
+    # Budget of the email provider, queued emails are sent at this rate
+    SMTP_MAX_EMAILS_PER_MINUTE: int = 30
+    # Part of the budget which queued emails can not use, so that emails sent directly by endpoints, for example to reset a password, are not delayed
+    SMTP_RESERVED_EMAILS_PER_MINUTE: int = 5
 
     ########################
     # Redis configuration #
@@ -255,16 +288,33 @@ class Settings(BaseSettings):
     REDIS_LIMIT: int = 1000
     REDIS_WINDOW: int = 60
 
-    # Rate limit requests based on REDIS_LIMIT and REDIS_WINDOW
+    # Rate limit requests based on REDIS_LIMIT and REDIS_WINDOW: an ip address can make
+    # at most REDIS_LIMIT requests during any sliding window of REDIS_WINDOW seconds
+    # Some endpoints have additional limits, per ip address or per user
     # A working Redis client is required to use the rate limiter
     ENABLE_RATE_LIMITER: bool = True
 
+    # Queued and cron jobs are executed by a scheduler worker. By default, each application worker runs its own scheduler worker.
+    # If USE_DEDICATED_SCHEDULER_WORKER is set, application workers only queue jobs, which are executed by a separate
+    # process started with `python -m app.worker`. A Redis server is required.
+    # A scheduler worker executes at most SCHEDULER_MAX_JOBS jobs at the same time.
+    # The dedicated worker records its health in Redis every SCHEDULER_HEALTH_CHECK_INTERVAL seconds, it can be checked with `python -m app.worker --check`.
+    # When stopped, it waits at most SCHEDULER_SHUTDOWN_TIMEOUT seconds for running jobs to complete.
+    USE_DEDICATED_SCHEDULER_WORKER: bool = False
+    SCHEDULER_MAX_JOBS: int = 10
+    SCHEDULER_HEALTH_CHECK_INTERVAL: int = 60
+    SCHEDULER_SHUTDOWN_TIMEOUT: int = 30
+
     ##########################
     # Firebase Configuration #
     ##########################
     # To enable Firebase push notification capabilities, a JSON key file named `firebase.json` should be placed at Hyperion root.
     # This file can be created and downloaded from [Google cloud, IAM and administration, Service account](https://console.cloud.google.com/iam-admin/serviceaccounts) page.
     USE_FIREBASE: bool = False
+    # The Firebase SDK is synchronous, its calls are made in a pool of FIREBASE_THREADS threads.
+    # A notification to many devices is sent in chunks of 500 tokens, at most FIREBASE_MAX_CONCURRENT_CHUNKS at a time.
+    FIREBASE_THREADS: int = 4
+    FIREBASE_MAX_CONCURRENT_CHUNKS: int = 4
 
     ########################
     # School Configuration #
@@ -477,6 +527,18 @@ class Settings(BaseSettings):
 
         return self
 
+    @model_validator(mode="after")
+    def check_smtp_settings(self) -> "Settings":
+        """
+        Queued emails should be allowed to use part of the budget
+        """
+        if self.SMTP_RESERVED_EMAILS_PER_MINUTE >= self.SMTP_MAX_EMAILS_PER_MINUTE:
+            raise DotenvInvalidVariableError(  # noqa: TRY003
+                "SMTP_RESERVED_EMAILS_PER_MINUTE must be lower than SMTP_MAX_EMAILS_PER_MINUTE",
+            )
+
+        return self
+
     @model_validator(mode="after")
     def check_database_settings(self) -> "Settings":
         """
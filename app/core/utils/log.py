@@ -151,6 +151,8 @@ class LogConfig:
                     "folder": "mypayment"
                     if not settings.S3_DIRECTORY
                     else settings.S3_DIRECTORY + "/mypayment",
+                    # Records are spooled on the disk and uploaded by a background thread, see S3LogHandler
+                    "spool_directory": "logs/s3_spool/mypayment",
                 },
                 "s3": {
                     "formatter": "mypayment",
@@ -162,6 +164,7 @@ class LogConfig:
                     "folder": ""
                     if not settings.S3_DIRECTORY
                     else settings.S3_DIRECTORY,
+                    "spool_directory": "logs/s3_spool/s3",
                 },
                 # There is a handler per log file #
                 # They are based on RotatingFileHandler to logs in multiple 1024 bytes files
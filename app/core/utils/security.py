@@ -1,6 +1,9 @@
+import asyncio
 import secrets
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime, timedelta
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, TypeVar
 
 import bcrypt
 import jwt
@@ -9,6 +12,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.auth import schemas_auth
 from app.core.users import cruds_users, models_users
+from app.types.exceptions import PasswordHasherSaturatedError
 
 if TYPE_CHECKING:
     from app.core.utils.config import Settings
@@ -19,8 +23,12 @@ In order to salt and hash password, we the bcrypt hashing function (see https://
 
 A different salt will be added automatically for each password. See [Auth0 Understanding bcrypt](https://auth0.com/blog/hashing-in-action-understanding-bcrypt/) for information about bcrypt.
 It is important to use enough rounds while accounting for the hash computation time. Default is 12. 13 allows for a 0.5 seconds computing delay.
+
+Hashing a password thus takes a long time and should never be done on the event loop: endpoints should use the worker `PasswordHasher`.
 """
 
+T = TypeVar("T")
+
 oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl="/auth/authorize",
     tokenUrl="/auth/token",
@@ -62,26 +70,97 @@ def get_password_hash(password: str) -> str:
     return hashed.decode("utf-8")
 
 
-def verify_password(plain_password: str, hashed_password: str | None) -> bool:
+def get_fake_password_hash() -> bytes:
+    """
+    Return a hash of a random password.
+
+    Comparing a password against this hash takes the same time as a real verification.
+    """
+    return bcrypt.hashpw(generate_token(12).encode("utf-8"), bcrypt.gensalt(13))
+
+
+def verify_password(
+    plain_password: str,
+    hashed_password: str | None,
+    fake_password_hash: bytes,
+) -> bool:
     """
     Compare `plain_password` against its salted hash representation `hashed_password`.
 
-    We genrerate a fake_hash for the case where hashed_password=None (ie the email isn't valid) to simulate the delay a real verification would have taken.
+    We use `fake_password_hash` for the case where hashed_password=None (ie the email isn't valid) to simulate the delay a real verification would have taken.
     This is useful to limit timing attacks that could be used to guess valid emails.
     """
-    fake_hash = bcrypt.hashpw(generate_token(12).encode("utf-8"), bcrypt.gensalt(13))
     if hashed_password is None:
-        return bcrypt.checkpw(plain_password.encode("utf-8"), fake_hash)
+        return bcrypt.checkpw(plain_password.encode("utf-8"), fake_password_hash)
     return bcrypt.checkpw(
         plain_password.encode("utf-8"),
         hashed_password.encode("utf-8"),
     )
 
 
+class PasswordHasher:
+    def __init__(self, max_workers: int, max_pending_operations: int):
+        """
+        Hash and verify passwords in a pool of threads, without blocking the event loop.
+
+        bcrypt releases the GIL while computing hashes, threads are thus enough to use multiple cores.
+
+        If `max_pending_operations` operations are already running or waiting for a thread,
+        new operations are refused with a `PasswordHasherSaturatedError`, resulting in a 503 response.
+        During a login storm, this prevents requests from piling up until they time out.
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="password-hasher",
+        )
+        self.max_pending_operations = max_pending_operations
+        self.pending_operations = 0
+        # Computed before the first login, which would otherwise be slower for an unknown email
+        self.fake_password_hash = get_fake_password_hash()
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        if self.pending_operations >= self.max_pending_operations:
+            raise PasswordHasherSaturatedError
+        self.pending_operations += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                func,
+                *args,
+            )
+        finally:
+            self.pending_operations -= 1
+
+    async def get_password_hash(self, password: str) -> str:
+        """
+        See `get_password_hash`
+        """
+        return await self._run(get_password_hash, password)
+
+    async def verify_password(
+        self,
+        plain_password: str,
+        hashed_password: str | None,
+    ) -> bool:
+        """
+        See `verify_password`
+        """
+        return await self._run(
+            verify_password,
+            plain_password,
+            hashed_password,
+            self.fake_password_hash,
+        )
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
 async def authenticate_user(
     db: AsyncSession,
     email: str,
     password: str,
+    password_hasher: PasswordHasher,
 ) -> models_users.CoreUser | None:
     """
     Try to authenticate the user.
@@ -90,10 +169,10 @@ async def authenticate_user(
     user = await cruds_users.get_user_by_email(db=db, email=email)
     if not user:
         # In order to prevent timing attacks, we simulate the delay the password validation would have taken if the account existed
-        verify_password("", None)
+        await password_hasher.verify_password("", None)
 
         return None
-    if not verify_password(password, user.password_hash):
+    if not await password_hasher.verify_password(password, user.password_hash):
         return None
     return user
 
@@ -8,6 +8,7 @@ async def get_users(db: AsyncSession = Depends(get_db)):
 """
 
 import logging
+import math
 from collections.abc import AsyncGenerator, Callable, Coroutine
 from functools import lru_cache
 from typing import TYPE_CHECKING, Annotated, Any, cast
@@ -15,6 +16,7 @@ from uuid import UUID
 
 import calypsso
 import redis
+import redis.asyncio
 import starlette
 import starlette.datastructures
 from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Request
@@ -28,6 +30,7 @@ from app.core.checkout.payment_tool import PaymentTool
 from app.core.checkout.types_checkout import HelloAssoConfigName
 from app.core.groups.groups_type import AccountType, GroupType, get_school_account_types
 from app.core.users import models_users
+from app.core.users.search_users import UserSearchIndex
 from app.core.utils import security
 from app.core.utils.config import Settings, construct_prod_settings
 from app.modules.raid.utils.drive.drive_file_manager import DriveFileManager
@@ -36,22 +39,34 @@ from app.types.exceptions import (
     PaymentToolCredentialsNotSetException,
 )
 from app.types.scopes_type import ScopeType
+from app.types.sqlalchemy import SessionLocalType
 from app.types.websocket import WebsocketConnectionManager
 from app.utils.auth import auth_utils
 from app.utils.communication.notifications import NotificationManager, NotificationTool
+from app.utils.redis import RateLimiter
 from app.utils.state import (
     GlobalState,
     RuntimeLifespanState,
+    disconnect_async_redis_client,
+    disconnect_notification_manager,
+    disconnect_password_hasher,
     disconnect_redis_client,
     disconnect_scheduler,
+    disconnect_thread_pools,
     disconnect_websocket_connection_manager,
+    init_async_redis_client,
     init_engine,
     init_mail_templates,
+    init_password_hasher,
     init_payment_tools,
+    init_rate_limiter,
     init_redis_client,
     init_scheduler,
     init_SessionLocal,
+    init_thread_pools,
+    init_user_search_index,
     init_websocket_connection_manager,
+    init_worker_caches,
 )
 from app.utils.tools import (
     is_user_external,
@@ -65,6 +80,7 @@ if TYPE_CHECKING:
 # We could maybe use hyperion.security
 hyperion_access_logger = logging.getLogger("hyperion.access")
 hyperion_error_logger = logging.getLogger("hyperion.error")
+hyperion_security_logger = logging.getLogger("hyperion.security")
 
 GLOBAL_STATE: GlobalState
 
@@ -100,6 +116,13 @@ async def init_state(
         hyperion_error_logger=hyperion_error_logger,
     )
 
+    async_redis_client = await init_async_redis_client(
+        settings=settings,
+        hyperion_error_logger=hyperion_error_logger,
+    )
+
+    rate_limiter = init_rate_limiter(async_redis_client=async_redis_client)
+
     scheduler = await init_scheduler(
         settings=settings,
         _dependency_overrides=app.dependency_overrides,
@@ -120,16 +143,28 @@ async def init_state(
 
     mail_templates = init_mail_templates(settings=settings)
 
+    user_search_index = init_user_search_index(settings=settings)
+
+    init_worker_caches(settings=settings)
+
+    init_thread_pools(settings=settings)
+
+    password_hasher = init_password_hasher(settings=settings)
+
     GLOBAL_STATE = GlobalState(
         engine=engine,
         SessionLocal=SessionLocal,
         redis_client=redis_client,
+        async_redis_client=async_redis_client,
+        rate_limiter=rate_limiter,
         scheduler=scheduler,
         ws_manager=ws_manager,
         notification_manager=notification_manager,
         drive_file_manager=drive_file_manager,
         payment_tools=payment_tools,
         mail_templates=mail_templates,
+        user_search_index=user_search_index,
+        password_hasher=password_hasher,
     )
 
 
@@ -143,8 +178,12 @@ async def disconnect_state(
     """
 
     disconnect_redis_client(GLOBAL_STATE["redis_client"])
+    await disconnect_async_redis_client(GLOBAL_STATE["async_redis_client"])
     await disconnect_scheduler(GLOBAL_STATE["scheduler"])
     await disconnect_websocket_connection_manager(GLOBAL_STATE["ws_manager"])
+    disconnect_password_hasher(GLOBAL_STATE["password_hasher"])
+    disconnect_notification_manager(GLOBAL_STATE["notification_manager"])
+    disconnect_thread_pools()
 
     hyperion_error_logger.info("Application state disconnected successfully.")
 
@@ -236,6 +275,16 @@ async def get_unsafe_db() -> AsyncGenerator[AsyncSession, None]:
         yield db
 
 
+def get_session_local() -> SessionLocalType:
+    """
+    Return the session factory, to open a database session that should outlive the request.
+
+    Streaming responses are sent after the dependencies exited, thus after the session returned by `get_db` was closed.
+    The session should be committed and closed by the caller.
+    """
+    return GLOBAL_STATE["SessionLocal"]
+
+
 def get_redis_client() -> redis.Redis | None:
     """
     Dependency that returns the redis client
@@ -245,6 +294,24 @@ def get_redis_client() -> redis.Redis | None:
     return GLOBAL_STATE["redis_client"]
 
 
+def get_async_redis_client() -> redis.asyncio.Redis | None:
+    """
+    Dependency that returns the asynchronous redis client
+
+    If the redis client is not available, it will return None.
+    """
+    return GLOBAL_STATE["async_redis_client"]
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """
+    Dependency that returns the rate limiter
+
+    If Redis is not available, it will return None.
+    """
+    return GLOBAL_STATE["rate_limiter"]
+
+
 def get_scheduler() -> "Scheduler":
     return GLOBAL_STATE["scheduler"]
 
@@ -267,6 +334,7 @@ def get_notification_tool(
     background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     notification_manager: NotificationManager = Depends(get_notification_manager),
+    scheduler: "Scheduler" = Depends(get_scheduler),
 ) -> NotificationTool:
     """
     Dependency that returns a notification tool, allowing to send push notification as a background tasks.
@@ -276,6 +344,7 @@ def get_notification_tool(
         background_tasks=background_tasks,
         notification_manager=notification_manager,
         db=db,
+        scheduler=scheduler,
     )
 
 
@@ -312,6 +381,24 @@ def get_mail_templates() -> calypsso.MailTemplates:
     return GLOBAL_STATE["mail_templates"]
 
 
+def get_user_search_index() -> UserSearchIndex:
+    """
+    Dependency that returns the worker users search index.
+    """
+
+    return GLOBAL_STATE["user_search_index"]
+
+
+def get_password_hasher() -> security.PasswordHasher:
+    """
+    Dependency that returns the worker password hasher.
+
+    Passwords should always be hashed and verified using this tool, to avoid blocking the event loop.
+    """
+
+    return GLOBAL_STATE["password_hasher"]
+
+
 def get_token_data(
     settings: Settings = Depends(get_settings),
     token: str = Depends(security.oauth2_scheme),
@@ -327,6 +414,67 @@ def get_token_data(
     )
 
 
+def rate_limit(
+    limit: int,
+    window: int,
+    per_user: bool = False,
+) -> Callable[..., Coroutine[Any, Any, None]]:
+    """
+    Generate a dependency which will allow at most `limit` requests to the endpoint during any `window` seconds.
+    Requests are counted for each ip address, or for each user if `per_user` is True.
+    A user limit requires the endpoint to be called with a valid token.
+
+    This limit applies in addition to the global ip address limit, checked by the middleware. For example:
+    ```python
+    @router.post("/users/recover", dependencies=[Depends(rate_limit(limit=10, window=60))])
+    ```
+    """
+
+    async def check_rate_limit(request: Request, key: str, settings: Settings) -> None:
+        rate_limiter = get_rate_limiter()
+        if rate_limiter is None or not settings.ENABLE_RATE_LIMITER:
+            return
+
+        # The route path contains the path parameters names instead of their values
+        route_path = getattr(request.scope.get("route"), "path", request.url.path)
+        result = await rate_limiter.hit(
+            key=f"{route_path}:{key}",
+            limit=limit,
+            window=window,
+        )
+        if result.alert:
+            hyperion_security_logger.warning(
+                f"Rate limit reached for {key} on {route_path} (limit: {limit}, window: {window})",
+            )
+        if not result.allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too Many Requests",
+                headers={"Retry-After": str(math.ceil(result.retry_after))},
+            )
+
+    if per_user:
+
+        async def rate_limit_user(
+            request: Request,
+            settings: Settings = Depends(get_settings),
+            token_data: schemas_auth.TokenData = Depends(get_token_data),
+        ) -> None:
+            await check_rate_limit(request, f"user:{token_data.sub}", settings)
+
+        return rate_limit_user
+
+    async def rate_limit_ip(
+        request: Request,
+        settings: Settings = Depends(get_settings),
+    ) -> None:
+        # The middleware makes sure the client information is available
+        ip_address = request.client.host if request.client else ""
+        await check_rate_limit(request, f"ip:{ip_address}", settings)
+
+    return rate_limit_ip
+
+
 def get_user_from_token_with_scopes(
     scopes: list[list[ScopeType]],
 ) -> Callable[
@@ -2,7 +2,7 @@ import logging
 import uuid
 from datetime import UTC, datetime
 
-from fastapi import Depends, File, HTTPException, Query, UploadFile
+from fastapi import BackgroundTasks, Depends, File, HTTPException, Query, UploadFile
 from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -16,6 +16,7 @@ from app.dependencies import (
     get_db,
     get_notification_manager,
     get_notification_tool,
+    get_scheduler,
     is_user_a_school_member,
 )
 from app.modules.advert import (
@@ -24,8 +25,9 @@ from app.modules.advert import (
     schemas_advert,
 )
 from app.modules.advert.factory_advert import AdvertFactory
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.module import Module
+from app.types.scheduler import Scheduler
 from app.utils.communication.notifications import NotificationManager, NotificationTool
 from app.utils.tools import (
     get_file_from_data,
@@ -95,10 +97,12 @@ async def read_advert(
 )
 async def create_advert(
     advert: schemas_advert.AdvertBase,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_school_member),
     notification_tool: NotificationTool = Depends(get_notification_tool),
     notification_manager: NotificationManager = Depends(get_notification_manager),
+    scheduler: Scheduler = Depends(get_scheduler),
 ):
     """
     Create a new advert
@@ -148,24 +152,24 @@ async def create_advert(
     )
     if topic is None:
         # This means that the association never sent a news before, we have thus
-        # never registred its topic
-        topic_id = uuid.uuid4()
+        # never registred its topic. The message will be sent once users are subscribed to it
         await notification_manager.register_new_topic(
-            topic_id=topic_id,
+            topic_id=uuid.uuid4(),
             name=f"📣 Annonce - {association.name}",
             module_root=root,
             topic_identifier=str(association.id),
             restrict_to_group_id=None,
             restrict_to_members=True,
             db=db,
+            scheduler=scheduler,
+            background_tasks=background_tasks,
+            message=message,
         )
     else:
-        topic_id = topic.id
-
-    await notification_tool.send_notification_to_topic(
-        topic_id=topic_id,
-        message=message,
-    )
+        await notification_tool.send_notification_to_topic(
+            topic_id=topic.id,
+            message=message,
+        )
 
     if advert.post_to_feed:
         await create_feed_news(
@@ -267,6 +271,7 @@ async def delete_advert(
 )
 async def read_advert_image(
     advert_id: uuid.UUID,
+    size: ImageSize | None = None,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_school_member),
 ):
@@ -286,6 +291,7 @@ async def read_advert_image(
         directory="adverts",
         filename=advert_id,
         raise_http_exception=True,
+        size=size,
     )
 
 
@@ -350,31 +350,21 @@ async def create_cash_of_user(
 
 
 async def add_cash(db: AsyncSession, user_id: str, amount: float):
-    result = await db.execute(
-        select(models_amap.Cash).where(models_amap.Cash.user_id == user_id),
-    )
-    balance = result.scalars().first()
-    if balance is not None:
-        await db.execute(
-            update(models_amap.Cash)
-            .where(models_amap.Cash.user_id == user_id)
-            .values(user_id=balance.user_id, balance=balance.balance + amount),
-        )
-        await db.flush()
+    await db.execute(
+        update(models_amap.Cash)
+        .where(models_amap.Cash.user_id == user_id)
+        .values(balance=models_amap.Cash.balance + amount),
+    )
+    await db.flush()
 
 
 async def remove_cash(db: AsyncSession, user_id: str, amount: float):
-    result = await db.execute(
-        select(models_amap.Cash).where(models_amap.Cash.user_id == user_id),
-    )
-    balance = result.scalars().first()
-    if balance is not None:
-        await db.execute(
-            update(models_amap.Cash)
-            .where(models_amap.Cash.user_id == user_id)
-            .values(user_id=balance.user_id, balance=balance.balance - amount),
-        )
-        await db.flush()
+    await db.execute(
+        update(models_amap.Cash)
+        .where(models_amap.Cash.user_id == user_id)
+        .values(balance=models_amap.Cash.balance - amount),
+    )
+    await db.flush()
 
 
 async def get_orders_of_user(
@@ -3,7 +3,7 @@ import uuid
 from datetime import UTC, datetime
 
 from fastapi import Depends, HTTPException, Response
-from redis import Redis
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.groups.groups_type import AccountType, GroupType
@@ -11,9 +11,9 @@ from app.core.notification.schemas_notification import Message, Topic
 from app.core.users import cruds_users, models_users, schemas_users
 from app.core.users.endpoints_users import read_user
 from app.dependencies import (
+    get_async_redis_client,
     get_db,
     get_notification_tool,
-    get_redis_client,
     get_request_id,
     is_user_a_member,
     is_user_in,
@@ -21,9 +21,10 @@ from app.dependencies import (
 from app.modules.amap import cruds_amap, models_amap, schemas_amap
 from app.modules.amap.factory_amap import AmapFactory
 from app.modules.amap.types_amap import DeliveryStatusType
+from app.types.exceptions import LockTimeoutError
 from app.types.module import Module
 from app.utils.communication.notifications import NotificationTool
-from app.utils.redis import locker_get, locker_set
+from app.utils.redis import distributed_lock
 from app.utils.tools import is_user_member_of_any_group
 
 root = "amap"
@@ -395,7 +396,7 @@ async def get_order_by_id(
 async def add_order_to_delievery(
     order: schemas_amap.OrderBase,
     db: AsyncSession = Depends(get_db),
-    redis_client: Redis | None = Depends(get_redis_client),
+    redis_client: Redis | None = Depends(get_async_redis_client),
     user: models_users.CoreUser = Depends(is_user_a_member),
     request_id: str = Depends(get_request_id),
 ):
@@ -469,36 +470,31 @@ async def add_order_to_delievery(
     if not amount:
         raise HTTPException(status_code=400, detail="You can't order nothing")
 
-    redis_key = "amap_" + order.user_id
-
-    if not isinstance(redis_client, Redis) or locker_get(
-        redis_client=redis_client,
-        key=redis_key,
-    ):
-        raise HTTPException(status_code=429, detail="Too fast !")
-    locker_set(redis_client=redis_client, key=redis_key, lock=True)
-
     try:
-        await cruds_amap.add_order_to_delivery(
-            order=db_order,
+        async with distributed_lock(
+            key="amap_" + order.user_id,
             db=db,
-        )
-        await cruds_amap.remove_cash(
-            db=db,
-            user_id=order.user_id,
-            amount=amount,
-        )
-
-        orderret = await cruds_amap.get_order_by_id(order_id=db_order.order_id, db=db)
-        productsret = await cruds_amap.get_products_of_order(db=db, order_id=order_id)
+            redis_client=redis_client,
+        ):
+            await cruds_amap.add_order_to_delivery(
+                order=db_order,
+                db=db,
+            )
+            await cruds_amap.remove_cash(
+                db=db,
+                user_id=order.user_id,
+                amount=amount,
+            )
+    except LockTimeoutError:
+        raise HTTPException(status_code=429, detail="Too fast !")
 
-        hyperion_amap_logger.info(
-            f"Add_order_to_delivery: An order has been created for user {order.user_id} for an amount of {amount}€. ({request_id})",
-        )
-        return schemas_amap.OrderReturn(productsdetail=productsret, **orderret.__dict__)
+    orderret = await cruds_amap.get_order_by_id(order_id=db_order.order_id, db=db)
+    productsret = await cruds_amap.get_products_of_order(db=db, order_id=order_id)
 
-    finally:
-        locker_set(redis_client=redis_client, key=redis_key, lock=False)
+    hyperion_amap_logger.info(
+        f"Add_order_to_delivery: An order has been created for user {order.user_id} for an amount of {amount}€. ({request_id})",
+    )
+    return schemas_amap.OrderReturn(productsdetail=productsret, **orderret.__dict__)
 
 
 @module.router.patch(
@@ -509,7 +505,7 @@ async def edit_order_from_delivery(
     order_id: str,
     order: schemas_amap.OrderEdit,
     db: AsyncSession = Depends(get_db),
-    redis_client: Redis | None = Depends(get_redis_client),
+    redis_client: Redis | None = Depends(get_async_redis_client),
     user: models_users.CoreUser = Depends(is_user_a_member),
     request_id: str = Depends(get_request_id),
 ):
@@ -584,36 +580,27 @@ async def edit_order_from_delivery(
         if not balance:
             raise HTTPException(status_code=404, detail="No cash found")
 
-        redis_key = "amap_" + previous_order.user_id
-
-        if not isinstance(redis_client, Redis) or locker_get(
-            redis_client=redis_client,
-            key=redis_key,
-        ):
-            raise HTTPException(status_code=429, detail="Too fast !")
-        locker_set(redis_client=redis_client, key=redis_key, lock=True)
-
         try:
-            await cruds_amap.edit_order_with_products(
-                order=db_order,
-                db=db,
-            )
-            await cruds_amap.remove_cash(
+            async with distributed_lock(
+                key="amap_" + previous_order.user_id,
                 db=db,
-                user_id=previous_order.user_id,
-                amount=amount,
-            )
-            await cruds_amap.add_cash(
-                db=db,
-                user_id=previous_order.user_id,
-                amount=previous_amount,
-            )
-            hyperion_amap_logger.info(
-                f"Edit_order: Order {order_id} has been edited for user {db_order.user_id}. Amount was {previous_amount}€, is now {amount}€. ({request_id})",
-            )
+                redis_client=redis_client,
+            ):
+                await cruds_amap.edit_order_with_products(
+                    order=db_order,
+                    db=db,
+                )
+                await cruds_amap.add_cash(
+                    db=db,
+                    user_id=previous_order.user_id,
+                    amount=previous_amount - amount,
+                )
+        except LockTimeoutError:
+            raise HTTPException(status_code=429, detail="Too fast !")
 
-        finally:
-            locker_set(redis_client=redis_client, key=redis_key, lock=False)
+        hyperion_amap_logger.info(
+            f"Edit_order: Order {order_id} has been edited for user {db_order.user_id}. Amount was {previous_amount}€, is now {amount}€. ({request_id})",
+        )
 
 
 @module.router.delete(
@@ -623,7 +610,7 @@ async def edit_order_from_delivery(
 async def remove_order(
     order_id: str,
     db: AsyncSession = Depends(get_db),
-    redis_client: Redis | None = Depends(get_redis_client),
+    redis_client: Redis | None = Depends(get_async_redis_client),
     user: models_users.CoreUser = Depends(is_user_a_member),
     request_id: str = Depends(get_request_id),
 ):
@@ -660,32 +647,28 @@ async def remove_order(
     if not balance:
         raise HTTPException(status_code=404, detail="No cash found")
 
-    redis_key = "amap_" + order.user_id
-
-    if not isinstance(redis_client, Redis) or locker_get(
-        redis_client=redis_client,
-        key=redis_key,
-    ):
-        raise HTTPException(status_code=429, detail="Too fast !")
-    locker_set(redis_client=redis_client, key=redis_key, lock=True)
-
     try:
-        await cruds_amap.remove_order(
-            db=db,
-            order_id=order_id,
-        )
-        await cruds_amap.add_cash(
+        async with distributed_lock(
+            key="amap_" + order.user_id,
             db=db,
-            user_id=order.user_id,
-            amount=amount,
-        )
-        hyperion_amap_logger.info(
-            f"Delete_order: Order {order_id} by {order.user_id} was deleted. {amount}€ were refunded. ({request_id})",
-        )
-        return Response(status_code=204)
+            redis_client=redis_client,
+        ):
+            await cruds_amap.remove_order(
+                db=db,
+                order_id=order_id,
+            )
+            await cruds_amap.add_cash(
+                db=db,
+                user_id=order.user_id,
+                amount=amount,
+            )
+    except LockTimeoutError:
+        raise HTTPException(status_code=429, detail="Too fast !")
 
-    finally:
-        locker_set(redis_client=redis_client, key=redis_key, lock=False)
+    hyperion_amap_logger.info(
+        f"Delete_order: Order {order_id} by {order.user_id} was deleted. {amount}€ were refunded. ({request_id})",
+    )
+    return Response(status_code=204)
 
 
 @module.router.post(
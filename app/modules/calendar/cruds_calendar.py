@@ -1,4 +1,5 @@
 from collections.abc import Sequence
+from datetime import UTC, datetime
 from uuid import UUID
 
 from sqlalchemy import delete, select, update
@@ -84,6 +85,7 @@ async def edit_event(
         .where(models_calendar.Event.id == event_id)
         .values(
             decision=decision,
+            last_modified=datetime.now(UTC),
             **event.model_dump(exclude_unset=True),
         ),
     )
@@ -113,12 +115,12 @@ async def confirm_event(
     await db.execute(
         update(models_calendar.Event)
         .where(models_calendar.Event.id == event_id)
-        .values(decision=decision),
+        .values(decision=decision, last_modified=datetime.now(UTC)),
     )
     await db.flush()
-    if decision == Decision.approved:
-        events = await get_all_events(db)
-        await create_icalendar_file(events, settings=settings)
+    # A declined event may have been approved before, and should be removed from the calendar
+    events = await get_all_events(db)
+    await create_icalendar_file(events, settings=settings)
 
 
 async def get_ical_secret_by_user_id(
@@ -1,7 +1,9 @@
 import uuid
 from datetime import UTC, datetime
+from email.utils import formatdate
 
-from fastapi import Depends, File, HTTPException, UploadFile
+import aiofiles.os
+from fastapi import Depends, File, Header, HTTPException, Response, UploadFile
 from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -248,6 +250,7 @@ async def add_event(
         recurrence_rule=event.recurrence_rule,
         ticket_url=event.ticket_url,
         ticket_url_opening=event.ticket_url_opening,
+        last_modified=datetime.now(UTC),
     )
 
     await cruds_calendar.add_event(event=db_event, db=db)
@@ -264,6 +267,11 @@ async def add_event(
             db=db,
             notification_tool=notification_tool,
         )
+        events = await cruds_calendar.get_all_events(db)
+        await utils_calendar.create_icalendar_file(
+            all_events=events,
+            settings=settings,
+        )
 
     return created_event
 
@@ -277,6 +285,7 @@ async def edit_bookings_id(
     event_edit: schemas_calendar.EventEdit,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_school_member),
+    settings: Settings = Depends(get_settings),
 ):
     """
     Edit an event.
@@ -318,6 +327,7 @@ async def edit_bookings_id(
             detail="You are not allowed to edit this event",
         )
 
+    previous_decision = event.decision
     new_decision = event.decision
     if event.decision != Decision.pending and not is_user_member_of_BDE:
         # If the event is not pending and the user is not a member of the group BDE, we will change the decision back to pending
@@ -330,6 +340,13 @@ async def edit_bookings_id(
         db=db,
     )
 
+    if Decision.approved in (previous_decision, new_decision):
+        events = await cruds_calendar.get_all_events(db)
+        await utils_calendar.create_icalendar_file(
+            all_events=events,
+            settings=settings,
+        )
+
 
 @module.router.patch(
     "/calendar/events/{event_id}/reply/{decision}",
@@ -464,9 +481,18 @@ async def recreate_ical_file(
 )
 async def get_icalendar_file(
     secret: str,
+    association_id: uuid.UUID | None = None,
+    if_none_match: str | None = Header(default=None),
     db: AsyncSession = Depends(get_db),
+    settings: Settings = Depends(get_settings),
 ):
-    """Get the icalendar file corresponding to the event in the database."""
+    """
+    Get the icalendar file corresponding to the event in the database.
+    If `association_id` is provided, only the events of this association are included.
+
+    The response contains an `ETag` header identifying the version of the calendar. If it matches the `If-None-Match` header,
+    a 304 response is returned.
+    """
 
     existing_secret = await cruds_calendar.get_ical_secret_by_secret(
         secret=secret,
@@ -475,4 +501,36 @@ async def get_icalendar_file(
     if existing_secret is None:
         raise HTTPException(status_code=403, detail="Invalid secret")
 
-    return FileResponse(utils_calendar.calendar_file_path)
+    if association_id is not None:
+        events = await cruds_calendar.get_events_by_association(
+            association_id=association_id,
+            db=db,
+        )
+        # Filtered calendars are rendered from the same event fragments as the calendar file
+        content = utils_calendar.icalendar_renderer.render(
+            events=events,
+            settings=settings,
+        )
+        etag = utils_calendar.get_icalendar_etag(content)
+        if utils_calendar.is_etag_matching(etag, if_none_match):
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(
+            content=content,
+            media_type="text/calendar",
+            headers={"ETag": etag},
+        )
+
+    etag = await utils_calendar.icalendar_renderer.get_file_etag()
+    if utils_calendar.is_etag_matching(etag, if_none_match):
+        last_modified = await aiofiles.os.path.getmtime(
+            utils_calendar.calendar_file_path,
+        )
+        return Response(
+            status_code=304,
+            headers={
+                "ETag": etag,
+                "Last-Modified": formatdate(last_modified, usegmt=True),
+            },
+        )
+    # The Last-Modified header is set from the modification date of the file
+    return FileResponse(utils_calendar.calendar_file_path, headers={"ETag": etag})
@@ -35,6 +35,9 @@ class Event(Base):
     ticket_url: Mapped[str | None]
     ticket_url_opening: Mapped[datetime | None]
 
+    # Used as the DTSTAMP of the event in the icalendar feed
+    last_modified: Mapped[datetime]
+
     association: Mapped[CoreAssociation] = relationship("CoreAssociation", init=False)
 
 
@@ -1,7 +1,10 @@
+import hashlib
 from collections.abc import Sequence
-from datetime import UTC, datetime
+from typing import Any
+from uuid import UUID, uuid4
 
 import aiofiles
+import aiofiles.os
 from icalendar import Calendar, Event, vRecur
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -37,41 +40,152 @@ async def add_event_to_feed(
     )
 
 
+class ICalendarRenderer:
+    def __init__(self):
+        """
+        Render icalendar feeds, keeping the serialized VEVENT of each event.
+
+        A fragment is rendered again only if one of the fields it was rendered from changed.
+        Rendered feeds only depend on the events, every worker thus renders the same bytes, with the same ETag.
+        """
+        self.fragments: dict[UUID, tuple[tuple[Any, ...], bytes]] = {}
+        # The ETag of the calendar file, for its modification time and size
+        self.file_etag: tuple[tuple[int, int], str] | None = None
+
+    def get_event_fragment(
+        self,
+        event: models_calendar.Event,
+        settings: Settings,
+    ) -> bytes:
+        fragment_key = (
+            event.name,
+            event.description,
+            event.start,
+            event.end,
+            event.all_day,
+            event.location,
+            event.recurrence_rule,
+            event.last_modified,
+            event.association.name,
+            settings.school.application_domain_name,
+        )
+        cached_fragment = self.fragments.get(event.id)
+        if cached_fragment is not None and cached_fragment[0] == fragment_key:
+            return cached_fragment[1]
+
+        if event.all_day:
+            start = event.start.date()
+            end = event.end.date()
+        else:
+            start = event.start
+            end = event.end
+        ical_event = Event()
+        ical_event.add(
+            "uid",
+            f"{event.id}@{settings.school.application_domain_name}",
+        )
+        ical_event.add("summary", event.name)
+        ical_event.add("description", event.description)
+        ical_event.add("dtstart", start)
+        ical_event.add("dtend", end)
+        # A stable timestamp, so that unchanged events are rendered identically
+        ical_event.add("dtstamp", event.last_modified)
+        ical_event.add("class", "public")
+        ical_event.add("organizer", event.association.name)
+        ical_event.add("location", event.location)
+        if event.recurrence_rule:
+            ical_event.add("rrule", vRecur.from_ical(event.recurrence_rule))
+
+        fragment: bytes = ical_event.to_ical()
+        self.fragments[event.id] = (fragment_key, fragment)
+        return fragment
+
+    def render(
+        self,
+        events: Sequence[models_calendar.Event],
+        settings: Settings,
+    ) -> bytes:
+        """
+        Render a calendar containing the approved events among `events`.
+        """
+        calendar = Calendar()
+        # Required fields
+        calendar.add("version", "2.0")
+        calendar.add("prodid", settings.school.application_domain_name)
+        # The calendar ends with `END:VCALENDAR`, events are inserted before it
+        header, footer = calendar.to_ical().rsplit(b"END:VCALENDAR", 1)
+
+        approved_events = sorted(
+            (event for event in events if event.decision == Decision.approved),
+            key=lambda event: (event.start, str(event.id)),
+        )
+        return b"".join(
+            [
+                header,
+                *(
+                    self.get_event_fragment(event=event, settings=settings)
+                    for event in approved_events
+                ),
+                b"END:VCALENDAR",
+                footer,
+            ],
+        )
+
+    def remove_other_fragments(self, event_ids: set[UUID]) -> None:
+        """
+        Forget the fragments of events which are not in `event_ids`, for example deleted events.
+        """
+        for event_id in self.fragments.keys() - event_ids:
+            del self.fragments[event_id]
+
+    async def get_file_etag(self) -> str:
+        """
+        Return the ETag of the calendar file. The file is only hashed again once it was modified, possibly by another worker.
+        """
+        stat_result = await aiofiles.os.stat(calendar_file_path)
+        file_version = (stat_result.st_mtime_ns, stat_result.st_size)
+        if self.file_etag is None or self.file_etag[0] != file_version:
+            async with aiofiles.open(calendar_file_path, mode="rb") as calendar_file:
+                content = await calendar_file.read()
+            self.file_etag = (file_version, get_icalendar_etag(content))
+        return self.file_etag[1]
+
+
+icalendar_renderer = ICalendarRenderer()
+
+
+def get_icalendar_etag(content: bytes) -> str:
+    return f'"{hashlib.sha256(content).hexdigest()}"'
+
+
+def is_etag_matching(etag: str, if_none_match: str | None) -> bool:
+    return if_none_match is not None and etag in [
+        tag.strip() for tag in if_none_match.split(",")
+    ]
+
+
 async def create_icalendar_file(
     all_events: Sequence[models_calendar.Event],
     settings: Settings,
 ) -> None:
-    """Create the ics file corresponding to the database. The calendar is entirely recreated each time an event is added or deleted in the db."""
-
-    calendar = Calendar()
-    calendar.add("version", "2.0")  # Required field
-    calendar.add("proid", settings.school.application_domain_name)  # Required field
-
-    for event in all_events:
-        if event.decision == Decision.approved:
-            if event.all_day:
-                start = event.start.date()
-                end = event.end.date()
-            else:
-                start = event.start
-                end = event.end
-            ical_event = Event()
-            ical_event.add(
-                "uid",
-                f"{event.id}@{settings.school.application_domain_name}",
-            )
-            ical_event.add("summary", event.name)
-            ical_event.add("description", event.description)
-            ical_event.add("dtstart", start)
-            ical_event.add("dtend", end)
-            ical_event.add("dtstamp", datetime.now(UTC))
-            ical_event.add("class", "public")
-            ical_event.add("organizer", event.association.name)
-            ical_event.add("location", event.location)
-            if event.recurrence_rule:
-                ical_event.add("rrule", vRecur.from_ical(event.recurrence_rule))
-
-            calendar.add_component(ical_event)
-
-    async with aiofiles.open(calendar_file_path, mode="wb") as calendar_file:
-        await calendar_file.write(calendar.to_ical())
+    """
+    Create the ics file corresponding to the database.
+
+    Only modified events are serialized again, and the file is only written if its content changed,
+    so that its ETag and modification date stay the same for calendar clients.
+    """
+    content = icalendar_renderer.render(events=all_events, settings=settings)
+    icalendar_renderer.remove_other_fragments(
+        event_ids={event.id for event in all_events},
+    )
+
+    if await aiofiles.os.path.exists(calendar_file_path):
+        async with aiofiles.open(calendar_file_path, mode="rb") as calendar_file:
+            if await calendar_file.read() == content:
+                return
+
+    # The file is replaced atomically, other workers may be serving it
+    temporary_file_path = f"{calendar_file_path}.{uuid4()}.tmp"
+    async with aiofiles.open(temporary_file_path, mode="wb") as calendar_file:
+        await calendar_file.write(content)
+    await aiofiles.os.replace(temporary_file_path, calendar_file_path)
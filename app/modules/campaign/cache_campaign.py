@@ -0,0 +1,17 @@
+"""Cache of the status of the vote and of the voter groups, used by read-only endpoints"""
+
+from typing import NamedTuple
+
+from app.modules.campaign.types_campaign import StatusType
+from app.utils.cache import TTLCache
+
+# The cache contains a single entry
+CAMPAIGN_STATE_KEY = "state"
+
+
+class CampaignState(NamedTuple):
+    status: StatusType
+    voter_group_ids: list[str]
+
+
+campaign_cache: TTLCache[str, CampaignState] = TTLCache(max_size=1)
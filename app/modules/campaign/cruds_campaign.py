@@ -3,11 +3,12 @@ import uuid
 from collections.abc import Sequence
 
 from fastapi import HTTPException
-from sqlalchemy import delete, select, update
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.modules.campaign import models_campaign, schemas_campaign
+from app.modules.campaign.cache_campaign import campaign_cache
 from app.modules.campaign.types_campaign import ListType, StatusType
 
 hyperion_error_logger = logging.getLogger("hyperion.error")
@@ -49,6 +50,7 @@ async def add_voter(
 ) -> None:
     db.add(voter)
     await db.flush()
+    campaign_cache.clear_after_commit(db)
 
 
 async def delete_voter_by_group_id(
@@ -61,6 +63,7 @@ async def delete_voter_by_group_id(
         ),
     )
     await db.flush()
+    campaign_cache.clear_after_commit(db)
 
 
 async def delete_voters(
@@ -68,6 +71,7 @@ async def delete_voters(
 ) -> None:
     await db.execute(delete(models_campaign.VoterGroups))
     await db.flush()
+    campaign_cache.clear_after_commit(db)
 
 
 async def set_status(
@@ -76,15 +80,18 @@ async def set_status(
 ):
     await db.execute(update(models_campaign.Status).values(status=new_status))
     await db.flush()
+    campaign_cache.clear_after_commit(db)
 
 
-async def get_vote_count(db: AsyncSession, section_id: str):
-    count = await db.execute(
-        select(models_campaign.HasVoted).where(
+async def get_vote_count(db: AsyncSession, section_id: str) -> int:
+    result = await db.execute(
+        select(func.count())
+        .select_from(models_campaign.HasVoted)
+        .where(
             models_campaign.HasVoted.section_id == section_id,
         ),
     )
-    return len(count.scalars().all())
+    return result.scalar_one()
 
 
 async def add_blank_option(db: AsyncSession):
@@ -204,6 +211,19 @@ async def get_list_by_id(
     return result.scalars().first()
 
 
+async def get_list_section_id(
+    db: AsyncSession,
+    list_id: str,
+) -> str | None:
+    """Return the id of the section of the list, or None if the list does not exist."""
+    result = await db.execute(
+        select(models_campaign.Lists.section_id).where(
+            models_campaign.Lists.id == list_id,
+        ),
+    )
+    return result.scalars().first()
+
+
 async def add_list(
     db: AsyncSession,
     campaign_list: models_campaign.Lists,
@@ -330,9 +350,14 @@ async def get_has_voted(
     return result.scalars().all()
 
 
-async def get_votes(db: AsyncSession) -> Sequence[models_campaign.Votes]:
-    result = await db.execute(select(models_campaign.Votes))
-    return result.scalars().all()
+async def get_votes_count_by_list(db: AsyncSession) -> Sequence[tuple[str, int]]:
+    """Return the number of votes of each list, counted by the database."""
+    result = await db.execute(
+        select(models_campaign.Votes.list_id, func.count()).group_by(
+            models_campaign.Votes.list_id,
+        ),
+    )
+    return result.tuples().all()
 
 
 async def delete_votes(db: AsyncSession) -> None:
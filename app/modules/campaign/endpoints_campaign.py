@@ -4,7 +4,8 @@ import uuid
 from datetime import UTC, datetime
 
 import aiofiles
-from fastapi import Depends, File, HTTPException, UploadFile
+import redis.asyncio
+from fastapi import BackgroundTasks, Depends, File, HTTPException, UploadFile
 from fastapi.responses import FileResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -12,6 +13,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.groups.groups_type import GroupType
 from app.core.users import cruds_users, models_users
 from app.dependencies import (
+    get_async_redis_client,
     get_db,
     get_request_id,
     is_user_a_member,
@@ -21,11 +23,12 @@ from app.modules.campaign import (
     cruds_campaign,
     models_campaign,
     schemas_campaign,
+    utils_campaign,
 )
 from app.modules.campaign.factory_campaign import CampaignFactory
 from app.modules.campaign.types_campaign import ListType, StatusType
 from app.types import standard_responses
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.module import Module
 from app.utils.tools import (
     get_file_from_data,
@@ -57,9 +60,8 @@ async def get_sections(
 
     **The user must be a member of a group authorized to vote (voters) or a member of the group CAA to use this endpoint**
     """
-    voters = await cruds_campaign.get_voters(db)
-    voters_groups = [voter.group_id for voter in voters]
-    voters_groups.append(GroupType.admin_vote)
+    campaign_state = await utils_campaign.get_campaign_state(db=db)
+    voters_groups = [*campaign_state.voter_group_ids, GroupType.admin_vote]
     if not is_user_member_of_any_group(user, voters_groups):
         raise HTTPException(
             status_code=403,
@@ -144,9 +146,8 @@ async def get_lists(
 
     **The user must be a member of a group authorized to vote (voters) or a member of the group CAA to use this endpoint**
     """
-    voters = await cruds_campaign.get_voters(db)
-    voters_groups = [voter.group_id for voter in voters]
-    voters_groups.append(GroupType.admin_vote)
+    campaign_state = await utils_campaign.get_campaign_state(db=db)
+    voters_groups = [*campaign_state.voter_group_ids, GroupType.admin_vote]
     if not is_user_member_of_any_group(user, voters_groups):
         raise HTTPException(
             status_code=403,
@@ -429,6 +430,7 @@ async def delete_voters(
 async def open_vote(
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_in(GroupType.admin_vote)),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
 ):
     """
     If the status is 'waiting', change it to 'voting' and create the blank lists.
@@ -449,6 +451,11 @@ async def open_vote(
     await cruds_campaign.add_blank_option(db=db)
     # Set the status to open
     await cruds_campaign.set_status(db=db, new_status=StatusType.open)
+    # Nobody could vote before, live counters start from zero
+    await utils_campaign.reset_sections_vote_count(
+        section_ids=[section.id for section in await cruds_campaign.get_sections(db)],
+        redis_client=redis_client,
+    )
 
     # Archive all changes to a json file
     lists = await cruds_campaign.get_lists(db=db)
@@ -560,14 +567,14 @@ async def reset_vote(
         )
 
     # Archive results to a json file
-    results = await get_results(db=db, user=user)
+    results = await cruds_campaign.get_votes_count_by_list(db=db)
     async with aiofiles.open(
         f"data/campaigns/results-{datetime.now(UTC).date().isoformat()}.json",
         mode="w",
     ) as file:
         await file.write(
             json.dumps(
-                [{"list_id": res.list_id, "count": res.count} for res in results],
+                [{"list_id": list_id, "count": count} for list_id, count in results],
             ),
         )
 
@@ -584,8 +591,10 @@ async def reset_vote(
 )
 async def vote(
     vote: schemas_campaign.VoteBase,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_member),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
 ):
     """
     Add a vote for a given campaign list.
@@ -594,32 +603,36 @@ async def vote(
 
     **The user must be a member of a group authorized to vote (voters) to use this endpoint**
     """
-    voters = await cruds_campaign.get_voters(db)
-    voters_groups = [voter.group_id for voter in voters]
+    # The vote must not be accepted based on an outdated state, the state is thus not read from the cache
+    campaign_state = await utils_campaign.load_campaign_state(db=db)
+    voters_groups = campaign_state.voter_group_ids
     if not is_user_member_of_any_group(user, voters_groups):
         raise HTTPException(
             status_code=403,
             detail="Access forbidden : you are not a poll member",
         )
 
-    status = await cruds_campaign.get_status(db=db)
+    status = campaign_state.status
     if status != StatusType.open:
         raise HTTPException(
             status_code=400,
             detail=f"You can only vote if the vote is open. The current status is {status}",
         )
 
-    campaign_list = await cruds_campaign.get_list_by_id(db=db, list_id=vote.list_id)
+    section_id = await cruds_campaign.get_list_section_id(
+        db=db,
+        list_id=vote.list_id,
+    )
 
     # Check if the campaign list exist.
-    if campaign_list is None:
+    if section_id is None:
         raise HTTPException(status_code=404, detail="The list does not exist.")
 
     # Check if the user has already voted for this section.
     has_voted = await cruds_campaign.has_user_voted_for_section(
         db=db,
         user_id=user.id,
-        section_id=campaign_list.section_id,
+        section_id=section_id,
     )
     if has_voted:
         raise HTTPException(
@@ -637,13 +650,20 @@ async def vote(
     await cruds_campaign.mark_has_voted(
         db=db,
         user_id=user.id,
-        section_id=campaign_list.section_id,
+        section_id=section_id,
     )
     await cruds_campaign.add_vote(
         db=db,
         vote=model_vote,
     )
 
+    # The vote is counted once it was committed
+    background_tasks.add_task(
+        utils_campaign.increment_section_vote_count,
+        section_id=section_id,
+        redis_client=redis_client,
+    )
+
 
 @module.router.get(
     "/campaign/votes",
@@ -659,15 +679,15 @@ async def get_sections_already_voted(
 
     **The user must be a member of a group authorized to vote (voters) to use this endpoint**
     """
-    voters = await cruds_campaign.get_voters(db)
-    voters_groups = [voter.group_id for voter in voters]
+    campaign_state = await utils_campaign.get_campaign_state(db=db)
+    voters_groups = campaign_state.voter_group_ids
     if not is_user_member_of_any_group(user, voters_groups):
         raise HTTPException(
             status_code=403,
             detail="Access forbidden : you are not a poll member",
         )
 
-    status = await cruds_campaign.get_status(db=db)
+    status = campaign_state.status
     if status != StatusType.open:
         raise HTTPException(
             status_code=400,
@@ -692,40 +712,24 @@ async def get_results(
 
     **The user must be a member of a group authorized to vote (voters) or a member of the group CAA to use this endpoint**
     """
-    voters = await cruds_campaign.get_voters(db)
-    voters_groups = [voter.group_id for voter in voters]
-    voters_groups.append(GroupType.admin_vote)
+    campaign_state = await utils_campaign.get_campaign_state(db=db)
+    voters_groups = [*campaign_state.voter_group_ids, GroupType.admin_vote]
     if not is_user_member_of_any_group(user, voters_groups):
         raise HTTPException(
             status_code=403,
             detail="Access forbidden : you are not a poll member",
         )
 
-    status = await cruds_campaign.get_status(db=db)
+    status = campaign_state.status
 
     if (
         status == StatusType.counting
         and is_user_member_of_any_group(user, [GroupType.admin_vote])
     ) or status == StatusType.published:
-        votes = await cruds_campaign.get_votes(db=db)
-
-        count_by_list = {}
-        for vote in votes:
-            if vote.list_id not in count_by_list:
-                count_by_list[vote.list_id] = 0
-
-            count_by_list[vote.list_id] += 1
-
-        results = []
-
-        for list_id, count in count_by_list.items():
-            results.append(
-                schemas_campaign.Result(
-                    list_id=list_id,
-                    count=count,
-                ),
-            )
-        return results
+        return [
+            schemas_campaign.Result(list_id=list_id, count=count)
+            for list_id, count in await cruds_campaign.get_votes_count_by_list(db=db)
+        ]
     raise HTTPException(
         status_code=400,
         detail=f"Results can only be acceded by admins in counting mode or by everyone in published mode. The current status is {status}",
@@ -746,16 +750,15 @@ async def get_status_vote(
 
     **The user must be a member of a group authorized to vote (voters) or a member of the group CAA to use this endpoint**
     """
-    voters = await cruds_campaign.get_voters(db)
-    voters_groups = [voter.group_id for voter in voters]
-    voters_groups.append(GroupType.admin_vote)
+    campaign_state = await utils_campaign.get_campaign_state(db=db)
+    voters_groups = [*campaign_state.voter_group_ids, GroupType.admin_vote]
     if not is_user_member_of_any_group(user, voters_groups):
         raise HTTPException(
             status_code=403,
             detail="Access forbidden : you are not a poll member",
         )
 
-    status = await cruds_campaign.get_status(db=db)
+    status = campaign_state.status
     return schemas_campaign.VoteStatus(status=status)
 
 
@@ -768,19 +771,24 @@ async def get_stats_for_section(
     section_id: str,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_in(GroupType.admin_vote)),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
 ):
     """
     Get stats about a given section.
 
     **The user must be a member of the group CAA to use this endpoint**
     """
-    status = await cruds_campaign.get_status(db=db)
+    status = (await utils_campaign.get_campaign_state(db=db)).status
     if status != StatusType.open:
         raise HTTPException(
             status_code=400,
             detail=f"Stats can only be acceded during the vote. The current status is {status}",
         )
-    count = await cruds_campaign.get_vote_count(db=db, section_id=section_id)
+    count = await utils_campaign.get_section_vote_count(
+        section_id=section_id,
+        db=db,
+        redis_client=redis_client,
+    )
     return schemas_campaign.VoteStats(section_id=section_id, count=count)
 
 
@@ -838,6 +846,7 @@ async def create_campaigns_logo(
 )
 async def read_campaigns_logo(
     list_id: str,
+    size: ImageSize | None = None,
     user: models_users.CoreUser = Depends(is_user_a_member),
     db: AsyncSession = Depends(get_db),
 ):
@@ -845,9 +854,8 @@ async def read_campaigns_logo(
     Get the logo of a campaign list.
     **The user must be a member of a group authorized to vote (voters) or a member of the group CAA to use this endpoint**
     """
-    voters = await cruds_campaign.get_voters(db)
-    voters_groups = [voter.group_id for voter in voters]
-    voters_groups.append(GroupType.admin_vote)
+    campaign_state = await utils_campaign.get_campaign_state(db=db)
+    voters_groups = [*campaign_state.voter_group_ids, GroupType.admin_vote]
     if not is_user_member_of_any_group(user, voters_groups):
         raise HTTPException(
             status_code=403,
@@ -865,4 +873,5 @@ async def read_campaigns_logo(
         directory="campaigns",
         filename=str(list_id),
         default_asset="assets/images/default_campaigns_logo.png",
+        size=size,
     )
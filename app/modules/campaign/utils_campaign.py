@@ -0,0 +1,83 @@
+import redis.asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.modules.campaign import cruds_campaign
+from app.modules.campaign.cache_campaign import (
+    CAMPAIGN_STATE_KEY,
+    CampaignState,
+    campaign_cache,
+)
+
+
+def _get_vote_count_key(section_id: str) -> str:
+    return f"campaign:vote_count:{section_id}"
+
+
+async def load_campaign_state(db: AsyncSession) -> CampaignState:
+    """
+    Return the status of the vote and the groups allowed to vote, from the database.
+    """
+    return CampaignState(
+        status=await cruds_campaign.get_status(db=db),
+        voter_group_ids=[
+            voter.group_id for voter in await cruds_campaign.get_voters(db=db)
+        ],
+    )
+
+
+async def get_campaign_state(db: AsyncSession) -> CampaignState:
+    """
+    Return the status of the vote and the groups allowed to vote, from the cache of the worker if possible.
+
+    The state may be outdated by a few seconds, endpoints writing to the database should use `load_campaign_state`.
+    """
+    state = campaign_cache.get(CAMPAIGN_STATE_KEY)
+    if state is None:
+        generation = campaign_cache.generation
+        state = await load_campaign_state(db=db)
+        campaign_cache.set(key=CAMPAIGN_STATE_KEY, value=state, generation=generation)
+    return state
+
+
+async def increment_section_vote_count(
+    section_id: str,
+    redis_client: redis.asyncio.Redis | None,
+) -> None:
+    """
+    Count a vote in the live counter of the section.
+
+    This function should be called after the vote was committed, for example in a background task.
+    """
+    if redis_client is not None:
+        await redis_client.incr(_get_vote_count_key(section_id))
+
+
+async def get_section_vote_count(
+    section_id: str,
+    db: AsyncSession,
+    redis_client: redis.asyncio.Redis | None,
+) -> int:
+    """
+    Return the number of votes for a section. Without Redis, votes are counted by the database.
+    """
+    if redis_client is not None:
+        count = await redis_client.get(_get_vote_count_key(section_id))
+        if count is not None:
+            return int(count)
+
+    count = await cruds_campaign.get_vote_count(db=db, section_id=section_id)
+    if redis_client is not None:
+        # Counters are reset when the vote is opened, they are only missing if Redis lost its data.
+        # A counter created by a vote in the meantime is kept
+        await redis_client.set(_get_vote_count_key(section_id), count, nx=True)
+    return count
+
+
+async def reset_sections_vote_count(
+    section_ids: list[str],
+    redis_client: redis.asyncio.Redis | None,
+) -> None:
+    if redis_client is not None and section_ids:
+        await redis_client.delete(
+            *[_get_vote_count_key(section_id) for section_id in section_ids],
+        )
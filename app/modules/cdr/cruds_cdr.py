@@ -1,10 +1,11 @@
 from collections.abc import Sequence
 from uuid import UUID
 
-from sqlalchemy import delete, select, update
+from sqlalchemy import delete, select, union, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import noload, selectinload
 
+from app.core.groups.groups_type import AccountType
 from app.core.users.models_users import CoreUser
 from app.modules.cdr import models_cdr, schemas_cdr
 
@@ -18,6 +19,40 @@ async def get_cdr_users_curriculum(
     return result.scalars().all()
 
 
+async def get_cdr_users_previews(
+    db: AsyncSession,
+) -> Sequence[
+    tuple[str, str, str, str | None, AccountType, UUID, UUID | None, str | None]
+]:
+    """
+    Return the columns of `CdrUserPreview` for all users: id, name, firstname, nickname, account type and school id,
+    followed by the id and the name of the user's curriculum, or None if the user has no curriculum.
+
+    Only these columns are selected, without loading groups and school relationships.
+    """
+    result = await db.execute(
+        select(
+            CoreUser.id,
+            CoreUser.name,
+            CoreUser.firstname,
+            CoreUser.nickname,
+            CoreUser.account_type,
+            CoreUser.school_id,
+            models_cdr.Curriculum.id,
+            models_cdr.Curriculum.name,
+        )
+        .outerjoin(
+            models_cdr.CurriculumMembership,
+            models_cdr.CurriculumMembership.user_id == CoreUser.id,
+        )
+        .outerjoin(
+            models_cdr.Curriculum,
+            models_cdr.Curriculum.id == models_cdr.CurriculumMembership.curriculum_id,
+        ),
+    )
+    return result.tuples().all()
+
+
 async def get_cdr_user_curriculum(
     db: AsyncSession,
     user_id: str,
@@ -453,6 +488,61 @@ async def get_purchases_by_user_id_by_seller_id(
     return result.scalars().all()
 
 
+async def get_product_variants_by_seller_id(
+    db: AsyncSession,
+    seller_id: UUID,
+) -> Sequence[models_cdr.ProductVariant]:
+    result = await db.execute(
+        select(models_cdr.ProductVariant)
+        .join(models_cdr.CdrProduct)
+        .where(models_cdr.CdrProduct.seller_id == seller_id)
+        .options(noload("*")),
+    )
+    return result.scalars().all()
+
+
+async def get_purchases_by_seller_id(
+    db: AsyncSession,
+    seller_id: UUID,
+) -> Sequence[models_cdr.Purchase]:
+    result = await db.execute(
+        select(models_cdr.Purchase)
+        .join(models_cdr.ProductVariant)
+        .join(models_cdr.CdrProduct)
+        .where(models_cdr.CdrProduct.seller_id == seller_id)
+        .options(noload("*")),
+    )
+    return result.scalars().all()
+
+
+async def get_users_with_purchases_or_customdata_by_seller_id(
+    db: AsyncSession,
+    seller_id: UUID,
+) -> Sequence[CoreUser]:
+    """
+    Return the users who bought a product of the seller or answered one of its custom data fields,
+    without loading their relationships.
+    """
+    purchasers = (
+        select(models_cdr.Purchase.user_id)
+        .join(models_cdr.ProductVariant)
+        .join(models_cdr.CdrProduct)
+        .where(models_cdr.CdrProduct.seller_id == seller_id)
+    )
+    respondents = (
+        select(models_cdr.CustomData.user_id)
+        .join(models_cdr.CustomDataField)
+        .join(models_cdr.CdrProduct)
+        .where(models_cdr.CdrProduct.seller_id == seller_id)
+    )
+    result = await db.execute(
+        select(CoreUser)
+        .where(CoreUser.id.in_(union(purchasers, respondents)))
+        .options(noload("*")),
+    )
+    return result.scalars().all()
+
+
 def create_purchase(
     db: AsyncSession,
     purchase: models_cdr.Purchase,
@@ -863,6 +953,32 @@ async def get_product_customdata_fields(
     return result.scalars().all()
 
 
+async def get_customdata_fields_by_seller_id(
+    db: AsyncSession,
+    seller_id: UUID,
+) -> Sequence[models_cdr.CustomDataField]:
+    result = await db.execute(
+        select(models_cdr.CustomDataField)
+        .join(models_cdr.CdrProduct)
+        .where(models_cdr.CdrProduct.seller_id == seller_id),
+    )
+    return result.scalars().all()
+
+
+async def get_customdata_by_seller_id(
+    db: AsyncSession,
+    seller_id: UUID,
+) -> Sequence[models_cdr.CustomData]:
+    result = await db.execute(
+        select(models_cdr.CustomData)
+        .join(models_cdr.CustomDataField)
+        .join(models_cdr.CdrProduct)
+        .where(models_cdr.CdrProduct.seller_id == seller_id)
+        .options(noload("*")),
+    )
+    return result.scalars().all()
+
+
 async def update_customdata(db: AsyncSession, field_id: UUID, user_id: str, value: str):
     await db.execute(
         update(models_cdr.CustomData)
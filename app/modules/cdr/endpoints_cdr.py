@@ -6,26 +6,34 @@ from pathlib import Path
 from uuid import UUID, uuid4
 
 import calypsso
+import redis.asyncio
 from fastapi import (
+    BackgroundTasks,
     Depends,
+    Header,
     HTTPException,
     WebSocket,
 )
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.checkout.payment_tool import PaymentTool
 from app.core.checkout.types_checkout import HelloAssoConfigName
+from app.core.exports import schemas_exports
+from app.core.exports.types_exports import ExportType
+from app.core.exports.utils_exports import start_export_job
 from app.core.groups import cruds_groups, schemas_groups
 from app.core.groups.groups_type import GroupType
 from app.core.memberships import cruds_memberships, schemas_memberships
 from app.core.users import cruds_users, models_users, schemas_users
-from app.core.users.cruds_users import get_user_by_id, get_users
+from app.core.users.cruds_users import get_user_by_id
 from app.core.utils.config import Settings
 from app.dependencies import (
+    get_async_redis_client,
     get_db,
     get_mail_templates,
     get_payment_tool,
+    get_scheduler,
     get_settings,
     get_unsafe_db,
     get_websocket_connection_manager,
@@ -40,15 +48,26 @@ from app.modules.cdr.types_cdr import (
     DocumentSignatureType,
 )
 from app.modules.cdr.utils_cdr import (
+    can_user_subscribe_to_seller,
     check_request_consistency,
-    construct_dataframe_from_users_purchases,
+    export_seller_results,
+    get_cdr_users_changes,
+    get_cdr_users_previews,
+    get_cdr_users_snapshot,
+    get_cdr_users_snapshot_version,
+    invalidate_cdr_users_snapshot,
     is_user_in_a_seller_group,
+    send_purchase_message,
     validate_payment,
+    write_seller_results,
 )
 from app.types.module import Module
+from app.types.scheduler import Scheduler
 from app.types.websocket import (
     HyperionWebsocketsRoom,
     WebsocketConnectionManager,
+    WebsocketRoomType,
+    is_user_own_room,
 )
 
 # from app.utils.mail.mailworker import send_email
@@ -76,12 +95,68 @@ hyperion_error_logger = logging.getLogger("hyperion.error")
     status_code=200,
 )
 async def get_cdr_users(
+    if_none_match: str | None = Header(default=None),
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_member),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
 ):
     """
     Get all users.
 
+    The response contains an `ETag` header identifying the version of the list. If it matches the `If-None-Match` header,
+    a 304 response is returned. `/cdr/users/changes/` returns only the users modified since a given version.
+
+    **User must be part of a seller group to use this endpoint**
+    """
+    if not (
+        is_user_member_of_any_group(user, [GroupType.admin_cdr])
+        or await cruds_cdr.get_sellers_by_group_ids(
+            db=db,
+            group_ids=user.group_ids,
+        )
+    ):
+        raise HTTPException(
+            status_code=403,
+            detail="You must be a seller to use this endpoint.",
+        )
+
+    if redis_client is not None:
+        version = await get_cdr_users_snapshot_version(
+            db=db,
+            redis_client=redis_client,
+        )
+        if version is not None and if_none_match is not None:
+            if f'"{version}"' in [tag.strip() for tag in if_none_match.split(",")]:
+                return Response(status_code=304, headers={"ETag": f'"{version}"'})
+        snapshot = await get_cdr_users_snapshot(redis_client=redis_client)
+        if snapshot is not None:
+            # Users are cached as JSON, we don't need to validate them again
+            return Response(
+                content=b"[" + b",".join(snapshot.users) + b"]",
+                media_type="application/json",
+                headers={"ETag": f'"{snapshot.version}"'},
+            )
+
+    return list((await get_cdr_users_previews(db=db)).values())
+
+
+@module.router.get(
+    "/cdr/users/changes/",
+    response_model=schemas_cdr.CdrUsersChanges,
+    status_code=200,
+)
+async def get_cdr_users_changes_since(
+    since: int,
+    db: AsyncSession = Depends(get_db),
+    user: models_users.CoreUser = Depends(is_user_a_member),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
+):
+    """
+    Get the users modified or deleted since the version `since`, as returned by the `ETag` header of `/cdr/users/`
+    or by a previous call to this endpoint.
+
+    If the version is unknown, all users are returned and `reset` is true: the client should replace its list.
+
     **User must be part of a seller group to use this endpoint**
     """
     if not (
@@ -95,13 +170,20 @@ async def get_cdr_users(
             status_code=403,
             detail="You must be a seller to use this endpoint.",
         )
-    users = {u.id: u.__dict__ for u in await get_users(db=db)}
-    curriculum = await cruds_cdr.get_cdr_users_curriculum(db)
-    curriculum_complete = {c.id: c for c in await cruds_cdr.get_curriculums(db=db)}
-    for c in curriculum:
-        users[c.user_id]["curriculum"] = curriculum_complete[c.curriculum_id]
 
-    return list(users.values())
+    if redis_client is not None:
+        await get_cdr_users_snapshot_version(db=db, redis_client=redis_client)
+        changes = await get_cdr_users_changes(since=since, redis_client=redis_client)
+        if changes is not None:
+            return changes
+
+    # Without a snapshot, the versions are unknown
+    return schemas_cdr.CdrUsersChanges(
+        version=0,
+        reset=True,
+        users=list((await get_cdr_users_previews(db=db)).values()),
+        deleted_user_ids=[],
+    )
 
 
 @module.router.get(
@@ -229,7 +311,9 @@ async def get_cdr_user(
 async def update_cdr_user(
     user_id: str,
     user_update: schemas_cdr.CdrUserUpdate,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
     seller_user: models_users.CoreUser = Depends(
         is_user_in(GroupType.admin_cdr),
     ),
@@ -294,6 +378,11 @@ async def update_cdr_user(
             ),
         )
     await db.flush()
+    # The snapshot is invalidated once the modification is committed
+    background_tasks.add_task(
+        invalidate_cdr_users_snapshot,
+        redis_client=redis_client,
+    )
 
     user_db = await get_user_by_id(db, user_id)
     if not user_db:
@@ -412,70 +501,15 @@ async def generate_and_send_results(
             status_code=404,
             detail="Seller group not found.",
         )
-    products = await cruds_cdr.get_products_by_seller_id(db, seller_id)
-    if len(products) == 0:
-        raise HTTPException(
-            status_code=400,
-            detail="There is no products for this seller so there is no results to send.",
-        )
-    variants: list[models_cdr.ProductVariant] = []
-    product_fields: dict[UUID, list[models_cdr.CustomDataField]] = {}
-    for product in products:
-        product_variants = await cruds_cdr.get_product_variants(db, product.id)
-        variants.extend(product_variants)
-        product_fields[product.id] = list(
-            await cruds_cdr.get_product_customdata_fields(
-                db,
-                product.id,
-            ),
-        )
-    variant_ids = [v.id for v in variants]
-    purchases = await cruds_cdr.get_all_purchases(db)
-    if len(purchases) == 0:
-        raise HTTPException(
-            status_code=400,
-            detail="There is no purchases in the database so there is no results to send.",
-        )
-    purchases_by_users: dict[str, list[models_cdr.Purchase]] = {}
-    users = await get_users(db)
-    for purchase in purchases:
-        if purchase.product_variant_id in variant_ids:
-            if purchase.user_id not in purchases_by_users:
-                purchases_by_users[purchase.user_id] = []
-            purchases_by_users[purchase.user_id].append(purchase)
-    users_answers = {}
-    for each_user in users:
-        users_answers[each_user.id] = list(
-            await cruds_cdr.get_customdata_by_user_id(
-                db,
-                each_user.id,
-            ),
-        )
-    hyperion_error_logger.info(
-        f"Data for seller {seller.name} fetched. Starting to construct the dataframe.",
-    )
-    df = construct_dataframe_from_users_purchases(
-        users_purchases=purchases_by_users,
-        users=list(users),
-        products=list(products),
-        variants=variants,
-        data_fields=product_fields,
-        users_answers=users_answers,
-    )
-    hyperion_error_logger.info(
-        f"Dataframe for seller {seller.name} constructed. Generating the Excel file.",
-    )
-
     file_directory = "/app/data/cdr"
     file_uuid = uuid4()
     # file_name = f"CdR {datetime.now(tz=UTC).year} ventes {seller.name}.xlsx"
 
     Path.mkdir(Path(file_directory), parents=True, exist_ok=True)
-    df.to_excel(
-        Path(file_directory, str(file_uuid)),
-        index=False,
-        freeze_panes=(2, 3),
-        engine="xlsxwriter",
+    await write_seller_results(
+        seller=seller,
+        db=db,
+        file_path=Path(file_directory, str(file_uuid)),
     )
     return Path(file_directory, str(file_uuid))
 
@@ -520,6 +554,46 @@ async def send_seller_results(
     return FileResponse(path)
 
 
+@module.router.post(
+    "/cdr/sellers/{seller_id}/results/export",
+    response_model=schemas_exports.ExportJob,
+    status_code=201,
+)
+async def export_seller_results_in_background(
+    seller_id: UUID,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    user: models_users.CoreUser = Depends(is_user_in(GroupType.admin_cdr)),
+    scheduler: Scheduler = Depends(get_scheduler),
+):
+    """
+    Start the generation of a seller's results, which can then be followed and downloaded using `/exports/{export_job_id}`.
+
+    If the results of this seller are already being generated, the current export is returned.
+
+    **User must be CDR Admin to use this endpoint**
+    """
+    seller = await cruds_cdr.get_seller_by_id(db, seller_id)
+    if not seller:
+        raise HTTPException(
+            status_code=404,
+            detail="Seller not found.",
+        )
+
+    return await start_export_job(
+        export_type=ExportType.cdr_seller_results,
+        lock=f"cdr_seller_results_{seller_id}",
+        file_name=f"CdR {datetime.now(tz=UTC).year} ventes {seller.name}.xlsx",
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        export_function=export_seller_results,
+        creator_id=user.id,
+        db=db,
+        scheduler=scheduler,
+        background_tasks=background_tasks,
+        seller_id=seller_id,
+    )
+
+
 @module.router.get(
     "/cdr/online/products/",
     response_model=list[schemas_cdr.ProductComplete],
@@ -1384,8 +1458,10 @@ async def create_purchase(
     user_id: str,
     product_variant_id: UUID,
     purchase: schemas_cdr.PurchaseBase,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user()),
+    ws_manager: WebsocketConnectionManager = Depends(get_websocket_connection_manager),
 ):
     """
     Create a purchase.
@@ -1448,12 +1524,23 @@ async def create_purchase(
             purchase=purchase,
         )
         cruds_cdr.create_action(db, db_action)
-        await db.flush()
-        return db_purchase
-
-    cruds_cdr.create_purchase(db, db_purchase)
-    cruds_cdr.create_action(db, db_action)
+        # The update is synchronized with the purchase already loaded in the session
+        db_purchase = existing_db_purchase
+    else:
+        cruds_cdr.create_purchase(db, db_purchase)
+        cruds_cdr.create_action(db, db_action)
     await db.flush()
+
+    background_tasks.add_task(
+        send_purchase_message,
+        message=schemas_cdr.UpdatePurchaseWSMessageModel(
+            data=schemas_cdr.PurchaseComplete.model_validate(db_purchase),
+        ),
+        seller_id=product.seller_id,
+        user_id=user_id,
+        cdr_status=status.status,
+        ws_manager=ws_manager,
+    )
     return db_purchase
 
 
@@ -1530,8 +1617,10 @@ async def mark_purchase_as_validated(
     user_id: str,
     product_variant_id: UUID,
     validated: bool,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_in(GroupType.admin_cdr)),
+    ws_manager: WebsocketConnectionManager = Depends(get_websocket_connection_manager),
 ):
     """
     Validate a purchase.
@@ -1662,6 +1751,24 @@ async def mark_purchase_as_validated(
         validated=validated,
     )
     await db.flush()
+
+    cdr_status = await get_core_data(schemas_cdr.Status, db)
+    background_tasks.add_task(
+        send_purchase_message,
+        message=schemas_cdr.UpdatePurchaseWSMessageModel(
+            data=schemas_cdr.PurchaseComplete(
+                user_id=user_id,
+                product_variant_id=product_variant_id,
+                quantity=db_purchase.quantity,
+                validated=validated,
+                purchased_on=db_purchase.purchased_on,
+            ),
+        ),
+        seller_id=product.seller_id,
+        user_id=user_id,
+        cdr_status=cdr_status.status,
+        ws_manager=ws_manager,
+    )
     return db_purchase
 
 
@@ -1672,8 +1779,10 @@ async def mark_purchase_as_validated(
 async def delete_purchase(
     user_id: str,
     product_variant_id: UUID,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user()),
+    ws_manager: WebsocketConnectionManager = Depends(get_websocket_connection_manager),
 ):
     """
     Delete a purchase.
@@ -1774,6 +1883,18 @@ async def delete_purchase(
     )
     cruds_cdr.create_action(db, db_action)
 
+    cdr_status = await get_core_data(schemas_cdr.Status, db)
+    background_tasks.add_task(
+        send_purchase_message,
+        message=schemas_cdr.DeletePurchaseWSMessageModel(
+            data=schemas_cdr.PurchaseComplete.model_validate(db_purchase),
+        ),
+        seller_id=product.seller_id,
+        user_id=user_id,
+        cdr_status=cdr_status.status,
+        ws_manager=ws_manager,
+    )
+
 
 @module.router.get(
     "/cdr/users/{user_id}/signatures/",
@@ -1980,7 +2101,9 @@ async def create_curriculum(
 )
 async def delete_curriculum(
     curriculum_id: UUID,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
     user: models_users.CoreUser = Depends(is_user_in(GroupType.admin_cdr)),
 ):
     """
@@ -2002,6 +2125,10 @@ async def delete_curriculum(
         curriculum_id=curriculum_id,
         db=db,
     )
+    background_tasks.add_task(
+        invalidate_cdr_users_snapshot,
+        redis_client=redis_client,
+    )
 
 
 @module.router.post(
@@ -2011,7 +2138,9 @@ async def delete_curriculum(
 async def create_curriculum_membership(
     user_id: str,
     curriculum_id: UUID,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
     user: models_users.CoreUser = Depends(is_user()),
     ws_manager: WebsocketConnectionManager = Depends(get_websocket_connection_manager),
 ):
@@ -2069,6 +2198,10 @@ async def create_curriculum_membership(
         curriculum_membership=curriculum_membership,
     )
     await db.flush()
+    background_tasks.add_task(
+        invalidate_cdr_users_snapshot,
+        redis_client=redis_client,
+    )
 
     cdr_status = await get_core_data(schemas_cdr.Status, db)
     if cdr_status.status == CdrStatus.onsite:
@@ -2108,7 +2241,9 @@ async def create_curriculum_membership(
 async def update_curriculum_membership(
     user_id: str,
     curriculum_id: UUID,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
     user: models_users.CoreUser = Depends(is_user()),
     ws_manager: WebsocketConnectionManager = Depends(get_websocket_connection_manager),
 ):
@@ -2146,6 +2281,10 @@ async def update_curriculum_membership(
         curriculum_id=curriculum_id,
     )
     await db.flush()
+    background_tasks.add_task(
+        invalidate_cdr_users_snapshot,
+        redis_client=redis_client,
+    )
 
     cdr_status = await get_core_data(schemas_cdr.Status, db)
     if cdr_status.status == CdrStatus.onsite:
@@ -2185,7 +2324,9 @@ async def update_curriculum_membership(
 async def delete_curriculum_membership(
     user_id: str,
     curriculum_id: UUID,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
+    redis_client: redis.asyncio.Redis | None = Depends(get_async_redis_client),
     user: models_users.CoreUser = Depends(is_user()),
     ws_manager: WebsocketConnectionManager = Depends(get_websocket_connection_manager),
 ):
@@ -2223,6 +2364,10 @@ async def delete_curriculum_membership(
         curriculum_id=curriculum_id,
     )
     await db.flush()
+    background_tasks.add_task(
+        invalidate_cdr_users_snapshot,
+        redis_client=redis_client,
+    )
 
     cdr_status = await get_core_data(schemas_cdr.Status, db)
     if cdr_status.status == CdrStatus.onsite:
@@ -3093,9 +3238,19 @@ async def websocket_endpoint(
     db: AsyncSession = Depends(get_unsafe_db),
     settings: Settings = Depends(get_settings),
 ):
+    """
+    Websocket of the CDR room, sending users updates while the CDR is on site.
+
+    Clients can subscribe to the purchases of a seller, or to their own purchases, with the room types
+    `cdr_seller` and `user`.
+    """
     await ws_manager.manage_websocket(
         websocket=websocket,
         settings=settings,
         room=HyperionWebsocketsRoom.CDR,
+        room_authorizers={
+            WebsocketRoomType.cdr_seller: can_user_subscribe_to_seller,
+            WebsocketRoomType.user: is_user_own_room,
+        },
         db=db,
     )
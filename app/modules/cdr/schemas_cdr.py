@@ -51,6 +51,16 @@ class CdrUser(CdrUserPreview):
     model_config = ConfigDict(from_attributes=True)
 
 
+class CdrUsersChanges(BaseModel):
+    """Users added or modified since a version of the CDR users list"""
+
+    version: int
+    # True if the given version is unknown, `users` then contains all users and the client should replace its list
+    reset: bool
+    users: list[CdrUserPreview]
+    deleted_user_ids: list[str]
+
+
 class CdrUserUpdate(BaseModel):
     promo: int | None = None
     nickname: str | None = None
@@ -292,6 +302,16 @@ class UpdateUserWSMessageModel(WSMessageModel):
     data: CdrUser
 
 
+class UpdatePurchaseWSMessageModel(WSMessageModel):
+    command: Literal["UPDATE_PURCHASE"] = "UPDATE_PURCHASE"
+    data: PurchaseComplete
+
+
+class DeletePurchaseWSMessageModel(WSMessageModel):
+    command: Literal["DELETE_PURCHASE"] = "DELETE_PURCHASE"
+    data: PurchaseComplete
+
+
 class CustomDataFieldBase(BaseModel):
     name: str
 
@@ -1,30 +1,75 @@
+import asyncio
 import logging
+import time
 from datetime import UTC, datetime
+from pathlib import Path
+from typing import NamedTuple
 from uuid import UUID, uuid4
 
 import pandas as pd
+import redis.asyncio
+import xlsxwriter
 from fastapi import (
     HTTPException,
 )
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.checkout import schemas_checkout
+from app.core.exports.utils_exports import ExportProgress
 from app.core.groups.groups_type import GroupType
 from app.core.users import models_users
+from app.core.utils.config import Settings
 from app.dependencies import (
     hyperion_access_logger,
 )
-from app.modules.cdr import cruds_cdr, models_cdr
+from app.modules.cdr import cruds_cdr, models_cdr, schemas_cdr
 from app.modules.cdr.types_cdr import (
     CdrLogActionType,
+    CdrStatus,
     PaymentType,
 )
+from app.types.websocket import (
+    WebsocketConnectionManager,
+    WebsocketRoomType,
+    WSMessageModel,
+    get_room_id,
+)
 from app.utils.tools import (
     is_user_member_of_any_group,
 )
 
 hyperion_error_logger = logging.getLogger("hyperion.error")
 
+# The list of CDR users is cached in Redis as a versioned snapshot. Each user is stored as the JSON of its
+# `CdrUserPreview`, along with the version in which it was last modified, so that sellers' devices can fetch
+# only the users modified since the version they already have.
+#
+# Keys, prefixed by `CDR_USERS_SNAPSHOT_KEY`:
+# - `version`: current version of the snapshot
+# - `base`: version at which the snapshot was built from scratch, older versions are unknown
+# - `users`: user id -> JSON of the user
+# - `versions`: user id -> version in which the user was last modified
+# - `deleted`: user id -> version in which the user was deleted
+# - `generation`: incremented each time the snapshot is invalidated
+# - `built_generation`: generation of the data used to build the snapshot, expires after `CDR_USERS_SNAPSHOT_TTL`
+# - `rebuild`: lock held by the worker rebuilding the snapshot
+CDR_USERS_SNAPSHOT_KEY = "cdr_users_snapshot"
+# The snapshot is invalidated by the CDR endpoints modifying users. Other changes, like new accounts,
+# are taken into account after this delay, in seconds
+CDR_USERS_SNAPSHOT_TTL = 60
+# In milliseconds, the lock is released after this delay if the worker rebuilding the snapshot crashed
+CDR_USERS_SNAPSHOT_REBUILD_TIMEOUT = 30_000
+
+
+class CdrUsersSnapshot(NamedTuple):
+    version: int
+    # JSON of each user
+    users: list[bytes]
+
+
+def _get_snapshot_key(name: str) -> str:
+    return f"{CDR_USERS_SNAPSHOT_KEY}:{name}"
+
 
 async def validate_payment(
     checkout_payment: schemas_checkout.CheckoutPayment,
@@ -94,6 +139,279 @@ async def is_user_in_a_seller_group(
     )
 
 
+async def can_user_subscribe_to_seller(
+    user: models_users.CoreUser,
+    entity_id: str,
+    db: AsyncSession,
+) -> bool:
+    """
+    Only members of the seller group and CDR Admins can subscribe to the updates of a seller
+    """
+    try:
+        seller_id = UUID(entity_id)
+    except ValueError:
+        return False
+    seller = await cruds_cdr.get_seller_by_id(db=db, seller_id=seller_id)
+    return seller is not None and is_user_member_of_any_group(
+        user=user,
+        allowed_groups=[str(seller.group_id), GroupType.admin_cdr],
+    )
+
+
+async def send_purchase_message(
+    message: WSMessageModel,
+    seller_id: UUID,
+    user_id: str,
+    cdr_status: CdrStatus,
+    ws_manager: WebsocketConnectionManager,
+) -> None:
+    """
+    Send a message about a purchase to the room of the seller and to the room of the buyer, while the CDR is on site.
+
+    The message should be sent in a background task, once the purchase is committed.
+    """
+    if cdr_status != CdrStatus.onsite:
+        return
+    for room_id in (
+        get_room_id(WebsocketRoomType.cdr_seller, seller_id),
+        get_room_id(WebsocketRoomType.user, user_id),
+    ):
+        try:
+            await ws_manager.send_message_to_room(message=message, room_id=room_id)
+        except Exception:
+            hyperion_error_logger.exception(
+                f"Error while sending a message to the room {room_id}",
+            )
+
+
+async def get_cdr_users_previews(
+    db: AsyncSession,
+) -> dict[str, schemas_cdr.CdrUserPreview]:
+    """
+    Return all users with their curriculum, indexed by their id.
+    """
+    return {
+        user_id: schemas_cdr.CdrUserPreview(
+            id=user_id,
+            name=name,
+            firstname=firstname,
+            nickname=nickname,
+            account_type=account_type,
+            school_id=school_id,
+            curriculum=schemas_cdr.CurriculumComplete(
+                id=curriculum_id,
+                name=curriculum_name,
+            )
+            if curriculum_id is not None and curriculum_name is not None
+            else None,
+        )
+        for (
+            user_id,
+            name,
+            firstname,
+            nickname,
+            account_type,
+            school_id,
+            curriculum_id,
+            curriculum_name,
+        ) in await cruds_cdr.get_cdr_users_previews(db=db)
+    }
+
+
+async def invalidate_cdr_users_snapshot(
+    redis_client: redis.asyncio.Redis | None,
+) -> None:
+    """
+    Mark the snapshot of CDR users as outdated, it will be rebuilt on the next request.
+
+    This function should be called after the modification was committed, for example in a background task.
+    """
+    if redis_client is not None:
+        await redis_client.incr(_get_snapshot_key("generation"))
+
+
+async def refresh_cdr_users_snapshot(
+    db: AsyncSession,
+    redis_client: redis.asyncio.Redis,
+) -> None:
+    """
+    Rebuild the snapshot of CDR users from the database.
+
+    Only users which differ from the cached snapshot are written, in a new version.
+    """
+    # The generation is read before the database, so that an invalidation happening during the rebuild
+    # leaves the snapshot outdated
+    generation = await redis_client.get(_get_snapshot_key("generation"))
+    # Keys are typed as accepted by redis `hset`
+    users: dict[str | bytes, str] = {
+        user_id: user.model_dump_json()
+        for user_id, user in (await get_cdr_users_previews(db=db)).items()
+    }
+
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.get(_get_snapshot_key("version"))
+        pipe.get(_get_snapshot_key("base"))
+        pipe.hgetall(_get_snapshot_key("users"))
+        version, base, cached_users = await pipe.execute()
+    cached_users = {
+        user_id.decode(): user.decode() for user_id, user in cached_users.items()
+    }
+
+    async with redis_client.pipeline(transaction=True) as pipe:
+        new_version: int | None = None
+        if version is None or base is None:
+            # The snapshot was never built or was lost. Versions are then initialized with a timestamp,
+            # so that they are greater than any version a client may know
+            new_version = int(time.time() * 1000)
+            pipe.delete(
+                _get_snapshot_key("users"),
+                _get_snapshot_key("versions"),
+                _get_snapshot_key("deleted"),
+            )
+            pipe.set(_get_snapshot_key("base"), new_version)
+            modified_users = users
+            deleted_user_ids = []
+        else:
+            modified_users = {
+                user_id: user
+                for user_id, user in users.items()
+                if cached_users.get(user_id) != user
+            }
+            deleted_user_ids = [
+                user_id for user_id in cached_users if user_id not in users
+            ]
+            if modified_users or deleted_user_ids:
+                new_version = int(version) + 1
+
+        if new_version is not None:
+            if modified_users:
+                pipe.hset(_get_snapshot_key("users"), mapping=modified_users)
+                pipe.hset(
+                    _get_snapshot_key("versions"),
+                    mapping=dict.fromkeys(modified_users, new_version),
+                )
+                pipe.hdel(_get_snapshot_key("deleted"), *modified_users)
+            if deleted_user_ids:
+                pipe.hdel(_get_snapshot_key("users"), *deleted_user_ids)
+                pipe.hdel(_get_snapshot_key("versions"), *deleted_user_ids)
+                pipe.hset(
+                    _get_snapshot_key("deleted"),
+                    mapping=dict.fromkeys(deleted_user_ids, new_version),
+                )
+            pipe.set(_get_snapshot_key("version"), new_version)
+        pipe.set(
+            _get_snapshot_key("built_generation"),
+            generation or 0,
+            ex=CDR_USERS_SNAPSHOT_TTL,
+        )
+        await pipe.execute()
+
+
+async def get_cdr_users_snapshot_version(
+    db: AsyncSession,
+    redis_client: redis.asyncio.Redis,
+) -> int | None:
+    """
+    Return the version of the snapshot of CDR users, after rebuilding it if it is outdated.
+
+    Only one worker rebuilds the snapshot at a time, others use the outdated snapshot meanwhile.
+    Return None if there is no snapshot yet.
+    """
+    version, generation, built_generation = await redis_client.mget(
+        _get_snapshot_key("version"),
+        _get_snapshot_key("generation"),
+        _get_snapshot_key("built_generation"),
+    )
+    if built_generation is None or int(built_generation) != int(generation or 0):
+        if await redis_client.set(
+            _get_snapshot_key("rebuild"),
+            1,
+            nx=True,
+            px=CDR_USERS_SNAPSHOT_REBUILD_TIMEOUT,
+        ):
+            try:
+                await refresh_cdr_users_snapshot(db=db, redis_client=redis_client)
+            finally:
+                await redis_client.delete(_get_snapshot_key("rebuild"))
+            version = await redis_client.get(_get_snapshot_key("version"))
+    return int(version) if version is not None else None
+
+
+async def get_cdr_users_snapshot(
+    redis_client: redis.asyncio.Redis,
+) -> CdrUsersSnapshot | None:
+    """
+    Return all users of the snapshot. Users may be more recent than the returned version.
+    """
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.get(_get_snapshot_key("version"))
+        pipe.hvals(_get_snapshot_key("users"))
+        version, users = await pipe.execute()
+    if version is None:
+        return None
+    return CdrUsersSnapshot(version=int(version), users=users)
+
+
+async def get_cdr_users_changes(
+    since: int,
+    redis_client: redis.asyncio.Redis,
+) -> schemas_cdr.CdrUsersChanges | None:
+    """
+    Return the users modified or deleted after the version `since`.
+    If this version is unknown, all users are returned with `reset` set to True.
+
+    Returned users may be more recent than the returned version, a client will then receive them again
+    with its next version, which is harmless.
+    """
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.get(_get_snapshot_key("version"))
+        pipe.get(_get_snapshot_key("base"))
+        pipe.hgetall(_get_snapshot_key("versions"))
+        pipe.hgetall(_get_snapshot_key("deleted"))
+        version, base, users_versions, deleted_users_versions = await pipe.execute()
+    if version is None or base is None:
+        return None
+    version = int(version)
+
+    if since < int(base) or since > version:
+        snapshot = await get_cdr_users_snapshot(redis_client=redis_client)
+        return schemas_cdr.CdrUsersChanges(
+            version=version,
+            reset=True,
+            users=[
+                schemas_cdr.CdrUserPreview.model_validate_json(user)
+                for user in (snapshot.users if snapshot is not None else [])
+            ],
+            deleted_user_ids=[],
+        )
+
+    modified_user_ids = [
+        user_id
+        for user_id, user_version in users_versions.items()
+        if int(user_version) > since
+    ]
+    modified_users = (
+        await redis_client.hmget(_get_snapshot_key("users"), modified_user_ids)
+        if modified_user_ids
+        else []
+    )
+    return schemas_cdr.CdrUsersChanges(
+        version=version,
+        reset=False,
+        users=[
+            schemas_cdr.CdrUserPreview.model_validate_json(user)
+            for user in modified_users
+            # The user may have been deleted meanwhile
+            if user is not None
+        ],
+        deleted_user_ids=[
+            user_id.decode()
+            for user_id, user_version in deleted_users_versions.items()
+            if int(user_version) > since
+        ],
+    )
+
+
 async def check_request_consistency(
     db: AsyncSession,
     seller_id: UUID | None = None,
@@ -215,51 +533,159 @@ def construct_dataframe_from_users_purchases(
     data.append(" ")
     columns.append("Commentaire")
     data.append(" ")
-    df = pd.DataFrame(
-        columns=columns,
-    )
-    df = pd.concat(
-        [
-            df,
-            pd.DataFrame(
-                data=[data],
-                columns=columns,
-            ),
-        ],
+
+    # Rows are created for users who bought a variant or answered a field of the seller
+    user_ids = list(
+        dict.fromkeys(
+            [
+                *users_purchases,
+                *(
+                    user_id
+                    for user_id, answers in users_answers.items()
+                    if any(answer.field_id in field_to_column for answer in answers)
+                ),
+            ],
+        ),
     )
+    # The first row contains the prices of the variants
+    user_rows = {user_id: row for row, user_id in enumerate(user_ids, start=1)}
+
+    # The sheet is built column by column, each column being a list of the values of every row
+    sheet: dict[str, list[str | int | bool]] = {
+        column: [value, *[""] * len(user_ids)]
+        for column, value in zip(columns, data, strict=True)
+    }
+
+    users_by_id = {user.id: user for user in users}
+    for user_id, row in user_rows.items():
+        user = users_by_id.get(user_id)
+        if user is None:
+            continue
+        sheet["Nom"][row] = user.name
+        sheet["Prénom"][row] = user.firstname
+        sheet["Surnom"][row] = user.nickname or ""
+        sheet["Email"][row] = user.email
+
     for user_id, purchases in users_purchases.items():
+        row = user_rows[user_id]
         for purchase in purchases:
-            df.loc[
-                user_id,
-                variant_to_column[purchase.product_variant_id],
-            ] = purchase.quantity
+            sheet[variant_to_column[purchase.product_variant_id]][row] = (
+                purchase.quantity
+            )
+        if user_id not in users_by_id:
+            continue
+        missing_purchases = [
+            variant_to_column[purchase.product_variant_id].split(". ")[1]
+            for purchase in purchases
+            if not purchase.validated
+        ]
+        sheet["Panier payé"][row] = not missing_purchases
+        if missing_purchases:
+            sheet["Commentaire"][row] = "Manquant : \n-" + "\n-".join(
+                missing_purchases,
+            )
 
     for user_id, answers in users_answers.items():
         for answer in answers:
             column = field_to_column.get(answer.field_id)
             if column:
-                df.loc[
-                    user_id,
-                    field_to_column[answer.field_id],
-                ] = answer.value
+                sheet[column][user_rows[user_id]] = answer.value
 
-    for user_id in df.index:
-        user = next((u for u in users if u.id == user_id), None)
-        if user is None:
-            continue
-        df.loc[user_id, "Nom"] = user.name
-        df.loc[user_id, "Prénom"] = user.firstname
-        df.loc[user_id, "Surnom"] = user.nickname
-        df.loc[user_id, "Email"] = user.email
-        if user_id in users_purchases:
-            if all(purchase.validated for purchase in users_purchases[user_id]):
-                df.loc[user_id, "Panier payé"] = True
-            else:
-                df.loc[user_id, "Panier payé"] = False
-                df.loc[user_id, "Commentaire"] = "Manquant : \n-" + "\n-".join(
-                    variant_to_column[purchase.product_variant_id].split(". ")[1]
-                    for purchase in users_purchases[user_id]
-                    if not purchase.validated
-                )
-    df.fillna("", inplace=True)
-    return df
+    return pd.DataFrame(sheet, index=[0, *user_ids])
+
+
+def write_dataframe_to_xlsx(df: pd.DataFrame, path: Path) -> None:
+    """
+    Write a DataFrame built by `construct_dataframe_from_users_purchases` to an xlsx file.
+
+    Rows are written one after the other using xlsxwriter `constant_memory` mode, which flushes each row to the disk
+    as soon as the next one is started, instead of keeping the whole sheet in memory as `DataFrame.to_excel` does.
+    """
+    with xlsxwriter.Workbook(path, {"constant_memory": True}) as workbook:
+        worksheet = workbook.add_worksheet()
+        worksheet.freeze_panes(2, 3)
+        header_format = workbook.add_format({"bold": True, "border": 1})
+        worksheet.write_row(0, 0, df.columns.tolist(), header_format)
+        for row, values in enumerate(df.itertuples(index=False), start=1):
+            worksheet.write_row(row, 0, values)
+
+
+async def write_seller_results(
+    seller: models_cdr.Seller,
+    db: AsyncSession,
+    file_path: Path,
+    progress: ExportProgress | None = None,
+) -> None:
+    """
+    Write the purchases of the seller's products and the answers to its custom data fields in an xlsx file.
+    """
+    products = await cruds_cdr.get_products_by_seller_id(db, seller.id)
+    if len(products) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="There is no products for this seller so there is no results to send.",
+        )
+    variants = await cruds_cdr.get_product_variants_by_seller_id(db, seller.id)
+    product_fields: dict[UUID, list[models_cdr.CustomDataField]] = {}
+    for field in await cruds_cdr.get_customdata_fields_by_seller_id(db, seller.id):
+        product_fields.setdefault(field.product_id, []).append(field)
+
+    purchases = await cruds_cdr.get_purchases_by_seller_id(db, seller.id)
+    if len(purchases) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="There is no purchases for this seller so there is no results to send.",
+        )
+    purchases_by_users: dict[str, list[models_cdr.Purchase]] = {}
+    for purchase in purchases:
+        purchases_by_users.setdefault(purchase.user_id, []).append(purchase)
+    users_answers: dict[str, list[models_cdr.CustomData]] = {}
+    for answer in await cruds_cdr.get_customdata_by_seller_id(db, seller.id):
+        users_answers.setdefault(answer.user_id, []).append(answer)
+    users = await cruds_cdr.get_users_with_purchases_or_customdata_by_seller_id(
+        db,
+        seller.id,
+    )
+    hyperion_error_logger.info(
+        f"Data for seller {seller.name} fetched. Generating the Excel file.",
+    )
+    if progress is not None:
+        await progress.update(1, 2)
+
+    def write_results() -> None:
+        df = construct_dataframe_from_users_purchases(
+            users_purchases=purchases_by_users,
+            users=list(users),
+            products=list(products),
+            variants=list(variants),
+            data_fields=product_fields,
+            users_answers=users_answers,
+        )
+        write_dataframe_to_xlsx(df, file_path)
+
+    # Building and writing the sheet is CPU bound, we don't want to block the event loop
+    await asyncio.to_thread(write_results)
+
+
+async def export_seller_results(
+    progress: ExportProgress,
+    file_path: Path,
+    db: AsyncSession,
+    settings: Settings,
+    seller_id: UUID,
+) -> None:
+    """
+    Export function generating the results of a seller, see `start_export_job`
+    """
+    seller = await cruds_cdr.get_seller_by_id(db, seller_id)
+    if seller is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Seller not found.",
+        )
+    await write_seller_results(
+        seller=seller,
+        db=db,
+        file_path=file_path,
+        progress=progress,
+    )
@@ -22,7 +22,7 @@ from app.dependencies import (
 from app.modules.cinema import cruds_cinema, schemas_cinema
 from app.modules.cinema.factory_cinema import CinemaFactory
 from app.types import standard_responses
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.module import Module
 from app.types.scheduler import Scheduler
 from app.utils.communication.date_manager import (
@@ -236,6 +236,7 @@ async def create_campaigns_logo(
 )
 async def read_session_poster(
     session_id: str,
+    size: ImageSize | None = None,
     user: models_users.CoreUser = Depends(is_user_a_member),
     db: AsyncSession = Depends(get_db),
 ):
@@ -250,4 +251,5 @@ async def read_session_poster(
         default_asset="assets/images/default_movie.png",
         directory="cinemasessions",
         filename=str(session_id),
+        size=size,
     )
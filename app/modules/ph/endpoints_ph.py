@@ -17,7 +17,7 @@ from app.dependencies import (
     is_user_in,
 )
 from app.modules.ph import cruds_ph, models_ph, schemas_ph
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.module import Module
 from app.types.scheduler import Scheduler
 from app.utils.communication.notifications import NotificationTool
@@ -198,6 +198,7 @@ async def create_paper_pdf_and_cover(
 )
 async def get_cover(
     paper_id: uuid.UUID,
+    size: ImageSize | None = None,
     user: models_users.CoreUser = Depends(is_user_a_member),
     db: AsyncSession = Depends(get_db),
 ):
@@ -212,6 +213,7 @@ async def get_cover(
         default_asset="assets/images/default_cover.jpeg",
         directory="ph/cover",
         filename=str(paper_id),
+        size=size,
     )
 
 
@@ -17,7 +17,7 @@ from app.modules.phonebook import cruds_phonebook, schemas_phonebook
 from app.modules.phonebook.factory_phonebook import PhonebookFactory
 from app.modules.phonebook.types_phonebook import RoleTags
 from app.types import standard_responses
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.module import Module
 from app.utils.tools import (
     get_file_from_data,
@@ -711,6 +711,7 @@ async def create_association_logo(
 )
 async def read_association_logo(
     association_id: str,
+    size: ImageSize | None = None,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_school_member),
 ) -> FileResponse:
@@ -726,4 +727,5 @@ async def read_association_logo(
         directory="associations",
         filename=association_id,
         default_asset="assets/images/default_association_picture.png",
+        size=size,
     )
@@ -360,15 +360,34 @@ async def create_cash_of_user(
     return cash
 
 
-async def edit_cash(db: AsyncSession, user_id: str, amount: float):
+async def add_cash(db: AsyncSession, user_id: str, amount: float):
     await db.execute(
         update(models_raffle.Cash)
         .where(models_raffle.Cash.user_id == user_id)
-        .values(user_id=user_id, balance=amount),
+        .values(balance=models_raffle.Cash.balance + amount),
     )
     await db.flush()
 
 
+async def remove_cash_if_enough(db: AsyncSession, user_id: str, amount: float) -> bool:
+    """
+    Remove `amount` from the balance of the user, only if the balance is sufficient.
+    The balance is checked by the database, concurrent requests can thus not overdraw it.
+
+    Return if the amount was removed.
+    """
+    result = await db.execute(
+        update(models_raffle.Cash)
+        .where(
+            models_raffle.Cash.user_id == user_id,
+            models_raffle.Cash.balance >= amount,
+        )
+        .values(balance=models_raffle.Cash.balance - amount),
+    )
+    await db.flush()
+    return result.rowcount == 1
+
+
 async def draw_winner_by_prize_raffle(
     prize_id: str,
     db: AsyncSession,
@@ -3,7 +3,7 @@ import uuid
 
 from fastapi import Depends, File, HTTPException, UploadFile
 from fastapi.responses import FileResponse
-from redis import Redis
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.groups import cruds_groups
@@ -11,8 +11,8 @@ from app.core.groups.groups_type import AccountType, GroupType
 from app.core.users import cruds_users, models_users
 from app.core.users.endpoints_users import read_user
 from app.dependencies import (
+    get_async_redis_client,
     get_db,
-    get_redis_client,
     get_request_id,
     is_user_a_member,
     is_user_in,
@@ -20,9 +20,10 @@ from app.dependencies import (
 from app.modules.raffle import cruds_raffle, models_raffle, schemas_raffle
 from app.modules.raffle.types_raffle import RaffleStatusType
 from app.types import standard_responses
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
+from app.types.exceptions import LockTimeoutError
 from app.types.module import Module
-from app.utils.redis import locker_get, locker_set
+from app.utils.redis import distributed_lock
 from app.utils.tools import (
     get_file_from_data,
     is_user_member_of_any_group,
@@ -250,6 +251,7 @@ async def create_current_raffle_logo(
 )
 async def read_raffle_logo(
     raffle_id: str,
+    size: ImageSize | None = None,
     user: models_users.CoreUser = Depends(is_user_a_member),
     db: AsyncSession = Depends(get_db),
 ):
@@ -264,6 +266,7 @@ async def read_raffle_logo(
         directory="raffle-pictures",
         filename=str(raffle_id),
         default_asset="assets/images/default_raffle_logo.png",
+        size=size,
     )
 
 
@@ -438,7 +441,7 @@ async def get_tickets(
 async def buy_ticket(
     pack_id: str,
     db: AsyncSession = Depends(get_db),
-    redis_client: Redis | None = Depends(get_redis_client),
+    redis_client: Redis | None = Depends(get_async_redis_client),
     user: models_users.CoreUser = Depends(is_user_a_member),
     request_id: str = Depends(get_request_id),
 ):
@@ -449,24 +452,6 @@ async def buy_ticket(
     if pack_ticket is None:
         raise HTTPException(status_code=404, detail="Ticket type not found")
 
-    balance: models_raffle.Cash | None = await cruds_raffle.get_cash_by_id(
-        db=db,
-        user_id=user.id,
-    )
-
-    # If the balance does not exist, we create a new one with a balance of 0
-    if not balance:
-        new_cash_db = schemas_raffle.CashDB(
-            balance=0,
-            user_id=user.id,
-        )
-        balance = models_raffle.Cash(
-            **new_cash_db.dict(),
-        )
-        await cruds_raffle.create_cash_of_user(
-            cash=balance,
-            db=db,
-        )
     db_ticket = [
         models_raffle.Ticket(id=str(uuid.uuid4()), pack_id=pack_id, user_id=user.id)
         for i in range(pack_ticket.pack_size)
@@ -476,37 +461,48 @@ async def buy_ticket(
         ticket.user = user
         ticket.pack_ticket = pack_ticket
 
-    redis_key = "raffle_" + user.id
-
-    if not isinstance(redis_client, Redis) or locker_get(
-        redis_client=redis_client,
-        key=redis_key,
-    ):
-        raise HTTPException(status_code=429, detail="Too fast !")
-
-    locker_set(redis_client=redis_client, key=redis_key, lock=True)
-
     try:
-        new_amount = balance.balance - pack_ticket.price
-        if new_amount < 0:
-            raise HTTPException(status_code=400, detail="Not enough cash")
-
-        tickets = await cruds_raffle.create_ticket(tickets=db_ticket, db=db)
-        await cruds_raffle.edit_cash(
+        async with distributed_lock(
+            key="raffle_" + user.id,
             db=db,
-            user_id=user.id,
-            amount=new_amount,
-        )
-
-        display_name = user.full_name
-        hyperion_raffle_logger.info(
-            f"Add_ticket_to_user: A pack of {pack_ticket.pack_size} tickets of type {pack_id} has been bought by user {display_name}({user.id}) for an amount of {pack_ticket.price}€. ({request_id})",
-        )
+            redis_client=redis_client,
+        ):
+            balance: models_raffle.Cash | None = await cruds_raffle.get_cash_by_id(
+                db=db,
+                user_id=user.id,
+            )
+
+            # If the balance does not exist, we create a new one with a balance of 0
+            if not balance:
+                new_cash_db = schemas_raffle.CashDB(
+                    balance=0,
+                    user_id=user.id,
+                )
+                balance = models_raffle.Cash(
+                    **new_cash_db.model_dump(),
+                )
+                await cruds_raffle.create_cash_of_user(
+                    cash=balance,
+                    db=db,
+                )
+
+            if not await cruds_raffle.remove_cash_if_enough(
+                db=db,
+                user_id=user.id,
+                amount=pack_ticket.price,
+            ):
+                raise HTTPException(status_code=400, detail="Not enough cash")
+
+            tickets = await cruds_raffle.create_ticket(tickets=db_ticket, db=db)
+    except LockTimeoutError:
+        raise HTTPException(status_code=429, detail="Too fast !")
 
-        return tickets
+    display_name = user.full_name
+    hyperion_raffle_logger.info(
+        f"Add_ticket_to_user: A pack of {pack_ticket.pack_size} tickets of type {pack_id} has been bought by user {display_name}({user.id}) for an amount of {pack_ticket.price}€. ({request_id})",
+    )
 
-    finally:
-        locker_set(redis_client=redis_client, key=redis_key, lock=False)
+    return tickets
 
 
 @module.router.get(
@@ -773,6 +769,7 @@ async def create_prize_picture(
 )
 async def read_prize_logo(
     prize_id: str,
+    size: ImageSize | None = None,
     user: models_users.CoreUser = Depends(is_user_a_member),
     db: AsyncSession = Depends(get_db),
 ):
@@ -787,6 +784,7 @@ async def read_prize_logo(
         directory="raffle-prize_picture",
         filename=str(prize_id),
         default_asset="assets/images/default_prize_picture.png",
+        size=size,
     )
 
 
@@ -895,7 +893,7 @@ async def edit_cash_by_id(
     balance: schemas_raffle.CashEdit,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_in(GroupType.admin)),
-    redis_client: Redis = Depends(get_redis_client),
+    redis_client: Redis | None = Depends(get_async_redis_client),
 ):
     """
     Edit cash for an user. This will add the balance to the current balance.
@@ -914,23 +912,19 @@ async def edit_cash_by_id(
             detail="The user don't have a cash.",
         )
 
-    redis_key = "raffle_" + user_id
-
-    if not isinstance(redis_client, Redis) or locker_get(
-        redis_client=redis_client,
-        key=redis_key,
-    ):
-        raise HTTPException(status_code=403, detail="Too fast !")
-    locker_set(redis_client=redis_client, key=redis_key, lock=True)
-
     try:
-        await cruds_raffle.edit_cash(
-            user_id=user_id,
-            amount=cash.balance + balance.balance,
+        async with distributed_lock(
+            key="raffle_" + user_id,
             db=db,
-        )
-    finally:
-        locker_set(redis_client=redis_client, key=redis_key, lock=False)
+            redis_client=redis_client,
+        ):
+            await cruds_raffle.add_cash(
+                user_id=user_id,
+                amount=balance.balance,
+                db=db,
+            )
+    except LockTimeoutError:
+        raise HTTPException(status_code=403, detail="Too fast !")
 
 
 @module.router.post(
@@ -2,12 +2,15 @@ import logging
 import uuid
 from datetime import UTC, date, datetime
 
-from fastapi import Depends, File, HTTPException, UploadFile
+from fastapi import BackgroundTasks, Depends, File, HTTPException, UploadFile
 from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.checkout.payment_tool import PaymentTool
 from app.core.checkout.types_checkout import HelloAssoConfigName
+from app.core.exports import schemas_exports
+from app.core.exports.types_exports import ExportType
+from app.core.exports.utils_exports import start_export_job
 from app.core.google_api.google_api import DriveGoogleAPI
 from app.core.groups.groups_type import AccountType, GroupType
 from app.core.users import models_users, schemas_users
@@ -16,6 +19,7 @@ from app.dependencies import (
     get_db,
     get_drive_file_manager,
     get_payment_tool,
+    get_scheduler,
     get_settings,
     is_user,
     is_user_in,
@@ -24,6 +28,8 @@ from app.modules.raid import coredata_raid, cruds_raid, models_raid, schemas_rai
 from app.modules.raid.raid_type import DocumentType, DocumentValidation, Size
 from app.modules.raid.utils.drive.drive_file_manager import DriveFileManager
 from app.modules.raid.utils.utils_raid import (
+    export_teams_csv,
+    export_teams_pdf,
     generate_teams_pdf_util,
     get_participant,
     post_update_actions,
@@ -36,6 +42,7 @@ from app.types.exceptions import (
     GoogleAPIMissingConfigInDotenvError,
 )
 from app.types.module import Module
+from app.types.scheduler import Scheduler
 from app.utils.tools import (
     delete_all_folder_from_data,
     get_core_data,
@@ -296,6 +303,65 @@ async def generate_teams_pdf(
     return "PDF generation started"
 
 
+@module.router.post(
+    "/raid/teams/pdf/export",
+    response_model=schemas_exports.ExportJob,
+    status_code=201,
+)
+async def export_teams_pdf_in_background(
+    background_tasks: BackgroundTasks,
+    user: models_users.CoreUser = Depends(is_user_in(GroupType.admin_raid)),
+    db: AsyncSession = Depends(get_db),
+    scheduler: Scheduler = Depends(get_scheduler),
+):
+    """
+    Start the regeneration of the PDF of every team, which can then be followed using `/exports/{export_job_id}`.
+    Once done, the PDF of all teams can be downloaded as a single file.
+    """
+    return await start_export_job(
+        export_type=ExportType.raid_teams_pdf,
+        lock="raid_teams_pdf",
+        file_name="Équipes - "
+        + datetime.now(UTC).strftime("%Y-%m-%d_%H_%M_%S")
+        + ".pdf",
+        media_type=ContentType.pdf,
+        export_function=export_teams_pdf,
+        creator_id=user.id,
+        db=db,
+        scheduler=scheduler,
+        background_tasks=background_tasks,
+    )
+
+
+@module.router.post(
+    "/raid/teams/csv/export",
+    response_model=schemas_exports.ExportJob,
+    status_code=201,
+)
+async def export_teams_csv_in_background(
+    background_tasks: BackgroundTasks,
+    user: models_users.CoreUser = Depends(is_user_in(GroupType.admin_raid)),
+    db: AsyncSession = Depends(get_db),
+    scheduler: Scheduler = Depends(get_scheduler),
+):
+    """
+    Start the export of the validated teams as a CSV file, which can then be followed and downloaded using `/exports/{export_job_id}`.
+    """
+    return await start_export_job(
+        export_type=ExportType.raid_teams_csv,
+        lock="raid_teams_csv",
+        file_name="Équipes - "
+        + datetime.now(UTC).strftime("%Y-%m-%d_%H_%M_%S")
+        + ".csv",
+        media_type="text/csv",
+        export_function=export_teams_csv,
+        creator_id=user.id,
+        db=db,
+        scheduler=scheduler,
+        background_tasks=background_tasks,
+    )
+
+
 @module.router.get(
     "/raid/participants/{participant_id}/team",
     response_model=schemas_raid.Team,
@@ -9,7 +9,9 @@ import fitz
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import dependencies
 from app.core.checkout import schemas_checkout
+from app.core.exports.utils_exports import ExportProgress
 from app.core.google_api.google_api import DriveGoogleAPI
 from app.core.utils.config import Settings
 from app.modules.raid import coredata_raid, cruds_raid, models_raid, schemas_raid
@@ -105,14 +107,10 @@ async def validate_payment(
     # await post_update_actions(team, db, drive_file_manager)
 
 
-async def write_teams_csv(
+async def write_teams_csv_file(
     teams: Sequence[models_raid.Team],
-    db: AsyncSession,
-    drive_file_manager: DriveFileManager,
-    settings: Settings,
+    file_path: str | Path,
 ) -> None:
-    file_name = "Équipes - " + datetime.now(UTC).strftime("%Y-%m-%d_%H_%M_%S") + ".csv"
-    file_path = "data/raid/" + file_name
     data: list[list[str]] = [["Team name", "Captain", "Second", "Difficulty", "Number"]]
     data.extend(
         [
@@ -137,6 +135,18 @@ async def write_teams_csv(
         for line in data:
             await file.write(",".join(line) + "\n")
 
+
+async def write_teams_csv(
+    teams: Sequence[models_raid.Team],
+    db: AsyncSession,
+    drive_file_manager: DriveFileManager,
+    settings: Settings,
+) -> None:
+    file_name = "Équipes - " + datetime.now(UTC).strftime("%Y-%m-%d_%H_%M_%S") + ".csv"
+    file_path = "data/raid/" + file_name
+    Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+    await write_teams_csv_file(teams, file_path)
+
     await drive_file_manager.upload_raid_file(
         file_path,
         file_name,
@@ -175,7 +185,11 @@ async def save_team_info(
     db: AsyncSession,
     drive_file_manager: DriveFileManager,
     settings: Settings,
-):
+) -> uuid.UUID | None:
+    """
+    Generate the complete file of the team and upload it to the drive.
+    Return the id of the generated file, saved in the `raid/team` directory.
+    """
     try:
         physical_file_uuid = await prepare_complete_team_file(
             team=team,
@@ -217,7 +231,8 @@ async def save_team_info(
         await cruds_raid.update_team_file_id(team.id, file_id, db)
     except Exception:
         hyperion_error_logger.exception("Error while creating pdf")
-        return
+        return None
+    return physical_file_uuid
 
 
 async def post_update_actions(
@@ -226,7 +241,10 @@ async def post_update_actions(
     drive_file_manager: DriveFileManager,
     settings: Settings,
     should_generate_all_teams_csv: bool = True,
-) -> None:
+) -> uuid.UUID | None:
+    """
+    Return the id of the generated team file, see `save_team_info`.
+    """
     try:
         if team.validation_progress == 100 and (
             team.number is None or team.number == -1
@@ -244,7 +262,7 @@ async def post_update_actions(
                     settings=settings,
                 )
         information = await get_core_data(coredata_raid.RaidInformation, db)
-        await save_team_info(
+        return await save_team_info(
             team,
             information,
             db,
@@ -253,7 +271,7 @@ async def post_update_actions(
         )
     except Exception:
         hyperion_error_logger.exception(f"Error while creating pdf for team {team.id}")
-        return
+        return None
 
 
 async def generate_security_file_pdf(
@@ -332,7 +350,7 @@ def scale_rect_to_fit(container, content_width, content_height):
 async def prepare_complete_team_file(
     team: models_raid.Team,
     information: coredata_raid.RaidInformation,
-):
+) -> uuid.UUID:
     recap_file_id = await generate_recap_file_pdf(
         team=team,
     )
@@ -530,23 +548,33 @@ async def generate_teams_pdf_util(
     db: AsyncSession,
     drive_file_manager: DriveFileManager,
     settings: Settings,
-):
+    progress: ExportProgress | None = None,
+) -> list[uuid.UUID]:
+    """
+    Regenerate the PDF of every team.
+    Return the ids of the generated files, saved in the `raid/team` directory.
+    """
     teams = await cruds_raid.get_all_teams(db)
+    team_file_ids: list[uuid.UUID] = []
 
     hyperion_error_logger.warning(f"RAID: Generating PDF for {len(teams)} teams")
 
     for index, team in enumerate(teams):
         hyperion_error_logger.info(f"RAID: team {index}/{len(teams)}")
+        if progress is not None:
+            await progress.update(index, len(teams))
 
         # We reset the team number to -1 to force the update of the team number
         await cruds_raid.update_team(team.id, schemas_raid.TeamUpdate(number=-1), db)
-        await post_update_actions(
+        team_file_id = await post_update_actions(
             team,
             db,
             drive_file_manager,
             settings=settings,
             should_generate_all_teams_csv=False,
         )
+        if team_file_id is not None:
+            team_file_ids.append(team_file_id)
 
     all_teams = await cruds_raid.get_all_validated_teams(db)
     await write_teams_csv(
@@ -559,3 +587,47 @@ async def generate_teams_pdf_util(
     hyperion_error_logger.warning(
         f"RAID: Successfully generated PDF for {len(teams)} teams",
     )
+
+    return team_file_ids
+
+
+async def export_teams_pdf(
+    progress: ExportProgress,
+    file_path: Path,
+    db: AsyncSession,
+    settings: Settings,
+) -> None:
+    """
+    Export function regenerating the PDF of every team, see `start_export_job`.
+    The PDF of all teams are concatenated in the exported file.
+    """
+    team_file_ids = await generate_teams_pdf_util(
+        db=db,
+        drive_file_manager=dependencies.get_drive_file_manager(),
+        settings=settings,
+        progress=progress,
+    )
+    with fitz.open() as output_pdf:
+        for team_file_id in team_file_ids:
+            concat_pdf(
+                source_directory="raid/team",
+                source_filename=team_file_id,
+                output_pdf=output_pdf,
+            )
+        # A PDF document without any page can not be saved
+        if output_pdf.page_count == 0:
+            output_pdf.new_page()
+        output_pdf.save(file_path)
+
+
+async def export_teams_csv(
+    progress: ExportProgress,
+    file_path: Path,
+    db: AsyncSession,
+    settings: Settings,
+) -> None:
+    """
+    Export function writing the list of validated teams as a CSV file, see `start_export_job`
+    """
+    all_teams = await cruds_raid.get_all_validated_teams(db)
+    await write_teams_csv_file(all_teams, file_path)
@@ -19,7 +19,7 @@ from app.modules.recommendation import (
 )
 from app.modules.recommendation.factory_recommendation import RecommendationFactory
 from app.types import standard_responses
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.module import Module
 from app.utils.tools import get_file_from_data, save_file_as_data
 
@@ -137,6 +137,7 @@ async def delete_recommendation(
 )
 async def read_recommendation_image(
     recommendation_id: uuid.UUID,
+    size: ImageSize | None = None,
     db: AsyncSession = Depends(get_db),
     user: models_users.CoreUser = Depends(is_user_a_member),
 ):
@@ -157,6 +158,7 @@ async def read_recommendation_image(
         default_asset="assets/images/default_recommendation.png",
         directory="recommendations",
         filename=str(recommendation_id),
+        size=size,
     )
 
 
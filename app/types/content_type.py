@@ -10,3 +10,13 @@ class ContentType(str, Enum):
     png = "image/png"
     webp = "image/webp"
     pdf = "application/pdf"
+
+
+class ImageSize(str, Enum):
+    """
+    Variants of uploaded images. Images are resized to fit in a square, keeping their aspect ratio.
+    """
+
+    thumbnail = "thumbnail"
+    medium = "medium"
+    original = "original"
@@ -82,6 +82,19 @@ class AuthHTTPException(ContentHTTPException):
         super().__init__(status_code=status_code, content=content)
 
 
+class PasswordHasherSaturatedError(HTTPException):
+    """
+    Too many password hashing operations are already waiting for a thread
+    """
+
+    def __init__(self):
+        super().__init__(
+            status_code=503,
+            detail="Too many authentication requests, please try again later",
+            headers={"Retry-After": "1"},
+        )
+
+
 class PaymentToolCredentialsNotSetException(Exception):
     def __init__(self):
         super().__init__("HelloAsso API credentials are not set")
@@ -217,3 +230,13 @@ class NewlyAddedObjectInDbNotFoundError(Exception):
         super().__init__(
             f"Newly added object {object_name} not found in the database",
         )
+
+
+class LockTimeoutError(Exception):
+    def __init__(self, key: str):
+        super().__init__(f"Timed out while waiting for lock {key}")
+
+
+class InvalidImageError(Exception):
+    def __init__(self):
+        super().__init__("The file is not a valid image")
@@ -1,8 +1,19 @@
+import hashlib
 import logging
 import re
+import uuid
+from collections.abc import Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from datetime import UTC, datetime, timedelta
 from io import BytesIO
-from typing import Any
+from pathlib import Path
+from typing import Any, NamedTuple
 
 import boto3
 import botocore
@@ -19,6 +30,12 @@ AUTHORIZED_FILE_STRING = r"^[\w](?:[\w_:\.-]*[\w])?$"
 AUTHORIZED_FOLDER_STRING = r"^[\w](?:[\w/_:\.-]*[\w])?$"
 
 
+class S3Object(NamedTuple):
+    key: str
+    # Hash of the content of the object, computed by S3
+    etag: str
+
+
 class S3Access:
     """Class to manage S3 access with configurable object locking."""
 
@@ -65,27 +82,24 @@ class S3Access:
         ):
             raise InvalidS3BucketNameError(self.bucket_name)
 
-    def write_file(
+    def get_object_key(
         self,
-        message: str,
         filename: str,
         subfolder: str | None = None,
-        retention: int = 0,
-    ):
-        """Write in an S3 bucket with object locking if needed.
+    ) -> str:
+        """Build the key of an object from its filename and subfolder.
         The filename must not contain a "/" because S3 will consider it as a folder.
 
         Args:
-            message (str): Message to write
-            filename (str): Filename to write
-            subfolder (str): Subfolder to write in, it must not start nor end with a special caracter (optional)
+            filename (str): Filename of the object
+            subfolder (str): Subfolder of the object, it must not start nor end with a special caracter (optional)
 
         Raises:
             InvalidS3FileNameError: If the prefix is not a valid filename
             InvalidS3SubfolderError: If the subfolder is not a valid subfolder
 
         Returns:
-            None
+            str: Key of the object, including the folder of this S3Access
         """
         # If there is a "/" in the filename the s3 while consider it as a folder
         if not re.match(AUTHORIZED_FILE_STRING, filename):
@@ -97,8 +111,67 @@ class S3Access:
             filename = subfolder + "/" + filename
         if self.folder != "":
             filename = self.folder + "/" + filename
+        return filename
 
-        file_object = BytesIO(message.encode("utf-8"))
+    def upload_object(
+        self,
+        message: str,
+        key: str,
+        retention: int = 0,
+    ) -> None:
+        """Upload an object with object locking if needed.
+        Contrary to `write_file`, errors are not caught, allowing the caller to retry the upload.
+
+        Args:
+            message (str): Message to write
+            key (str): Key of the object, as returned by `get_object_key`
+            retention (int): Number of days during which the object can not be deleted nor modified (optional)
+
+        Raises:
+            ValueError: If S3 is not configured
+            botocore.exceptions.BotoCoreError: If S3 could not be reached
+            botocore.exceptions.ClientError: If S3 refused the object
+        """
+        if self.s3 is None:
+            raise ValueError("S3 is not configured")  # noqa: TRY003
+
+        self.s3.upload_fileobj(
+            BytesIO(message.encode("utf-8")),
+            self.bucket_name,
+            key,
+            # "COMPLIANCE" mode forbids anyone to delete or modify the created object, including its owner
+            ExtraArgs={
+                "ObjectLockMode": "COMPLIANCE",
+                "ObjectLockRetainUntilDate": datetime.now(UTC)
+                + timedelta(days=retention),
+            }
+            if retention > 0
+            else {},
+        )
+
+    def write_file(
+        self,
+        message: str,
+        filename: str,
+        subfolder: str | None = None,
+        retention: int = 0,
+    ):
+        """Write in an S3 bucket with object locking if needed.
+        The filename must not contain a "/" because S3 will consider it as a folder.
+
+        Args:
+            message (str): Message to write
+            filename (str): Filename to write
+            subfolder (str): Subfolder to write in, it must not start nor end with a special caracter (optional)
+
+        Raises:
+            InvalidS3FileNameError: If the prefix is not a valid filename
+            InvalidS3SubfolderError: If the subfolder is not a valid subfolder
+
+        Returns:
+            None
+        """
+        filename = self.get_object_key(filename, subfolder)
 
         if self.s3 is None:
             self.failure_logger.warning(
@@ -106,19 +179,7 @@ class S3Access:
             )
             return
         try:
-            self.s3.upload_fileobj(
-                file_object,
-                self.bucket_name,
-                filename,
-                # "COMPLIANCE" mode forbids anyone to delete or modify the created object, including its owner
-                ExtraArgs={
-                    "ObjectLockMode": "COMPLIANCE",
-                    "ObjectLockRetainUntilDate": datetime.now(UTC)
-                    + timedelta(days=retention),
-                }
-                if retention > 0
-                else {},
-            )
+            self.upload_object(message, filename, retention)
         except botocore.exceptions.ClientError as e:
             self.failure_logger.warning(f"Filename: {filename}, Message: {message}")
             self.failure_logger.info(f"Filename: {filename}, Error: {e}")
@@ -194,6 +255,97 @@ class S3Access:
             return {"Contents": []}
         return self.s3.list_objects_v2(Prefix=prefix, Bucket=self.bucket_name)
 
+    def iter_objects_for_prefix(
+        self,
+        prefix: str,
+        subfolder: str = "",
+    ) -> Iterator[S3Object]:
+        """List all objects with a given prefix, following the pagination of S3 which returns at most 1000 objects per page.
+        The prefix must not contain a "/" because S3 will consider it as a folder.
+
+        Args:
+            prefix (str): Prefix to list
+            subfolder (str): Subfolder to list in, it must not start nor end with a special caracter (optional)
+        Raises:
+            InvalidS3FileNameError: If the prefix is not a valid filename
+            InvalidS3SubfolderError: If the subfolder is not a valid subfolder
+        Returns:
+            Iterator[S3Object]: Objects, in the lexicographic order of their keys
+        """
+        if not re.match(AUTHORIZED_FILE_STRING, prefix):
+            raise InvalidS3FileNameError(prefix)
+        if subfolder != "" and not re.match(AUTHORIZED_FOLDER_STRING, subfolder):
+            raise InvalidS3FolderError(subfolder)
+
+        prefix = (
+            f"{self.folder}/{subfolder}/{prefix}"
+            if self.folder != ""
+            else f"{subfolder}/{prefix}"
+        )
+
+        if self.s3 is None:
+            self.failure_logger.warning(f"LIST Prefix: {prefix}")
+            return
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Prefix=prefix, Bucket=self.bucket_name):
+            for obj in page.get("Contents", []):
+                yield S3Object(key=obj["Key"], etag=obj["ETag"].strip('"'))
+
+    def iter_files_content_for_prefix(
+        self,
+        prefix: str,
+        subfolder: str = "",
+        max_concurrent_downloads: int = 16,
+        cache_directory: Path | None = None,
+    ) -> Iterator[tuple[str, str]]:
+        """Fetch the content of all objects with a given prefix.
+        Objects are downloaded in a thread pool, at most `max_concurrent_downloads` at once,
+        and `(key, content)` pairs are yielded as soon as they are available, in no particular order.
+
+        If `cache_directory` is set, downloaded contents are stored in this directory, named after the ETag of the object,
+        and are not downloaded again. As objects are never modified once written, with object locking, the cache never needs to be invalidated.
+
+        Args:
+            prefix (str): Prefix to list
+            subfolder (str): Subfolder to list in, it must not start nor end with a special caracter (optional)
+            max_concurrent_downloads (int): Maximum number of objects being downloaded at once (optional)
+            cache_directory (Path): Directory of the local content-addressed cache (optional)
+        Raises:
+            InvalidS3FileNameError: If the prefix is not a valid filename
+            InvalidS3SubfolderError: If the subfolder is not a valid subfolder
+        Returns:
+            Iterator[tuple[str, str]]: Key and content of each object
+        """
+        if cache_directory is not None:
+            cache_directory.mkdir(parents=True, exist_ok=True)
+
+        with ThreadPoolExecutor(
+            max_workers=max_concurrent_downloads,
+            thread_name_prefix="s3-download",
+        ) as executor:
+            pending: set[Future[tuple[str, str]]] = set()
+            try:
+                for obj in self.iter_objects_for_prefix(prefix, subfolder):
+                    cached_content = self._get_cached_content(obj, cache_directory)
+                    if cached_content is not None:
+                        yield obj.key, cached_content
+                        continue
+
+                    # Listing is paused while too many downloads are waiting, so that memory usage stays bounded
+                    if len(pending) >= 2 * max_concurrent_downloads:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                    pending.add(
+                        executor.submit(self._download_object, obj, cache_directory),
+                    )
+                for future in as_completed(pending):
+                    yield future.result()
+            finally:
+                # If the iteration is interrupted, downloads which did not start yet are cancelled
+                for future in pending:
+                    future.cancel()
+
     def get_files_content_for_prefix(
         self,
         prefix: str,
@@ -202,6 +354,8 @@ class S3Access:
         """List all logs with a given prefix
         The prefix must not contain a "/" because S3 will consider it as a folder.
 
+        See `iter_files_content_for_prefix` to process the logs as they are downloaded.
+
         Args:
             prefix (str): Prefix to list
             subfolder (str): Subfolder to list in, it must not start nor end with a special caracter (optional)
@@ -209,10 +363,42 @@ class S3Access:
             InvalidS3FileNameError: If the prefix is not a valid filename
             InvalidS3SubfolderError: If the subfolder is not a valid subfolder
         Returns:
-            list[str]: List of objects
+            list[str]: List of objects, in the lexicographic order of their keys
         """
-        objects = self.list_object(prefix, subfolder)
-        if "Contents" not in objects or not objects["Contents"]:
-            return []
-        file_names = [obj["Key"].split("/")[-1] for obj in objects["Contents"]]
-        return [self.get_file_with_name(x, subfolder) for x in file_names]
+        contents = dict(self.iter_files_content_for_prefix(prefix, subfolder))
+        return [contents[key] for key in sorted(contents)]
+
+    def _get_cached_content(
+        self,
+        obj: S3Object,
+        cache_directory: Path | None,
+    ) -> str | None:
+        if cache_directory is None:
+            return None
+        try:
+            return (cache_directory / obj.etag).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def _download_object(
+        self,
+        obj: S3Object,
+        cache_directory: Path | None,
+    ) -> tuple[str, str]:
+        if self.s3 is None:
+            raise ValueError("S3 is not configured")  # noqa: TRY003
+        response = self.s3.get_object(Bucket=self.bucket_name, Key=obj.key)
+        content: bytes = response["Body"].read()
+
+        # The ETag of an object uploaded in a single part is the md5 hash of its content.
+        # Multipart ETags can not be verified and are not cached, as they never occur for log records.
+        if (
+            cache_directory is not None
+            and hashlib.md5(content, usedforsecurity=False).hexdigest() == obj.etag
+        ):
+            # The content is written to a temporary file then renamed, so that a concurrent reader never sees a partial file
+            temporary_path = cache_directory / f"{obj.etag}.{uuid.uuid4()}.tmp"
+            temporary_path.write_bytes(content)
+            temporary_path.replace(cache_directory / obj.etag)
+
+        return obj.key, content.decode("utf-8")
@@ -1,18 +1,19 @@
 import asyncio
 import logging
 from collections.abc import AsyncGenerator, Callable, Coroutine
-from datetime import datetime
+from datetime import datetime, timedelta
 from inspect import signature
 from typing import TYPE_CHECKING, Any
 
 from arq import cron
-from arq.connections import RedisSettings
+from arq.connections import ArqRedis, RedisSettings, create_pool
 from arq.jobs import Job, JobStatus
 from arq.typing import WorkerSettingsBase
 from arq.worker import create_worker
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import dependencies
+from app.core.exports.utils_exports import delete_expired_exports
 from app.core.utils.config import Settings
 from app.types.exceptions import SchedulerNotStartedError
 from app.utils.mail.mailworker import (
@@ -23,6 +24,8 @@ from app.utils.tools import execute_async_or_sync_method
 if TYPE_CHECKING:
     from arq import Worker
 
+    from app.utils.communication.notifications import NotificationManager
+
 scheduler_logger = logging.getLogger("scheduler")
 
 
@@ -95,7 +98,7 @@ def get_send_emails_from_queue_task(
 ):
     """
     Send emails from the email queue. This function should be called by a cron scheduled task.
-    The task will only send a small amount of emails per hour to avoid being rate-limited by the email provider.
+    The task will only send `SMTP_MAX_EMAILS_PER_MINUTE` emails per minute to avoid being rate-limited by the email provider.
     """
 
     # We can not get the db and settings from the scheduler, we will thus get them from the dependency overrides directly
@@ -126,6 +129,99 @@ def get_send_emails_from_queue_task(
     return send_emails_from_queue_task
 
 
+def get_delete_expired_exports_task(
+    _dependency_overrides: dict[Callable[..., Any], Callable[..., Any]],
+):
+    """
+    Delete expired exports and their files. This function should be called by a cron scheduled task.
+    """
+
+    _get_db: Callable[
+        [],
+        AsyncGenerator[AsyncSession, None],
+    ] = _dependency_overrides.get(
+        dependencies.get_db,
+        dependencies.get_db,
+    )
+
+    async def delete_expired_exports_task(
+        ctx: dict[Any, Any] | None,
+    ):
+        async for db in _get_db():
+            await delete_expired_exports(db=db)
+
+    return delete_expired_exports_task
+
+
+def get_send_notifications_from_outbox_task(
+    _dependency_overrides: dict[Callable[..., Any], Callable[..., Any]],
+):
+    """
+    Send the notifications of the outbox. This function should be called by a cron scheduled task.
+
+    Notifications are usually sent by a job queued when they are added to the outbox, the cron task sends
+    the notifications that should be retried and those whose job was lost.
+    """
+
+    _get_notification_manager: Callable[[], NotificationManager] = (
+        _dependency_overrides.get(
+            dependencies.get_notification_manager,
+            dependencies.get_notification_manager,
+        )
+    )
+
+    async def send_notifications_from_outbox_task(
+        ctx: dict[Any, Any] | None,
+    ):
+        await _get_notification_manager().send_notifications_from_outbox()
+
+    return send_notifications_from_outbox_task
+
+
+def get_worker_settings(
+    worker_redis_settings: RedisSettings,
+    _dependency_overrides: dict[Callable[..., Any], Callable[..., Any]],
+) -> type[WorkerSettingsBase]:
+    """
+    Return the settings of the arq worker executing queued and cron jobs.
+    """
+
+    class ArqWorkerSettings(WorkerSettingsBase):
+        functions = [run_task]
+        allow_abort_jobs = True
+        # After a job is completed or aborted, we want arq to remove its result
+        # to be able to queue a new task with the same id
+        keep_result = 0
+        keep_result_forever = False
+        redis_settings = worker_redis_settings
+        # Every minute we send some emails in the queue
+        cron_jobs = [
+            cron(
+                get_send_emails_from_queue_task(
+                    _dependency_overrides=_dependency_overrides,
+                ),
+                hour=None,
+                minute=None,
+            ),
+            cron(
+                get_delete_expired_exports_task(
+                    _dependency_overrides=_dependency_overrides,
+                ),
+                hour=None,
+                minute=5,
+            ),
+            cron(
+                get_send_notifications_from_outbox_task(
+                    _dependency_overrides=_dependency_overrides,
+                ),
+                hour=None,
+                minute=None,
+            ),
+        ]
+
+    return ArqWorkerSettings
+
+
 class Scheduler:
     """
     An [arq](https://arq-docs.helpmanual.io/) scheduler.
@@ -140,6 +236,8 @@ class Scheduler:
     _dependency_overrides: dict[Callable[..., Any], Callable[..., Any]]
 
     def __init__(self):
+        # Redis pool used to queue jobs
+        self.pool: ArqRedis | None = None
         # ArqWorker, in charge of scheduling and executing tasks
         self.worker: Worker | None = None
         # Task will contain the asyncio task that runs the worker
@@ -151,6 +249,7 @@ class Scheduler:
         redis_port: int,
         redis_password: str | None,
         _dependency_overrides: dict[Callable[..., Any], Callable[..., Any]],
+        run_worker: bool = True,
         **kwargs,
     ):
         """
@@ -159,49 +258,42 @@ class Scheduler:
         - redis_port: int
         - redis_password: str
         - _dependency_overrides: dict[Callable[..., Any], Callable[..., Any]] a pointer to the app dependency overrides dict
+        - run_worker: if False, the scheduler only queues jobs, which should be executed by a dedicated worker (see `app/worker.py`)
         """
-
-        class ArqWorkerSettings(WorkerSettingsBase):
-            functions = [run_task]
-            allow_abort_jobs = True
-            # After a job is completed or aborted, we want arq to remove its result
-            # to be able to queue a new task with the same id
-            keep_result = 0
-            keep_result_forever = False
-            redis_settings = RedisSettings(
-                host=redis_host,
-                port=redis_port,
-                password=redis_password or "",
-            )
-            # Every fifteen minutes we send some emails in the queue
-            cron_jobs = [
-                cron(
-                    get_send_emails_from_queue_task(
-                        _dependency_overrides=_dependency_overrides,
-                    ),
-                    hour=None,
-                    minute={0, 15, 30, 45},
-                ),
-            ]
-
-        # We pass handle_signals=False to avoid arq from handling signals
-        # See https://github.com/python-arq/arq/issues/182
-        self.worker = create_worker(
-            ArqWorkerSettings,
-            handle_signals=False,
-            **kwargs,
+        redis_settings = RedisSettings(
+            host=redis_host,
+            port=redis_port,
+            password=redis_password or "",
         )
-        # We run the worker in an asyncio task
-        self.task = asyncio.create_task(self.worker.async_run())
+        self.pool = await create_pool(redis_settings)
+
+        if run_worker:
+            # We pass handle_signals=False to avoid arq from handling signals
+            # See https://github.com/python-arq/arq/issues/182
+            self.worker = create_worker(
+                get_worker_settings(
+                    worker_redis_settings=redis_settings,
+                    _dependency_overrides=_dependency_overrides,
+                ),
+                redis_pool=self.pool,
+                handle_signals=False,
+                **kwargs,
+            )
+            # We run the worker in an asyncio task
+            self.task = asyncio.create_task(self.worker.async_run())
 
         self._dependency_overrides = _dependency_overrides
 
-        scheduler_logger.info("Scheduler started")
+        scheduler_logger.info(
+            "Scheduler started" if run_worker else "Scheduler started without worker",
+        )
 
     async def close(self):
-        # If the worker was started, we close it
+        # If the worker was started, we close it. The worker closes its Redis pool
         if self.worker is not None:
             await self.worker.close()
+        elif self.pool is not None:
+            await self.pool.close(close_connection_pool=True)
 
     async def queue_job_defer_to(
         self,
@@ -214,10 +306,10 @@ class Scheduler:
         Queue a job to execute job_function at defer_date
         job_id will allow to abort if needed
         """
-        if self.worker is None:
+        if self.pool is None:
             raise SchedulerNotStartedError
 
-        job = await self.worker.pool.enqueue_job(
+        job = await self.pool.enqueue_job(
             "run_task",
             job_function=job_function,
             _job_id=job_id,
@@ -227,13 +319,39 @@ class Scheduler:
         )
         scheduler_logger.debug(f"Job {job_id} queued {job}")
 
+    async def queue_job(
+        self,
+        job_function: Callable[..., Coroutine[Any, Any, Any]],
+        job_id: str,
+        job_timeout: timedelta | None = None,
+        **kwargs,
+    ):
+        """
+        Queue a job to execute job_function as soon as possible
+        job_id will allow to abort if needed
+
+        The job is cancelled after `job_timeout`, by default after the five minutes timeout of arq
+        """
+        if self.pool is None:
+            raise SchedulerNotStartedError
+
+        job = await self.pool.enqueue_job(
+            "run_task",
+            job_function=job_function,
+            _job_id=job_id,
+            _job_timeout=job_timeout,
+            _dependency_overrides=self._dependency_overrides,
+            **kwargs,
+        )
+        scheduler_logger.debug(f"Job {job_id} queued {job}")
+
     async def cancel_job(self, job_id: str):
         """
         cancel a queued job based on its job_id
         """
-        if self.worker is None:
+        if self.pool is None:
             raise SchedulerNotStartedError
-        job = Job(job_id, redis=self.worker.pool)
+        job = Job(job_id, redis=self.pool)
         # We only want to abort the job if it exist
         # otherwise if we try to plan a job with the same id just after, we may get
         # a job aborted before being queued
@@ -251,11 +369,12 @@ class OfflineScheduler(Scheduler):
     # See https://github.com/fastapi/fastapi/discussions/9143#discussioncomment-5157572
 
     def __init__(self):
+        self.pool: ArqRedis | None = None
         # ArqWorker, in charge of scheduling and executing tasks
         self.worker: Worker | None = None
         # Task will contain the asyncio task that runs the worker
         self.task: asyncio.Task | None = None
-        # Pointer to the get_db dependency
+        self._dependency_overrides = {}
 
     async def start(
         self,
@@ -263,6 +382,7 @@ class OfflineScheduler(Scheduler):
         redis_port: int,
         redis_password: str | None,
         _dependency_overrides: dict[Callable[..., Any], Callable[..., Any]],
+        run_worker: bool = True,
         **kwargs,
     ):
         """
@@ -273,6 +393,8 @@ class OfflineScheduler(Scheduler):
         - _dependency_overrides: dict[Callable[..., Any], Callable[..., Any]] a pointer to the app dependency overrides dict
         """
 
+        self._dependency_overrides = _dependency_overrides
+
         scheduler_logger.info("OfflineScheduler started")
 
     async def close(self):
@@ -294,6 +416,24 @@ class OfflineScheduler(Scheduler):
             f"Job {job_id} queued in OfflineScheduler with defer to {defer_date}",
         )
 
+    async def queue_job(
+        self,
+        job_function: Callable[..., Coroutine[Any, Any, Any]],
+        job_id: str,
+        job_timeout: timedelta | None = None,
+        **kwargs,
+    ):
+        """
+        Without Redis, jobs that should be executed as soon as possible are run immediately, in the current task
+        """
+        scheduler_logger.debug(f"Job {job_id} executed by OfflineScheduler")
+        await run_task(
+            None,
+            job_function=job_function,
+            _dependency_overrides=self._dependency_overrides,
+            **kwargs,
+        )
+
     async def cancel_job(self, job_id: str):
         """
         cancel a queued job based on its job_id
@@ -1,14 +1,18 @@
 import asyncio
+import json
 import logging
 import os
+from collections.abc import Awaitable, Callable
 from enum import Enum
-from typing import Any, Literal
+from typing import Any, Literal, NamedTuple
+from uuid import UUID
 
 from broadcaster import Broadcast
 from fastapi import WebSocket, WebSocketDisconnect
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.users import models_users
 from app.core.utils.config import Settings
 from app.types.scopes_type import ScopeType
 from app.utils.auth import auth_utils
@@ -18,6 +22,28 @@ class HyperionWebsocketsRoom(str, Enum):
     CDR = "5a816d32-8b5d-4c44-8a8d-18fd830ec5a8"
 
 
+class WebsocketRoomType(str, Enum):
+    """
+    Types of dynamic rooms. A dynamic room contains the connections which subscribed to the updates of an entity,
+    its id is given by `get_room_id`.
+    """
+
+    cdr_seller = "cdr_seller"
+    mypayment_store = "mypayment_store"
+    user = "user"
+
+
+def get_room_id(room_type: WebsocketRoomType, entity_id: UUID | str) -> str:
+    return f"{room_type.value}:{entity_id}"
+
+
+# Check if a user is allowed to subscribe to the room of an entity, given its id
+WebsocketRoomAuthorizer = Callable[
+    [models_users.CoreUser, str, AsyncSession],
+    Awaitable[bool],
+]
+
+
 hyperion_error_logger = logging.getLogger("hyperion.error")
 
 
@@ -40,17 +66,165 @@ class ConnectionWSMessageModel(BaseModel):
     data: ConnectionWSMessageModelData
 
 
+class SubscriptionWSMessageModelData(BaseModel):
+    room_type: WebsocketRoomType
+    entity_id: str
+
+
+class SubscriptionWSMessageModel(BaseModel):
+    """Message sent by a client to subscribe to, or unsubscribe from, the room of an entity"""
+
+    command: Literal["subscribe", "unsubscribe"]
+    data: SubscriptionWSMessageModelData
+
+
+class SubscriptionStatusWSMessageModelStatus(str, Enum):
+    subscribed = "subscribed"
+    unsubscribed = "unsubscribed"
+    forbidden = "forbidden"
+
+
+class SubscriptionStatusWSMessageModelData(SubscriptionWSMessageModelData):
+    status: SubscriptionStatusWSMessageModelStatus
+
+
+class SubscriptionStatusWSMessageModel(BaseModel):
+    command: Literal["WSSubscription"] = "WSSubscription"
+    data: SubscriptionStatusWSMessageModelData
+
+
+class WebsocketOverflowPolicy(str, Enum):
+    """
+    What to do when a message is sent to a connection whose queue is full, because the client is too slow to receive messages
+    """
+
+    # The oldest queued message is dropped
+    drop_oldest = "drop_oldest"
+    # The new message is dropped
+    drop_newest = "drop_newest"
+    # The connection is closed. As messages are updates, the client should reconnect and reload its data
+    close = "close"
+
+
+class WebsocketRoomStats(NamedTuple):
+    connections: int
+    # Messages received from the broadcaster for this room
+    messages: int
+    # Messages waiting to be sent to the connections of the room, and the longest queue of a connection
+    queued_messages: int
+    max_queue_depth: int
+    # Messages which were not sent to a connection because its queue was full
+    dropped_messages: int
+    # Connections closed because they were too slow or because a message could not be sent
+    closed_connections: int
+
+
+async def is_user_own_room(
+    user: models_users.CoreUser,
+    entity_id: str,
+    db: AsyncSession,
+) -> bool:
+    """
+    A user can only subscribe to their own room
+    """
+    return entity_id == user.id
+
+
+class WebsocketRoomCounters:
+    def __init__(self):
+        self.messages = 0
+        self.dropped_messages = 0
+        self.closed_connections = 0
+
+
+class WebsocketConnection:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_queue_size: int,
+        send_timeout: float,
+        on_failure: Callable[["WebsocketConnection", str], None],
+    ):
+        """
+        A websocket connection, which may be in multiple rooms. Messages are queued, then sent by a dedicated writer task,
+        so that a slow client does not delay the delivery to other clients.
+
+        If a message can not be sent within `send_timeout` seconds, or fails, `on_failure` is called with a reason.
+        """
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self.on_failure = on_failure
+        self.rooms: set[str] = set()
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queue_size)
+        self.writer_task = asyncio.create_task(self._write_messages())
+
+    def enqueue(
+        self,
+        message_str: str,
+        overflow_policy: WebsocketOverflowPolicy,
+    ) -> bool:
+        """
+        Queue a message to be sent. Return False if a message was dropped because the queue is full.
+
+        With the `close` policy, no message is dropped, the caller should close the connection.
+        """
+        try:
+            self.queue.put_nowait(message_str)
+        except asyncio.QueueFull:
+            if overflow_policy == WebsocketOverflowPolicy.drop_oldest:
+                self.queue.get_nowait()
+                self.queue.put_nowait(message_str)
+            return False
+        return True
+
+    async def _write_messages(self) -> None:
+        while True:
+            message_str = await self.queue.get()
+            try:
+                await asyncio.wait_for(
+                    self.websocket.send_text(message_str),
+                    timeout=self.send_timeout,
+                )
+            except TimeoutError:
+                self.on_failure(self, "Websocket client is too slow")
+                return
+            except RuntimeError:
+                # The websocket is already closed
+                self.on_failure(self, "Failed to send message to websocket")
+                return
+            except Exception:
+                hyperion_error_logger.exception("Error while sending websocket message")
+                self.on_failure(self, "Failed to send message to websocket")
+                return
+
+    def stop(self) -> None:
+        """
+        Stop sending messages. Queued messages are discarded.
+        """
+        self.writer_task.cancel()
+
+
 class WebsocketConnectionManager:
-    def __init__(self, settings: Settings):
+    def __init__(
+        self,
+        settings: Settings,
+        max_queue_size: int = 100,
+        send_timeout: float = 10,
+        overflow_policy: WebsocketOverflowPolicy = WebsocketOverflowPolicy.close,
+        max_rooms_per_connection: int = 100,
+    ):
         """
         Initialize the ConnectionManager.
 
         The ConnectionManager is responsible for multiple rooms. A room is a set of connected websocket over which messages can be broadcasted.
+        Rooms are either static, see `HyperionWebsocketsRoom`, or dynamic: a client can subscribe to the updates of an entity,
+        for example a CDR seller, see `WebsocketRoomType`.
 
         When using multiple Hyperion workers, a websocket may be open with any worker.
         To be able to broadcast messages to all connected websocket, we need to send it to all open websocket from all workers.
 
-        To do this, the class use a broadcaster.
+        To do this, the class use a broadcaster, with a channel per room. A worker only listens to the channels of the rooms
+        where it has connections.
 
         When a message must be send to a room:
          - the worker send the message to its connected websocket
@@ -58,6 +232,10 @@ class WebsocketConnectionManager:
          - all workers will receive the message from the broadcaster and send it to its connected websocket
 
 
+        Each connection has a queue of at most `max_queue_size` messages, sent by its own writer task: publishing a message
+        to a room only queues it for every connection. A connection which can not receive a message within `send_timeout`
+        seconds is closed. When a queue is full, `overflow_policy` decides whether messages are dropped or the connection is closed.
+
         You must configure a Redis server to use this feature.
         Without Redis, a memory broadcaster is used, which should not work with multiple workers.
         """
@@ -67,15 +245,23 @@ class WebsocketConnectionManager:
             else Broadcast("memory://")
         )
 
-        # For each Room, we store the set of connected websockets
-        self.connections: dict[
-            HyperionWebsocketsRoom,
-            set[WebSocket],
-        ] = {}
+        self.max_queue_size = max_queue_size
+        self.send_timeout = send_timeout
+        self.overflow_policy = overflow_policy
+        self.max_rooms_per_connection = max_rooms_per_connection
+
+        # For each Room, we store the connected websockets
+        self.connections: dict[str, dict[WebSocket, WebsocketConnection]] = {}
+        # A websocket has a single connection, shared by all its rooms
+        self.websocket_connections: dict[WebSocket, WebsocketConnection] = {}
+        # Counters are removed with the last connection of the room
+        self.room_counters: dict[str, WebsocketRoomCounters] = {}
+        # We keep a reference to the tasks closing connections, so that they are not garbage collected
+        self.closing_tasks: set[asyncio.Task] = set()
 
         # We keep a reference to the listening tasks for each room
         # to be able to stop listening to a room when there is no more connection
-        self.listening_tasks: dict[HyperionWebsocketsRoom, asyncio.Task] = {}
+        self.listening_tasks: dict[str, asyncio.Task] = {}
 
     async def connect_broadcaster(self):
         await self.broadcaster.connect()
@@ -85,7 +271,7 @@ class WebsocketConnectionManager:
 
     async def add_connection_to_room(
         self,
-        room_id: HyperionWebsocketsRoom,
+        room_id: str,
         ws_connection: WebSocket,
     ) -> None:
         """
@@ -94,9 +280,24 @@ class WebsocketConnectionManager:
           - listen to the room over the broadcaster if it wasn't already done to
             see incoming messages from other workers that need to be send over websocket
         """
-        if room_id not in self.connections:
-            self.connections[room_id] = set({ws_connection})
+        connection = self.websocket_connections.get(ws_connection)
+        if connection is None:
+            connection = WebsocketConnection(
+                websocket=ws_connection,
+                max_queue_size=self.max_queue_size,
+                send_timeout=self.send_timeout,
+                on_failure=lambda connection, reason: self._close_connection(
+                    connection=connection,
+                    reason=reason,
+                ),
+            )
+            self.websocket_connections[ws_connection] = connection
+        connection.rooms.add(room_id)
 
+        self.room_counters.setdefault(room_id, WebsocketRoomCounters())
+        self.connections.setdefault(room_id, {})[ws_connection] = connection
+
+        if room_id not in self.listening_tasks:
             # This worker wasn't listening to this room over the broadcaster yet because it didn't had any open websocket connection for this room.
             # We will start to listen to the room over the broadcaster.
             subscribe_n_listen_task = asyncio.create_task(
@@ -111,22 +312,30 @@ class WebsocketConnectionManager:
             # https://docs.python.org/3/library/asyncio-task.html#asyncio.create_task
 
             subscribe_n_listen_task.add_done_callback(
-                lambda task: self._remove_task_from_listening_tasks_callback(room_id),
+                lambda task: self._remove_task_from_listening_tasks_callback(
+                    room_id=room_id,
+                    task=task,
+                ),
             )
 
-        else:
-            self.connections[room_id].add(ws_connection)
-
     def _remove_task_from_listening_tasks_callback(
         self,
-        room_id: HyperionWebsocketsRoom,
+        room_id: str,
+        task: asyncio.Task,
     ):
         """
         Asyncio task callback to remove the task from the listening_tasks dict
         The method is called after the listening task is done or cancelled
         """
-        self.listening_tasks.pop(room_id, None)
-        self.connections.pop(room_id, None)
+        # A cancelled task was already removed by `_unsubscribe_channel`, a new task may have been started since
+        if self.listening_tasks.get(room_id) is task:
+            # The task stopped by itself, connections of the room won't receive messages anymore
+            self.listening_tasks.pop(room_id)
+            for connection in list(self.connections.get(room_id, {}).values()):
+                self._remove_connection_from_room(
+                    connection=connection,
+                    room_id=room_id,
+                )
         hyperion_error_logger.info(
             f"Websocket: unsubscribed broadcaster from channel {room_id} for worker {os.getpid()}",
         )
@@ -134,42 +343,122 @@ class WebsocketConnectionManager:
     async def _consume_events_from_broadcaster(
         self,
         message_str: str,
-        room_id: HyperionWebsocketsRoom,
+        room_id: str,
     ):
         """
-        Handle an incoming message from the broadcaster. Send the message to all connected websocket in the room.
+        Handle an incoming message from the broadcaster. Queue the message for all connected websocket in the room.
         """
-        room_connections: set[WebSocket] = self.connections.get(room_id, set())
+        room_connections = self.connections.get(room_id, {})
         if len(room_connections) == 0:
             # If we don't have any connection in the room, we don't need to keep listening to the room over the broadcaster
             self._unsubscribe_channel(room_id)
             return
 
-        for connection in room_connections:
-            if not await self._send_message_to_ws_connection(
+        counters = self.room_counters[room_id]
+        counters.messages += 1
+        # Connections may be closed while iterating
+        for connection in list(room_connections.values()):
+            if not connection.enqueue(
                 message_str=message_str,
-                ws_connection=connection,
+                overflow_policy=self.overflow_policy,
             ):
-                # If the message couldn't be sent to the connection, we disconnect the websocket connection
-                await connection.close(reason="Failed to send message to websocket")
+                counters.dropped_messages += 1
+                if self.overflow_policy == WebsocketOverflowPolicy.close:
+                    self._close_connection(
+                        connection=connection,
+                        reason="Websocket client is too slow",
+                    )
+
+    def _remove_connection_from_room(
+        self,
+        connection: WebsocketConnection,
+        room_id: str,
+    ) -> None:
+        """
+        Remove a connection from a room. The connection is stopped when it is not in any room anymore.
+        If there is no more connection in the room, we stop listening to the room over the broadcaster
+        """
+        connection.rooms.discard(room_id)
+        if not connection.rooms:
+            connection.stop()
+            self.websocket_connections.pop(connection.websocket, None)
+
+        room_connections = self.connections.get(room_id, {})
+        room_connections.pop(connection.websocket, None)
+        if len(room_connections) == 0:
+            self._unsubscribe_channel(room_id)
+
+    def _close_connection(
+        self,
+        connection: WebsocketConnection,
+        reason: str,
+    ) -> None:
+        """
+        Remove a connection from all its rooms, then close the websocket in a separate task, without waiting for the client.
+        """
+        if self.websocket_connections.get(connection.websocket) is not connection:
+            # The connection was already removed
+            return
+        for room_id in list(connection.rooms):
+            if room_id in self.room_counters:
+                self.room_counters[room_id].closed_connections += 1
+            self._remove_connection_from_room(connection=connection, room_id=room_id)
+
+        closing_task = asyncio.create_task(
+            self._close_websocket(websocket=connection.websocket, reason=reason),
+        )
+        self.closing_tasks.add(closing_task)
+        closing_task.add_done_callback(self.closing_tasks.discard)
+
+    async def _close_websocket(self, websocket: WebSocket, reason: str) -> None:
+        try:
+            # 1013: Try Again Later
+            await asyncio.wait_for(
+                websocket.close(code=1013, reason=reason),
+                timeout=self.send_timeout,
+            )
+        except Exception:
+            # The websocket may already be closed, or the client may not answer
+            hyperion_error_logger.debug(
+                "Websocket: failed to close a websocket connection",
+                exc_info=True,
+            )
 
     async def remove_connection_from_room(
         self,
         connection: WebSocket,
-        room_id: HyperionWebsocketsRoom,
+        room_id: str,
     ):
         """
         Remove a websocket connection from a room.
         If there is no more connection in the room, we stop listening to the room over the broadcaster
         """
-        if connection in self.connections[room_id]:
-            self.connections[room_id].remove(connection)
+        ws_connection = self.connections.get(room_id, {}).get(connection)
+        if ws_connection is not None:
+            self._remove_connection_from_room(
+                connection=ws_connection,
+                room_id=room_id,
+            )
 
-        # If there is no more connection in the room, we can stop listening to the room over the broadcaster
-        if len(self.connections[room_id]) == 0:
-            self._unsubscribe_channel(room_id)
+    def get_room_stats(self, room_id: str) -> WebsocketRoomStats:
+        """
+        Return the counters of a room for this worker
+        """
+        room_connections = self.connections.get(room_id, {})
+        counters = self.room_counters.get(room_id, WebsocketRoomCounters())
+        queue_depths = [
+            connection.queue.qsize() for connection in room_connections.values()
+        ]
+        return WebsocketRoomStats(
+            connections=len(room_connections),
+            messages=counters.messages,
+            queued_messages=sum(queue_depths),
+            max_queue_depth=max(queue_depths, default=0),
+            dropped_messages=counters.dropped_messages,
+            closed_connections=counters.closed_connections,
+        )
 
-    async def _subscribe_and_listen_to_channel(self, room_id: HyperionWebsocketsRoom):
+    async def _subscribe_and_listen_to_channel(self, room_id: str):
         """
         Subscribe to a channel and listen to incoming messages. Incoming messages are sent over open websocket connections.
         """
@@ -188,18 +477,20 @@ class WebsocketConnectionManager:
             f"Websocket: Finished listening to channel {room_id} for worker {os.getpid()}",
         )
 
-    def _unsubscribe_channel(self, room_id: HyperionWebsocketsRoom):
-        if room_id in self.listening_tasks:
+    def _unsubscribe_channel(self, room_id: str):
+        self.connections.pop(room_id, None)
+        self.room_counters.pop(room_id, None)
+        listening_task = self.listening_tasks.pop(room_id, None)
+        if listening_task is not None:
             # By cancelling the task, asyncio will raise a CancelledError in the task
             # forcing the broadcaster to stop listening to the room
             # The finally block of `broadcaster.subscribe()` will ensure that the channel is unsubscribed from Redis/local memory
-            self.listening_tasks[room_id].cancel()
-            # del self.listening_tasks # Should be done by the callback
+            listening_task.cancel()
 
     async def send_message_to_room(
         self,
         message: WSMessageModel,
-        room_id: HyperionWebsocketsRoom,
+        room_id: str,
     ):
         # We need to send the message over the broadcaster even if there is no connection in the room for this worker
         # Because other workers may have open websocket connections for this room
@@ -209,26 +500,50 @@ class WebsocketConnectionManager:
             message=message.model_dump_json(),
         )
 
-    async def _send_message_to_ws_connection(
+    async def _handle_subscription_message(
         self,
-        message_str: str,
-        ws_connection: WebSocket,
-    ) -> bool:
+        websocket: WebSocket,
+        message: SubscriptionWSMessageModel,
+        user: models_users.CoreUser,
+        room_authorizers: dict[WebsocketRoomType, WebsocketRoomAuthorizer],
+        db: AsyncSession,
+    ) -> SubscriptionStatusWSMessageModelStatus:
+        room_id = get_room_id(message.data.room_type, message.data.entity_id)
+
+        if message.command == "unsubscribe":
+            await self.remove_connection_from_room(
+                connection=websocket,
+                room_id=room_id,
+            )
+            return SubscriptionStatusWSMessageModelStatus.unsubscribed
+
+        authorizer = room_authorizers.get(message.data.room_type)
+        connection = self.websocket_connections.get(websocket)
+        if authorizer is None or (
+            connection is not None
+            and room_id not in connection.rooms
+            and len(connection.rooms) >= self.max_rooms_per_connection
+        ):
+            return SubscriptionStatusWSMessageModelStatus.forbidden
         try:
-            await ws_connection.send_text(message_str)
-        except RuntimeError:
-            return False
-        except Exception:
-            hyperion_error_logger.exception("Error while sending websocket message")
-            return False
-        return True
+            is_allowed = await authorizer(user, message.data.entity_id, db)
+        finally:
+            # The session should not stay open while the websocket is connected
+            await db.close()
+        if not is_allowed:
+            return SubscriptionStatusWSMessageModelStatus.forbidden
+
+        await self.add_connection_to_room(room_id=room_id, ws_connection=websocket)
+        return SubscriptionStatusWSMessageModelStatus.subscribed
 
     async def manage_websocket(
         self,
         websocket: WebSocket,
         settings: Settings,
-        room: HyperionWebsocketsRoom,
         db: AsyncSession,
+        room: HyperionWebsocketsRoom | None = None,
+        room_authorizers: dict[WebsocketRoomType, WebsocketRoomAuthorizer]
+        | None = None,
     ):
         """
         This function is used to manage the websocket connection.
@@ -236,6 +551,10 @@ class WebsocketConnectionManager:
         It will create an infinite loop that will wait for messages from the websocket.
         The loop will be broken when the websocket is disconnected.
 
+        Once authenticated, the connection is added to the static `room`, if provided. The client can then subscribe to dynamic rooms
+        by sending `SubscriptionWSMessageModel` messages, for the room types of `room_authorizers`.
+        Each subscription is checked by the authorizer of its room type, and answered with a `SubscriptionStatusWSMessageModel`.
+
         The databse is closed manually in this method, so you need to use the dependency `get_unsafe_db` in the FastAPI endpoint.
 
         NOTE:
@@ -243,6 +562,7 @@ class WebsocketConnectionManager:
         - you should never use `get_db` in the websocket endpoint, as the connection will never be closed  until the websocket is disconnected
         If you use `get_db` in the websocket endpoint, you will have a lot of open connections to the database at the same time, which will led to a Postgresql error.
         """
+        room_authorizers = room_authorizers or {}
 
         await websocket.accept()
 
@@ -287,23 +607,60 @@ class WebsocketConnectionManager:
         )
 
         # Add the user to the connection stack
-        await self.add_connection_to_room(
-            room_id=room,
-            ws_connection=websocket,
-        )
+        if room is not None:
+            await self.add_connection_to_room(
+                room_id=room,
+                ws_connection=websocket,
+            )
 
         try:
             while True:
-                # TODO: we could use received messages from the websocket
-                await websocket.receive_json()
+                try:
+                    message = SubscriptionWSMessageModel.model_validate(
+                        await websocket.receive_json(),
+                    )
+                except (json.JSONDecodeError, ValidationError):
+                    # Other messages are ignored
+                    continue
+
+                status = await self._handle_subscription_message(
+                    websocket=websocket,
+                    message=message,
+                    user=user,
+                    room_authorizers=room_authorizers,
+                    db=db,
+                )
+                status_message = SubscriptionStatusWSMessageModel(
+                    data=SubscriptionStatusWSMessageModelData(
+                        room_type=message.data.room_type,
+                        entity_id=message.data.entity_id,
+                        status=status,
+                    ),
+                ).model_dump_json()
+                connection = self.websocket_connections.get(websocket)
+                if connection is None:
+                    await websocket.send_text(status_message)
+                # Once the websocket is in a room, only its writer task should send messages
+                elif (
+                    not connection.enqueue(
+                        message_str=status_message,
+                        overflow_policy=self.overflow_policy,
+                    )
+                    and self.overflow_policy == WebsocketOverflowPolicy.close
+                ):
+                    self._close_connection(
+                        connection=connection,
+                        reason="Websocket client is too slow",
+                    )
         except WebSocketDisconnect:
-            await self.remove_connection_from_room(
-                room_id=room,
-                connection=websocket,
+            hyperion_error_logger.debug(
+                f"{room}: Websocket connection from {user.id} closed on worker {os.getpid()}",
             )
-        except Exception:
-            await self.remove_connection_from_room(
-                room_id=room,
-                connection=websocket,
-            )
-            raise
+        finally:
+            connection = self.websocket_connections.get(websocket)
+            if connection is not None:
+                for room_id in list(connection.rooms):
+                    self._remove_connection_from_room(
+                        connection=connection,
+                        room_id=room_id,
+                    )
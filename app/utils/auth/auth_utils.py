@@ -8,6 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.auth import schemas_auth
 from app.core.users import cruds_users, models_users
+from app.core.users.cache_users import authenticated_users_cache
 from app.core.utils import security
 from app.core.utils.config import Settings
 from app.types.scopes_type import ScopeType
@@ -69,23 +70,18 @@ async def get_user_from_token_with_scopes(
     """
     Dependency that makes sure the token is valid, contains the expected scopes and returns the corresponding user.
     The expected scopes are passed as list of list of scopes, each list of scopes is an "AND" condition, and the list of list of scopes is an "OR" condition.
+
+    Recently authenticated users are cached for a few seconds, see `app.core.users.cache_users`.
     """
 
-    access_granted = False
-    if scopes == []:
-        access_granted = True
-    else:
-        for scope_set in scopes:
-            # `token_data.scopes` contain a " " separated list of scopes
-            # `scope_set` is a list of scopes that must be present in the token
-            # If one of the scope set is present in the token, the access is granted
+    # `token_data.scopes` contain a " " separated list of scopes
+    token_scopes = set(token_data.scopes.split(" "))
 
-            scope_set_present = True
-            for scope in scope_set:
-                scope_set_present = scope_set_present and (
-                    scope in token_data.scopes.split(" ")
-                )
-            access_granted = access_granted or scope_set_present
+    # `scope_set` is a list of scopes that must be present in the token
+    # If one of the scope set is present in the token, the access is granted
+    access_granted = scopes == [] or any(
+        token_scopes.issuperset(scope_set) for scope_set in scopes
+    )
 
     if not access_granted:
         raise HTTPException(
@@ -94,7 +90,13 @@ async def get_user_from_token_with_scopes(
         )
     user_id = token_data.sub
 
+    cached_user = authenticated_users_cache.get(user_id)
+    if cached_user is not None:
+        return await authenticated_users_cache.attach(db=db, cached_user=cached_user)
+
+    generation = authenticated_users_cache.generation
     user = await cruds_users.get_user_by_id(db=db, user_id=user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    authenticated_users_cache.set_user(user=user, generation=generation)
     return user
@@ -0,0 +1,120 @@
+"""
+Per-worker caches keeping values for a few seconds.
+
+Caches are module level objects, invalidated by the cruds which modify the cached data, and configured when the
+application state is initialized.
+Other workers can not be notified of an invalidation, they will see the change once their entry expires.
+
+Cruds should invalidate a cache once their transaction is committed, using `clear_after_commit` or `invalidate_after_commit`.
+A request loading the data between an earlier invalidation and the commit would cache the data which is being modified.
+"""
+
+import time
+from collections.abc import Callable
+from typing import Generic, NamedTuple, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
+
+KeyType = TypeVar("KeyType")
+ValueType = TypeVar("ValueType")
+
+
+def run_after_commit(db: AsyncSession, callback: Callable[[], None]) -> None:
+    """
+    Call `callback` once the current transaction of `db` is committed.
+    """
+
+    def after_commit(session: Session) -> None:
+        callback()
+
+    event.listen(db.sync_session, "after_commit", after_commit, once=True)
+
+
+def run_after_transaction(db: AsyncSession, callback: Callable[[], None]) -> None:
+    """
+    Call `callback` once the current transaction of `db` is committed or rolled back,
+    or immediately if `db` is not in a transaction.
+    """
+    transaction = db.sync_session.get_transaction()
+    if transaction is None:
+        callback()
+        return
+
+    def after_transaction_end(session: Session, ended: SessionTransaction) -> None:
+        # Savepoints also end a transaction, we wait for the outermost one
+        if ended is transaction:
+            callback()
+
+    event.listen(db.sync_session, "after_transaction_end", after_transaction_end)
+
+
+class CacheEntry(NamedTuple, Generic[ValueType]):
+    value: ValueType
+    # Monotonic time after which the entry should not be used anymore
+    expire_at: float
+
+
+class TTLCache(Generic[KeyType, ValueType]):
+    def __init__(self, ttl: int = 0, max_size: int = 10000):
+        """
+        Initialize an empty cache. A `ttl` of 0 disables the cache.
+
+        When the cache contains `max_size` entries, expired entries are removed, or the whole cache if none expired.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: dict[KeyType, CacheEntry[ValueType]] = {}
+        # Incremented on each invalidation. A value loaded before an invalidation
+        # may be outdated and should not be cached
+        self.generation = 0
+
+    def configure(self, ttl: int) -> None:
+        self.ttl = ttl
+        self.clear()
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.generation += 1
+
+    def invalidate(self, key: KeyType) -> None:
+        self.entries.pop(key, None)
+        self.generation += 1
+
+    def clear_after_commit(self, db: AsyncSession) -> None:
+        run_after_commit(db, self.clear)
+
+    def invalidate_after_commit(self, db: AsyncSession, key: KeyType) -> None:
+        run_after_commit(db, lambda: self.invalidate(key))
+
+    def get(self, key: KeyType) -> ValueType | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expire_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        return entry.value
+
+    def set(self, key: KeyType, value: ValueType, generation: int) -> None:
+        """
+        Cache `value`.
+
+        `generation` is the value of `self.generation` before the value was loaded.
+        """
+        if self.ttl <= 0 or generation != self.generation:
+            return
+        if len(self.entries) >= self.max_size:
+            now = time.monotonic()
+            self.entries = {
+                entry_key: entry
+                for entry_key, entry in self.entries.items()
+                if entry.expire_at > now
+            }
+            if len(self.entries) >= self.max_size:
+                self.entries.clear()
+        self.entries[key] = CacheEntry(
+            value=value,
+            expire_at=time.monotonic() + self.ttl,
+        )
@@ -1,13 +1,17 @@
+import asyncio
 import logging
-from datetime import datetime
-from typing import TYPE_CHECKING
-from uuid import UUID
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING, Any, NamedTuple, TypeVar
+from uuid import UUID, uuid4
 
 import firebase_admin
 from fastapi import BackgroundTasks
 from firebase_admin import credentials, messaging
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import dependencies
 from app.core.notification import cruds_notification, models_notification
 from app.core.notification.schemas_notification import Message
 from app.core.users import cruds_users
@@ -18,6 +22,38 @@ if TYPE_CHECKING:
 
 hyperion_error_logger = logging.getLogger("hyperion.error")
 
+# Firebase accepts at most 500 tokens in a multicast message, and 1000 tokens in a topic subscription request
+FIREBASE_MULTICAST_MAX_TOKENS = 500
+FIREBASE_TOPIC_MAX_TOKENS = 1000
+
+# The outbox is emptied by batches, each batch is committed in its own transaction
+NOTIFICATION_OUTBOX_BATCH_SIZE = 1000
+# A message that could not be sent is retried after 30 seconds, 1 minute, 2 minutes...
+NOTIFICATION_OUTBOX_RETRY_DELAY = timedelta(seconds=30)
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = 6
+# Id of the scheduler job emptying the outbox, only one job can be queued at a time
+NOTIFICATION_OUTBOX_JOB_ID = "send_notifications_from_outbox"
+
+T = TypeVar("T")
+
+
+class NotificationOutboxStats(NamedTuple):
+    # Messages of the outbox processed by the dispatcher
+    messages: int
+    # Firebase notifications sent, identical messages to multiple users are sent as a single notification
+    notifications: int
+    devices: int
+    failed_devices: int
+    retried_messages: int
+    dropped_messages: int
+
+
+class FirebaseMulticastResult(NamedTuple):
+    # Devices whose token is not valid anymore. These tokens are removed from the database
+    failed_devices: int
+    # Tokens of the chunks which could not be sent, for example because Firebase was not reachable
+    unsent_tokens: list[str]
+
 
 class NotificationManager:
     """
@@ -29,6 +65,13 @@ class NotificationManager:
 
     def __init__(self, settings: Settings):
         self.use_firebase = settings.USE_FIREBASE
+        # Firebase SDK calls are blocking network calls, they must not be made on the event loop.
+        # Threads are only started when needed, the pool costs nothing if Firebase is disabled
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.FIREBASE_THREADS,
+            thread_name_prefix="firebase",
+        )
+        self.max_concurrent_chunks = settings.FIREBASE_MAX_CONCURRENT_CHUNKS
 
         if not self.use_firebase:
             hyperion_error_logger.info("Firebase is configured to be disabled.")
@@ -43,18 +86,34 @@ class NotificationManager:
             )
             self.use_firebase = False
 
-    async def _manage_firebase_batch_response(
+    def __reduce__(self):
+        # Bound methods of the manager are queued as scheduler jobs and must thus be pickled.
+        # Its thread pool can not be, the job will use the notification manager of the worker executing it
+        return (dependencies.get_notification_manager, ())
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run_in_executor(self, func: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            func,
+            *args,
+        )
+
+    def _manage_firebase_batch_response(
         self,
         response: messaging.BatchResponse,
         tokens: list[str],
-        db: AsyncSession,
-    ):
+    ) -> list[str]:
         """
-        Manage the response of a firebase notification. We need to assume that tokens that failed to be send are not valid anymore and delete them from the database.
+        Manage the response of a firebase notification. We need to assume that tokens that failed to be send are not valid anymore.
+
+        Return the tokens to delete from the database.
         """
+        failed_tokens: list[str] = []
         if response.failure_count > 0:
             responses = response.responses
-            failed_tokens = []
             for idx, resp in enumerate(responses):
                 if not resp.success:
                     # Firebase may return different errors: https://firebase.google.com/docs/reference/admin/python/firebase_admin.messaging#exceptions
@@ -72,64 +131,106 @@ class NotificationManager:
             hyperion_error_logger.info(
                 f"{response.failure_count} messages failed to be send, removing their tokens from the database.",
             )
-            await cruds_notification.batch_delete_firebase_device_by_token(
-                tokens=failed_tokens,
-                db=db,
+        return failed_tokens
+
+    async def _send_firebase_multicast_chunk(
+        self,
+        tokens: list[str],
+        message_content: Message,
+        semaphore: asyncio.Semaphore,
+    ) -> list[str]:
+        """
+        Send a multicast message to at most `FIREBASE_MULTICAST_MAX_TOKENS` tokens and return the tokens that are not valid anymore.
+        """
+        message = messaging.MulticastMessage(
+            tokens=tokens,
+            data={"action_module": message_content.action_module},
+            notification=messaging.Notification(
+                title=message_content.title,
+                body=message_content.content,
+            ),
+        )
+        async with semaphore:
+            result = await self._run_in_executor(
+                messaging.send_each_for_multicast,
+                message,
             )
+        return self._manage_firebase_batch_response(
+            response=result,
+            tokens=tokens,
+        )
 
     async def _send_firebase_push_notification_by_tokens(
         self,
         db: AsyncSession,
         tokens: list[str],
         message_content: Message,
-    ):
+    ) -> FirebaseMulticastResult:
         """
         Send a firebase push notification to a list of tokens.
+        Return the number of devices the notification could not be sent to, and the tokens of the chunks which failed.
+        Other chunks were sent, only the unsent tokens should be retried.
 
         Prefer using `self._send_firebase_trigger_notification_by_tokens` to send a trigger notification.
         """
         # See https://firebase.google.com/docs/cloud-messaging/send-message?hl=fr#send-messages-to-multiple-devices
         if not self.use_firebase:
-            return
+            return FirebaseMulticastResult(failed_devices=0, unsent_tokens=[])
 
         if len(tokens) == 0:
             # We should not try to send a message to an emtpy list of tokens
             # or we will get an error "max_workers must be greater than 0"
             # See https://github.com/firebase/firebase-admin-python/issues/792
-            return
+            return FirebaseMulticastResult(failed_devices=0, unsent_tokens=[])
+
+        # We can only send 500 tokens at a time. Chunks are sent concurrently,
+        # the semaphore prevents a single large notification from using all the threads of the executor
+        semaphore = asyncio.Semaphore(self.max_concurrent_chunks)
+        chunks = [
+            tokens[i : i + FIREBASE_MULTICAST_MAX_TOKENS]
+            for i in range(0, len(tokens), FIREBASE_MULTICAST_MAX_TOKENS)
+        ]
+        results = await asyncio.gather(
+            *(
+                self._send_firebase_multicast_chunk(
+                    tokens=chunk,
+                    message_content=message_content,
+                    semaphore=semaphore,
+                )
+                for chunk in chunks
+            ),
+            return_exceptions=True,
+        )
 
-        # We can only send 500 tokens at a time
-        if len(tokens) > 500:
-            await self._send_firebase_push_notification_by_tokens(
-                tokens=tokens[500:],
+        failed_tokens: list[str] = []
+        unsent_tokens: list[str] = []
+        errors: list[BaseException] = []
+        for chunk, result in zip(chunks, results, strict=True):
+            if isinstance(result, BaseException):
+                errors.append(result)
+                unsent_tokens.extend(chunk)
+            else:
+                failed_tokens.extend(result)
+
+        # Invalid tokens of all the chunks are removed at once, even if some chunks could not be sent
+        if failed_tokens:
+            await cruds_notification.batch_delete_firebase_device_by_token(
+                tokens=failed_tokens,
                 db=db,
-                message_content=message_content,
             )
-            tokens = tokens[:500]
 
-        try:
-            message = messaging.MulticastMessage(
-                tokens=tokens,
-                data={"action_module": message_content.action_module},
-                notification=messaging.Notification(
-                    title=message_content.title,
-                    body=message_content.content,
-                ),
+        if errors:
+            hyperion_error_logger.error(
+                f"Notification: Unable to send firebase notification to tokens, {len(errors)} chunks failed",
+                exc_info=errors[0],
             )
 
-            result = messaging.send_each_for_multicast(message)
-        except Exception:
-            hyperion_error_logger.exception(
-                "Notification: Unable to send firebase notification to tokens",
-            )
-            raise
-        await self._manage_firebase_batch_response(
-            response=result,
-            tokens=tokens,
-            db=db,
+        return FirebaseMulticastResult(
+            failed_devices=len(failed_tokens),
+            unsent_tokens=unsent_tokens,
         )
 
-    def _send_firebase_push_notification_by_topic(
+    async def _send_firebase_push_notification_by_topic(
         self,
         topic_id: UUID,
         message_content: Message,
@@ -151,7 +252,7 @@ class NotificationManager:
             ),
         )
         try:
-            messaging.send(message)
+            await self._run_in_executor(messaging.send, message)
         except messaging.FirebaseError:
             hyperion_error_logger.exception(
                 f"Notification: Unable to send firebase notification for topic {topic}",
@@ -169,15 +270,18 @@ class NotificationManager:
         if not self.use_firebase:
             return
 
-        if len(tokens) == 0:
-            return
-
         topic = str(topic_id)
-        response = messaging.subscribe_to_topic(tokens, topic)
-        if response.failure_count > 0:
-            hyperion_error_logger.info(
-                f"Notification: Failed to subscribe to topic {topic} due to {[error.reason for error in response.errors]}",
+        # Firebase accepts at most 1000 tokens per request
+        for i in range(0, len(tokens), FIREBASE_TOPIC_MAX_TOKENS):
+            response = await self._run_in_executor(
+                messaging.subscribe_to_topic,
+                tokens[i : i + FIREBASE_TOPIC_MAX_TOKENS],
+                topic,
             )
+            if response.failure_count > 0:
+                hyperion_error_logger.info(
+                    f"Notification: Failed to subscribe to topic {topic} due to {[error.reason for error in response.errors]}",
+                )
 
     async def unsubscribe_tokens_to_topic(
         self,
@@ -191,7 +295,12 @@ class NotificationManager:
             return
 
         topic = str(topic_id)
-        messaging.unsubscribe_from_topic(tokens, topic)
+        for i in range(0, len(tokens), FIREBASE_TOPIC_MAX_TOKENS):
+            await self._run_in_executor(
+                messaging.unsubscribe_from_topic,
+                tokens[i : i + FIREBASE_TOPIC_MAX_TOKENS],
+                topic,
+            )
 
     async def send_notification_to_users(
         self,
@@ -221,11 +330,15 @@ class NotificationManager:
         )
 
         try:
-            await self._send_firebase_push_notification_by_tokens(
+            result = await self._send_firebase_push_notification_by_tokens(
                 tokens=firebase_device_tokens,
                 db=db,
                 message_content=message,
             )
+            if result.unsent_tokens:
+                hyperion_error_logger.warning(
+                    f"Notification: Unable to send firebase notification to {len(result.unsent_tokens)} devices of users {user_ids}",
+                )
         except Exception as error:
             hyperion_error_logger.warning(
                 f"Notification: Unable to send firebase notification to users {user_ids} with device: {error}",
@@ -250,7 +363,7 @@ class NotificationManager:
             return
 
         try:
-            self._send_firebase_push_notification_by_topic(
+            await self._send_firebase_push_notification_by_topic(
                 topic_id=topic_id,
                 message_content=message,
             )
@@ -259,6 +372,153 @@ class NotificationManager:
                 f"Notification: Unable to send firebase notification for topic {topic_id}: {error}",
             )
 
+    async def send_notifications_from_outbox(self) -> NotificationOutboxStats:
+        """
+        Send the messages of the notification outbox. This function should be called by the scheduler.
+
+        Identical messages to multiple users are coalesced in a single notification, and the tokens of all the users
+        of a batch are fetched with a single query. Messages that could not be sent are retried with an exponential backoff,
+        until `NOTIFICATION_OUTBOX_MAX_ATTEMPTS` is reached.
+        """
+        session_local = dependencies.get_session_local()
+        stats = NotificationOutboxStats(0, 0, 0, 0, 0, 0)
+
+        while True:
+            async with session_local() as db:
+                outbox_messages = (
+                    await cruds_notification.get_notification_outbox_messages_to_send(
+                        now=datetime.now(UTC),
+                        limit=NOTIFICATION_OUTBOX_BATCH_SIZE,
+                        db=db,
+                    )
+                )
+                if len(outbox_messages) == 0:
+                    break
+
+                batch_stats = await self._send_outbox_messages(
+                    outbox_messages=outbox_messages,
+                    db=db,
+                )
+                await db.commit()
+
+            stats = NotificationOutboxStats(
+                *(
+                    total + value
+                    for total, value in zip(stats, batch_stats, strict=True)
+                ),
+            )
+            if len(outbox_messages) < NOTIFICATION_OUTBOX_BATCH_SIZE:
+                break
+
+        if stats.messages > 0:
+            hyperion_error_logger.info(f"Notification: outbox processed, {stats}")
+        return stats
+
+    async def _send_outbox_messages(
+        self,
+        outbox_messages: Sequence[models_notification.NotificationOutboxMessage],
+        db: AsyncSession,
+    ) -> NotificationOutboxStats:
+        # Messages are coalesced by content, a user receiving the same message twice is only notified once
+        coalesced_messages: dict[
+            tuple[str | None, str | None, str],
+            list[models_notification.NotificationOutboxMessage],
+        ] = {}
+        for outbox_message in outbox_messages:
+            coalesced_messages.setdefault(
+                (
+                    outbox_message.title,
+                    outbox_message.content,
+                    outbox_message.action_module,
+                ),
+                [],
+            ).append(outbox_message)
+
+        tokens_by_user_id: dict[str, list[str]] = {}
+        for device in await cruds_notification.get_firebase_devices_by_user_ids(
+            user_ids=list({message.user_id for message in outbox_messages}),
+            db=db,
+        ):
+            tokens_by_user_id.setdefault(device.user_id, []).append(
+                device.firebase_device_token,
+            )
+
+        sent_message_ids: list[UUID] = []
+        dropped_message_ids: list[UUID] = []
+        retried_messages: dict[int, list[UUID]] = {}
+        devices = 0
+        failed_devices = 0
+        for (title, content, action_module), messages in coalesced_messages.items():
+            # Tokens of a user are kept together, so that they are split between as few chunks as possible
+            user_ids = list(dict.fromkeys(message.user_id for message in messages))
+            tokens = [
+                token
+                for user_id in user_ids
+                for token in tokens_by_user_id.get(user_id, [])
+            ]
+            try:
+                result = await self._send_firebase_push_notification_by_tokens(
+                    tokens=tokens,
+                    db=db,
+                    message_content=Message(
+                        title=title,
+                        content=content,
+                        action_module=action_module,
+                    ),
+                )
+            except Exception:
+                result = FirebaseMulticastResult(
+                    failed_devices=0,
+                    unsent_tokens=tokens,
+                )
+
+            # Only the messages of users with a device in a chunk which could not be sent are retried,
+            # other users already received the notification
+            unsent_tokens = set(result.unsent_tokens)
+            for message in messages:
+                if not any(
+                    token in unsent_tokens
+                    for token in tokens_by_user_id.get(message.user_id, [])
+                ):
+                    sent_message_ids.append(message.id)
+                elif message.attempts + 1 >= NOTIFICATION_OUTBOX_MAX_ATTEMPTS:
+                    dropped_message_ids.append(message.id)
+                else:
+                    retried_messages.setdefault(message.attempts, []).append(
+                        message.id,
+                    )
+
+            devices += len(tokens) - len(unsent_tokens)
+            failed_devices += result.failed_devices
+            hyperion_error_logger.info(
+                f"Notification: {action_module} notification sent to {len(user_ids)} users, {len(tokens) - len(unsent_tokens)} devices, {result.failed_devices} failed",
+            )
+
+        if dropped_message_ids:
+            hyperion_error_logger.error(
+                f"Notification: dropping {len(dropped_message_ids)} messages after {NOTIFICATION_OUTBOX_MAX_ATTEMPTS} attempts",
+            )
+        await cruds_notification.delete_notification_outbox_messages(
+            outbox_message_ids=sent_message_ids + dropped_message_ids,
+            db=db,
+        )
+        for attempts, message_ids in retried_messages.items():
+            await cruds_notification.postpone_notification_outbox_messages(
+                outbox_message_ids=message_ids,
+                next_attempt=datetime.now(UTC)
+                + NOTIFICATION_OUTBOX_RETRY_DELAY * 2**attempts,
+                db=db,
+            )
+
+        return NotificationOutboxStats(
+            messages=len(outbox_messages),
+            notifications=len(coalesced_messages),
+            devices=devices,
+            failed_devices=failed_devices,
+            retried_messages=sum(len(ids) for ids in retried_messages.values()),
+            dropped_messages=len(dropped_message_ids),
+        )
+
     async def subscribe_user_to_topic(
         self,
         topic_id: UUID,
@@ -326,7 +586,16 @@ class NotificationManager:
         restrict_to_group_id: str | None,
         restrict_to_members: bool,
         db: AsyncSession,
+        scheduler: "Scheduler",
+        background_tasks: BackgroundTasks,
+        message: Message | None = None,
     ):
+        """
+        Create a new topic. By default, all users, or all members of `restrict_to_group_id`, are subscribed to it.
+
+        Subscribing a large number of users takes time, the subscriptions are done by the scheduler
+        once the topic is committed. If `message` is provided, it is sent to the topic once its members are subscribed.
+        """
         await cruds_notification.create_notification_topic(
             notification_topic=models_notification.NotificationTopic(
                 id=topic_id,
@@ -339,17 +608,40 @@ class NotificationManager:
             db=db,
         )
 
-        # We want, by default, to register users to this new topic
-        users = await cruds_users.get_users(
+        background_tasks.add_task(
+            scheduler.queue_job,
+            self.subscribe_all_users_to_topic,
+            job_id=f"subscribe_all_users_to_topic_{topic_id}",
+            topic_id=topic_id,
+            restrict_to_group_id=restrict_to_group_id,
+            message=message,
+        )
+
+    async def subscribe_all_users_to_topic(
+        self,
+        topic_id: UUID,
+        restrict_to_group_id: str | None,
+        db: AsyncSession,
+        message: Message | None = None,
+    ) -> None:
+        """
+        Subscribe all users, or all members of `restrict_to_group_id`, to a topic. This function should be called by the scheduler.
+
+        Memberships are created with a single query, and device tokens are subscribed to the Firebase topic by batches.
+        """
+        await cruds_notification.create_topic_memberships_for_all_users(
+            topic_id=topic_id,
+            group_id=restrict_to_group_id,
             db=db,
-            included_groups=[restrict_to_group_id] if restrict_to_group_id else None,
         )
-        for user in users:
-            await self.subscribe_user_to_topic(
-                topic_id=topic_id,
-                user_id=user.id,
-                db=db,
-            )
+        tokens = await cruds_notification.get_firebase_tokens_by_topic_id(
+            topic_id=topic_id,
+            db=db,
+        )
+        await self.subscribe_tokens_to_topic(topic_id=topic_id, tokens=tokens)
+
+        if message is not None:
+            await self.send_notification_to_topic(topic_id=topic_id, message=message)
 
 
 class NotificationTool:
@@ -366,12 +658,12 @@ class NotificationTool:
         background_tasks: BackgroundTasks,
         notification_manager: NotificationManager,
         db: AsyncSession,
-        # scheduler: Scheduler,
+        scheduler: "Scheduler",
     ):
         self.background_tasks = background_tasks
         self.notification_manager = notification_manager
         self.db = db
-        # self.scheduler = scheduler
+        self.scheduler = scheduler
 
     async def send_notification_to_group(
         self,
@@ -412,12 +704,44 @@ class NotificationTool:
                 job_id=job_id,
             )
         else:
-            self.background_tasks.add_task(
-                self.notification_manager.send_notification_to_users,
-                user_ids=user_ids,
-                message=message,
-                db=self.db,
-            )
+            await self.add_notification_to_outbox(user_ids=user_ids, message=message)
+
+    async def add_notification_to_outbox(
+        self,
+        user_ids: list[str],
+        message: Message,
+    ):
+        """
+        Add the notification to the outbox, in the transaction of the request.
+        The scheduler will send it once the request session is committed.
+        """
+        if not self.notification_manager.use_firebase or len(user_ids) == 0:
+            return
+
+        now = datetime.now(UTC)
+        await cruds_notification.create_notification_outbox_messages(
+            outbox_messages=[
+                models_notification.NotificationOutboxMessage(
+                    id=uuid4(),
+                    user_id=user_id,
+                    title=message.title,
+                    content=message.content,
+                    action_module=message.action_module,
+                    creation=now,
+                    attempts=0,
+                    next_attempt=now,
+                )
+                for user_id in set(user_ids)
+            ],
+            db=self.db,
+        )
+        # Background tasks are run after the request session is committed.
+        # If a job is already queued, it will also send this notification
+        self.background_tasks.add_task(
+            self.scheduler.queue_job,
+            self.notification_manager.send_notifications_from_outbox,
+            job_id=NOTIFICATION_OUTBOX_JOB_ID,
+        )
 
     async def send_future_notification_to_users_defer_to(
         self,
@@ -0,0 +1,87 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+from app.types.content_type import ImageSize
+from app.types.exceptions import InvalidImageError
+
+# Largest side of each variant, in pixels. The original variant keeps the size of the uploaded image,
+# unless it is larger than the maximum size of a WebP image
+IMAGE_VARIANT_MAX_SIDES: dict[ImageSize, int] = {
+    ImageSize.thumbnail: 256,
+    ImageSize.medium: 1024,
+    ImageSize.original: 16383,
+}
+WEBP_QUALITY = 80
+
+
+def create_image_variants(image_bytes: bytes) -> dict[ImageSize, bytes]:
+    """
+    Decode an image once and encode each of its variants as WebP.
+
+    Variants are rotated according to the EXIF orientation of the image, and don't keep its metadata.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as source:
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    # Pillow raises a `DecompressionBombError` for images with too many pixels
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise InvalidImageError from error
+
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert(
+            "RGBA" if image.has_transparency_data else "RGB",
+        )
+
+    variants: dict[ImageSize, bytes] = {}
+    # Each variant is resized from the previous, larger, one
+    for size, max_side in reversed(IMAGE_VARIANT_MAX_SIDES.items()):
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        try:
+            image.save(buffer, format="WEBP", quality=WEBP_QUALITY)
+        except (OSError, ValueError) as error:
+            raise InvalidImageError from error
+        variants[size] = buffer.getvalue()
+    return variants
+
+
+class ImageProcessor:
+    def __init__(self):
+        """
+        Create the variants of uploaded images in a pool of threads, without blocking the event loop.
+        Pillow releases the GIL while decoding, resizing and encoding images, threads are thus enough to use multiple cores.
+
+        The processor should be configured using `configure` before being used.
+        """
+        self.executor: ThreadPoolExecutor | None = None
+
+    def configure(self, max_workers: int) -> None:
+        self.shutdown()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="image-processor",
+        )
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def create_image_variants(self, image_bytes: bytes) -> dict[ImageSize, bytes]:
+        """
+        See `create_image_variants`
+        """
+        if self.executor is None:
+            raise RuntimeError("The image processor is not configured")  # noqa: TRY003
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            create_image_variants,
+            image_bytes,
+        )
+
+
+image_processor = ImageProcessor()
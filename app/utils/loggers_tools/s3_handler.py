@@ -1,7 +1,17 @@
+import json
+import logging
+import os
+import random
 import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime
 from logging import StreamHandler
+from pathlib import Path
+from typing import Any, NamedTuple
 
+import botocore.exceptions
 from typing_extensions import override
 
 from app.types.s3_access import S3Access
@@ -9,6 +19,32 @@ from app.utils.tools import get_random_string
 
 alphanum = string.ascii_lowercase + string.digits
 
+hyperion_error_logger = logging.getLogger("hyperion.error")
+
+OPEN_SEGMENT_SUFFIX = ".open"
+SEALED_SEGMENT_SUFFIX = ".sealed"
+
+
+DEAD_LETTER_FILE = "dead_letter.jsonl"
+
+# Error codes returned by S3 for which the upload may succeed later. Other client errors,
+# such as an access denied or an invalid retention, are permanent.
+TRANSIENT_S3_ERROR_CODES = {
+    "InternalError",
+    "RequestTimeout",
+    "RequestTimeTooSkewed",
+    "ServiceUnavailable",
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+}
+
+
+class S3SpoolRecord(NamedTuple):
+    key: str
+    message: str
+    retention: int
+
 
 class S3LogHandler(StreamHandler):
     def __init__(
@@ -18,7 +54,32 @@ class S3LogHandler(StreamHandler):
         s3_bucket_name: str | None = None,
         s3_access_key_id: str | None = None,
         s3_secret_access_key: str | None = None,
+        spool_directory: str | None = None,
+        max_concurrent_uploads: int = 8,
+        max_segment_bytes: int = 1024 * 1024,
+        pending_bytes_alert: int = 1024 * 1024 * 50,
+        max_retry_delay: float = 60,
+        max_upload_attempts: int = 20,
+        close_timeout: float = 10,
     ):
+        """
+        Write each log record as an S3 object, named after the `s3_filename` and `s3_subfolder` attributes of the record.
+        If `s3_retention` is set, the object is locked in COMPLIANCE mode for this number of days.
+
+        If `spool_directory` is set, records are first appended to a local write-ahead spool, made of segment files
+        synced to the disk before `emit` returns. A background thread seals the segments and uploads their records,
+        at most `max_concurrent_uploads` at once, retrying failed uploads with an exponential backoff.
+        A segment is only deleted once all its records are uploaded, and segments left by a stopped process are
+        uploaded by the next handler using the same spool directory. A record may thus be uploaded twice, but never lost.
+
+        Records refused by S3 with a permanent error, or still failing after `max_upload_attempts` attempts,
+        are moved to the dead letter file of the spool directory, so that they don't block the following records.
+        An error is then logged to the failure logger.
+
+        A warning is logged to the failure logger when the spool exceeds `pending_bytes_alert`.
+
+        Without `spool_directory`, or if S3 is not configured, records are written synchronously using `S3Access.write_file`.
+        """
         super().__init__()
         self.s3_access = S3Access(
             failure_logger,
@@ -27,6 +88,50 @@ class S3LogHandler(StreamHandler):
             s3_access_key_id,
             s3_secret_access_key,
         )
+        self.failure_logger = logging.getLogger(failure_logger)
+
+        self.spool_directory = Path(spool_directory) if spool_directory else None
+        self.max_concurrent_uploads = max_concurrent_uploads
+        self.max_segment_bytes = max_segment_bytes
+        self.pending_bytes_alert = pending_bytes_alert
+        self.max_retry_delay = max_retry_delay
+        self.max_upload_attempts = max_upload_attempts
+        self.close_timeout = close_timeout
+
+        # Protects the open segment and the counters below
+        self.spool_lock = threading.Lock()
+        self.segment_file: Any = None
+        self.segment_path: Path | None = None
+        self.segment_index = 0
+        self.pending_records = 0
+        self.pending_bytes = 0
+        self.uploaded_records = 0
+        self.failed_attempts = 0
+        self.dead_letter_records = 0
+        # Segment -> (number of records, size in bytes, time of the first record)
+        self.pending_segments: dict[Path, tuple[int, int, float]] = {}
+        self.pending_alert_sent = False
+
+        self.wake_up = threading.Event()
+        self.stopping = threading.Event()
+        # Set when the handler is closed and the spool could not be drained in time
+        self.giving_up = threading.Event()
+        self.uploader: threading.Thread | None = None
+
+        if self.spool_directory is not None:
+            self.spool_directory.mkdir(parents=True, exist_ok=True)
+            self._recover_segments()
+            if self.s3_access.s3 is not None:
+                self.uploader = threading.Thread(
+                    target=self._run_uploader,
+                    name=f"s3-spool-{folder or 'root'}",
+                    daemon=True,
+                )
+                self.uploader.start()
+            elif self.pending_records > 0:
+                self.failure_logger.critical(
+                    f"{self.pending_records} records are waiting in {self.spool_directory} but S3 is not accessible, they will be uploaded at the next start",
+                )
 
     @override
     def emit(self, record):
@@ -39,4 +144,261 @@ class S3LogHandler(StreamHandler):
             filename = now.strftime("%Y-%m-%dT%H:%M:%S.%fZ") + get_random_string(8)
 
         msg = self.format(record)
-        self.s3_access.write_file(msg, filename, subfolder, retention)
+        if self.uploader is None:
+            self.s3_access.write_file(msg, filename, subfolder, retention)
+            return
+
+        # The key is computed before spooling the record, so that invalid names are still refused to the caller
+        key = self.s3_access.get_object_key(filename, subfolder)
+        self._append_to_spool(S3SpoolRecord(key=key, message=msg, retention=retention))
+        self.wake_up.set()
+
+    @override
+    def flush(self):
+        """
+        Seal the open segment so that the uploader takes it into account. Records are not awaited.
+        """
+        if self.uploader is not None:
+            self._seal_segment()
+            self.wake_up.set()
+
+    @override
+    def close(self):
+        """
+        Stop the uploader, waiting at most `close_timeout` seconds for the spool to be drained.
+        Remaining records stay in the spool and will be uploaded at the next start.
+        """
+        if self.uploader is not None:
+            self._seal_segment()
+            self.stopping.set()
+            self.wake_up.set()
+            self.uploader.join(timeout=self.close_timeout)
+            self.giving_up.set()
+        super().close()
+
+    def _append_to_spool(self, spool_record: S3SpoolRecord) -> None:
+        line = (json.dumps(spool_record._asdict()) + "\n").encode("utf-8")
+        with self.spool_lock:
+            segment_path = self.segment_path
+            if self.segment_file is None or segment_path is None:
+                segment_path = self._open_segment()
+            self.segment_file.write(line)
+            self.segment_file.flush()
+            # The record must be on the disk before being considered as logged
+            os.fsync(self.segment_file.fileno())
+
+            records, size, first_record = self.pending_segments.get(
+                segment_path,
+                (0, 0, time.time()),
+            )
+            self.pending_segments[segment_path] = (
+                records + 1,
+                size + len(line),
+                first_record,
+            )
+            self.pending_records += 1
+            self.pending_bytes += len(line)
+            if size + len(line) >= self.max_segment_bytes:
+                self._seal_segment_locked()
+
+            if self.pending_bytes >= self.pending_bytes_alert:
+                if not self.pending_alert_sent:
+                    self.pending_alert_sent = True
+                    self.failure_logger.warning(
+                        f"S3 spool {self.spool_directory} is lagging behind: {self.pending_records} records ({self.pending_bytes} bytes) are waiting to be uploaded. "
+                        f"{self.uploaded_records} records were uploaded and {self.failed_attempts} uploads failed since the start",
+                    )
+            else:
+                self.pending_alert_sent = False
+
+    def _open_segment(self) -> Path:
+        # Segments are named after the process, so that multiple workers can share the same spool directory
+        # and sorted by creation, so that records are uploaded in order
+        assert self.spool_directory is not None  # noqa: S101
+        self.segment_index += 1
+        self.segment_path = (
+            self.spool_directory
+            / f"{time.time_ns():020d}-{os.getpid()}-{self.segment_index}{OPEN_SEGMENT_SUFFIX}"
+        )
+        self.segment_file = self.segment_path.open("ab")
+        return self.segment_path
+
+    def _seal_segment(self) -> None:
+        with self.spool_lock:
+            self._seal_segment_locked()
+
+    def _seal_segment_locked(self) -> None:
+        if self.segment_file is None or self.segment_path is None:
+            return
+        self.segment_file.close()
+        sealed_path = self.segment_path.with_suffix(SEALED_SEGMENT_SUFFIX)
+        self.segment_path.rename(sealed_path)
+        self.pending_segments[sealed_path] = self.pending_segments.pop(
+            self.segment_path,
+            (0, 0, time.time()),
+        )
+        self.segment_file = None
+        self.segment_path = None
+
+    def _recover_segments(self) -> None:
+        """
+        Take over the segments of processes which are not running anymore, including a previous run of this process.
+        """
+        assert self.spool_directory is not None  # noqa: S101
+        pid = os.getpid()
+        for path in sorted(self.spool_directory.iterdir()):
+            if path.suffix not in (OPEN_SEGMENT_SUFFIX, SEALED_SEGMENT_SUFFIX):
+                continue
+            timestamp, owner, index = path.stem.split("-")
+            if int(owner) != pid and _is_process_running(int(owner)):
+                continue
+            self.segment_index += 1
+            recovered_path = (
+                self.spool_directory
+                / f"{timestamp}-{pid}-{self.segment_index}{SEALED_SEGMENT_SUFFIX}"
+            )
+            try:
+                # Renaming is atomic: if another process recovered the segment first, the rename fails
+                path.rename(recovered_path)
+            except FileNotFoundError:
+                continue
+            records = _read_segment(recovered_path)
+            size = recovered_path.stat().st_size
+            self.pending_segments[recovered_path] = (len(records), size, time.time())
+            self.pending_records += len(records)
+            self.pending_bytes += size
+
+    def _run_uploader(self) -> None:
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrent_uploads,
+            thread_name_prefix="s3-upload",
+        ) as executor:
+            while True:
+                self.wake_up.wait()
+                self.wake_up.clear()
+                # Records logged while the previous segments were uploaded are sent together
+                self._seal_segment()
+                with self.spool_lock:
+                    segments = sorted(self.pending_segments)
+                for segment in segments:
+                    if segment.suffix != SEALED_SEGMENT_SUFFIX:
+                        continue
+                    try:
+                        self._upload_segment(segment, executor)
+                    except Exception:
+                        hyperion_error_logger.exception(
+                            f"S3 spool: could not upload segment {segment}",
+                        )
+                        self.wake_up.set()
+                        self.giving_up.wait(self.max_retry_delay)
+                        break
+                # `close` wakes the uploader up a last time after sealing the open segment
+                if self.giving_up.is_set() or (
+                    self.stopping.is_set() and not self.wake_up.is_set()
+                ):
+                    return
+
+    def _upload_segment(self, segment: Path, executor: ThreadPoolExecutor) -> None:
+        records = _read_segment(segment)
+        # `map` waits for all the uploads of the segment, which are retried until they succeed or are given up
+        for _ in executor.map(self._upload_record, records):
+            pass
+        segment.unlink()
+        with self.spool_lock:
+            count, size, _ = self.pending_segments.pop(segment)
+            self.pending_records -= count
+            self.pending_bytes -= size
+
+    def _upload_record(self, spool_record: S3SpoolRecord) -> None:
+        delay = min(0.5, self.max_retry_delay)
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                self.s3_access.upload_object(
+                    spool_record.message,
+                    spool_record.key,
+                    spool_record.retention,
+                )
+            except (
+                botocore.exceptions.BotoCoreError,
+                botocore.exceptions.ClientError,
+            ) as error:
+                with self.spool_lock:
+                    self.failed_attempts += 1
+                if (
+                    not _is_transient_error(error)
+                    or attempts >= self.max_upload_attempts
+                ):
+                    self._write_dead_letter(spool_record, error)
+                    return
+                self.failure_logger.info(
+                    f"Filename: {spool_record.key}, Error: {error}, retrying in {delay:.1f}s",
+                )
+                # The jitter prevents all uploads from being retried at the same time
+                if self.giving_up.wait(delay * random.uniform(0.5, 1)):  # noqa: S311
+                    # The record stays in the spool and will be uploaded at the next start
+                    raise
+                delay = min(delay * 2, self.max_retry_delay)
+            else:
+                with self.spool_lock:
+                    self.uploaded_records += 1
+                return
+
+    def _write_dead_letter(
+        self,
+        spool_record: S3SpoolRecord,
+        error: Exception,
+    ) -> None:
+        assert self.spool_directory is not None  # noqa: S101
+        dead_letter_path = self.spool_directory / DEAD_LETTER_FILE
+        line = (
+            json.dumps(spool_record._asdict() | {"error": str(error)}) + "\n"
+        ).encode("utf-8")
+        with self.spool_lock:
+            with dead_letter_path.open("ab") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+            self.dead_letter_records += 1
+        self.failure_logger.error(
+            f"Filename: {spool_record.key}, Error: {error}, the record could not be uploaded and was moved to {dead_letter_path}",
+        )
+
+
+def _read_segment(path: Path) -> list[S3SpoolRecord]:
+    records = []
+    with path.open("rb") as file:
+        for line in file:
+            try:
+                records.append(S3SpoolRecord(**json.loads(line)))
+            except (ValueError, TypeError):
+                # The last line of a segment may be incomplete if the process was killed while writing it.
+                # As the record was not synced, it was not acknowledged to the caller.
+                hyperion_error_logger.warning(
+                    f"S3 spool: ignoring an incomplete record in {path}",
+                )
+    return records
+
+
+def _is_transient_error(error: Exception) -> bool:
+    if isinstance(error, botocore.exceptions.ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        status_code = error.response.get("ResponseMetadata", {}).get(
+            "HTTPStatusCode",
+            0,
+        )
+        return code in TRANSIENT_S3_ERROR_CODES or status_code >= 500
+    # Invalid parameters won't become valid, other errors are mostly network errors
+    return not isinstance(error, botocore.exceptions.ParamValidationError)
+
+
+def _is_process_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user
+        return True
+    return True
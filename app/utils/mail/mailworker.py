@@ -1,8 +1,13 @@
+import asyncio
 import logging
+import queue
 import smtplib
 import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, NamedTuple
 
 from app.core.core_endpoints import cruds_core
 
@@ -13,8 +18,229 @@ if TYPE_CHECKING:
 
 hyperion_error_logger = logging.getLogger("hyperion.error")
 
+# Email providers close idle connections after a few minutes, we don't reuse connections idle for longer than this delay
+SMTP_CONNECTION_IDLE_TIMEOUT = 60
 
-def send_email(
+
+class SMTPEmail(NamedTuple):
+    message: EmailMessage
+    recipients: list[str]
+
+
+class SMTPRateLimiter:
+    def __init__(self, max_emails_per_minute: int):
+        """
+        A thread safe token bucket, allowing bursts of `max_emails_per_minute` emails.
+        """
+        self.capacity = max_emails_per_minute
+        self.rate = max_emails_per_minute / 60
+        self.tokens = float(max_emails_per_minute)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, reserved: int = 0) -> None:
+        """
+        Reserve a token, waiting until it is available. This method blocks the calling thread.
+
+        The caller waits while there are fewer than `reserved` tokens left, so that these tokens are kept for other callers.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated_at) * self.rate,
+            )
+            self.updated_at = now
+            # The token is reserved even if it is not available yet, following callers will wait longer
+            self.tokens -= 1
+            wait = (reserved - self.tokens) / self.rate if self.tokens < reserved else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class SMTPSender:
+    def __init__(self):
+        """
+        Send emails using a pool of persistent, authenticated SMTP connections.
+
+        Connecting, starting TLS and logging in takes most of the time needed to send an email, connections are thus kept open
+        and reused. smtplib being synchronous, emails are sent in a pool of threads, one per connection, without blocking the event loop.
+        A token bucket limits the number of emails sent per minute, to stay within the budget of the email provider.
+        Part of the budget is reserved to emails sent directly, which are awaited by requests, queued emails can not use it.
+
+        The sender should be configured using `configure` before being used.
+        """
+        self.settings: Settings | None = None
+        self.executor: ThreadPoolExecutor | None = None
+        self.rate_limiter: SMTPRateLimiter | None = None
+        self.reserved_emails_per_minute = 0
+        # Idle connections with the time they were last used. The most recently used connection is reused first
+        self.idle_connections: queue.LifoQueue[tuple[smtplib.SMTP, float]] = (
+            queue.LifoQueue()
+        )
+
+    def configure(self, settings: "Settings") -> None:
+        self.shutdown()
+        self.settings = settings
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.SMTP_MAX_CONNECTIONS,
+            thread_name_prefix="smtp",
+        )
+        self.rate_limiter = SMTPRateLimiter(
+            max_emails_per_minute=settings.SMTP_MAX_EMAILS_PER_MINUTE,
+        )
+        self.reserved_emails_per_minute = settings.SMTP_RESERVED_EMAILS_PER_MINUTE
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        while not self.idle_connections.empty():
+            connection, _ = self.idle_connections.get_nowait()
+            self._close_connection(connection)
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.settings is None:
+            raise RuntimeError("The SMTP sender is not configured")  # noqa: TRY003
+        connection = smtplib.SMTP(
+            self.settings.SMTP_SERVER,
+            self.settings.SMTP_PORT,
+            timeout=30,
+        )
+        try:
+            connection.starttls(context=ssl.create_default_context())
+            connection.login(self.settings.SMTP_USERNAME, self.settings.SMTP_PASSWORD)
+        except Exception:
+            self._close_connection(connection)
+            raise
+        return connection
+
+    def _get_connection(self) -> smtplib.SMTP:
+        while True:
+            try:
+                connection, last_used = self.idle_connections.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < SMTP_CONNECTION_IDLE_TIMEOUT:
+                return connection
+            self._close_connection(connection)
+
+    def _close_connection(self, connection: smtplib.SMTP) -> None:
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def _send_messages(
+        self,
+        emails: list[SMTPEmail],
+        raise_errors: bool,
+        reserved: int,
+    ) -> list[bool]:
+        """
+        Send the emails over a single connection. This method blocks the calling thread.
+        `reserved` is the number of tokens of the rate limiter these emails can not use.
+
+        Return, for each email, if it was processed: sent, or refused by the server because of its recipients.
+        If no connection can be opened, the batch is stopped and the remaining emails are not processed.
+        """
+        if self.rate_limiter is None:
+            raise RuntimeError("The SMTP sender is not configured")  # noqa: TRY003
+
+        processed: list[bool] = []
+        connection: smtplib.SMTP | None = None
+        try:
+            for message, recipients in emails:
+                self.rate_limiter.acquire(reserved=reserved)
+                try:
+                    if connection is None:
+                        connection = self._get_connection()
+                    try:
+                        connection.send_message(message, message["From"], recipients)
+                    except smtplib.SMTPServerDisconnected:
+                        # The server closed the connection while it was idle, we retry once with a new connection
+                        connection.close()
+                        connection = None
+                        connection = self._connect()
+                        connection.send_message(message, message["From"], recipients)
+                    processed.append(True)
+                except smtplib.SMTPRecipientsRefused:
+                    hyperion_error_logger.warning(
+                        f'Bad email adress: "{", ".join(recipients)}" for mail with subject "{message["Subject"]}".',
+                    )
+                    processed.append(True)
+                except Exception:
+                    if connection is None:
+                        # We could not connect or log in, following emails would fail the same way
+                        if raise_errors:
+                            raise
+                        hyperion_error_logger.exception(
+                            f"Could not connect to the SMTP server, {len(emails) - len(processed)} emails were not sent",
+                        )
+                        break
+                    # The connection may be in an unknown state, we don't reuse it
+                    self._close_connection(connection)
+                    connection = None
+                    if raise_errors:
+                        raise
+                    hyperion_error_logger.exception(
+                        f'Error while sending email to "{", ".join(recipients)}" with subject "{message["Subject"]}"',
+                    )
+                    processed.append(False)
+        finally:
+            if connection is not None:
+                self.idle_connections.put((connection, time.monotonic()))
+        # Emails following a connection failure were not processed
+        processed.extend([False] * (len(emails) - len(processed)))
+        return processed
+
+    async def send_email(self, email: SMTPEmail) -> None:
+        """
+        Send an email, raising an exception if it could not be sent.
+        """
+        await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            self._send_messages,
+            [email],
+            True,
+            0,
+        )
+
+    async def send_emails(self, emails: list[SMTPEmail]) -> list[bool]:
+        """
+        Send emails over a single connection, without using the reserved part of the budget.
+        Return, for each email, if it was processed. Emails that could not be sent may be retried later.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            self._send_messages,
+            emails,
+            False,
+            self.reserved_emails_per_minute,
+        )
+
+
+# The sender is configured when the application state is initialized
+smtp_sender = SMTPSender()
+
+
+def create_email(
+    recipient: list[str],
+    subject: str,
+    content: str,
+    settings: "Settings",
+) -> SMTPEmail:
+    # Prevent send email from going to spam
+    # https://errorsfixing.com/why-do-some-python-smtplib-messages-deliver-to-gmail-spam-folder/
+    msg = EmailMessage()
+    msg.set_content(content, subtype="html", charset="utf-8")
+    msg["From"] = settings.SMTP_EMAIL
+    msg["To"] = ";".join(recipient)
+    msg["Subject"] = subject
+    return SMTPEmail(message=msg, recipients=recipient)
+
+
+async def send_email(
     recipient: str | list[str],
     subject: str,
     content: str,
@@ -24,11 +250,11 @@ def send_email(
     Send a html email using **starttls**.
     Use the SMTP settings defined in environments variables or the dotenv file.
     See [Settings class](app/core/settings.py) for more information
+
+    The email is sent using a pooled SMTP connection, see `SMTPSender`.
     """
     # Send email using
     # https://realpython.com/python-send-email/#option-1-setting-up-a-gmail-account-for-development
-    # Prevent send email from going to spam
-    # https://errorsfixing.com/why-do-some-python-smtplib-messages-deliver-to-gmail-spam-folder/
 
     if isinstance(recipient, str):
         if recipient == "":
@@ -38,52 +264,48 @@ def send_email(
     if len(recipient) == 0:
         return
 
-    context = ssl.create_default_context()
-
-    msg = EmailMessage()
-    msg.set_content(content, subtype="html", charset="utf-8")
-    msg["From"] = settings.SMTP_EMAIL
-    msg["To"] = ";".join(recipient)
-    msg["Subject"] = subject
-
-    with smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
-        server.starttls(context=context)
-        server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-        try:
-            server.send_message(msg, settings.SMTP_EMAIL, recipient)
-        except smtplib.SMTPRecipientsRefused:
-            hyperion_error_logger.warning(
-                f'Bad email adress: "{", ".join(recipient)}" for mail with subject "{subject}".',
-            )
+    await smtp_sender.send_email(
+        create_email(
+            recipient=recipient,
+            subject=subject,
+            content=content,
+            settings=settings,
+        ),
+    )
 
 
 async def send_emails_from_queue(db: "AsyncSession", settings: "Settings") -> None:
     """
-    Send emails from the email queue. This function should be called by a cron scheduled task only once per hour.
-    The task will only send 25 emails per fivteen minutes (100 emails per hour) to avoid being rate-limited by the email provider.
+    Send emails from the email queue. This function should be called by a cron scheduled task every minute.
+    The task sends at most `SMTP_MAX_EMAILS_PER_MINUTE - SMTP_RESERVED_EMAILS_PER_MINUTE` emails over a single SMTP connection,
+    to avoid being rate-limited by the email provider while leaving room for emails sent directly.
     """
     queued_emails = await cruds_core.get_queued_emails(
         db=db,
-        limit=25,
+        limit=settings.SMTP_MAX_EMAILS_PER_MINUTE
+        - settings.SMTP_RESERVED_EMAILS_PER_MINUTE,
     )
+    if len(queued_emails) == 0:
+        return
 
-    send_emails_ids = [email.id for email in queued_emails]
-
-    for email in queued_emails:
-        try:
-            send_email(
-                recipient=email.email,
+    processed = await smtp_sender.send_emails(
+        [
+            create_email(
+                recipient=[email.email],
                 subject=email.subject,
                 content=email.body,
                 settings=settings,
             )
-        except Exception:
-            hyperion_error_logger.exception(
-                f"Error while sending queued email to {email.email} with subject {email.subject}",
-            )
-            send_emails_ids.remove(email.id)
+            for email in queued_emails
+        ],
+    )
 
+    # Emails that could not be sent stay in the queue and will be retried
     await cruds_core.delete_queued_email(
-        queued_email_ids=send_emails_ids,
+        queued_email_ids=[
+            email.id
+            for email, is_processed in zip(queued_emails, processed, strict=True)
+            if is_processed
+        ],
         db=db,
     )
@@ -0,0 +1,93 @@
+import logging
+import math
+import uuid
+from collections.abc import Callable
+
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.utils.config import Settings
+from app.utils.redis import RateLimiter
+
+hyperion_access_logger = logging.getLogger("hyperion.access")
+hyperion_security_logger = logging.getLogger("hyperion.security")
+
+
+class LoggingMiddleware:
+    """
+    This middleware is called around each request.
+    It logs the request and inject a unique identifier in the request that should be used to associate logs saved during the request.
+    It also rejects requests from ip addresses exceeding the rate limit.
+
+    This is a pure ASGI middleware, see https://www.starlette.io/middleware/#pure-asgi-middleware.
+    Contrary to middlewares declared with `@app.middleware("http")`, it does not run the endpoint in a separate task
+    nor wraps the response body in a stream, which was costly and broke streaming responses.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        settings: Settings,
+        get_rate_limiter: Callable[[], RateLimiter | None],
+    ):
+        self.app = app
+        self.settings = settings
+        self.get_rate_limiter = get_rate_limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # We generate a unique identifier for the request and save it as a state.
+        # This identifier will allow combining logs associated with the same request
+        # `request.state` is backed by the `state` key of the scope, see https://www.starlette.io/requests/#other-state
+        request_id = str(uuid.uuid4())
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        path = scope["path"]
+        # This should never happen, but we log it just in case
+        if scope.get("client") is None:
+            hyperion_security_logger.warning(
+                f"Client information not available for {path}",
+            )
+            response = PlainTextResponse("No client information", status_code=400)
+            await response(scope, receive, send)
+            return
+
+        ip_address, port = scope["client"]
+
+        # We test the ip address with the redis limiter
+        rate_limiter = self.get_rate_limiter()
+        if rate_limiter and self.settings.ENABLE_RATE_LIMITER:
+            result = await rate_limiter.hit(
+                key=f"ip:{ip_address}",
+                limit=self.settings.REDIS_LIMIT,
+                window=self.settings.REDIS_WINDOW,
+            )
+            if result.alert:
+                hyperion_security_logger.warning(
+                    f"Rate limit reached for {ip_address} (limit: {self.settings.REDIS_LIMIT}, window: {self.settings.REDIS_WINDOW})",
+                )
+            if not result.allowed:
+                response = PlainTextResponse(
+                    "Too Many Requests",
+                    status_code=429,
+                    headers={"Retry-After": str(math.ceil(result.retry_after))},
+                )
+                await response(scope, receive, send)
+                return
+
+        status_code = 500
+
+        async def send_with_status_code(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        await self.app(scope, receive, send_with_status_code)
+
+        hyperion_access_logger.info(
+            f'{ip_address}:{port} - "{scope["method"]} {path}" {status_code} ({request_id})',
+        )
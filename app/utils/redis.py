@@ -1,28 +1,340 @@
+import asyncio
+import hashlib
+import logging
+import random
+import time
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from typing import NamedTuple
+
 import redis
+import redis.asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.types.exceptions import LockTimeoutError
+from app.utils.cache import run_after_transaction
+
+hyperion_error_logger = logging.getLogger("hyperion.error")
+
+# Sliding window counter, see https://konghq.com/blog/how-to-design-a-scalable-rate-limiting-algorithm.
+# The number of requests made during the last `window` is estimated from the counters of the current
+# and previous fixed windows, the previous one being weighted by its overlap with the sliding window.
+# Refused requests are not counted, so that a client is allowed again as soon as its rate decreases.
+#
+# KEYS[1]: counter of the current window
+# KEYS[2]: counter of the previous window
+# KEYS[3]: flag set when the limit is reached, to issue only one alert per window
+# ARGV[1]: limit
+# ARGV[2]: window duration, in milliseconds
+# ARGV[3]: time elapsed since the beginning of the current window, in milliseconds
+#
+# Returns {allowed, alert, retry_after}, `retry_after` being the number of milliseconds
+# before a request would be allowed again.
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+local current = tonumber(redis.call("GET", KEYS[1]) or "0")
+local previous = tonumber(redis.call("GET", KEYS[2]) or "0")
+
+if previous * (window - elapsed) / window + current + 1 <= limit then
+    redis.call("INCR", KEYS[1])
+    redis.call("PEXPIRE", KEYS[1], 2 * window)
+    return {1, 0, 0}
+end
+
+local retry_after
+if current + 1 <= limit then
+    -- The weight of the previous window needs to decrease
+    retry_after = math.ceil(window - (limit - current - 1) * window / previous) - elapsed
+else
+    -- We need to wait for the next window, where the current counter will become the previous one
+    retry_after = window - elapsed + math.ceil(window - (limit - 1) * window / current)
+end
+
+local alert = 0
+if redis.call("SET", KEYS[3], 1, "NX", "PX", window) then
+    alert = 1
+end
+return {0, alert, retry_after}
+"""
+
+
+class RateLimitResult(NamedTuple):
+    # True if the request can be processed
+    allowed: bool
+    # True the first time the limit is reached during a window, an alert should be issued
+    alert: bool
+    # Number of seconds before a request would be allowed again, 0 if the request is allowed
+    retry_after: float
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        redis_client: redis.asyncio.Redis,
+        max_blocked_keys: int = 10000,
+    ):
+        """
+        Sliding window rate limiter. Each call makes a single round-trip to Redis, running an atomic Lua script.
+
+        Keys refused by Redis are then refused by the worker, without querying Redis, until they would be allowed again.
+        At most `max_blocked_keys` keys are remembered.
+        """
+        self.script = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+        self.max_blocked_keys = max_blocked_keys
+        # Key -> time (as returned by `time.time()`) after which the key may be allowed again
+        self.blocked_until: dict[str, float] = {}
+
+    def _block(self, key: str, until: float) -> None:
+        if len(self.blocked_until) >= self.max_blocked_keys:
+            now = time.time()
+            self.blocked_until = {
+                blocked_key: blocked_until
+                for blocked_key, blocked_until in self.blocked_until.items()
+                if blocked_until > now
+            }
+            if len(self.blocked_until) >= self.max_blocked_keys:
+                self.blocked_until.clear()
+        self.blocked_until[key] = until
+
+    async def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        """
+        Count a request for `key`, which should be an ip address or a user id, prefixed by the scope of the limit.
+        At most `limit` requests are allowed during any `window` seconds.
+
+        If Redis is not reachable, the request is allowed.
+        """
+        now = time.time()
+        blocked_until = self.blocked_until.get(key)
+        if blocked_until is not None:
+            if now < blocked_until:
+                return RateLimitResult(
+                    allowed=False,
+                    alert=False,
+                    retry_after=blocked_until - now,
+                )
+            del self.blocked_until[key]
+
+        window_ms = window * 1000
+        now_ms = int(now * 1000)
+        current_window = now_ms // window_ms
+        try:
+            allowed, alert, retry_after_ms = await self.script(
+                keys=[
+                    f"ratelimit:{key}:{current_window}",
+                    f"ratelimit:{key}:{current_window - 1}",
+                    f"ratelimit:{key}:alert",
+                ],
+                args=[limit, window_ms, now_ms % window_ms],
+            )
+        except redis.exceptions.RedisError:
+            hyperion_error_logger.exception(
+                f"Rate limiter: could not reach Redis, allowing request for {key}",
+            )
+            return RateLimitResult(allowed=True, alert=False, retry_after=0)
+
+        if allowed:
+            return RateLimitResult(allowed=True, alert=False, retry_after=0)
+
+        retry_after = retry_after_ms / 1000
+        self._block(key, now + retry_after)
+        return RateLimitResult(
+            allowed=False,
+            alert=bool(alert),
+            retry_after=retry_after,
+        )
+
+
+# Default duration after which a lock expires, in seconds, if its owner did not release it, for example after a crash
+LOCK_TTL = 10
+# Default duration during which we wait for a lock held by another request, in seconds
+LOCK_WAIT_TIMEOUT = 5
+# Bounds of the delay between two attempts to acquire a lock, in seconds
+LOCK_RETRY_MIN_DELAY = 0.01
+LOCK_RETRY_MAX_DELAY = 0.5
+
+# Delete the lock only if it is still owned by the caller. It may have expired and been acquired by another owner.
+#
+# KEYS[1]: lock
+# ARGV[1]: token of the owner
+#
+# Returns 1 if the lock was released, 0 if it was not owned anymore.
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+# Keys of the locks held by this worker, used when neither Redis nor Postgres advisory locks are available
+_local_locks: set[str] = set()
+# We keep a reference to the tasks releasing Redis locks, so that they are not garbage collected
+_releasing_tasks: set[asyncio.Task] = set()
+
+
+class RedisLock:
+    def __init__(
+        self,
+        redis_client: redis.asyncio.Redis,
+        key: str,
+        ttl: float = LOCK_TTL,
+    ):
+        """
+        Lock shared by all workers. Each instance has its own owner token, so that it never releases a lock acquired by another owner.
+
+        The lock expires after `ttl` seconds: the work done while holding it should be shorter.
+        """
+        self.redis_client = redis_client
+        self.key = f"lock:{key}"
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.release_script = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+
+    async def try_acquire(self) -> bool:
+        return bool(
+            await self.redis_client.set(
+                self.key,
+                self.token,
+                nx=True,
+                px=int(self.ttl * 1000),
+            ),
+        )
+
+    async def release(self) -> None:
+        try:
+            released = await self.release_script(keys=[self.key], args=[self.token])
+        except redis.exceptions.RedisError:
+            hyperion_error_logger.exception(
+                f"Lock: could not release {self.key}, it will expire after {self.ttl} seconds",
+            )
+            return
+        if not released:
+            hyperion_error_logger.warning(
+                f"Lock: {self.key} expired before being released",
+            )
+
+    def release_in_background(self) -> None:
+        releasing_task = asyncio.create_task(self.release())
+        _releasing_tasks.add(releasing_task)
+        releasing_task.add_done_callback(_releasing_tasks.discard)
+
+
+async def wait_for_lock(
+    try_acquire: Callable[[], Awaitable[bool]],
+    wait_timeout: float,
+) -> bool:
+    """
+    Call `try_acquire` until it returns True, during at most `wait_timeout` seconds.
+
+    The delay between two attempts grows exponentially and is randomized,
+    so that waiting requests don't retry all at the same time.
+    """
+    deadline = time.monotonic() + wait_timeout
+    delay = LOCK_RETRY_MIN_DELAY
+    while not await try_acquire():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(random.uniform(delay / 2, delay), remaining))  # noqa: S311
+        delay = min(delay * 2, LOCK_RETRY_MAX_DELAY)
+    return True
+
+
+def get_advisory_lock_id(key: str) -> int:
+    """
+    Postgres advisory locks are identified by a signed 64 bits integer
+    """
+    return int.from_bytes(
+        hashlib.sha256(key.encode()).digest()[:8],
+        byteorder="big",
+        signed=True,
+    )
+
+
+@asynccontextmanager
+async def database_lock(
+    key: str,
+    db: AsyncSession,
+    wait_timeout: float = LOCK_WAIT_TIMEOUT,
+) -> AsyncIterator[None]:
+    """
+    Lock `key` using a Postgres transaction level advisory lock. It is released when the transaction of `db` ends,
+    which may be after leaving the context manager.
+
+    With SQLite, which doesn't support advisory locks, the lock is only shared by the coroutines of this worker,
+    and is also released when the transaction ends.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        lock_id = get_advisory_lock_id(key)
+
+        async def try_acquire_advisory_lock() -> bool:
+            result = await db.execute(
+                text("SELECT pg_try_advisory_xact_lock(:lock_id)"),
+                {"lock_id": lock_id},
+            )
+            return bool(result.scalar())
+
+        if not await wait_for_lock(try_acquire_advisory_lock, wait_timeout):
+            raise LockTimeoutError(key)
+        yield
+        return
+
+    async def try_acquire_local_lock() -> bool:
+        if key in _local_locks:
+            return False
+        _local_locks.add(key)
+        return True
+
+    if not await wait_for_lock(try_acquire_local_lock, wait_timeout):
+        raise LockTimeoutError(key)
+    try:
+        yield
+    finally:
+        run_after_transaction(db, lambda: _local_locks.discard(key))
 
 
-def limiter(redis_client: redis.Redis, key: str, limit: int, window: int):
-    """Simple fixed window rate limiter, returns a couple of booleans: the first is True if the request can be processed, False otherwise; the second indicates if an alert should be issued. key should be an ip address or a user id"""
-    # Fixed window: see https://konghq.com/blog/how-to-design-a-scalable-rate-limiting-algorithm.
-    nb = redis_client.incr(key)
-    if nb == 1:
-        redis_client.expire(key, window)
-    elif nb == limit:
-        return (
-            False,
-            True,
-        )  # We want to issue an alert the first time the limit is reached
-    elif nb > limit:
-        return False, False
-    return True, False
+@asynccontextmanager
+async def distributed_lock(
+    key: str,
+    db: AsyncSession,
+    redis_client: redis.asyncio.Redis | None,
+    ttl: float = LOCK_TTL,
+    wait_timeout: float = LOCK_WAIT_TIMEOUT,
+) -> AsyncIterator[None]:
+    """
+    Hold a lock on `key` while executing the body of the context manager. If the lock is held by another request,
+    we wait for it during at most `wait_timeout` seconds, then raise a `LockTimeoutError`.
 
+    The lock is stored in Redis. If Redis is not configured or not reachable, we use a database lock instead.
 
-def locker_get(redis_client: redis.Redis, key: str):
-    value = redis_client.get(key)
-    if value is None:
-        return False
-    return bool(int(value))
+    Whatever the backend, the lock is released once the transaction of `db` is committed or rolled back,
+    which may be after leaving the context manager: the next request holding the lock sees the changes of the previous one.
+    If the transaction lasts more than `ttl` seconds, the Redis lock expires before being released.
 
+    ```python
+    async with distributed_lock(key=f"amap_{user_id}", db=db, redis_client=redis_client):
+        # Only one request can execute this code for a given key
+    ```
+    """
+    if redis_client is not None:
+        lock = RedisLock(redis_client=redis_client, key=key, ttl=ttl)
+        try:
+            acquired = await wait_for_lock(lock.try_acquire, wait_timeout)
+        except redis.exceptions.RedisError:
+            hyperion_error_logger.exception(
+                f"Lock: could not reach Redis, using a database lock for {key}",
+            )
+        else:
+            if not acquired:
+                raise LockTimeoutError(key)
+            try:
+                yield
+            finally:
+                run_after_transaction(db, lock.release_in_background)
+            return
 
-def locker_set(redis_client: redis.Redis, key: str, lock: bool):
-    redis_client.set(key, int(lock))
+    async with database_lock(key=key, db=db, wait_timeout=wait_timeout):
+        yield
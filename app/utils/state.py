@@ -4,6 +4,7 @@ from typing import Any, TypedDict
 
 import calypsso
 import redis
+import redis.asyncio
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
@@ -13,12 +14,20 @@ from sqlalchemy.ext.asyncio import (
 
 from app.core.checkout.payment_tool import PaymentTool
 from app.core.checkout.types_checkout import HelloAssoConfigName
+from app.core.feed.cache_feed import published_news_cache
+from app.core.users.cache_users import authenticated_users_cache
+from app.core.users.search_users import UserSearchIndex
 from app.core.utils.config import Settings
+from app.core.utils.security import PasswordHasher
+from app.modules.campaign.cache_campaign import campaign_cache
 from app.modules.raid.utils.drive.drive_file_manager import DriveFileManager
 from app.types.scheduler import OfflineScheduler, Scheduler
 from app.types.sqlalchemy import SessionLocalType
 from app.types.websocket import WebsocketConnectionManager
 from app.utils.communication.notifications import NotificationManager
+from app.utils.images import image_processor
+from app.utils.mail.mailworker import smtp_sender
+from app.utils.redis import RateLimiter
 
 
 class GlobalState(TypedDict):
@@ -32,12 +41,18 @@ class GlobalState(TypedDict):
     SessionLocal: SessionLocalType
     # We may not have a Redis Client if it was not configured
     redis_client: redis.Redis | None
+    # Asynchronous client, which should be preferred for calls made while handling requests
+    async_redis_client: redis.asyncio.Redis | None
+    # The rate limiter requires Redis
+    rate_limiter: RateLimiter | None
     scheduler: Scheduler
     ws_manager: WebsocketConnectionManager
     notification_manager: NotificationManager
     drive_file_manager: DriveFileManager
     payment_tools: dict[HelloAssoConfigName, PaymentTool]
     mail_templates: calypsso.MailTemplates
+    user_search_index: UserSearchIndex
+    password_hasher: PasswordHasher
 
 
 class LifespanState(TypedDict):
@@ -108,6 +123,48 @@ def disconnect_redis_client(redis_client: redis.Redis | None) -> None:
         redis_client.close()
 
 
+async def init_async_redis_client(
+    settings: Settings,
+    hyperion_error_logger: logging.Logger,
+) -> redis.asyncio.Redis | None:
+    """
+    Initialize the asynchronous Redis client if the settings specify a Redis connection.
+    Returns None if Redis is not configured or can not be reached.
+    """
+    if not settings.REDIS_HOST:
+        return None
+    async_redis_client = redis.asyncio.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        password=settings.REDIS_PASSWORD,
+        socket_keepalive=True,
+    )
+    try:
+        await async_redis_client.ping()  # Test the connection
+    except redis.exceptions.ConnectionError:
+        hyperion_error_logger.exception(
+            "Redis connection error: Check the Redis configuration or the Redis server",
+        )
+        await async_redis_client.aclose()  # type: ignore[attr-defined] # types-redis stubs predate redis 5 `aclose`
+        return None
+    return async_redis_client
+
+
+async def disconnect_async_redis_client(
+    async_redis_client: redis.asyncio.Redis | None,
+) -> None:
+    if async_redis_client is not None:
+        await async_redis_client.aclose()  # type: ignore[attr-defined] # types-redis stubs predate redis 5 `aclose`
+
+
+def init_rate_limiter(
+    async_redis_client: redis.asyncio.Redis | None,
+) -> RateLimiter | None:
+    if async_redis_client is None:
+        return None
+    return RateLimiter(redis_client=async_redis_client)
+
+
 async def init_scheduler(
     settings: Settings,
     _dependency_overrides: dict[Callable[..., Any], Callable[..., Any]],
@@ -120,10 +177,19 @@ async def init_scheduler(
             redis_port=settings.REDIS_PORT,
             redis_password=settings.REDIS_PASSWORD,
             _dependency_overrides=_dependency_overrides,
+            run_worker=not settings.USE_DEDICATED_SCHEDULER_WORKER,
+            max_jobs=settings.SCHEDULER_MAX_JOBS,
         )
     else:
         scheduler = OfflineScheduler()
 
+        await scheduler.start(
+            redis_host="",
+            redis_port=settings.REDIS_PORT,
+            redis_password=None,
+            _dependency_overrides=_dependency_overrides,
+        )
+
     return scheduler
 
 
@@ -169,6 +235,60 @@ def init_payment_tools(
     return payment_tools
 
 
+def init_user_search_index(
+    settings: Settings,
+) -> UserSearchIndex:
+    return UserSearchIndex(ttl=settings.USER_SEARCH_INDEX_TTL)
+
+
+def init_worker_caches(
+    settings: Settings,
+) -> None:
+    """
+    Caches are invalidated by the cruds and thus are not part of the global state, see `TTLCache`.
+    They still need to be configured and emptied when the state is initialized.
+    """
+    authenticated_users_cache.configure(ttl=settings.AUTHENTICATED_USERS_CACHE_TTL)
+    published_news_cache.configure(ttl=settings.FEED_CACHE_TTL)
+    campaign_cache.configure(ttl=settings.CAMPAIGN_CACHE_TTL)
+
+
+def init_thread_pools(
+    settings: Settings,
+) -> None:
+    """
+    The SMTP sender and the image processor are used by helpers without access to the global state,
+    like `send_email` or `save_file_as_data`, and thus are not part of it.
+    Their thread pools still need to be configured, and stopped, with the state.
+    """
+    smtp_sender.configure(settings=settings)
+    image_processor.configure(max_workers=settings.IMAGE_PROCESSING_THREADS)
+
+
+def disconnect_thread_pools() -> None:
+    smtp_sender.shutdown()
+    image_processor.shutdown()
+
+
+def init_password_hasher(
+    settings: Settings,
+) -> PasswordHasher:
+    return PasswordHasher(
+        max_workers=settings.PASSWORD_HASHING_THREADS,
+        max_pending_operations=settings.PASSWORD_HASHING_MAX_PENDING,
+    )
+
+
+def disconnect_password_hasher(password_hasher: PasswordHasher) -> None:
+    password_hasher.shutdown()
+
+
+def disconnect_notification_manager(
+    notification_manager: NotificationManager,
+) -> None:
+    notification_manager.shutdown()
+
+
 def init_mail_templates(
     settings: Settings,
 ) -> calypsso.MailTemplates:
@@ -1,11 +1,10 @@
-import bisect
 import logging
 import os
 import re
 import secrets
 import shutil
 import unicodedata
-from collections.abc import Callable, Sequence
+from collections.abc import Callable
 from inspect import iscoroutinefunction
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, TypeVar
@@ -31,12 +30,14 @@ from app.core.users import cruds_users, models_users
 from app.core.users.models_users import CoreUser
 from app.core.utils import security
 from app.types import core_data
-from app.types.content_type import ContentType
+from app.types.content_type import ContentType, ImageSize
 from app.types.exceptions import (
     CoreDataNotFoundError,
     FileDoesNotExistError,
     FileNameIsNotAnUUIDError,
+    InvalidImageError,
 )
+from app.utils.images import image_processor
 from app.utils.mail.mailworker import send_email
 
 if TYPE_CHECKING:
@@ -54,6 +55,9 @@ uuid_regex = re.compile(
     r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$",
 )
 
+# Content types for which resized variants are created, see `save_file_as_data`
+IMAGE_CONTENT_TYPES = [ContentType.jpg, ContentType.png, ContentType.webp]
+
 
 def is_user_external(
     user: CoreUser,
@@ -64,42 +68,31 @@ def is_user_external(
     return user.account_type == AccountType.external
 
 
-def sort_user(
-    query: str,
-    users: Sequence[models_users.CoreUser],
-    limit: int = 10,
-) -> list[models_users.CoreUser]:
+def unaccent(s: str) -> str:
     """
-    Search for users using Fuzzy String Matching
+    Remove accents from `s`, `é` will become `e`
+    """
+    return unicodedata.normalize("NFKD", s).encode("ASCII", "ignore").decode("utf8")
 
-    `query` will be compared against `users` name, firstname and nickname.
-    Accents will be ignored.
-    The size of the answer can be limited using `limit` parameter.
 
-    Use Jaro-Winkler algorithm from Jellyfish library.
+def get_user_match_score(
+    query: str,
+    firstname: str,
+    name: str,
+    nickname: str | None,
+) -> float:
     """
+    Score how close an unaccented `query` is to an user unaccented names.
 
-    def unaccent(s: str) -> str:
-        return unicodedata.normalize("NFKD", s).encode("ASCII", "ignore").decode("utf8")
-
-    query = unaccent(query)
-    scored: list[tuple[CoreUser, float]] = []
-    for user in users:
-        firstname = unaccent(user.firstname)
-        name = unaccent(user.name)
-        nickname = unaccent(user.nickname) if user.nickname else None
-        score = max(
-            jaro_winkler_similarity(query, firstname),
-            jaro_winkler_similarity(query, name),
-            jaro_winkler_similarity(query, f"{firstname} {name}"),
-            jaro_winkler_similarity(query, f"{name} {firstname}"),
-            jaro_winkler_similarity(query, nickname) if nickname else 0,
-        )
-        bisect.insort(scored, (user, score), key=(lambda s: s[1]))
-        if len(scored) > limit:
-            scored.pop(0)
-
-    return [user for user, _ in reversed(scored)]
+    Use Jaro-Winkler algorithm from Jellyfish library.
+    """
+    return max(
+        jaro_winkler_similarity(query, firstname),
+        jaro_winkler_similarity(query, name),
+        jaro_winkler_similarity(query, f"{firstname} {name}"),
+        jaro_winkler_similarity(query, f"{name} {firstname}"),
+        jaro_winkler_similarity(query, nickname) if nickname else 0,
+    )
 
 
 def is_user_member_of_any_group(
@@ -182,6 +175,10 @@ async def save_file_as_data(
     There should only be one file with the same filename, thus, saving a new file will remove the existing even if its extension was different.
     Currently, compatible extensions are defined in the enum `ContentType`
 
+    For images, WebP variants are saved next to the original file: "data/{directory}/{filename}.{size}.webp",
+    see `ImageSize`. They can be retrieved using the `size` parameter of `get_file_from_data`.
+    A 400 error is raised if the image can not be decoded.
+
     An HTTP Exception will be raised if an error occurres.
 
     The filename should be a uuid.
@@ -223,14 +220,24 @@ async def save_file_as_data(
         )
     # We go back to the beginning of the file to save it on the disk
     await upload_file.seek(0)
+    # The size of the file was checked, it can be kept in memory
+    file_bytes = await upload_file.read()
 
     extension = ContentType(upload_file.content_type).name
-    # Remove the existing file if any and create the new one
+
+    # Variants are created before removing the existing file, which should be kept if the image is invalid
+    variants: dict[ImageSize, bytes] = {}
+    if upload_file.content_type in IMAGE_CONTENT_TYPES:
+        try:
+            variants = await image_processor.create_image_variants(file_bytes)
+        except InvalidImageError:
+            raise HTTPException(status_code=400, detail="Invalid image")
 
     # If the directory does not exist, we want to create it
     Path(f"data/{directory}/").mkdir(parents=True, exist_ok=True)
 
     try:
+        # Remove the existing file and its variants if any and create the new ones
         for filePath in Path().glob(f"data/{directory}/{filename}.*"):
             filePath.unlink()
 
@@ -238,9 +245,13 @@ async def save_file_as_data(
             f"data/{directory}/{filename}.{extension}",
             mode="wb",
         ) as buffer:
-            # https://stackoverflow.com/questions/63580229/how-to-save-uploadfile-in-fastapi
-            while content := await upload_file.read(1024):
-                await buffer.write(content)
+            await buffer.write(file_bytes)
+
+        await save_image_variants(
+            variants=variants,
+            directory=directory,
+            filename=filename,
+        )
 
     except Exception:
         hyperion_error_logger.exception(
@@ -248,6 +259,23 @@ async def save_file_as_data(
         )
 
 
+def get_image_variant_path(directory: str, filename: str, size: ImageSize) -> Path:
+    return Path(f"data/{directory}/{filename}.{size.value}.webp")
+
+
+async def save_image_variants(
+    variants: dict[ImageSize, bytes],
+    directory: str,
+    filename: str,
+) -> None:
+    for size, variant_bytes in variants.items():
+        async with aiofiles.open(
+            get_image_variant_path(directory, filename, size),
+            mode="wb",
+        ) as buffer:
+            await buffer.write(variant_bytes)
+
+
 async def save_bytes_as_data(
     file_bytes: bytes,
     directory: str,
@@ -300,11 +328,15 @@ def get_file_path_from_data(
     filename: str | UUID,
     default_asset: str | None = None,
     raise_http_exception: bool = False,
+    size: ImageSize | None = None,
 ) -> Path:
     """
     If there is a file with the provided filename in the data folder, return it. The file extension will be inferred from the provided content file.
     > "data/{directory}/{filename}.ext"
 
+    If `size` is provided, the corresponding variant of the image is returned if it exists.
+    Files saved before variants were introduced, or which are not images, don't have variants: the original file is then returned.
+
     Otherwise, return the default asset if provided, or raise an exception.
     If `raise_http_exception`, then a 404 error will be returned, otherwise a `FileDoesNotExistError` server error will be raised
 
@@ -321,8 +353,15 @@ def get_file_path_from_data(
         )
         raise FileNameIsNotAnUUIDError()
 
+    if size is not None:
+        variant_path = get_image_variant_path(directory, filename, size)
+        if variant_path.exists():
+            return variant_path
+
     for filePath in Path().glob(f"data/{directory}/{filename}.*"):
-        return filePath
+        # Variants are named "{filename}.{size}.webp"
+        if len(filePath.suffixes) == 1:
+            return filePath
 
     if default_asset is not None:
         return Path(default_asset)
@@ -338,12 +377,15 @@ def get_file_from_data(
     filename: str | UUID,
     default_asset: str | None = None,
     raise_http_exception: bool = False,
+    size: ImageSize | None = None,
 ) -> FileResponse:
     """
     If there is a file with the provided filename in the data folder, return it. The file extension will be inferred from the provided content file.
     > "data/{directory}/{filename}.ext"
     Otherwise, return the default asset.
 
+    If `size` is provided, the corresponding variant of the image is returned, see `get_file_path_from_data`.
+
     The filename should be a uuid.
 
     WARNING: **NEVER** trust user input when calling this function. Always check that parameters are valid.
@@ -353,6 +395,7 @@ def get_file_from_data(
         filename,
         default_asset,
         raise_http_exception,
+        size,
     )
 
     return FileResponse(path)
@@ -455,7 +498,7 @@ async def save_pdf_first_page_as_image(
 ):
     """
     Open the pdf file "data/{input_pdf_directory}/{filename}.ext" and export its first page as a jpg image.
-    The image will be saved in the `data` folder: "data/{output_image_directory}/{filename}.jpg"
+    The image will be saved in the `data` folder: "data/{output_image_directory}/{filename}.jpg", with its variants.
 
     WARNING: **NEVER** trust user input when calling this function. Always check that parameters are valid.
     """
@@ -484,6 +527,12 @@ async def save_pdf_first_page_as_image(
             extension="jpg",
         )
 
+    await save_image_variants(
+        variants=await image_processor.create_image_variants(cover_bytes),
+        directory=output_image_directory,
+        filename=str(filename),
+    )
+
 
 def get_random_string(length: int = 5) -> str:
     return "".join(
@@ -599,7 +648,7 @@ async def create_and_send_email_migration(
         mail = mail_templates.get_mail_mail_migration_confirm(
             confirmation_url=f"{settings.CLIENT_URL}users/migrate-mail-confirm?token={confirmation_token}",
         )
-        send_email(
+        await send_email(
             recipient=new_email,
             subject="MyECL - Confirm your new email address",
             content=mail,
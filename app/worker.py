@@ -0,0 +1,89 @@
+"""
+Dedicated scheduler worker, executing queued and cron jobs outside of the application workers.
+
+It should be used with `USE_DEDICATED_SCHEDULER_WORKER`, and started with:
+```bash
+python -m app.worker
+```
+`python -m app.worker --check` exits with a non-zero code if the worker did not record its health recently.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import sys
+
+from arq.connections import RedisSettings
+from arq.worker import async_check_health, create_worker
+
+from app.app import get_application
+from app.core.utils.config import Settings
+from app.dependencies import disconnect_state, get_settings, init_state
+from app.types.scheduler import get_worker_settings
+
+
+def get_redis_settings(settings: Settings) -> RedisSettings:
+    return RedisSettings(
+        host=settings.REDIS_HOST or "",
+        port=settings.REDIS_PORT,
+        password=settings.REDIS_PASSWORD or "",
+    )
+
+
+async def run_worker(settings: Settings) -> int:
+    app = get_application(settings=settings)
+    hyperion_error_logger = logging.getLogger("hyperion.error")
+
+    if not settings.REDIS_HOST or not settings.USE_DEDICATED_SCHEDULER_WORKER:
+        hyperion_error_logger.error(
+            "Worker: the dedicated scheduler worker requires REDIS_HOST and USE_DEDICATED_SCHEDULER_WORKER to be set",
+        )
+        return 1
+
+    # Jobs use the same global state as the application, the scheduler of this state only queues jobs
+    await init_state(
+        app=app,
+        settings=settings,
+        hyperion_error_logger=hyperion_error_logger,
+    )
+
+    worker = create_worker(
+        get_worker_settings(
+            worker_redis_settings=get_redis_settings(settings),
+            _dependency_overrides=app.dependency_overrides,
+        ),
+        max_jobs=settings.SCHEDULER_MAX_JOBS,
+        health_check_interval=settings.SCHEDULER_HEALTH_CHECK_INTERVAL,
+        # On SIGINT or SIGTERM, the worker stops picking new jobs and waits for running jobs to complete
+        job_completion_wait=settings.SCHEDULER_SHUTDOWN_TIMEOUT,
+    )
+    hyperion_error_logger.info("Worker: starting the dedicated scheduler worker")
+    try:
+        # The worker main task is cancelled once the worker is stopped
+        with contextlib.suppress(asyncio.CancelledError):
+            await worker.async_run()
+    finally:
+        await worker.close()
+        await disconnect_state(hyperion_error_logger=hyperion_error_logger)
+    hyperion_error_logger.info("Worker: dedicated scheduler worker stopped")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Hyperion scheduler worker")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="check the health of a running worker instead of starting one",
+    )
+    args = parser.parse_args()
+
+    settings = get_settings()
+    if args.check:
+        return asyncio.run(async_check_health(get_redis_settings(settings)))
+    return asyncio.run(run_worker(settings))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
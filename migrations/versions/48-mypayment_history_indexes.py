@@ -0,0 +1,89 @@
+"""Indexes for MyPayment wallets history
+
+Create Date: 2026-10-18 10:12:43.518210
+"""
+
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytest_alembic import MigrationContext
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5a3e7c1d9f42"
+down_revision: str | None = "e39b96af2ca0"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_mypayment_transaction_debited_wallet_id_creation",
+        "mypayment_transaction",
+        ["debited_wallet_id", "creation"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_mypayment_transaction_credited_wallet_id_creation",
+        "mypayment_transaction",
+        ["credited_wallet_id", "creation"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_mypayment_refund_debited_wallet_id_creation",
+        "mypayment_refund",
+        ["debited_wallet_id", "creation"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_mypayment_refund_credited_wallet_id_creation",
+        "mypayment_refund",
+        ["credited_wallet_id", "creation"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_mypayment_transfer_wallet_id_creation",
+        "mypayment_transfer",
+        ["wallet_id", "creation"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_mypayment_transfer_wallet_id_creation",
+        table_name="mypayment_transfer",
+    )
+    op.drop_index(
+        "ix_mypayment_refund_credited_wallet_id_creation",
+        table_name="mypayment_refund",
+    )
+    op.drop_index(
+        "ix_mypayment_refund_debited_wallet_id_creation",
+        table_name="mypayment_refund",
+    )
+    op.drop_index(
+        "ix_mypayment_transaction_credited_wallet_id_creation",
+        table_name="mypayment_transaction",
+    )
+    op.drop_index(
+        "ix_mypayment_transaction_debited_wallet_id_creation",
+        table_name="mypayment_transaction",
+    )
+
+
+def pre_test_upgrade(
+    alembic_runner: "MigrationContext",
+    alembic_connection: sa.Connection,
+) -> None:
+    pass
+
+
+def test_upgrade(
+    alembic_runner: "MigrationContext",
+    alembic_connection: sa.Connection,
+) -> None:
+    pass
@@ -0,0 +1,86 @@
+"""Export jobs
+
+Create Date: 2026-10-18 14:02:31.604217
+"""
+
+from collections.abc import Sequence
+from enum import Enum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytest_alembic import MigrationContext
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.types.sqlalchemy import TZDateTime
+
+# revision identifiers, used by Alembic.
+revision: str = "b81f4d2c6e07"
+down_revision: str | None = "5a3e7c1d9f42"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+class ExportType(str, Enum):
+    cdr_seller_results = "cdr_seller_results"
+    raid_teams_pdf = "raid_teams_pdf"
+    raid_teams_csv = "raid_teams_csv"
+
+
+class ExportJobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "core_export_job",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column(
+            "export_type",
+            sa.Enum(ExportType, name="exporttype"),
+            nullable=False,
+        ),
+        sa.Column("creator_id", sa.String(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum(ExportJobStatus, name="exportjobstatus"),
+            nullable=False,
+        ),
+        sa.Column("progress", sa.Integer(), nullable=False),
+        sa.Column("file_name", sa.String(), nullable=False),
+        sa.Column("media_type", sa.String(), nullable=False),
+        sa.Column("creation", TZDateTime(), nullable=False),
+        sa.Column("lock", sa.String(), nullable=True),
+        sa.Column("expiration", TZDateTime(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["creator_id"],
+            ["core_user.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("lock"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("core_export_job")
+    sa.Enum(ExportJobStatus, name="exportjobstatus").drop(op.get_bind())
+    sa.Enum(ExportType, name="exporttype").drop(op.get_bind())
+
+
+def pre_test_upgrade(
+    alembic_runner: "MigrationContext",
+    alembic_connection: sa.Connection,
+) -> None:
+    pass
+
+
+def test_upgrade(
+    alembic_runner: "MigrationContext",
+    alembic_connection: sa.Connection,
+) -> None:
+    pass
@@ -0,0 +1,58 @@
+"""Calendar event last modified
+
+Create Date: 2026-10-18 18:12:47.205561
+"""
+
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytest_alembic import MigrationContext
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.types.sqlalchemy import TZDateTime
+
+# revision identifiers, used by Alembic.
+revision: str = "6e4b2f9a1c83"
+down_revision: str | None = "d3a91c5e7b24"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+calendar_events_table = sa.table(
+    "calendar_events",
+    sa.column("last_modified", TZDateTime()),
+)
+
+
+def upgrade() -> None:
+    op.add_column(
+        "calendar_events",
+        sa.Column("last_modified", TZDateTime(), nullable=True),
+    )
+    # Existing events are considered modified by the migration
+    conn = op.get_bind()
+    conn.execute(
+        sa.update(calendar_events_table).values(last_modified=datetime.now(UTC)),
+    )
+    op.alter_column("calendar_events", "last_modified", nullable=False)
+
+
+def downgrade() -> None:
+    op.drop_column("calendar_events", "last_modified")
+
+
+def pre_test_upgrade(
+    alembic_runner: "MigrationContext",
+    alembic_connection: sa.Connection,
+) -> None:
+    pass
+
+
+def test_upgrade(
+    alembic_runner: "MigrationContext",
+    alembic_connection: sa.Connection,
+) -> None:
+    pass
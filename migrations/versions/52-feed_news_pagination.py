@@ -0,0 +1,70 @@
+"""Feed news pagination
+
+Create Date: 2026-10-18 19:03:26.481907
+"""
+
+from collections.abc import Sequence
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytest_alembic import MigrationContext
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.types.sqlalchemy import TZDateTime
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c52e19d4f6"
+down_revision: str | None = "6e4b2f9a1c83"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+feed_news_table = sa.table(
+    "feed_news",
+    sa.column("last_modified", TZDateTime()),
+)
+
+
+def upgrade() -> None:
+    op.add_column(
+        "feed_news",
+        sa.Column("last_modified", TZDateTime(), nullable=True),
+    )
+    # Existing news are considered modified by the migration
+    conn = op.get_bind()
+    conn.execute(sa.update(feed_news_table).values(last_modified=datetime.now(UTC)))
+    op.alter_column("feed_news", "last_modified", nullable=False)
+    op.create_index(
+        op.f("ix_feed_news_last_modified"),
+        "feed_news",
+        ["last_modified"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_feed_news_start"),
+        "feed_news",
+        ["start"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_feed_news_start"), table_name="feed_news")
+    op.drop_index(op.f("ix_feed_news_last_modified"), table_name="feed_news")
+    op.drop_column("feed_news", "last_modified")
+
+
+def pre_test_upgrade(
+    alembic_runner: "MigrationContext",
+    alembic_connection: sa.Connection,
+) -> None:
+    pass
+
+
+def test_upgrade(
+    alembic_runner: "MigrationContext",
+    alembic_connection: sa.Connection,
+) -> None:
+    pass
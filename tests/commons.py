@@ -30,9 +30,15 @@ from app.types.sqlalchemy import Base, SessionLocalType
 from app.utils.communication.notifications import NotificationManager
 from app.utils.state import (
     GlobalState,
+    init_async_redis_client,
     init_mail_templates,
+    init_password_hasher,
+    init_rate_limiter,
     init_redis_client,
+    init_thread_pools,
+    init_user_search_index,
     init_websocket_connection_manager,
+    init_worker_caches,
 )
 from app.utils.tools import (
     get_random_string,
@@ -62,10 +68,24 @@ async def override_init_state(
         hyperion_error_logger=hyperion_error_logger,
     )
 
+    async_redis_client = await init_async_redis_client(
+        settings=settings,
+        hyperion_error_logger=hyperion_error_logger,
+    )
+
+    rate_limiter = init_rate_limiter(async_redis_client=async_redis_client)
+
     # Even if we have a Redis client, we still want to use the OfflineScheduler for tests
     # as tests are not able to run tasks in the future. The event loop of the test may not be running long enough
     # to execute the tasks.
     scheduler = OfflineScheduler()
+    # Jobs queued to be executed as soon as possible are run immediately by the OfflineScheduler
+    await scheduler.start(
+        redis_host="",
+        redis_port=settings.REDIS_PORT,
+        redis_password=None,
+        _dependency_overrides=app.dependency_overrides,
+    )
 
     ws_manager = await init_websocket_connection_manager(
         settings=settings,
@@ -79,16 +99,28 @@ async def override_init_state(
 
     mail_templates = init_mail_templates(settings=settings)
 
+    user_search_index = init_user_search_index(settings=settings)
+
+    init_worker_caches(settings=settings)
+
+    init_thread_pools(settings=settings)
+
+    password_hasher = init_password_hasher(settings=settings)
+
     dependencies.GLOBAL_STATE = GlobalState(
         engine=engine,
         SessionLocal=SessionLocal,
         redis_client=redis_client,
+        async_redis_client=async_redis_client,
+        rate_limiter=rate_limiter,
         scheduler=scheduler,
         ws_manager=ws_manager,
         notification_manager=notification_manager,
         drive_file_manager=drive_file_manager,
         payment_tools=payment_tools,
         mail_templates=mail_templates,
+        user_search_index=user_search_index,
+        password_hasher=password_hasher,
     )
 
 
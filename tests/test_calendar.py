@@ -73,6 +73,7 @@ async def init_objects() -> None:
         ticket_url_opening=datetime.datetime.now(datetime.UTC)
         + datetime.timedelta(days=6),
         ticket_url="url",
+        last_modified=datetime.datetime.now(datetime.UTC),
     )
     await add_object_to_db(calendar_event)
 
@@ -92,6 +93,7 @@ async def init_objects() -> None:
         ticket_url_opening=datetime.datetime.now(datetime.UTC)
         - datetime.timedelta(days=6),
         ticket_url="url",
+        last_modified=datetime.datetime.now(datetime.UTC),
     )
     await add_object_to_db(confirmed_calendar_event)
 
@@ -110,6 +112,7 @@ async def init_objects() -> None:
         recurrence_rule=None,
         ticket_url_opening=None,
         ticket_url=None,
+        last_modified=datetime.datetime.now(datetime.UTC),
     )
     await add_object_to_db(calendar_event_to_delete)
 
@@ -423,6 +426,52 @@ def test_get_ical(client: TestClient) -> None:
     assert response.status_code == 200
 
 
+def test_get_ical_not_modified(client: TestClient) -> None:
+    client.post(
+        "/calendar/ical/create",
+        headers={"Authorization": f"Bearer {token_admin}"},
+    )
+    response = client.get(f"/calendar/ical?secret={simple_user_ical_secret}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+
+    # The file is not written again if no event changed
+    client.post(
+        "/calendar/ical/create",
+        headers={"Authorization": f"Bearer {token_admin}"},
+    )
+    response = client.get(
+        f"/calendar/ical?secret={simple_user_ical_secret}",
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_get_association_ical(client: TestClient) -> None:
+    response = client.get(
+        f"/calendar/ical?secret={simple_user_ical_secret}&association_id={association.id}",
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/calendar")
+    assert f"UID:{confirmed_calendar_event.id}@".encode() in response.content
+    # Pending events are not included
+    assert f"UID:{calendar_event_to_delete.id}@".encode() not in response.content
+
+    response = client.get(
+        f"/calendar/ical?secret={simple_user_ical_secret}&association_id={association.id}",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+    response = client.get(
+        f"/calendar/ical?secret={simple_user_ical_secret}&association_id={uuid.uuid4()}",
+    )
+    assert response.status_code == 200
+    assert b"BEGIN:VEVENT" not in response.content
+
+
 def test_get_ical_invalid_secret(client: TestClient) -> None:
     """Test if a simple user can get the iCal URL for an event."""
     response = client.get(
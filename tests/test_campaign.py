@@ -1,17 +1,31 @@
+import asyncio
 import uuid
 from pathlib import Path
 
 import pytest_asyncio
+from fastapi import BackgroundTasks
 from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
 
-from app.core.groups.groups_type import GroupType
+from app.core.groups import models_groups
+from app.core.groups.groups_type import AccountType, GroupType
+from app.core.schools.schools_type import SchoolType
 from app.core.users import models_users
-from app.modules.campaign import models_campaign
+from app.modules.campaign import (
+    cruds_campaign,
+    endpoints_campaign,
+    models_campaign,
+    schemas_campaign,
+    utils_campaign,
+)
 from app.modules.campaign.types_campaign import ListType
 from tests.commons import (
+    TEST_PASSWORD_HASH,
     add_object_to_db,
     create_api_access_token,
     create_user_with_groups,
+    get_TestingSessionLocal,
+    override_get_settings,
 )
 
 vote_admin_user: models_users.CoreUser
@@ -289,6 +303,88 @@ def test_get_stats_for_section(client: TestClient) -> None:
     assert response.status_code == 200
 
 
+class Voter:
+    def __init__(self, user_id: str):
+        """
+        An authenticated voter, as returned by the `is_user_a_member` dependency
+        """
+        self.id = user_id
+        self.group_ids = [GroupType.admin_amap.value]
+
+
+async def test_concurrent_voters(mocker: MockerFixture) -> None:
+    voters_count = 2000
+    voters = [Voter(str(uuid.uuid4())) for _ in range(voters_count)]
+    async with get_TestingSessionLocal()() as db:
+        for voter in voters:
+            db.add(
+                models_users.CoreUser(
+                    id=voter.id,
+                    email=f"{voter.id}@etu.ec-lyon.fr",
+                    school_id=SchoolType.base_school.value,
+                    password_hash=TEST_PASSWORD_HASH,
+                    name="Voter",
+                    firstname="Voter",
+                    nickname=None,
+                    floor=None,
+                    account_type=AccountType.student,
+                    birthday=None,
+                    promo=None,
+                    phone=None,
+                    created_on=None,
+                ),
+            )
+        await db.flush()
+        db.add_all(
+            [
+                models_groups.CoreMembership(
+                    user_id=voter.id,
+                    group_id=GroupType.admin_amap.value,
+                    description=None,
+                )
+                for voter in voters
+            ],
+        )
+        await db.commit()
+
+    get_voters = mocker.spy(cruds_campaign, "get_voters")
+    # Voters share a limited number of database connections, like the application.
+    # SQLite does not support concurrent write transactions
+    connections = asyncio.Semaphore(1 if override_get_settings().SQLITE_DB else 20)
+
+    async def cast_vote(voter: Voter) -> None:
+        async with connections, get_TestingSessionLocal()() as db:
+            background_tasks = BackgroundTasks()
+            await endpoints_campaign.vote(
+                vote=schemas_campaign.VoteBase(list_id=campaign_list.id),
+                background_tasks=background_tasks,
+                db=db,
+                user=voter,  # type: ignore[arg-type]
+                redis_client=None,
+            )
+            await db.commit()
+            await background_tasks()
+
+    await asyncio.gather(*(cast_vote(voter) for voter in voters))
+
+    # Votes are never accepted based on the cached status and voters
+    assert get_voters.call_count == voters_count
+
+    async with get_TestingSessionLocal()() as db:
+        # The user of the previous tests voted too
+        assert dict(await cruds_campaign.get_votes_count_by_list(db=db)) == {
+            campaign_list.id: voters_count + 1,
+        }
+        assert (
+            await utils_campaign.get_section_vote_count(
+                section_id=section.id,
+                db=db,
+                redis_client=None,
+            )
+            == voters_count + 1
+        )
+
+
 def test_get_results_while_open(client: TestClient) -> None:
     # As the status is open, nobody should be able to access results
     token = create_api_access_token(vote_admin_user)
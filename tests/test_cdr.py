@@ -53,6 +53,7 @@ curriculum: models_cdr.Curriculum
 unused_curriculum: models_cdr.Curriculum
 
 cdr_user_with_curriculum_with_non_validated_purchase: models_users.CoreUser
+cdr_user_without_curriculum: models_users.CoreUser
 
 purchase: models_cdr.Purchase
 
@@ -252,6 +253,9 @@ async def init_objects():
     )
     await add_object_to_db(curriculum_membership)
 
+    global cdr_user_without_curriculum
+    cdr_user_without_curriculum = await create_user_with_groups([])
+
     global cdr_user_with_curriculum_with_non_validated_purchase
     cdr_user_with_curriculum_with_non_validated_purchase = (
         await create_user_with_groups(
@@ -380,6 +384,70 @@ def test_get_all_cdr_users_seller(client: TestClient):
     assert str(cdr_user.id) in [x["id"] for x in response.json()]
 
 
+def test_get_all_cdr_users_with_curriculum(client: TestClient):
+    response = client.get(
+        "/cdr/users/",
+        headers={"Authorization": f"Bearer {token_amap}"},
+    )
+    assert response.status_code == 200
+    users = {x["id"]: x for x in response.json()}
+    assert users[cdr_user_with_curriculum_with_non_validated_purchase.id][
+        "curriculum"
+    ] == {"id": str(curriculum.id), "name": curriculum.name}
+    assert users[cdr_user_without_curriculum.id]["curriculum"] is None
+
+    response = client.get(
+        "/cdr/users/",
+        headers={
+            "Authorization": f"Bearer {token_amap}",
+            "If-None-Match": response.headers["ETag"],
+        },
+    )
+    assert response.status_code == 304
+
+
+def test_get_cdr_users_changes(client: TestClient):
+    response = client.get(
+        "/cdr/users/",
+        headers={"Authorization": f"Bearer {token_amap}"},
+    )
+    assert response.status_code == 200
+    version = int(response.headers["ETag"].strip('"'))
+
+    response = client.post(
+        f"/cdr/users/{cdr_user_without_curriculum.id}/curriculums/{curriculum.id}/",
+        headers={"Authorization": f"Bearer {token_admin}"},
+    )
+    assert response.status_code == 201
+
+    response = client.get(
+        f"/cdr/users/changes/?since={version}",
+        headers={"Authorization": f"Bearer {token_amap}"},
+    )
+    assert response.status_code == 200
+    changes = response.json()
+    assert changes["version"] > version
+    assert not changes["reset"]
+    assert [x["id"] for x in changes["users"]] == [cdr_user_without_curriculum.id]
+    assert changes["users"][0]["curriculum"]["id"] == str(curriculum.id)
+
+    response = client.get(
+        f"/cdr/users/changes/?since={changes['version']}",
+        headers={"Authorization": f"Bearer {token_amap}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["users"] == []
+
+    # An unknown version requires the client to reload all users
+    response = client.get(
+        "/cdr/users/changes/?since=0",
+        headers={"Authorization": f"Bearer {token_amap}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["reset"]
+    assert cdr_user.id in [x["id"] for x in response.json()["users"]]
+
+
 def test_get_all_cdr_users_user(client: TestClient):
     response = client.get(
         "/cdr/users/",
@@ -1516,6 +1584,8 @@ def test_patch_purchase_seller(client: TestClient):
         headers={"Authorization": f"Bearer {token_amap}"},
     )
     assert response.status_code == 201
+    updated_purchase = response.json()
+    assert updated_purchase["quantity"] == 2
 
     response = client.get(
         f"/cdr/users/{cdr_admin.id}/purchases/",
@@ -1526,6 +1596,7 @@ def test_patch_purchase_seller(client: TestClient):
     for x in response.json():
         if x["product_variant_id"] == str(variant.id):
             assert x["quantity"] == 2
+            assert x["purchased_on"] == updated_purchase["purchased_on"]
 
 
 def test_patch_purchase_wrong_purchase(client: TestClient):
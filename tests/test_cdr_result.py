@@ -1,12 +1,17 @@
 import uuid
+import zipfile
 from datetime import UTC, datetime
+from pathlib import Path
 
 import pytest_asyncio
 
 from app.core.groups.groups_type import GroupType
 from app.core.users import models_users
 from app.modules.cdr import models_cdr
-from app.modules.cdr.utils_cdr import construct_dataframe_from_users_purchases
+from app.modules.cdr.utils_cdr import (
+    construct_dataframe_from_users_purchases,
+    write_dataframe_to_xlsx,
+)
 from tests.commons import (
     create_api_access_token,
     create_user_with_groups,
@@ -383,3 +388,31 @@ def test_construct_dataframe_from_users_purchases():
         True,
         "",
     ]
+
+
+def test_write_dataframe_to_xlsx(tmp_path: Path):
+    df = construct_dataframe_from_users_purchases(
+        users=[cdr_user1, cdr_user2, cdr_user3],
+        products=[product1],
+        variants=[product1_variant1, product1_variant2],
+        users_purchases={
+            cdr_user1.id: [purchase_user1_product1_variant1],
+            cdr_user2.id: [purchase_user2_product1_variant2],
+        },
+        data_fields={product1.id: [customdata_field1]},
+        users_answers={cdr_user3.id: [customdata_user3]},
+    )
+    # Users who only answered a field have a row
+    assert df.index.tolist() == [0, cdr_user1.id, cdr_user2.id, cdr_user3.id]
+
+    path = tmp_path / "results.xlsx"
+    write_dataframe_to_xlsx(df, path)
+
+    with zipfile.ZipFile(path) as xlsx:
+        # In constant memory mode, strings are written inline in the sheet
+        sheet = xlsx.read("xl/worksheets/sheet1.xml").decode()
+    assert f"1. {product1.name_fr} : {product1_variant1.name_fr}" in sheet
+    assert cdr_user1.email in sheet
+    assert "Value 3" in sheet
+    # Header, prices and users
+    assert sheet.count("<row ") == 5
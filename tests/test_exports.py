@@ -0,0 +1,223 @@
+import uuid
+from datetime import UTC, datetime, timedelta
+from urllib.parse import unquote
+
+import pytest_asyncio
+from fastapi.testclient import TestClient
+
+from app.core.exports import models_exports
+from app.core.exports.types_exports import ExportJobStatus, ExportType
+from app.core.exports.utils_exports import delete_expired_exports, get_export_file_path
+from app.core.groups.groups_type import GroupType
+from app.core.users import models_users
+from app.modules.cdr import models_cdr
+from tests.commons import (
+    add_object_to_db,
+    create_api_access_token,
+    create_user_with_groups,
+    get_TestingSessionLocal,
+)
+
+cdr_admin: models_users.CoreUser
+other_cdr_admin: models_users.CoreUser
+raid_admin: models_users.CoreUser
+
+token_cdr_admin: str
+token_other_cdr_admin: str
+token_raid_admin: str
+
+seller: models_cdr.Seller
+busy_seller: models_cdr.Seller
+running_export_job: models_exports.ExportJob
+
+
+@pytest_asyncio.fixture(scope="module", autouse=True)
+async def init_objects() -> None:
+    global cdr_admin, other_cdr_admin, raid_admin
+    cdr_admin = await create_user_with_groups([GroupType.admin_cdr])
+    other_cdr_admin = await create_user_with_groups([GroupType.admin_cdr])
+    raid_admin = await create_user_with_groups([GroupType.admin_raid])
+
+    global token_cdr_admin, token_other_cdr_admin, token_raid_admin
+    token_cdr_admin = create_api_access_token(cdr_admin)
+    token_other_cdr_admin = create_api_access_token(other_cdr_admin)
+    token_raid_admin = create_api_access_token(raid_admin)
+
+    global seller
+    seller = models_cdr.Seller(
+        id=uuid.uuid4(),
+        name="Exported seller",
+        group_id=str(GroupType.admin_cdr.value),
+        order=42,
+    )
+    await add_object_to_db(seller)
+    product = models_cdr.CdrProduct(
+        id=uuid.uuid4(),
+        seller_id=seller.id,
+        name_fr="Produit exporté",
+        name_en="Exported product",
+        available_online=False,
+    )
+    await add_object_to_db(product)
+    variant = models_cdr.ProductVariant(
+        id=uuid.uuid4(),
+        product_id=product.id,
+        name_fr="Variante",
+        name_en="Variant",
+        price=100,
+        unique=False,
+        enabled=True,
+    )
+    await add_object_to_db(variant)
+    await add_object_to_db(
+        models_cdr.Purchase(
+            user_id=other_cdr_admin.id,
+            product_variant_id=variant.id,
+            quantity=2,
+            validated=True,
+            purchased_on=datetime.now(UTC),
+        ),
+    )
+
+    global busy_seller
+    busy_seller = models_cdr.Seller(
+        id=uuid.uuid4(),
+        name="Busy seller",
+        group_id=str(GroupType.admin_cdr.value),
+        order=43,
+    )
+    await add_object_to_db(busy_seller)
+
+    global running_export_job
+    running_export_job = models_exports.ExportJob(
+        id=uuid.uuid4(),
+        export_type=ExportType.cdr_seller_results,
+        creator_id=cdr_admin.id,
+        status=ExportJobStatus.running,
+        progress=50,
+        file_name="results.xlsx",
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        creation=datetime.now(UTC),
+        lock=f"cdr_seller_results_{busy_seller.id}",
+    )
+    await add_object_to_db(running_export_job)
+
+
+def test_export_seller_results(client: TestClient) -> None:
+    response = client.post(
+        f"/cdr/sellers/{seller.id}/results/export",
+        headers={"Authorization": f"Bearer {token_cdr_admin}"},
+    )
+    assert response.status_code == 201
+    export_job_id = response.json()["id"]
+    assert response.json()["export_type"] == ExportType.cdr_seller_results
+
+    # Without Redis, the job is executed right after the response is sent
+    response = client.get(
+        f"/exports/{export_job_id}",
+        headers={"Authorization": f"Bearer {token_cdr_admin}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["status"] == ExportJobStatus.succeeded
+    assert response.json()["progress"] == 100
+
+    response = client.get(
+        f"/exports/{export_job_id}/download",
+        headers={"Authorization": f"Bearer {token_cdr_admin}"},
+    )
+    assert response.status_code == 200
+    assert "Exported seller" in unquote(response.headers["content-disposition"])
+    # An xlsx file is a zip archive
+    assert response.content.startswith(b"PK")
+
+
+def test_export_seller_results_already_running(client: TestClient) -> None:
+    response = client.post(
+        f"/cdr/sellers/{busy_seller.id}/results/export",
+        headers={"Authorization": f"Bearer {token_cdr_admin}"},
+    )
+    assert response.status_code == 201
+    assert response.json()["id"] == str(running_export_job.id)
+    assert response.json()["status"] == ExportJobStatus.running
+
+    response = client.get(
+        f"/exports/{running_export_job.id}/download",
+        headers={"Authorization": f"Bearer {token_cdr_admin}"},
+    )
+    assert response.status_code == 400
+
+
+def test_export_seller_results_failure(client: TestClient) -> None:
+    empty_seller = str(uuid.uuid4())
+    response = client.post(
+        f"/cdr/sellers/{empty_seller}/results/export",
+        headers={"Authorization": f"Bearer {token_cdr_admin}"},
+    )
+    assert response.status_code == 404
+
+
+def test_get_export_job_of_another_user(client: TestClient) -> None:
+    response = client.get(
+        f"/exports/{running_export_job.id}",
+        headers={"Authorization": f"Bearer {token_other_cdr_admin}"},
+    )
+    assert response.status_code == 404
+
+
+def test_export_teams_csv(client: TestClient) -> None:
+    response = client.post(
+        "/raid/teams/csv/export",
+        headers={"Authorization": f"Bearer {token_raid_admin}"},
+    )
+    assert response.status_code == 201
+    export_job_id = response.json()["id"]
+
+    response = client.get(
+        f"/exports/{export_job_id}/download",
+        headers={"Authorization": f"Bearer {token_raid_admin}"},
+    )
+    assert response.status_code == 200
+    assert response.text.startswith("Team name,Captain,Second,Difficulty,Number")
+
+
+def test_export_teams_pdf(client: TestClient) -> None:
+    response = client.post(
+        "/raid/teams/pdf/export",
+        headers={"Authorization": f"Bearer {token_raid_admin}"},
+    )
+    assert response.status_code == 201
+    export_job_id = response.json()["id"]
+
+    response = client.get(
+        f"/exports/{export_job_id}/download",
+        headers={"Authorization": f"Bearer {token_raid_admin}"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.content.startswith(b"%PDF")
+
+
+async def test_delete_expired_exports() -> None:
+    expired_export_job = models_exports.ExportJob(
+        id=uuid.uuid4(),
+        export_type=ExportType.raid_teams_csv,
+        creator_id=raid_admin.id,
+        status=ExportJobStatus.succeeded,
+        progress=100,
+        file_name="teams.csv",
+        media_type="text/csv",
+        creation=datetime.now(UTC) - timedelta(days=2),
+        lock=None,
+        expiration=datetime.now(UTC) - timedelta(days=1),
+    )
+    await add_object_to_db(expired_export_job)
+    file_path = get_export_file_path(expired_export_job.id)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text("Team name")
+
+    async with get_TestingSessionLocal()() as db:
+        await delete_expired_exports(db=db)
+        await db.commit()
+        assert await db.get(models_exports.ExportJob, expired_export_job.id) is None
+        assert await db.get(models_exports.ExportJob, running_export_job.id)
+    assert not file_path.exists()
@@ -0,0 +1,128 @@
+import uuid
+from datetime import UTC, datetime, timedelta
+
+import pytest_asyncio
+from fastapi.testclient import TestClient
+
+from app.core.feed import models_feed
+from app.core.feed.types_feed import NewsStatus
+from app.core.groups.groups_type import GroupType
+from tests.commons import (
+    add_object_to_db,
+    create_api_access_token,
+    create_user_with_groups,
+)
+
+token_simple: str
+token_feed_admin: str
+
+published_news: list[models_feed.News]
+waiting_news: models_feed.News
+
+
+def create_news(start: datetime, status: NewsStatus) -> models_feed.News:
+    return models_feed.News(
+        id=uuid.uuid4(),
+        title="News",
+        start=start,
+        end=None,
+        entity="Eclair",
+        location=None,
+        action_start=None,
+        module="advert",
+        module_object_id=uuid.uuid4(),
+        image_directory="adverts",
+        image_id=uuid.uuid4(),
+        status=status,
+        last_modified=datetime.now(UTC) - timedelta(days=1),
+    )
+
+
+@pytest_asyncio.fixture(scope="module", autouse=True)
+async def init_objects() -> None:
+    global token_simple, token_feed_admin
+    token_simple = create_api_access_token(await create_user_with_groups([]))
+    token_feed_admin = create_api_access_token(
+        await create_user_with_groups([GroupType.admin_feed]),
+    )
+
+    global published_news, waiting_news
+    now = datetime.now(UTC)
+    published_news = [
+        create_news(start=now - timedelta(days=i), status=NewsStatus.PUBLISHED)
+        for i in range(5)
+    ]
+    for news in published_news:
+        await add_object_to_db(news)
+    waiting_news = create_news(start=now, status=NewsStatus.WAITING_APPROVAL)
+    await add_object_to_db(waiting_news)
+
+
+def test_get_published_news_pages(client: TestClient) -> None:
+    response = client.get(
+        "/feed/news?limit=3",
+        headers={"Authorization": f"Bearer {token_simple}"},
+    )
+    assert response.status_code == 200
+    assert [news["id"] for news in response.json()] == [
+        str(news.id) for news in published_news[:3]
+    ]
+
+    response = client.get(
+        "/feed/news",
+        params={"limit": 3, "cursor": response.headers["X-Next-Cursor"]},
+        headers={"Authorization": f"Bearer {token_simple}"},
+    )
+    assert response.status_code == 200
+    assert [news["id"] for news in response.json()] == [
+        str(news.id) for news in published_news[3:]
+    ]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_published_news_invalid_cursor(client: TestClient) -> None:
+    response = client.get(
+        "/feed/news?cursor=invalid",
+        headers={"Authorization": f"Bearer {token_simple}"},
+    )
+    assert response.status_code == 400
+
+
+def test_get_published_news_since(client: TestClient) -> None:
+    since = datetime.now(UTC)
+    # The first page is cached, approving a news invalidates it
+    response = client.get(
+        "/feed/news?limit=3",
+        headers={"Authorization": f"Bearer {token_simple}"},
+    )
+    assert str(waiting_news.id) not in [news["id"] for news in response.json()]
+
+    response = client.post(
+        f"/feed/admin/news/{waiting_news.id}/approve",
+        headers={"Authorization": f"Bearer {token_feed_admin}"},
+    )
+    assert response.status_code == 204
+    response = client.post(
+        f"/feed/admin/news/{published_news[0].id}/reject",
+        headers={"Authorization": f"Bearer {token_feed_admin}"},
+    )
+    assert response.status_code == 204
+
+    response = client.get(
+        "/feed/news?limit=3",
+        headers={"Authorization": f"Bearer {token_simple}"},
+    )
+    assert response.json()[0]["id"] == str(waiting_news.id)
+    assert str(published_news[0].id) not in [news["id"] for news in response.json()]
+
+    # Only the news published or rejected since the previous refresh are returned
+    response = client.get(
+        "/feed/news",
+        params={"since": since.isoformat()},
+        headers={"Authorization": f"Bearer {token_simple}"},
+    )
+    assert response.status_code == 200
+    assert {(news["id"], news["status"]) for news in response.json()} == {
+        (str(waiting_news.id), NewsStatus.PUBLISHED),
+        (str(published_news[0].id), NewsStatus.REJECTED),
+    }
@@ -11,6 +11,7 @@ from tests.commons import (
 )
 
 admin_user: models_users.CoreUser
+removed_admin_user: models_users.CoreUser
 
 
 id_test_eclair = "8aab79e7-1e15-456d-b6e2-11e4e9f77e4f"
@@ -18,7 +19,7 @@ id_test_eclair = "8aab79e7-1e15-456d-b6e2-11e4e9f77e4f"
 
 @pytest_asyncio.fixture(scope="module", autouse=True)
 async def init_objects() -> None:
-    global admin_user
+    global admin_user, removed_admin_user
 
     eclair = models_groups.CoreGroup(
         id=id_test_eclair,
@@ -28,6 +29,7 @@ async def init_objects() -> None:
     await add_object_to_db(eclair)
 
     admin_user = await create_user_with_groups([GroupType.admin])
+    removed_admin_user = await create_user_with_groups([GroupType.admin])
 
 
 def test_read_groups(client: TestClient) -> None:
@@ -107,3 +109,32 @@ def test_delete_membership(client: TestClient) -> None:
         headers={"Authorization": f"Bearer {token}"},
     )
     assert response.status_code == 204
+
+
+def test_delete_membership_revokes_access(client: TestClient) -> None:
+    removed_admin_token = create_api_access_token(removed_admin_user)
+
+    # The user is now cached by the worker
+    response = client.get(
+        f"/groups/{id_test_eclair}",
+        headers={"Authorization": f"Bearer {removed_admin_token}"},
+    )
+    assert response.status_code == 200
+
+    token = create_api_access_token(admin_user)
+    response = client.request(
+        method="DELETE",
+        url="/groups/membership",
+        json={
+            "user_id": removed_admin_user.id,
+            "group_id": GroupType.admin.value,
+        },
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 204
+
+    response = client.get(
+        f"/groups/{id_test_eclair}",
+        headers={"Authorization": f"Bearer {removed_admin_token}"},
+    )
+    assert response.status_code == 403
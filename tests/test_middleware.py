@@ -0,0 +1,127 @@
+import asyncio
+from collections.abc import AsyncIterator
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from pytest_mock import MockerFixture
+from starlette.types import Message
+
+from app.utils import middleware
+from app.utils.middleware import LoggingMiddleware
+from app.utils.redis import RateLimitResult
+from tests.commons import override_get_settings
+
+
+class FakeRateLimiter:
+    def __init__(self, allowed: bool):
+        self.allowed = allowed
+        self.keys: list[str] = []
+
+    async def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        self.keys.append(key)
+        return RateLimitResult(
+            allowed=self.allowed,
+            alert=False,
+            retry_after=0 if self.allowed else 12.5,
+        )
+
+
+def create_app(rate_limiter: FakeRateLimiter | None = None) -> LoggingMiddleware:
+    app = FastAPI()
+
+    @app.get("/request-id")
+    async def get_request_id(request: Request) -> str:
+        return str(request.state.request_id)
+
+    @app.get("/stream")
+    async def stream() -> StreamingResponse:
+        async def chunks() -> AsyncIterator[bytes]:
+            for i in range(3):
+                yield f"chunk {i}\n".encode()
+
+        return StreamingResponse(chunks())
+
+    settings = override_get_settings().model_copy(
+        update={"ENABLE_RATE_LIMITER": True},
+    )
+    return LoggingMiddleware(
+        app,
+        settings=settings,
+        get_rate_limiter=lambda: rate_limiter,  # type: ignore[arg-type, return-value]
+    )
+
+
+async def test_logging_middleware_injects_request_id(mocker: MockerFixture) -> None:
+    access_log = mocker.spy(middleware.hyperion_access_logger, "info")
+    transport = httpx.ASGITransport(
+        app=create_app(),  # type: ignore[arg-type]
+        client=("127.0.0.1", 1234),
+    )
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/request-id")
+
+    assert response.status_code == 200
+    request_id = response.json()
+    # The access log contains the status code sent by the endpoint and the request id
+    access_log.assert_called_once_with(
+        f'127.0.0.1:1234 - "GET /request-id" 200 ({request_id})',
+    )
+
+
+async def test_logging_middleware_does_not_buffer_streaming_responses() -> None:
+    app = create_app()
+    messages: list[Message] = []
+    request_received = asyncio.Event()
+
+    async def receive() -> Message:
+        if not request_received.is_set():
+            request_received.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client stays connected, the response stops waiting for a disconnection once it is sent
+        await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    await app(
+        {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/stream",
+            "raw_path": b"/stream",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [],
+            "client": ("127.0.0.1", 1234),
+            "server": ("test", 80),
+        },
+        receive,
+        send,
+    )
+
+    # Each chunk is forwarded as soon as it is produced
+    body_messages = [
+        message["body"]
+        for message in messages
+        if message["type"] == "http.response.body" and message["body"]
+    ]
+    assert body_messages == [b"chunk 0\n", b"chunk 1\n", b"chunk 2\n"]
+
+
+async def test_logging_middleware_rejects_rate_limited_ip_addresses() -> None:
+    rate_limiter = FakeRateLimiter(allowed=False)
+    transport = httpx.ASGITransport(
+        app=create_app(rate_limiter),  # type: ignore[arg-type]
+        client=("127.0.0.1", 1234),
+    )
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/request-id")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "13"
+    assert rate_limiter.keys == ["ip:127.0.0.1"]
@@ -1,7 +1,9 @@
+import asyncio
 import base64
 from datetime import UTC, datetime, timedelta
 from uuid import UUID, uuid4
 
+import httpx
 import pytest_asyncio
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric.ed25519 import (
@@ -13,7 +15,7 @@ from pytest_mock import MockerFixture
 
 from app.core.groups.groups_type import GroupType
 from app.core.memberships import models_memberships
-from app.core.mypayment import cruds_mypayment, models_mypayment
+from app.core.mypayment import cruds_mypayment, models_mypayment, schemas_mypayment
 from app.core.mypayment.coredata_mypayment import (
     MyPaymentBankAccountHolder,
 )
@@ -33,6 +35,7 @@ from tests.commons import (
     create_api_access_token,
     create_user_with_groups,
     get_TestingSessionLocal,
+    override_get_settings,
 )
 
 admin_user: models_users.CoreUser
@@ -953,6 +956,45 @@ async def test_get_store_history(client: TestClient):
     assert history[str(transaction_from_ecl_user_to_store.id)]["total"] == 500
 
 
+async def test_get_store_history_names_of_other_stores() -> None:
+    async with get_TestingSessionLocal()() as db:
+        transaction = models_mypayment.Transaction(
+            id=uuid4(),
+            debited_wallet_id=store.wallet_id,
+            debited_wallet_device_id=store_wallet_device.id,
+            credited_wallet_id=store2.wallet_id,
+            transaction_type=TransactionType.DIRECT,
+            seller_user_id=ecl_user2.id,
+            total=100,
+            creation=datetime(2020, 1, 1, 12, 0, 0, tzinfo=UTC),
+            status=TransactionStatus.CONFIRMED,
+            store_note=None,
+            qr_code_id=None,
+        )
+        db.add(transaction)
+        await db.flush()
+
+        # The unpaginated history keeps the empty name it always returned
+        history = await cruds_mypayment.get_wallet_history(
+            wallet_id=store.wallet_id,
+            db=db,
+            end_datetime=datetime(2021, 1, 1, tzinfo=UTC),
+            include_transfers=False,
+            only_name_users=True,
+        )
+        assert [item.other_wallet_name for item in history] == [""]
+
+        history = await cruds_mypayment.get_wallet_history(
+            wallet_id=store.wallet_id,
+            db=db,
+            end_datetime=datetime(2021, 1, 1, tzinfo=UTC),
+            include_transfers=False,
+            limit=10,
+        )
+        assert [item.other_wallet_name for item in history] == [store2.name]
+        await db.rollback()
+
+
 async def test_get_store_history_with_date(client: TestClient):
     response = client.get(
         f"/mypayment/stores/{store.id}/history",
@@ -1953,6 +1995,46 @@ def test_get_transactions_success_with_date(client: TestClient):
     )
 
 
+def test_get_transactions_with_pagination(client: TestClient):
+    response = client.get(
+        "/mypayment/users/me/wallet/history",
+        headers={"Authorization": f"Bearer {ecl_user_access_token}"},
+    )
+    assert response.status_code == 200
+    transactions = response.json()
+    assert [t["creation"] for t in transactions] == sorted(
+        (t["creation"] for t in transactions),
+        reverse=True,
+    )
+
+    paginated_transactions = []
+    params: dict[str, str | int] = {"limit": 2}
+    while True:
+        response = client.get(
+            "/mypayment/users/me/wallet/history",
+            params=params,
+            headers={"Authorization": f"Bearer {ecl_user_access_token}"},
+        )
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        paginated_transactions += response.json()
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert paginated_transactions == transactions
+
+
+def test_get_transactions_with_invalid_cursor(client: TestClient):
+    response = client.get(
+        "/mypayment/users/me/wallet/history",
+        params={"cursor": "invalid"},
+        headers={"Authorization": f"Bearer {ecl_user_access_token}"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
 def test_transfer_with_redirect_url_not_trusted(client: TestClient):
     """Test transferring with an unregistered user"""
     response = client.post(
@@ -2297,9 +2379,18 @@ def test_store_scan_store_missing_wallet(
     mocker: MockerFixture,
 ):
     # This should never happen, as an user should never have a WalletDevice without an existing associated Wallet
+    get_store_scan_context = cruds_mypayment.get_store_scan_context
+
+    async def get_store_scan_context_without_wallet(
+        **kwargs,
+    ) -> schemas_mypayment.StoreScanContext | None:
+        context = await get_store_scan_context(**kwargs)
+        assert context is not None
+        return context.model_copy(update={"debited_wallet_id": None})
+
     mocker.patch(
-        "app.core.mypayment.cruds_mypayment.get_wallet",
-        return_value=None,
+        "app.core.mypayment.cruds_mypayment.get_store_scan_context",
+        side_effect=get_store_scan_context_without_wallet,
     )
 
     qr_code_id = uuid4()
@@ -2542,6 +2633,129 @@ async def test_store_scan_store_successful_scan(client: TestClient):
     # TODO: verify that a transaction was created
 
 
+async def test_store_scan_concurrent_scans(client: TestClient):
+    """
+    Fire parallel scans against a single store wallet.
+    Every payment should be banked exactly once, and a wallet should never be debited more than its balance.
+    """
+    payers: list[tuple[models_mypayment.WalletDevice, Ed25519PrivateKey]] = []
+    for i in range(20):
+        payer = await create_user_with_groups(groups=[])
+        await add_object_to_db(
+            models_memberships.CoreAssociationUserMembership(
+                id=uuid4(),
+                user_id=payer.id,
+                association_membership_id=association_membership.id,
+                start_date=datetime.now(UTC) - timedelta(days=1),
+                end_date=datetime.now(UTC) + timedelta(days=1),
+            ),
+        )
+        payer_wallet = models_mypayment.Wallet(
+            id=uuid4(),
+            type=WalletType.USER,
+            # The last payer can only afford two of its three payments
+            balance=250 if i == 19 else 1000,
+        )
+        await add_object_to_db(payer_wallet)
+        await add_object_to_db(
+            models_mypayment.UserPayment(
+                user_id=payer.id,
+                wallet_id=payer_wallet.id,
+                accepted_tos_signature=datetime.now(UTC),
+                accepted_tos_version=LATEST_TOS,
+            ),
+        )
+        private_key = Ed25519PrivateKey.generate()
+        payer_wallet_device = models_mypayment.WalletDevice(
+            id=uuid4(),
+            name="Concurrent scan device",
+            wallet_id=payer_wallet.id,
+            ed25519_public_key=private_key.public_key().public_bytes(
+                encoding=serialization.Encoding.Raw,
+                format=serialization.PublicFormat.Raw,
+            ),
+            creation=datetime.now(UTC),
+            status=WalletDeviceStatus.ACTIVE,
+            activation_token=f"activation_token_concurrent_scan_{i}",
+        )
+        await add_object_to_db(payer_wallet_device)
+        payers.append((payer_wallet_device, private_key))
+
+    async with get_TestingSessionLocal()() as db:
+        store_balance_before_scans = (
+            await cruds_mypayment.lock_wallets_balances(
+                wallet_ids=[store_wallet.id],
+                db=db,
+            )
+        )[store_wallet.id]
+
+    def scan_body(
+        wallet_device: models_mypayment.WalletDevice,
+        private_key: Ed25519PrivateKey,
+    ) -> dict:
+        qr_code_content = QRCodeContentData(
+            id=uuid4(),
+            tot=100,
+            iat=datetime.now(UTC),
+            store=True,
+            key=wallet_device.id,
+        )
+        signature = private_key.sign(
+            qr_code_content.model_dump_json().encode("utf-8"),
+        )
+        return {
+            "id": str(qr_code_content.id),
+            "key": str(qr_code_content.key),
+            "tot": qr_code_content.tot,
+            "iat": qr_code_content.iat.isoformat(),
+            "store": qr_code_content.store,
+            "signature": base64.b64encode(signature).decode("utf-8"),
+        }
+
+    bodies = [scan_body(*payer) for payer in payers]
+    bodies += [scan_body(*payers[-1]) for _ in range(2)]
+
+    # The TestClient can not send concurrent requests, we use an asynchronous client on the same application
+    async with httpx.AsyncClient(
+        # Starlette and httpx declare the same ASGI interface with different types
+        transport=httpx.ASGITransport(app=client.app),  # type: ignore[arg-type]
+        base_url="http://test",
+    ) as async_client:
+        responses = await asyncio.gather(
+            *(
+                async_client.post(
+                    f"/mypayment/stores/{store.id}/scan",
+                    headers={
+                        "Authorization": f"Bearer {store_seller_can_bank_user_access_token}",
+                    },
+                    json=body,
+                )
+                for body in bodies
+            ),
+        )
+
+    status_codes = [response.status_code for response in responses]
+    assert status_codes.count(201) == 21, [response.text for response in responses]
+    assert status_codes.count(400) == 1
+    assert all(
+        response.json()["detail"] == "Insufficient balance in the debited wallet"
+        for response in responses
+        if response.status_code == 400
+    )
+
+    async with get_TestingSessionLocal()() as db:
+        balances = await cruds_mypayment.lock_wallets_balances(
+            wallet_ids=[store_wallet.id]
+            + [wallet_device.wallet_id for wallet_device, _ in payers],
+            db=db,
+        )
+    assert balances[store_wallet.id] == store_balance_before_scans + 21 * 100
+    assert all(
+        balances[wallet_device.wallet_id] == 900 for wallet_device, _ in payers[:-1]
+    )
+    assert balances[payers[-1][0].wallet_id] == 50
+
+
 async def test_unknown_transaction_refund(client: TestClient):
     response = client.post(
         f"/mypayment/transactions/{uuid4()}/refund",
@@ -3049,3 +3263,104 @@ async def test_delete_invoice(
     )
     assert response.status_code == 200
     assert not any(invoice["id"] == invoice3.id for invoice in response.json())
+
+
+async def test_get_data_for_integrity_check_with_invalid_token(
+    client: TestClient,
+    mocker: MockerFixture,
+):
+    mocker.patch.object(
+        override_get_settings(),
+        "MYPAYMENT_DATA_VERIFIER_ACCESS_TOKEN",
+        "data_verifier_token",
+    )
+    response = client.get(
+        "/mypayment/integrity-check",
+        headers={"x-data-verifier-token": "invalid_token"},
+    )
+    assert response.status_code == 403, response.text
+
+
+async def test_get_data_for_integrity_check_substracts_recent_transactions(
+    client: TestClient,
+    mocker: MockerFixture,
+):
+    mocker.patch.object(
+        override_get_settings(),
+        "MYPAYMENT_DATA_VERIFIER_ACCESS_TOKEN",
+        "data_verifier_token",
+    )
+    # Balances already include the recent confirmed transaction
+    debited_wallet = models_mypayment.Wallet(
+        id=uuid4(),
+        type=WalletType.USER,
+        balance=700,
+    )
+    await add_object_to_db(debited_wallet)
+    credited_wallet = models_mypayment.Wallet(
+        id=uuid4(),
+        type=WalletType.STORE,
+        balance=2300,
+    )
+    await add_object_to_db(credited_wallet)
+    for status in (TransactionStatus.CONFIRMED, TransactionStatus.CANCELED):
+        await add_object_to_db(
+            models_mypayment.Transaction(
+                id=uuid4(),
+                debited_wallet_id=debited_wallet.id,
+                debited_wallet_device_id=ecl_user_wallet_device.id,
+                credited_wallet_id=credited_wallet.id,
+                transaction_type=TransactionType.DIRECT,
+                seller_user_id=None,
+                total=300,
+                creation=datetime.now(UTC),
+                status=status,
+                store_note=None,
+                qr_code_id=None,
+            ),
+        )
+
+    response = client.get(
+        "/mypayment/integrity-check",
+        params={"isInitialisation": True},
+        headers={"x-data-verifier-token": "data_verifier_token"},
+    )
+    assert response.status_code == 200, response.text
+    balances = {
+        wallet["id"]: wallet["balance"] for wallet in response.json()["wallets"]
+    }
+    assert balances[str(debited_wallet.id)] == 1000
+    assert balances[str(credited_wallet.id)] == 2000
+    assert response.json()["transactions"] == []
+
+
+async def test_get_data_for_integrity_check_as_stream(
+    client: TestClient,
+    mocker: MockerFixture,
+):
+    mocker.patch.object(
+        override_get_settings(),
+        "MYPAYMENT_DATA_VERIFIER_ACCESS_TOKEN",
+        "data_verifier_token",
+    )
+    params = {"lastChecked": (datetime.now(UTC) - timedelta(days=30)).isoformat()}
+    response = client.get(
+        "/mypayment/integrity-check",
+        params=params,
+        headers={"x-data-verifier-token": "data_verifier_token"},
+    )
+    assert response.status_code == 200, response.text
+    streamed_response = client.get(
+        "/mypayment/integrity-check",
+        params={**params, "stream": True},
+        headers={"x-data-verifier-token": "data_verifier_token"},
+    )
+    assert streamed_response.status_code == 200, streamed_response.text
+    assert streamed_response.headers["content-type"] == "application/json"
+
+    data = response.json()
+    streamed_data = streamed_response.json()
+    # The date is computed by the database at the beginning of each request
+    del data["date"], streamed_data["date"]
+    assert streamed_data == data
+    assert len(data["transactions"]) > 0
@@ -1,15 +1,35 @@
 import uuid
+from datetime import UTC, datetime, timedelta
 
 import pytest_asyncio
+from fastapi import BackgroundTasks
 from fastapi.testclient import TestClient
+from firebase_admin import messaging
+from pytest_mock import MockerFixture
+from sqlalchemy import select
 
 from app.core.groups.groups_type import GroupType
-from app.core.notification.models_notification import NotificationTopic
+from app.core.notification import cruds_notification
+from app.core.notification.models_notification import (
+    FirebaseDevice,
+    NotificationOutboxMessage,
+    NotificationTopic,
+    TopicMembership,
+)
+from app.core.notification.schemas_notification import Message
 from app.core.users import models_users
+from app.dependencies import get_scheduler
+from app.utils.communication.notifications import (
+    FIREBASE_MULTICAST_MAX_TOKENS,
+    NotificationManager,
+    NotificationOutboxStats,
+)
 from tests.commons import (
     add_object_to_db,
     create_api_access_token,
     create_user_with_groups,
+    get_TestingSessionLocal,
+    override_get_settings,
 )
 
 admin_user: models_users.CoreUser | None = None
@@ -281,3 +301,287 @@ def test_send_test_future_notification_topic(client: TestClient) -> None:
         },
     )
     assert response.status_code == 204
+
+
+async def test_send_notification_to_many_devices(mocker: MockerFixture) -> None:
+    user = await create_user_with_groups([])
+    tokens = [f"device-token-{i}" for i in range(1200)]
+    async with get_TestingSessionLocal()() as db:
+        db.add_all(
+            FirebaseDevice(
+                user_id=user.id,
+                firebase_device_token=token,
+                register_date=datetime.now(UTC).date(),
+            )
+            for token in tokens
+        )
+        await db.commit()
+
+    sent_chunks: list[list[str]] = []
+
+    def send_each_for_multicast(
+        message: messaging.MulticastMessage,
+    ) -> messaging.BatchResponse:
+        sent_chunks.append(message.tokens)
+        # The first device of each chunk is not registered anymore
+        responses = [
+            mocker.Mock(
+                success=i != 0,
+                exception=messaging.UnregisteredError("Unregistered"),
+            )
+            for i in range(len(message.tokens))
+        ]
+        return mocker.Mock(responses=responses, failure_count=1)
+
+    mocker.patch.object(messaging, "send_each_for_multicast", send_each_for_multicast)
+    notification_manager = NotificationManager(settings=override_get_settings())
+    notification_manager.use_firebase = True
+    delete_spy = mocker.spy(
+        cruds_notification,
+        "batch_delete_firebase_device_by_token",
+    )
+
+    async with get_TestingSessionLocal()() as db:
+        await notification_manager.send_notification_to_users(
+            user_ids=[user.id],
+            message=Message(
+                title="Test",
+                content="Test",
+                action_module="test",
+            ),
+            db=db,
+        )
+        await db.commit()
+        remaining_tokens = (
+            await db.execute(
+                select(FirebaseDevice.firebase_device_token).where(
+                    FirebaseDevice.user_id == user.id,
+                ),
+            )
+        ).scalars()
+        assert len(list(remaining_tokens)) == 1197
+    notification_manager.shutdown()
+
+    assert sorted(len(chunk) for chunk in sent_chunks) == [200, 500, 500]
+    # Invalid tokens of all the chunks are deleted with a single query
+    delete_spy.assert_called_once()
+
+
+def create_outbox_message(user_id: str, title: str) -> NotificationOutboxMessage:
+    return NotificationOutboxMessage(
+        id=uuid.uuid4(),
+        user_id=user_id,
+        title=title,
+        content="Content",
+        action_module="test",
+        creation=datetime.now(UTC),
+        attempts=0,
+        next_attempt=datetime.now(UTC),
+    )
+
+
+async def test_send_notifications_from_outbox(mocker: MockerFixture) -> None:
+    user_1 = await create_user_with_groups([])
+    user_2 = await create_user_with_groups([])
+    async with get_TestingSessionLocal()() as db:
+        db.add_all(
+            FirebaseDevice(
+                user_id=user_id,
+                firebase_device_token=token,
+                register_date=datetime.now(UTC).date(),
+            )
+            for user_id, token in [
+                (user_1.id, "outbox-token-1"),
+                (user_1.id, "outbox-token-2"),
+                (user_2.id, "outbox-token-3"),
+            ]
+        )
+        db.add_all(
+            [
+                create_outbox_message(user_1.id, "Shared"),
+                create_outbox_message(user_2.id, "Shared"),
+                create_outbox_message(user_1.id, "Shared"),
+                create_outbox_message(user_2.id, "Personal"),
+            ],
+        )
+        await db.commit()
+
+    sent_messages: dict[str | None, list[str]] = {}
+
+    def send_each_for_multicast(
+        message: messaging.MulticastMessage,
+    ) -> messaging.BatchResponse:
+        sent_messages[message.notification.title] = sorted(message.tokens)
+        return mocker.Mock(failure_count=0)
+
+    mocker.patch.object(messaging, "send_each_for_multicast", send_each_for_multicast)
+    notification_manager = NotificationManager(settings=override_get_settings())
+    notification_manager.use_firebase = True
+
+    stats = await notification_manager.send_notifications_from_outbox()
+    notification_manager.shutdown()
+
+    # Messages with the same content are sent as a single notification, and only once to each device
+    assert sent_messages == {
+        "Shared": ["outbox-token-1", "outbox-token-2", "outbox-token-3"],
+        "Personal": ["outbox-token-3"],
+    }
+    assert stats == NotificationOutboxStats(
+        messages=4,
+        notifications=2,
+        devices=4,
+        failed_devices=0,
+        retried_messages=0,
+        dropped_messages=0,
+    )
+    async with get_TestingSessionLocal()() as db:
+        assert (await db.execute(select(NotificationOutboxMessage))).first() is None
+
+
+async def test_retry_notifications_from_outbox(mocker: MockerFixture) -> None:
+    user = await create_user_with_groups([])
+    outbox_message = create_outbox_message(user.id, "Retried")
+    await add_object_to_db(
+        FirebaseDevice(
+            user_id=user.id,
+            firebase_device_token="retried-token",
+            register_date=datetime.now(UTC).date(),
+        ),
+    )
+    await add_object_to_db(outbox_message)
+
+    mocker.patch.object(
+        messaging,
+        "send_each_for_multicast",
+        side_effect=messaging.QuotaExceededError("Quota exceeded", None),
+    )
+    notification_manager = NotificationManager(settings=override_get_settings())
+    notification_manager.use_firebase = True
+
+    stats = await notification_manager.send_notifications_from_outbox()
+    assert stats.retried_messages == 1
+    # The message will only be retried after a delay
+    stats = await notification_manager.send_notifications_from_outbox()
+    assert stats.messages == 0
+    notification_manager.shutdown()
+
+    async with get_TestingSessionLocal()() as db:
+        retried_message = await db.get(NotificationOutboxMessage, outbox_message.id)
+        assert retried_message is not None
+        assert retried_message.attempts == 1
+        assert retried_message.next_attempt > datetime.now(UTC) + timedelta(
+            seconds=20,
+        )
+
+
+async def test_retry_notifications_of_failed_chunks(mocker: MockerFixture) -> None:
+    # The devices of the first user fill a whole chunk, the device of the second one is sent in another chunk
+    user_1 = await create_user_with_groups([])
+    user_2 = await create_user_with_groups([])
+    outbox_message_1 = create_outbox_message(user_1.id, "Chunked")
+    outbox_message_2 = create_outbox_message(user_2.id, "Chunked")
+    async with get_TestingSessionLocal()() as db:
+        db.add_all(
+            FirebaseDevice(
+                user_id=user_1.id,
+                firebase_device_token=f"chunked-token-{i}",
+                register_date=datetime.now(UTC).date(),
+            )
+            for i in range(FIREBASE_MULTICAST_MAX_TOKENS)
+        )
+        db.add(
+            FirebaseDevice(
+                user_id=user_2.id,
+                firebase_device_token="failed-chunk-token",
+                register_date=datetime.now(UTC).date(),
+            ),
+        )
+        db.add_all([outbox_message_1, outbox_message_2])
+        await db.commit()
+
+    def send_each_for_multicast(
+        message: messaging.MulticastMessage,
+    ) -> messaging.BatchResponse:
+        if "failed-chunk-token" in message.tokens:
+            raise messaging.QuotaExceededError("Quota exceeded", None)  # noqa: TRY003
+        return mocker.Mock(failure_count=0)
+
+    mocker.patch.object(messaging, "send_each_for_multicast", send_each_for_multicast)
+    notification_manager = NotificationManager(settings=override_get_settings())
+    notification_manager.use_firebase = True
+
+    stats = await notification_manager.send_notifications_from_outbox()
+    notification_manager.shutdown()
+
+    assert stats.devices == FIREBASE_MULTICAST_MAX_TOKENS
+    assert stats.retried_messages == 1
+    # Only the user whose devices were in the failed chunk will be notified again
+    async with get_TestingSessionLocal()() as db:
+        assert await db.get(NotificationOutboxMessage, outbox_message_1.id) is None
+        assert await db.get(NotificationOutboxMessage, outbox_message_2.id) is not None
+
+
+async def test_register_new_topic(mocker: MockerFixture) -> None:
+    group_member = await create_user_with_groups([GroupType.admin_cdr])
+    already_subscribed_member = await create_user_with_groups([GroupType.admin_cdr])
+    await create_user_with_groups([])
+    tokens = [f"topic-token-{i}" for i in range(1500)]
+    async with get_TestingSessionLocal()() as db:
+        db.add_all(
+            FirebaseDevice(
+                user_id=group_member.id,
+                firebase_device_token=token,
+                register_date=datetime.now(UTC).date(),
+            )
+            for token in tokens
+        )
+        await db.commit()
+
+    subscribed_tokens: list[list[str]] = []
+
+    def subscribe_to_topic(
+        tokens: list[str],
+        topic: str,
+    ) -> messaging.TopicManagementResponse:
+        subscribed_tokens.append(tokens)
+        return mocker.Mock(failure_count=0)
+
+    mocker.patch.object(messaging, "subscribe_to_topic", subscribe_to_topic)
+    notification_manager = NotificationManager(settings=override_get_settings())
+    notification_manager.use_firebase = True
+
+    topic_id = uuid.uuid4()
+    background_tasks = BackgroundTasks()
+    async with get_TestingSessionLocal()() as db:
+        await notification_manager.register_new_topic(
+            topic_id=topic_id,
+            name="New topic",
+            module_root="test",
+            topic_identifier=None,
+            restrict_to_group_id=GroupType.admin_cdr.value,
+            restrict_to_members=False,
+            db=db,
+            scheduler=get_scheduler(),
+            background_tasks=background_tasks,
+        )
+        db.add(
+            TopicMembership(user_id=already_subscribed_member.id, topic_id=topic_id),
+        )
+        await db.commit()
+    # Without Redis, the job is run as soon as it is queued
+    await background_tasks()
+    notification_manager.shutdown()
+
+    async with get_TestingSessionLocal()() as db:
+        subscribed_user_ids = (
+            await db.execute(
+                select(TopicMembership.user_id).where(
+                    TopicMembership.topic_id == topic_id,
+                ),
+            )
+        ).scalars()
+        assert sorted(subscribed_user_ids) == sorted(
+            [group_member.id, already_subscribed_member.id],
+        )
+    # Tokens are subscribed by batches of 1000
+    assert [len(batch) for batch in subscribed_tokens] == [1000, 500]
@@ -326,6 +326,23 @@ def test_buy_tickets(client: TestClient) -> None:
     assert response.status_code == 201
 
 
+def test_buy_tickets_without_enough_cash(client: TestClient) -> None:
+    token = create_api_access_token(AMAP_user)
+
+    response = client.post(
+        f"/tombola/tickets/buy/{packticket.id}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 400
+
+    response = client.get(
+        f"/tombola/users/{AMAP_user.id}/tickets",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+
+
 # def test_edit_tickets():
 #     token = create_api_access_token(BDE_user)
 
@@ -1,6 +1,73 @@
+from collections import Counter
+
+import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
 
+from app import dependencies
+from app.core.users import models_users
+from app.utils.redis import RateLimiter
 from tests import commons
+from tests.commons import (
+    create_api_access_token,
+    create_user_with_groups,
+    override_get_settings,
+)
+
+user_1: models_users.CoreUser
+user_2: models_users.CoreUser
+token_user_1: str
+token_user_2: str
+
+
+@pytest_asyncio.fixture(scope="module", autouse=True)
+async def init_objects() -> None:
+    global user_1, user_2, token_user_1, token_user_2
+    user_1 = await create_user_with_groups(groups=[])
+    user_2 = await create_user_with_groups(groups=[])
+    token_user_1 = create_api_access_token(user_1)
+    token_user_2 = create_api_access_token(user_2)
+
+
+class FakeSlidingWindowScript:
+    """
+    Replace the Lua script run by Redis. Each key is allowed `limit` requests, then requests are refused for 30 seconds.
+    """
+
+    def __init__(self):
+        self.counters: Counter[str] = Counter()
+        # Number of calls for each key, without the window suffix
+        self.calls: Counter[str] = Counter()
+
+    async def __call__(self, keys: list[str], args: list[int]) -> list[int]:
+        current_key = keys[0]
+        self.calls[current_key.rsplit(":", 1)[0]] += 1
+        if self.counters[current_key] < args[0]:
+            self.counters[current_key] += 1
+            return [1, 0, 0]
+        return [0, 1, 30000]
+
+
+@pytest.fixture
+def script(mocker: MockerFixture) -> FakeSlidingWindowScript:
+    """
+    Enable the rate limiter, without depending on Redis
+    """
+    script = FakeSlidingWindowScript()
+    redis_client = mocker.Mock()
+    redis_client.register_script.return_value = script
+    mocker.patch.dict(
+        dependencies.GLOBAL_STATE,
+        {"rate_limiter": RateLimiter(redis_client=redis_client)},
+    )
+    # The middleware uses the settings of the application of this module,
+    # while endpoints dependencies use the cached `override_get_settings`, which may be another instance
+    for settings in (commons.SETTINGS, override_get_settings()):
+        mocker.patch.object(settings, "ENABLE_RATE_LIMITER", True)
+        # The global limit of the middleware should not be reached
+        mocker.patch.object(settings, "REDIS_LIMIT", 1000)
+    return script
 
 
 def test_limiter(client: TestClient) -> None:
@@ -9,11 +76,82 @@ def test_limiter(client: TestClient) -> None:
     initial_ENABLE_RATE_LIMITER = commons.SETTINGS.ENABLE_RATE_LIMITER
     commons.SETTINGS.ENABLE_RATE_LIMITER = True
     try:
-        for _ in range(commons.SETTINGS.REDIS_LIMIT - 1):
+        for _ in range(commons.SETTINGS.REDIS_LIMIT):
             response = client.get("/information")
             assert response.status_code == 200
         for _ in range(2):
             response = client.get("/information")
             assert response.status_code == 429
+            assert int(response.headers["Retry-After"]) > 0
     finally:
         commons.SETTINGS.ENABLE_RATE_LIMITER = initial_ENABLE_RATE_LIMITER
+
+
+def test_rate_limited_route(
+    client: TestClient,
+    script: FakeSlidingWindowScript,
+) -> None:
+    for _ in range(10):
+        response = client.post(
+            "/users/recover",
+            json={"email": "unknown@example.fr"},
+        )
+        assert response.status_code == 201
+    response = client.post("/users/recover", json={"email": "unknown@example.fr"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
+
+    # Requests are counted for each ip address, in addition to the global limit of the middleware
+    assert script.calls["ratelimit:/users/recover:ip:testclient"] == 11
+    assert script.calls["ratelimit:ip:testclient"] == 11
+
+    # Other routes are not limited
+    response = client.get("/information")
+    assert response.status_code == 200
+
+
+def test_blocked_key_is_refused_without_querying_redis(
+    client: TestClient,
+    script: FakeSlidingWindowScript,
+) -> None:
+    for _ in range(11):
+        client.post("/users/recover", json={"email": "unknown@example.fr"})
+
+    # The worker remembers the key is blocked until it may be allowed again
+    for _ in range(5):
+        response = client.post(
+            "/users/recover",
+            json={"email": "unknown@example.fr"},
+        )
+        assert response.status_code == 429
+        assert 0 < int(response.headers["Retry-After"]) <= 30
+    assert script.calls["ratelimit:/users/recover:ip:testclient"] == 11
+
+
+def test_rate_limited_route_per_user(
+    client: TestClient,
+    script: FakeSlidingWindowScript,
+) -> None:
+    for _ in range(5):
+        response = client.post(
+            "/users/change-password",
+            json={},
+            headers={"Authorization": f"Bearer {token_user_1}"},
+        )
+        # The limit is checked before the body
+        assert response.status_code == 422
+    response = client.post(
+        "/users/change-password",
+        json={},
+        headers={"Authorization": f"Bearer {token_user_1}"},
+    )
+    assert response.status_code == 429
+
+    # Requests are counted for each user, another user from the same ip address is allowed
+    response = client.post(
+        "/users/change-password",
+        json={},
+        headers={"Authorization": f"Bearer {token_user_2}"},
+    )
+    assert response.status_code == 422
+    assert script.calls[f"ratelimit:/users/change-password:user:{user_2.id}"] == 1
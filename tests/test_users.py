@@ -8,11 +8,13 @@ from pytest_mock import MockerFixture
 
 from app.core.groups.groups_type import AccountType, GroupType
 from app.core.schools.schools_type import SchoolType
-from app.core.users import models_users
+from app.core.users import cruds_users, models_users, schemas_users
+from app.core.users.search_users import UserSearchIndex
 from app.dependencies import is_user
 from tests.commons import (
     create_api_access_token,
     create_user_with_groups,
+    get_TestingSessionLocal,
 )
 
 admin_user: models_users.CoreUser
@@ -20,6 +22,7 @@ student_user: models_users.CoreUser
 external_user: models_users.CoreUser
 student_user_with_old_email: models_users.CoreUser
 user_with_group: models_users.CoreUser
+searched_user: models_users.CoreUser
 
 token_admin_user: str
 token_student_user: str
@@ -56,6 +59,14 @@ async def init_objects() -> None:
     global user_with_group
     user_with_group = await create_user_with_groups([GroupType.admin_amap])
 
+    global searched_user
+    searched_user = await create_user_with_groups(
+        [GroupType.admin_amap],
+        firstname="Éloïse",
+        name="Delaunay",
+        nickname="Zébulon",
+    )
+
     global token_admin_user
     token_admin_user = create_api_access_token(admin_user)
 
@@ -100,6 +111,95 @@ def test_search_users(client: TestClient) -> None:
     assert all(user["id"] not in account_type_users for user in data)
 
 
+def test_search_users_by_name(client: TestClient) -> None:
+    # Accents are ignored, and the query may only be the beginning of a name
+    for query in ["elo", "Eloise Delau", "zebul"]:
+        response = client.get(
+            f"/users/search?query={query}",
+            headers={"Authorization": f"Bearer {token_student_user}"},
+        )
+        assert response.status_code == 200
+        assert response.json()[0]["id"] == searched_user.id
+
+
+def test_search_users_with_groups_filters(client: TestClient) -> None:
+    response = client.get(
+        f"/users/search?query=Delaunay&includedGroups={GroupType.admin_amap.value}",
+        headers={"Authorization": f"Bearer {token_student_user}"},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert searched_user.id in [user["id"] for user in data]
+    assert student_user.id not in [user["id"] for user in data]
+
+    response = client.get(
+        f"/users/search?query=Delaunay&excludedGroups={GroupType.admin_amap.value}",
+        headers={"Authorization": f"Bearer {token_student_user}"},
+    )
+    assert response.status_code == 200
+    assert searched_user.id not in [user["id"] for user in response.json()]
+
+
+def test_search_users_after_update(client: TestClient) -> None:
+    # Make sure the index is built before updating the user
+    client.get(
+        "/users/search?query=Delaunay",
+        headers={"Authorization": f"Bearer {token_student_user}"},
+    )
+    response = client.patch(
+        f"/users/{searched_user.id}",
+        json={"name": "Kerouac"},
+        headers={"Authorization": f"Bearer {token_admin_user}"},
+    )
+    assert response.status_code == 204
+
+    response = client.get(
+        "/users/search?query=Kerou",
+        headers={"Authorization": f"Bearer {token_student_user}"},
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["id"] == searched_user.id
+
+
+async def test_search_index_is_updated_after_the_commit() -> None:
+    user = await create_user_with_groups(groups=[], name="Zwanziger")
+    index = UserSearchIndex(ttl=60)
+
+    async with get_TestingSessionLocal()() as db:
+        await index.ensure_built(db)
+        await cruds_users.update_user(
+            db=db,
+            user_id=user.id,
+            user_update=schemas_users.CoreUserUpdateAdmin(name="Quenneville"),
+        )
+        await index.refresh_user_after_commit(db=db, user_id=user.id)
+        # The index should not contain changes which may be rolled back
+        assert user.id not in await index.search(db=db, query="Quenneville")
+
+        await db.commit()
+        assert user.id in await index.search(db=db, query="Quenneville")
+
+
+async def test_search_index_invalidated_during_a_build(mocker: MockerFixture) -> None:
+    index = UserSearchIndex(ttl=60)
+    get_users_memberships = cruds_users.get_users_memberships
+
+    async def get_users_memberships_while_invalidating(*args, **kwargs):
+        # The index is invalidated while the users are being loaded
+        index.invalidate()
+        return await get_users_memberships(*args, **kwargs)
+
+    mocker.patch.object(
+        cruds_users,
+        "get_users_memberships",
+        get_users_memberships_while_invalidating,
+    )
+    async with get_TestingSessionLocal()() as db:
+        await index.ensure_built(db)
+    # The tables may miss the change, they should be rebuilt on the next search
+    assert not index.is_up_to_date()
+
+
 def test_get_account_types(client: TestClient) -> None:
     response = client.get(
         "/users/account-types",
@@ -475,6 +575,18 @@ def test_read_own_profile_picture(client: TestClient) -> None:
     assert response.status_code == 200
 
 
+def test_read_own_profile_picture_thumbnail(client: TestClient) -> None:
+    token = create_api_access_token(student_user)
+
+    response = client.get(
+        "/users/me/profile-picture?size=thumbnail",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+
+
 def test_read_user_profile_picture(client: TestClient) -> None:
     token = create_api_access_token(student_user)
 
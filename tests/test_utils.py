@@ -1,15 +1,43 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
 import shutil
+import smtplib
+import time
 import uuid
+from datetime import UTC, datetime
 from pathlib import Path
 
+import botocore.exceptions
 import pytest
 import pytest_asyncio
+from arq.connections import RedisSettings
+from arq.worker import create_worker
 from fastapi import HTTPException, UploadFile
+from PIL import Image
+from pytest_mock import MockerFixture
+from sqlalchemy import text
 from starlette.datastructures import Headers
 
-from app.core.core_endpoints import models_core
+from app.core.core_endpoints import cruds_core, models_core
+from app.core.utils.security import PasswordHasher
+from app.types.content_type import ImageSize
 from app.types.core_data import BaseCoreData
-from app.types.exceptions import CoreDataNotFoundError, FileNameIsNotAnUUIDError
+from app.types.exceptions import (
+    CoreDataNotFoundError,
+    FileNameIsNotAnUUIDError,
+    LockTimeoutError,
+    PasswordHasherSaturatedError,
+)
+from app.types.s3_access import S3Access
+from app.types.scheduler import Scheduler, get_worker_settings
+from app.utils.cache import TTLCache
+from app.utils.images import IMAGE_VARIANT_MAX_SIDES, create_image_variants
+from app.utils.loggers_tools.s3_handler import DEAD_LETTER_FILE, S3LogHandler
+from app.utils.mail import mailworker
+from app.utils.redis import distributed_lock
 from app.utils.tools import (
     delete_file_from_data,
     get_core_data,
@@ -23,6 +51,7 @@ from app.utils.tools import (
 from tests.commons import (
     add_object_to_db,
     get_TestingSessionLocal,
+    override_get_settings,
 )
 
 
@@ -66,6 +95,33 @@ async def init_objects() -> None:
     await add_object_to_db(core_data)
 
 
+def test_ttl_cache_ignores_values_loaded_before_an_invalidation() -> None:
+    cache: TTLCache[str, int] = TTLCache(ttl=60)
+
+    generation = cache.generation
+    cache.invalidate("key")
+    cache.set(key="key", value=1, generation=generation)
+    assert cache.get("key") is None
+
+    cache.set(key="key", value=2, generation=cache.generation)
+    assert cache.get("key") == 2
+    cache.clear()
+    assert cache.get("key") is None
+
+
+async def test_ttl_cache_is_cleared_after_the_commit() -> None:
+    cache: TTLCache[str, int] = TTLCache(ttl=60)
+    cache.set(key="key", value=1, generation=cache.generation)
+
+    async with get_TestingSessionLocal()() as db:
+        cache.clear_after_commit(db)
+        # Concurrent requests may still use the values which are being modified
+        assert cache.get("key") == 1
+        await db.commit()
+
+    assert cache.get("key") is None
+
+
 async def test_save_file() -> None:
     valid_uuid = str(uuid.uuid4())
     with Path("assets/images/default_profile_picture.png").open("rb") as file:
@@ -79,6 +135,61 @@ async def test_save_file() -> None:
         )
 
 
+async def test_save_image_with_variants() -> None:
+    valid_uuid = str(uuid.uuid4())
+    with Path("assets/images/default_profile_picture.png").open("rb") as file:
+        await save_file_as_data(
+            upload_file=UploadFile(
+                file,
+                headers=Headers({"content-type": "image/png"}),
+            ),
+            directory="test",
+            filename=valid_uuid,
+        )
+
+    assert get_file_path_from_data(directory="test", filename=valid_uuid) == Path(
+        f"data/test/{valid_uuid}.png",
+    )
+    for size in ImageSize:
+        path = get_file_path_from_data(
+            directory="test",
+            filename=valid_uuid,
+            size=size,
+        )
+        assert path == Path(f"data/test/{valid_uuid}.{size.value}.webp")
+        with Image.open(path) as image:
+            assert image.format == "WEBP"
+            assert max(image.size) <= IMAGE_VARIANT_MAX_SIDES[size]
+
+    # Variants are removed with the original file
+    delete_file_from_data(directory="test", filename=valid_uuid)
+    assert list(Path().glob(f"data/test/{valid_uuid}.*")) == []
+
+
+def test_create_image_variants_of_an_image_wider_than_webp_allows() -> None:
+    buffer = io.BytesIO()
+    Image.new("RGB", (20000, 10)).save(buffer, format="PNG")
+
+    variants = create_image_variants(buffer.getvalue())
+
+    with Image.open(io.BytesIO(variants[ImageSize.original])) as image:
+        assert image.width == IMAGE_VARIANT_MAX_SIDES[ImageSize.original]
+
+
+async def test_save_invalid_image() -> None:
+    valid_uuid = str(uuid.uuid4())
+    with pytest.raises(HTTPException, match="400: Invalid image"):
+        await save_file_as_data(
+            upload_file=UploadFile(
+                io.BytesIO(b"not an image"),
+                headers=Headers({"content-type": "image/png"}),
+            ),
+            directory="test",
+            filename=valid_uuid,
+        )
+    assert list(Path().glob(f"data/test/{valid_uuid}.*")) == []
+
+
 async def test_save_file_with_invalid_content_type() -> None:
     valid_uuid = str(uuid.uuid4())
     with (
@@ -289,3 +400,454 @@ async def test_replace_core_data() -> None:
         )
         assert new_core_data.name == "ECLAIR"
         assert new_core_data.age == 42
+
+
+async def test_password_hasher() -> None:
+    password_hasher = PasswordHasher(max_workers=1, max_pending_operations=2)
+
+    password_hash = await password_hasher.get_password_hash("password")
+    assert await password_hasher.verify_password("password", password_hash)
+    assert not await password_hasher.verify_password("wrong password", password_hash)
+    # Unknown users are compared against a fake hash
+    assert not await password_hasher.verify_password("password", None)
+
+    password_hasher.shutdown()
+
+
+async def test_saturated_password_hasher_refuses_operations() -> None:
+    password_hasher = PasswordHasher(max_workers=1, max_pending_operations=0)
+
+    with pytest.raises(PasswordHasherSaturatedError):
+        await password_hasher.verify_password("password", None)
+
+    password_hasher.shutdown()
+
+
+executed_jobs: list[str] = []
+
+
+async def record_job(name: str) -> None:
+    executed_jobs.append(name)
+
+
+async def test_scheduler_with_dedicated_worker() -> None:
+    settings = override_get_settings()
+    scheduler = Scheduler()
+    await scheduler.start(
+        redis_host=settings.REDIS_HOST or "",
+        redis_port=settings.REDIS_PORT,
+        redis_password=settings.REDIS_PASSWORD,
+        _dependency_overrides={},
+        run_worker=False,
+    )
+    # The scheduler only queues the job
+    await scheduler.queue_job(record_job, job_id="record_job", name="queued")
+    assert scheduler.worker is None
+    assert executed_jobs == []
+
+    worker = create_worker(
+        get_worker_settings(
+            worker_redis_settings=RedisSettings(
+                host=settings.REDIS_HOST or "",
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD or "",
+            ),
+            _dependency_overrides={},
+        ),
+        # In burst mode, the worker stops once the queue is empty
+        burst=True,
+        handle_signals=False,
+    )
+    await worker.async_run()
+    await worker.close()
+    await scheduler.close()
+
+    assert executed_jobs == ["queued"]
+
+
+async def test_send_emails_from_queue_over_one_connection(
+    mocker: MockerFixture,
+) -> None:
+    settings = override_get_settings().model_copy(
+        update={"SMTP_MAX_EMAILS_PER_MINUTE": 100},
+    )
+    smtp = mocker.patch("app.utils.mail.mailworker.smtplib.SMTP")
+    connection = smtp.return_value
+
+    def send_message(message, from_addr, to_addrs):
+        if to_addrs == ["refused@example.fr"]:
+            raise smtplib.SMTPRecipientsRefused({})
+        if to_addrs == ["unavailable@example.fr"]:
+            raise smtplib.SMTPDataError(451, "Try again later")
+
+    connection.send_message.side_effect = send_message
+    mocker.patch.object(mailworker, "smtp_sender", mailworker.SMTPSender())
+    mailworker.smtp_sender.configure(settings=settings)
+
+    recipients = [
+        *[f"queued{i}@example.fr" for i in range(10)],
+        "refused@example.fr",
+        "unavailable@example.fr",
+    ]
+    for recipient in recipients:
+        await add_object_to_db(
+            models_core.EmailQueue(
+                id=uuid.uuid4(),
+                email=recipient,
+                subject="Invitation",
+                body="<p>Welcome</p>",
+                created_on=datetime.now(UTC),
+            ),
+        )
+
+    async with get_TestingSessionLocal()() as db:
+        await mailworker.send_emails_from_queue(db=db, settings=settings)
+        await db.commit()
+        remaining_emails = await cruds_core.get_queued_emails(db=db, limit=100)
+
+    # All emails are sent over a single authenticated connection
+    assert smtp.call_count == 1
+    assert connection.login.call_count == 1
+    assert connection.send_message.call_count == 12
+    # Refused recipients are dropped, emails which could not be sent are retried later
+    assert [email.email for email in remaining_emails] == ["unavailable@example.fr"]
+
+    # The connection was closed after the error, a new one is used for the next email
+    await mailworker.send_email(
+        recipient="direct@example.fr",
+        subject="Reset password",
+        content="<p>Reset</p>",
+        settings=settings,
+    )
+    assert smtp.call_count == 2
+    mailworker.smtp_sender.shutdown()
+
+
+def test_smtp_rate_limiter_keeps_reserved_tokens(mocker: MockerFixture) -> None:
+    sleep = mocker.patch("app.utils.mail.mailworker.time.sleep")
+    rate_limiter = mailworker.SMTPRateLimiter(max_emails_per_minute=60)
+
+    # Queued emails can use the budget until only the reserved tokens are left
+    for _ in range(55):
+        rate_limiter.acquire(reserved=5)
+    sleep.assert_not_called()
+
+    # Emails sent directly use the reserved tokens without waiting
+    rate_limiter.acquire()
+    sleep.assert_not_called()
+
+    rate_limiter.acquire(reserved=5)
+    sleep.assert_called_once()
+    assert sleep.call_args.args[0] == pytest.approx(2, abs=0.1)
+
+
+async def test_send_emails_stops_on_connection_failure(
+    mocker: MockerFixture,
+) -> None:
+    settings = override_get_settings().model_copy(
+        update={"SMTP_MAX_EMAILS_PER_MINUTE": 100},
+    )
+    smtp = mocker.patch("app.utils.mail.mailworker.smtplib.SMTP")
+    smtp.return_value.login.side_effect = smtplib.SMTPAuthenticationError(
+        535,
+        "Authentication failed",
+    )
+    sender = mailworker.SMTPSender()
+    sender.configure(settings=settings)
+
+    processed = await sender.send_emails(
+        [
+            mailworker.create_email(
+                recipient=[f"queued{i}@example.fr"],
+                subject="Invitation",
+                content="<p>Welcome</p>",
+                settings=settings,
+            )
+            for i in range(5)
+        ],
+    )
+
+    # The batch is stopped after the first failed login
+    assert processed == [False] * 5
+    assert smtp.call_count == 1
+    assert smtp.return_value.send_message.call_count == 0
+    sender.shutdown()
+
+
+class FakeS3Access(S3Access):
+    """S3Access storing uploaded objects in memory, failing the first `failures` uploads"""
+
+    failures = 0
+
+    def __init__(self, failure_logger: str, folder: str, *args) -> None:
+        self.folder = folder
+        self.failure_logger = logging.getLogger(failure_logger)
+        # Any non None client enables the spool, uploads are overridden below
+        self.s3 = object()  # type: ignore[assignment]
+        self.objects: dict[str, tuple[str, int]] = {}
+
+    def upload_object(self, message: str, key: str, retention: int = 0) -> None:
+        if key.endswith("denied"):
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "AccessDenied"}},
+                "PutObject",
+            )
+        if FakeS3Access.failures > 0:
+            FakeS3Access.failures -= 1
+            raise botocore.exceptions.EndpointConnectionError(endpoint_url="s3")
+        self.objects[key] = (message, retention)
+
+
+async def test_distributed_lock_without_redis() -> None:
+    events: list[str] = []
+
+    async def hold_lock(name: str) -> None:
+        async with (
+            get_TestingSessionLocal()() as db,
+            distributed_lock(key="test_lock", db=db, redis_client=None),
+        ):
+            events.append(f"{name} acquired")
+            await asyncio.sleep(0.05)
+            events.append(f"{name} released")
+
+    # The second request waits for the lock instead of failing
+    await asyncio.gather(hold_lock("first"), hold_lock("second"))
+    assert events == [
+        "first acquired",
+        "first released",
+        "second acquired",
+        "second released",
+    ]
+
+    async with get_TestingSessionLocal()() as db:
+        async with distributed_lock(key="test_lock", db=db, redis_client=None):
+            with pytest.raises(LockTimeoutError):
+                async with distributed_lock(
+                    key="test_lock",
+                    db=db,
+                    redis_client=None,
+                    wait_timeout=0.1,
+                ):
+                    pass
+        # The session is not in a transaction, the lock was released when leaving the context manager
+        async with distributed_lock(
+            key="test_lock",
+            db=db,
+            redis_client=None,
+            wait_timeout=0,
+        ):
+            pass
+
+    async with (
+        get_TestingSessionLocal()() as db,
+        get_TestingSessionLocal()() as other_db,
+    ):
+        await db.execute(text("SELECT 1"))
+        async with distributed_lock(key="test_lock", db=db, redis_client=None):
+            pass
+        # The lock is held until the transaction is committed, so that the changes are visible to the next owner
+        with pytest.raises(LockTimeoutError):
+            async with distributed_lock(
+                key="test_lock",
+                db=other_db,
+                redis_client=None,
+                wait_timeout=0,
+            ):
+                pass
+        await db.commit()
+        async with distributed_lock(
+            key="test_lock",
+            db=other_db,
+            redis_client=None,
+            wait_timeout=0,
+        ):
+            pass
+
+
+def test_s3_log_handler_retries_spooled_records(
+    mocker: MockerFixture,
+    tmp_path: Path,
+) -> None:
+    mocker.patch("app.utils.loggers_tools.s3_handler.S3Access", FakeS3Access)
+    mocker.patch.object(FakeS3Access, "failures", 3)
+    handler = S3LogHandler(
+        "hyperion.s3.fallback",
+        "mypayment",
+        spool_directory=str(tmp_path),
+        max_retry_delay=0.01,
+    )
+
+    for i in range(10):
+        record = logging.LogRecord(
+            "hyperion.mypayment",
+            logging.INFO,
+            "",
+            0,
+            f"action {i}",
+            None,
+            None,
+        )
+        record.s3_filename = f"action_{i}"
+        record.s3_subfolder = "2026"
+        record.s3_retention = 7
+        handler.handle(record)
+    handler.close()
+
+    assert isinstance(handler.s3_access, FakeS3Access)
+    assert handler.s3_access.objects == {
+        f"mypayment/2026/action_{i}": (f"action {i}", 7) for i in range(10)
+    }
+    assert handler.pending_records == 0
+    assert handler.uploaded_records == 10
+    assert handler.failed_attempts == 3
+    # Uploaded segments are deleted
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_s3_log_handler_uploads_segments_of_stopped_processes(
+    mocker: MockerFixture,
+    tmp_path: Path,
+) -> None:
+    mocker.patch("app.utils.loggers_tools.s3_handler.S3Access", FakeS3Access)
+    # A process which does not exist anymore left an open segment, whose last record was being written
+    segment = tmp_path / "00000000000000000001-999999999-1.open"
+    segment.write_text(
+        json.dumps({"key": "mypayment/action", "message": "action", "retention": 0})
+        + "\n"
+        + '{"key": "mypayment/incomplete',
+    )
+    handler = S3LogHandler(
+        "hyperion.s3.fallback",
+        "mypayment",
+        spool_directory=str(tmp_path),
+    )
+    handler.flush()
+    handler.close()
+
+    assert isinstance(handler.s3_access, FakeS3Access)
+    assert handler.s3_access.objects == {"mypayment/action": ("action", 0)}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_s3_log_handler_moves_refused_records_to_dead_letter(
+    mocker: MockerFixture,
+    tmp_path: Path,
+) -> None:
+    mocker.patch("app.utils.loggers_tools.s3_handler.S3Access", FakeS3Access)
+    mocker.patch.object(FakeS3Access, "failures", 2)
+    handler = S3LogHandler(
+        "hyperion.s3.fallback",
+        "mypayment",
+        spool_directory=str(tmp_path),
+        max_retry_delay=0.01,
+        max_upload_attempts=2,
+    )
+    for filename in ["action_denied", "action_failing", "action"]:
+        record = logging.LogRecord(
+            "hyperion.mypayment",
+            logging.INFO,
+            "",
+            0,
+            filename,
+            None,
+            None,
+        )
+        record.s3_filename = filename
+        handler.handle(record)
+        # Records are uploaded one after the other
+        handler.flush()
+        for _ in range(100):
+            if handler.pending_records == 0:
+                break
+            time.sleep(0.01)
+    handler.close()
+
+    # The access denied is not retried, the failing record is given up after two attempts
+    assert isinstance(handler.s3_access, FakeS3Access)
+    assert handler.s3_access.objects == {"mypayment/action": ("action", 0)}
+    assert handler.failed_attempts == 3
+    dead_letters = [
+        json.loads(line)
+        for line in (tmp_path / DEAD_LETTER_FILE).read_text().splitlines()
+    ]
+    assert [record["key"] for record in dead_letters] == [
+        "mypayment/action_denied",
+        "mypayment/action_failing",
+    ]
+    assert "AccessDenied" in dead_letters[0]["error"]
+    assert list(tmp_path.iterdir()) == [tmp_path / DEAD_LETTER_FILE]
+
+
+class FakeS3Client:
+    """S3 client listing objects two by two, counting downloads"""
+
+    def __init__(self, objects: dict[str, bytes]) -> None:
+        self.objects = objects
+        self.downloads = 0
+
+    def list_buckets(self):
+        return {"Buckets": [{"Name": "bucket"}]}
+
+    def get_paginator(self, operation_name: str) -> "FakeS3Client":
+        return self
+
+    def paginate(self, Prefix: str, Bucket: str):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        for i in range(0, len(keys), 2):
+            yield {
+                "Contents": [
+                    {
+                        "Key": key,
+                        "ETag": f'"{hashlib.md5(self.objects[key]).hexdigest()}"',  # noqa: S324
+                    }
+                    for key in keys[i : i + 2]
+                ],
+            }
+
+    def get_object(self, Bucket: str, Key: str):
+        self.downloads += 1
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+
+def test_s3_access_fetches_all_pages_of_objects(
+    mocker: MockerFixture,
+    tmp_path: Path,
+) -> None:
+    s3_client = FakeS3Client(
+        {f"mypayment/2026/action_{i}": f"action {i}".encode() for i in range(5)}
+        | {"mypayment/2025/action": b"other"},
+    )
+    mocker.patch("boto3.client", return_value=s3_client)
+    s3_access = S3Access(
+        "hyperion.s3.fallback",
+        "mypayment",
+        s3_bucket_name="bucket",
+        s3_access_key_id="id",
+        s3_secret_access_key="secret",
+    )
+
+    assert s3_access.get_files_content_for_prefix("action", "2026") == [
+        f"action {i}" for i in range(5)
+    ]
+
+    contents = dict(
+        s3_access.iter_files_content_for_prefix(
+            "action",
+            "2026",
+            max_concurrent_downloads=2,
+            cache_directory=tmp_path,
+        ),
+    )
+    assert contents == {f"mypayment/2026/action_{i}": f"action {i}" for i in range(5)}
+    assert s3_client.downloads == 10
+
+    # Immutable objects are read from the cache
+    contents = dict(
+        s3_access.iter_files_content_for_prefix(
+            "action",
+            "2026",
+            cache_directory=tmp_path,
+        ),
+    )
+    assert contents == {f"mypayment/2026/action_{i}": f"action {i}" for i in range(5)}
+    assert s3_client.downloads == 10
@@ -0,0 +1,285 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from broadcaster import Broadcast
+from fastapi.testclient import TestClient
+
+from app import dependencies
+from app.core.users import models_users
+from app.types.websocket import (
+    HyperionWebsocketsRoom,
+    SubscriptionStatusWSMessageModelStatus,
+    SubscriptionWSMessageModel,
+    WebsocketConnectionManager,
+    WebsocketOverflowPolicy,
+    WebsocketRoomType,
+    WSMessageModel,
+    get_room_id,
+    is_user_own_room,
+)
+from tests.commons import (
+    create_api_access_token,
+    create_user_with_groups,
+    override_get_settings,
+)
+
+user: models_users.CoreUser
+token: str
+
+
+@pytest_asyncio.fixture(scope="module", autouse=True)
+async def init_objects() -> None:
+    global user, token
+    user = await create_user_with_groups(groups=[])
+    token = create_api_access_token(user)
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0):
+        """
+        A websocket client which needs `delay` seconds to receive each message
+        """
+        self.delay = delay
+        self.messages: list[str] = []
+        self.close_reason: str | None = None
+
+    async def send_text(self, data: str) -> None:
+        await asyncio.sleep(self.delay)
+        self.messages.append(data)
+
+    async def close(self, code: int = 1000, reason: str | None = None) -> None:
+        self.close_reason = reason
+
+
+class FakeSession:
+    async def close(self) -> None:
+        pass
+
+
+class FakeUser:
+    def __init__(self, user_id: str):
+        self.id = user_id
+
+
+async def create_ws_manager(**kwargs) -> WebsocketConnectionManager:
+    ws_manager = WebsocketConnectionManager(
+        settings=override_get_settings(),
+        **kwargs,
+    )
+    # We don't want to depend on Redis pub/sub in these tests
+    ws_manager.broadcaster = Broadcast("memory://")
+    await ws_manager.connect_broadcaster()
+    return ws_manager
+
+
+async def send_messages(
+    ws_manager: WebsocketConnectionManager,
+    room: HyperionWebsocketsRoom,
+    count: int,
+) -> None:
+    for i in range(count):
+        await ws_manager.send_message_to_room(
+            message=WSMessageModel(command="TEST", data=i),
+            room_id=room,
+        )
+        # Updates are spread over time, a burst larger than the queues would overflow them
+        await asyncio.sleep(0.01)
+
+
+async def wait_until(condition) -> None:
+    for _ in range(1000):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    pytest.fail("Timed out")
+
+
+async def test_websocket_fan_out_with_slow_clients() -> None:
+    ws_manager = await create_ws_manager(max_queue_size=10, send_timeout=60)
+    room = HyperionWebsocketsRoom.CDR
+
+    clients = [FakeWebSocket(delay=0.001) for _ in range(300)]
+    stuck_clients = [FakeWebSocket(delay=3600) for _ in range(5)]
+    for client in clients + stuck_clients:
+        await ws_manager.add_connection_to_room(
+            room_id=room,
+            ws_connection=client,  # type: ignore[arg-type]
+        )
+    # Let the worker subscribe to the room
+    await asyncio.sleep(0.1)
+
+    start = time.monotonic()
+    await send_messages(ws_manager=ws_manager, room=room, count=20)
+    await wait_until(lambda: all(len(client.messages) == 20 for client in clients))
+    # Messages are sent concurrently: stuck clients don't delay the others
+    assert time.monotonic() - start < 5
+
+    # A stuck client receives the first message, then 10 are queued and the next one overflows its queue
+    await wait_until(lambda: all(client.close_reason for client in stuck_clients))
+    assert all(
+        client.close_reason == "Websocket client is too slow"
+        for client in stuck_clients
+    )
+
+    stats = ws_manager.get_room_stats(room)
+    assert stats.connections == 300
+    assert stats.messages == 20
+    assert stats.closed_connections == 5
+    assert stats.dropped_messages == 5
+    assert stats.queued_messages == 0
+
+    for client in clients:
+        await ws_manager.remove_connection_from_room(
+            connection=client,  # type: ignore[arg-type]
+            room_id=room,
+        )
+    assert ws_manager.get_room_stats(room).connections == 0
+    await ws_manager.disconnect_broadcaster()
+
+
+async def test_websocket_drop_oldest_messages() -> None:
+    ws_manager = await create_ws_manager(
+        max_queue_size=2,
+        send_timeout=60,
+        overflow_policy=WebsocketOverflowPolicy.drop_oldest,
+    )
+    room = HyperionWebsocketsRoom.CDR
+
+    client = FakeWebSocket(delay=0.2)
+    await ws_manager.add_connection_to_room(
+        room_id=room,
+        ws_connection=client,  # type: ignore[arg-type]
+    )
+    await asyncio.sleep(0.1)
+
+    await send_messages(ws_manager=ws_manager, room=room, count=5)
+    await wait_until(lambda: ws_manager.get_room_stats(room).messages == 5)
+    stats = ws_manager.get_room_stats(room)
+    assert stats.dropped_messages == 2
+    assert stats.max_queue_depth == 2
+
+    # The first message was being sent, the two following ones were dropped
+    await wait_until(lambda: len(client.messages) == 3)
+    assert [WSMessageModel.model_validate_json(m).data for m in client.messages] == [
+        0,
+        3,
+        4,
+    ]
+    assert client.close_reason is None
+
+    await ws_manager.remove_connection_from_room(
+        connection=client,  # type: ignore[arg-type]
+        room_id=room,
+    )
+    await ws_manager.disconnect_broadcaster()
+
+
+async def test_websocket_subscriptions() -> None:
+    ws_manager = await create_ws_manager(max_rooms_per_connection=2)
+    client = FakeWebSocket()
+    user = FakeUser("user-1")
+    room_authorizers = {WebsocketRoomType.user: is_user_own_room}
+
+    async def handle(command: str, room_type: str, entity_id: str):
+        return await ws_manager._handle_subscription_message(  # noqa: SLF001
+            websocket=client,  # type: ignore[arg-type]
+            message=SubscriptionWSMessageModel.model_validate(
+                {
+                    "command": command,
+                    "data": {"room_type": room_type, "entity_id": entity_id},
+                },
+            ),
+            user=user,  # type: ignore[arg-type]
+            room_authorizers=room_authorizers,  # type: ignore[arg-type]
+            db=FakeSession(),  # type: ignore[arg-type]
+        )
+
+    assert (
+        await handle("subscribe", "user", "user-1")
+        == SubscriptionStatusWSMessageModelStatus.subscribed
+    )
+    # Another user's room and rooms without an authorizer are forbidden
+    assert (
+        await handle("subscribe", "user", "user-2")
+        == SubscriptionStatusWSMessageModelStatus.forbidden
+    )
+    assert (
+        await handle("subscribe", "cdr_seller", "seller")
+        == SubscriptionStatusWSMessageModelStatus.forbidden
+    )
+
+    # Rooms of a websocket share a single connection and writer
+    await ws_manager.add_connection_to_room(
+        room_id=HyperionWebsocketsRoom.CDR,
+        ws_connection=client,  # type: ignore[arg-type]
+    )
+    connection = ws_manager.websocket_connections[client]  # type: ignore[index]
+    assert connection.rooms == {
+        get_room_id(WebsocketRoomType.user, "user-1"),
+        HyperionWebsocketsRoom.CDR,
+    }
+    # The connection reached its maximum number of rooms
+    room_authorizers[WebsocketRoomType.cdr_seller] = is_user_own_room
+    assert (
+        await handle("subscribe", "cdr_seller", "user-1")
+        == SubscriptionStatusWSMessageModelStatus.forbidden
+    )
+
+    await asyncio.sleep(0.1)
+    await ws_manager.send_message_to_room(
+        message=WSMessageModel(command="TEST", data="user"),
+        room_id=get_room_id(WebsocketRoomType.user, "user-1"),
+    )
+    await wait_until(lambda: len(client.messages) == 1)
+
+    assert (
+        await handle("unsubscribe", "user", "user-1")
+        == SubscriptionStatusWSMessageModelStatus.unsubscribed
+    )
+    assert connection.rooms == {HyperionWebsocketsRoom.CDR}
+    assert (
+        ws_manager.get_room_stats(
+            get_room_id(WebsocketRoomType.user, "user-1"),
+        ).connections
+        == 0
+    )
+
+    await ws_manager.remove_connection_from_room(
+        connection=client,  # type: ignore[arg-type]
+        room_id=HyperionWebsocketsRoom.CDR,
+    )
+    assert client not in ws_manager.websocket_connections
+    await ws_manager.disconnect_broadcaster()
+
+
+def test_websocket_endpoint(client: TestClient) -> None:
+    ws_manager = dependencies.GLOBAL_STATE["ws_manager"]
+    with client.websocket_connect("/cdr/users/ws") as websocket:
+        websocket.send_json({"token": token})
+        assert websocket.receive_json()["data"]["status"] == "connected"
+
+        # Invalid frames are ignored
+        websocket.send_text("not json")
+        websocket.send_json({"command": "unknown"})
+
+        websocket.send_json(
+            {
+                "command": "subscribe",
+                "data": {"room_type": "user", "entity_id": user.id},
+            },
+        )
+        assert websocket.receive_json()["data"]["status"] == "subscribed"
+        assert len(ws_manager.websocket_connections) == 1
+
+        # The endpoint should leave its rooms, then return without error once the client disconnected.
+        # Leaving the context would cancel the endpoint, so we wait for it here
+        websocket.close()
+        for _ in range(100):
+            if not ws_manager.websocket_connections:
+                break
+            time.sleep(0.01)
+        assert ws_manager.websocket_connections == {}
+        time.sleep(0.1)
+    # An exception raised by the endpoint is raised when leaving the context